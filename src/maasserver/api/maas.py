@@ -29,6 +29,7 @@ from maasserver.models import (
     Config,
     PackageRepository,
 )
+from maasserver.websockets.statistics import get_websocket_statistics
 from piston3.utils import rc
 
 
@@ -118,6 +119,19 @@ class MaasHandler(OperationsHandler):
     # about the available configuration items.
     get_config.__doc__ %= get_config_doc(indentation=8)
 
+    @admin_method
+    @operation(idempotent=True)
+    def websocket_stats(self, request):
+        """Get statistics about the websocket handlers.
+
+        Returns histograms of the latency, database queries and response
+        size of each handler method called, and of the time taken and
+        queries made to process notifications on each channel. They cover
+        only the region process that answers this request, since it was
+        started.
+        """
+        return get_websocket_statistics()
+
     @classmethod
     def resource_uri(cls, *args, **kwargs):
         return ('maas_handler', [])
@@ -91,10 +91,7 @@ from maasserver.storage_layouts import (
     StorageLayoutMissingBootDiskError,
 )
 from maasserver.utils.django_urls import reverse
-from maasserver.utils.orm import (
-    get_first,
-    reload_object,
-)
+from maasserver.utils.orm import reload_object
 import yaml
 
 # Machine's fields exposed on the API.
@@ -180,6 +177,9 @@ DISPLAYED_ANON_MACHINE_FIELDS = (
     'node_type',
 )
 
+# The most machines that one call to allocate may ask for.
+MAX_ALLOCATE_COUNT = 1000
+
 
 def get_storage_layout_params(request, required=False, extract_params=False):
     """Return and validate the storage_layout parameter."""
@@ -221,6 +221,38 @@ def get_allocation_parameters(request):
     return agent_name, bridge_all, bridge_fd, bridge_stp, comment
 
 
+def set_constraints_by_type(machine, storage, interfaces, verbose=False):
+    """Record on `machine` which of its storage and interfaces matched the
+    constraints it was allocated with."""
+    machine.constraint_map = storage.get(machine.id, {})
+    machine.constraints_by_type = {}
+    # Need to get the interface constraints map into the proper format
+    # to return it here.
+    # Backward compatibility: provide the storage constraints in both
+    # formats.
+    if len(machine.constraint_map) > 0:
+        machine.constraints_by_type['storage'] = {}
+        new_storage = machine.constraints_by_type['storage']
+        # Convert this to the "new style" constraints map format.
+        for storage_key in machine.constraint_map:
+            # Each key in the storage map is actually a value which
+            # contains the ID of the matching storage device.
+            # Convert this to a label: list-of-matches format, to
+            # match how the constraints will be done going forward.
+            new_key = machine.constraint_map[storage_key]
+            matches = new_storage.get(new_key, [])
+            matches.append(storage_key)
+            new_storage[new_key] = matches
+    if len(interfaces) > 0:
+        machine.constraints_by_type['interfaces'] = {
+            label: interfaces.get(label, {}).get(machine.id)
+            for label in interfaces
+        }
+    if verbose:
+        machine.constraints_by_type['verbose_storage'] = storage
+        machine.constraints_by_type['verbose_interfaces'] = interfaces
+
+
 def get_allocated_composed_machine(
         request, data, storage, pods, form, input_constraints):
     """Return composed machine if input constraints are matched."""
@@ -1609,9 +1641,15 @@ class MachinesHandler(NodesHandler, PowersMixin):
             constraint will be prefixed by `verbose_`, and contain the full
             data structure that indicates which machine(s) matched).
         :type verbose: bool
+        :param count: Optional number of machines to allocate, all matching
+            the same constraints. Up to this many machines are allocated in
+            one transaction and returned as a list, rather than as a single
+            machine. At most %d may be asked for.
+        :type count: positive integer
 
         Returns 409 if a suitable machine matching the constraints could not be
-        found.
+        found. When `count` is given, fewer machines than asked for may be
+        returned, but never none.
         """
         form = AcquireNodeForm(data=request.data)
         # XXX AndresRodriguez 2016-10-27: If new params are added and are not
@@ -1629,95 +1667,88 @@ class MachinesHandler(NodesHandler, PowersMixin):
         dry_run = get_optional_param(
             request.POST, 'dry_run', default=False, validator=StringBool)
         zone = get_optional_param(request.POST, 'zone', default=None)
+        count = get_optional_param(
+            request.POST, 'count', default=None,
+            validator=validators.Int(min=1, max=MAX_ALLOCATE_COUNT))
+        many = count is not None
 
         if not form.is_valid():
             raise MAASAPIValidationError(form.errors)
 
-        # This lock prevents a machine we've picked as available from
-        # becoming unavailable before our transaction commits.
-        with locks.node_acquire:
-            machines = (
-                self.base_model.objects.get_available_machines_for_acquisition(
-                    request.user)
-                )
-            machines, storage, interfaces = form.filter_nodes(machines)
-            machine = get_first(machines)
-            if machine is None:
-                cores = form.cleaned_data.get('cpu_count')
-                if cores is not None:
-                    cores = int(cores)
-                memory = form.cleaned_data.get('mem')
-                if memory is not None:
-                    memory = int(memory)
-                architecture = None
-                architectures = form.cleaned_data.get('arch')
-                if architectures is not None:
-                    architecture = (
-                        None if len(architectures) == 0
-                        else min(architectures))
-                storage = form.cleaned_data.get('storage')
-                data = {
-                    "cores": cores,
-                    "memory": memory,
-                    "architecture": architecture,
-                    "storage": storage,
-                }
-                # Only match allocation if Pod's zone matches.
-                pods = Pod.objects.filter(
-                    Q(default_pool__role__users=request.user) |
-                    Q(default_pool__role__groups__users=request.user))
-                if zone is not None:
-                    pods = pods.filter(zone__name=zone)
-                if pods:
+        machines = (
+            self.base_model.objects.get_available_machines_for_acquisition(
+                request.user)
+            )
+        machines, storage, interfaces = form.filter_nodes(
+            machines, constraint_maps=verbose)
+        # Lock the machines we pick so that they cannot become unavailable
+        # before our transaction commits. Machines locked by concurrent
+        # allocations are skipped rather than waited for, so independent
+        # allocations do not serialise on each other.
+        allocated = self.base_model.objects.lock_available(
+            machines, count if many else 1)
+        if not verbose:
+            # Only the machines picked need their constraint maps.
+            storage, interfaces = form.get_constraint_maps(allocated)
+        if len(allocated) == 0:
+            cores = form.cleaned_data.get('cpu_count')
+            if cores is not None:
+                cores = int(cores)
+            memory = form.cleaned_data.get('mem')
+            if memory is not None:
+                memory = int(memory)
+            architecture = None
+            architectures = form.cleaned_data.get('arch')
+            if architectures is not None:
+                architecture = (
+                    None if len(architectures) == 0
+                    else min(architectures))
+            storage = form.cleaned_data.get('storage')
+            data = {
+                "cores": cores,
+                "memory": memory,
+                "architecture": architecture,
+                "storage": storage,
+            }
+            # Only match allocation if Pod's zone matches.
+            pods = Pod.objects.filter(
+                Q(default_pool__role__users=request.user) |
+                Q(default_pool__role__groups__users=request.user))
+            if zone is not None:
+                pods = pods.filter(zone__name=zone)
+            if pods:
+                # Composing a machine in a pod is still serialised by the
+                # region-wide lock.
+                with locks.node_acquire:
                     machine, storage = get_allocated_composed_machine(
                         request, data, storage, pods, form, input_constraints)
-
-            if machine is None:
-                constraints = form.describe_constraints()
-                if constraints == '':
-                    # No constraints. That means no machines at all were
-                    # available.
-                    message = "No machine available."
-                else:
-                    message = (
-                        'No available machine matches constraints: %s '
-                        '(resolved to "%s")' % (
-                            str(input_constraints), constraints))
-                raise NodesNotAvailable(message)
+                if machine is not None:
+                    allocated = [machine]
+
+        if len(allocated) == 0:
+            constraints = form.describe_constraints()
+            if constraints == '':
+                # No constraints. That means no machines at all were
+                # available.
+                message = "No machine available."
+            else:
+                message = (
+                    'No available machine matches constraints: %s '
+                    '(resolved to "%s")' % (
+                        str(input_constraints), constraints))
+            raise NodesNotAvailable(message)
+        for machine in allocated:
             if not dry_run:
                 machine.acquire(
                     request.user, get_oauth_token(request),
                     agent_name=agent_name, comment=comment,
                     bridge_all=bridge_all, bridge_stp=bridge_stp,
                     bridge_fd=bridge_fd)
-            machine.constraint_map = storage.get(machine.id, {})
-            machine.constraints_by_type = {}
-            # Need to get the interface constraints map into the proper format
-            # to return it here.
-            # Backward compatibility: provide the storage constraints in both
-            # formats.
-            if len(machine.constraint_map) > 0:
-                machine.constraints_by_type['storage'] = {}
-                new_storage = machine.constraints_by_type['storage']
-                # Convert this to the "new style" constraints map format.
-                for storage_key in machine.constraint_map:
-                    # Each key in the storage map is actually a value which
-                    # contains the ID of the matching storage device.
-                    # Convert this to a label: list-of-matches format, to
-                    # match how the constraints will be done going forward.
-                    new_key = machine.constraint_map[storage_key]
-                    matches = new_storage.get(new_key, [])
-                    matches.append(storage_key)
-                    new_storage[new_key] = matches
-            if len(interfaces) > 0:
-                machine.constraints_by_type['interfaces'] = {
-                    label: interfaces.get(label, {}).get(machine.id)
-                    for label in interfaces
-                }
-            if verbose:
-                machine.constraints_by_type['verbose_storage'] = storage
-                machine.constraints_by_type['verbose_interfaces'] = interfaces
-            return machine
+            set_constraints_by_type(machine, storage, interfaces, verbose)
+        return allocated if many else allocated[0]
+
+    # Populate the docstring with the most machines that may be asked for.
+    allocate.__doc__ %= MAX_ALLOCATE_COUNT
 
     @admin_method
     @operation(idempotent=False)
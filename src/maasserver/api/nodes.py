@@ -21,6 +21,8 @@ from maasserver.api.support import (
     AnonymousOperationsHandler,
     operation,
     OperationsHandler,
+    SparseFields,
+    StreamedQuerySet,
 )
 from maasserver.api.utils import (
     get_mandatory_param,
@@ -162,6 +164,71 @@ NODES_PREFETCH = [
     'nodemetadata_set',
 ]
 
+# The relations, of those prefetched by NODES_PREFETCH, that are used when
+# emitting each field of a node. Fields that are not listed use none of them.
+NODES_FIELD_RELATIONS = {
+    'domain': {'domain'},
+    'fqdn': {'domain'},
+    'owner_data': {'ownerdata_set'},
+    'tag_names': {'tags'},
+    'hardware_info': {'nodemetadata_set'},
+    'special_filesystems': {'special_filesystems'},
+    'boot_interface': {'boot_interface'},
+    'interface_set': {'interface_set'},
+    'ip_addresses': {'boot_interface', 'interface_set'},
+    'default_gateways': {
+        'boot_interface', 'gateway_link_ipv4', 'gateway_link_ipv6',
+        'interface_set'},
+    'storage': {'blockdevice_set'},
+    'boot_disk': {'blockdevice_set'},
+    'blockdevice_set': {'blockdevice_set'},
+    'iscsiblockdevice_set': {'blockdevice_set'},
+    'physicalblockdevice_set': {'blockdevice_set'},
+    'virtualblockdevice_set': {'blockdevice_set'},
+    'volume_groups': {'blockdevice_set'},
+    'raids': {'blockdevice_set'},
+    'cache_sets': {'blockdevice_set'},
+    'bcaches': {'blockdevice_set'},
+}
+
+
+def get_nodes_prefetch(fields=None):
+    """Return the prefetches of NODES_PREFETCH needed to emit `fields`.
+
+    :param fields: Names of the fields to be emitted, or None for all.
+    """
+    if fields is None:
+        return NODES_PREFETCH
+    relations = set()
+    for field in fields:
+        relations.update(NODES_FIELD_RELATIONS.get(field, ()))
+    return [
+        prefetch for prefetch in NODES_PREFETCH
+        if getattr(prefetch, 'prefetch_through', prefetch).split('__')[0]
+        in relations
+    ]
+
+
+def get_requested_fields(request):
+    """Return the names of the fields given by the `fields` parameter.
+
+    The parameter can be given several times, and each can name several
+    fields separated by commas. The `system_id` field is always included:
+    piston emits every column of a model whose handler has no fields, so
+    the fields must never be narrowed down to none. Returns None if the
+    parameter is not given.
+    """
+    fields = get_optional_list(request.GET, 'fields')
+    if fields is None:
+        return None
+    names = ['system_id']
+    for value in fields:
+        for name in value.split(','):
+            name = name.strip()
+            if name != '' and name not in names:
+                names.append(name)
+    return names
+
 
 def store_node_power_parameters(node, request):
     """Store power parameters in request.
@@ -415,16 +482,26 @@ class NodeHandler(OperationsHandler):
     def read(self, request, system_id):
         """Read a specific Node.
 
+        :param fields: An optional list of the names of the fields to return.
+            This can be specified multiple times, or as a comma-separated
+            list. Names of fields that the node does not have are ignored.
+            The system_id is always returned. All fields are returned by
+            default.
+        :type fields: unicode
+
         Returns 404 if the node is not found.
         """
         node = self.model.objects.get_node_or_404(
             system_id=system_id, user=request.user, perm=NODE_PERMISSION.VIEW)
-        if self.model != Node:
-            return node
-        else:
+        if self.model == Node:
             # Return the specific node type object so we get the correct
             # listing
-            return node.as_self()
+            node = node.as_self()
+        fields = get_requested_fields(request)
+        if fields is None:
+            return node
+        else:
+            return SparseFields(node, Node, fields)
 
     def delete(self, request, system_id):
         """Delete a specific Node.
@@ -559,6 +636,19 @@ class AnonNodesHandler(AnonymousOperationsHandler):
         return ('nodes_handler', [])
 
 
+def set_related_node_parents(nodes):
+    """Set the node of the prefetched interfaces and block devices of `nodes`.
+
+    This saves a query for each when they are emitted.
+    """
+    for node in nodes:
+        prefetched = getattr(node, '_prefetched_objects_cache', {})
+        for interface in prefetched.get('interface_set', ()):
+            interface.node = node
+        for block_device in prefetched.get('blockdevice_set', ()):
+            block_device.node = node
+
+
 class NodesHandler(OperationsHandler):
     """Manage the collection of all the nodes in the MAAS."""
     api_doc_section_name = "Nodes"
@@ -566,6 +656,10 @@ class NodesHandler(OperationsHandler):
     anonymous = AnonNodesHandler
     base_model = Node
 
+    # Number of nodes that are read, prefetched and emitted at a time when
+    # listing them.
+    read_chunk_size = 500
+
     def read(self, request):
         """List Nodes visible to the user, optionally filtered by criteria.
 
@@ -596,8 +690,15 @@ class NodesHandler(OperationsHandler):
         :param agent_name: An optional agent name.  Only nodes relating to the
             nodes with matching agent names will be returned.
         :type agent_name: unicode
-        """
 
+        :param fields: An optional list of the names of the fields to return
+            for each node. This can be specified multiple times, or as a
+            comma-separated list. Names of fields that a node does not have
+            are ignored. The system_id is always returned. All fields are
+            returned by default.
+        :type fields: unicode
+        """
+        fields = get_requested_fields(request)
         if self.base_model == Node:
             # Avoid circular dependencies
             from maasserver.api.devices import DevicesHandler
@@ -606,27 +707,36 @@ class NodesHandler(OperationsHandler):
             from maasserver.api.regioncontrollers import (
                 RegionControllersHandler
             )
-            racks = RackControllersHandler().read(request).order_by("id")
+            racks = RackControllersHandler()._get_nodes(request, fields)
             nodes = list(chain(
-                DevicesHandler().read(request).order_by("id"),
-                MachinesHandler().read(request).order_by("id"),
+                DevicesHandler()._get_nodes(request, fields),
+                MachinesHandler()._get_nodes(request, fields),
                 racks,
-                RegionControllersHandler().read(request).exclude(
-                    id__in=racks).order_by("id"),
+                RegionControllersHandler()._get_nodes(
+                    request, fields).exclude(id__in=racks),
             ))
-            return nodes
+            set_related_node_parents(nodes)
         else:
-            nodes = filtered_nodes_list_from_request(request, self.base_model)
-            nodes = nodes.select_related(*NODES_SELECT_RELATED)
-            nodes = prefetch_queryset(
-                nodes, NODES_PREFETCH).order_by('id')
-            # Set related node parents so no extra queries are needed.
-            for node in nodes:
-                for interface in node.interface_set.all():
-                    interface.node = node
-                for block_device in node.blockdevice_set.all():
-                    block_device.node = node
+            # There can be many thousands of nodes, so they are emitted a
+            # chunk at a time rather than all at once.
+            nodes = StreamedQuerySet(
+                self._get_nodes(request, fields),
+                prepare=set_related_node_parents,
+                chunk_size=self.read_chunk_size)
+        if fields is None:
             return nodes
+        else:
+            return SparseFields(nodes, Node, fields)
+
+    def _get_nodes(self, request, fields=None):
+        """Return the nodes visible to the user that match the request.
+
+        Only the relations needed to emit `fields` are prefetched.
+        """
+        nodes = filtered_nodes_list_from_request(request, self.base_model)
+        nodes = nodes.select_related(*NODES_SELECT_RELATED)
+        return prefetch_queryset(
+            nodes, get_nodes_prefetch(fields)).order_by('id')
 
     @operation(idempotent=True)
     def is_registered(self, request):
@@ -1,4 +1,4 @@
-# Copyright 2012-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2012-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Supporting infrastructure for Piston-based APIs in MAAS."""
@@ -10,6 +10,8 @@ __all__ = [
     'ModelOperationsHandler',
     'operation',
     'OperationsHandler',
+    'SparseFields',
+    'StreamedQuerySet',
     ]
 
 from abc import (
@@ -17,9 +19,20 @@ from abc import (
     abstractproperty,
 )
 from functools import wraps
+from itertools import (
+    chain,
+    islice,
+)
+import json
 
 from django.core.exceptions import PermissionDenied
-from django.http import Http404
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import (
+    Http404,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404
 from maasserver.api.doc import get_api_description_hash
 from maasserver.exceptions import (
@@ -28,7 +41,10 @@ from maasserver.exceptions import (
 )
 from maasserver.utils.orm import get_one
 from piston3.authentication import NoAuthentication
-from piston3.emitters import Emitter
+from piston3.emitters import (
+    Emitter,
+    JSONEmitter,
+)
 from piston3.handler import (
     AnonymousBaseHandler,
     BaseHandler,
@@ -368,6 +384,175 @@ def method_fields_reserved_fields_patch(self, handler, fields):
 Emitter.method_fields = method_fields_reserved_fields_patch
 
 
+# The content type piston uses for JSON.
+JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+
+class StreamedQuerySet:
+    """A queryset to be emitted in chunks rather than all at once.
+
+    Return one of these from a handler to have `StreamingJSONEmitter` render
+    the results of `queryset` with a server-side cursor, `chunk_size` objects
+    at a time. The prefetches of `queryset` are made for each chunk, and the
+    chunk is passed to `prepare`, if given, before it is emitted.
+    """
+
+    def __init__(self, queryset, prepare=None, chunk_size=500):
+        super(StreamedQuerySet, self).__init__()
+        self.queryset = queryset
+        self.prepare = prepare
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        """Yield the objects of the queryset as lists of `chunk_size`."""
+        objects = self.queryset.iterator()
+        lookups = self.queryset._prefetch_related_lookups
+        while True:
+            chunk = list(islice(objects, self.chunk_size))
+            if len(chunk) == 0:
+                break
+            prefetch_related_objects(chunk, *lookups)
+            if self.prepare is not None:
+                self.prepare(chunk)
+            yield chunk
+
+
+class SparseFields:
+    """A result to be emitted with only some of its fields.
+
+    Return one of these from a handler to have `StreamingJSONEmitter` emit
+    objects of `model`, or of its subclasses, with only those of their
+    handler's fields that are named in `fields`. Names of fields that the
+    handler does not emit are ignored, but `fields` must name at least one
+    field of each handler. Other objects, such as those nested in the
+    fields, are emitted in full.
+
+    :param data: The result of the handler, which may be a
+        `StreamedQuerySet`.
+    """
+
+    def __init__(self, data, model, fields):
+        super(SparseFields, self).__init__()
+        self.data = data
+        self.model = model
+        self.fields = fields
+        self._handlers = {}
+
+    def get_handler(self, handler):
+        """Return a `SparseHandler` for `handler` with only the fields."""
+        if handler not in self._handlers:
+            self._handlers[handler] = SparseHandler(handler, self.fields)
+        return self._handlers[handler]
+
+
+class SparseHandler:
+    """Stands in for `handler` when emitting, with only the named fields."""
+
+    def __init__(self, handler, names):
+        super(SparseHandler, self).__init__()
+        self.handler = handler
+        self.fields = tuple(
+            field for field in handler.fields
+            if (field[0] if isinstance(field, tuple) else field) in names)
+        if len(self.fields) == 0:
+            # Piston would emit every column of the model, and every column
+            # of the models it refers to that have no handler.
+            raise ValueError(
+                "None of %s are fields of %s." % (
+                    ", ".join(sorted(names)), handler.__name__))
+
+    def __getattr__(self, name):
+        return getattr(self.handler, name)
+
+
+class ResultEmitterMixin:
+    """Emitter mixin for the results that MAAS handlers wrap their data in.
+
+    `SparseFields` results are emitted with only the fields they name, and
+    `StreamedQuerySet` results are read a chunk at a time, then emitted as
+    a whole.
+    """
+
+    sparse = None
+
+    def in_typemapper(self, model, anonymous):
+        handler = super(ResultEmitterMixin, self).in_typemapper(
+            model, anonymous)
+        if handler is None or self.sparse is None:
+            return handler
+        elif issubclass(model, self.sparse.model):
+            return self.sparse.get_handler(handler)
+        else:
+            return handler
+
+    def unwrap_sparse(self):
+        """Unwrap `SparseFields` data, keeping it to restrict fields."""
+        if isinstance(self.data, SparseFields):
+            self.sparse, self.data = self.data, self.data.data
+
+    def render(self, request):
+        self.unwrap_sparse()
+        if isinstance(self.data, StreamedQuerySet):
+            self.data = list(chain.from_iterable(self.data.chunks()))
+        return super(ResultEmitterMixin, self).render(request)
+
+
+class StreamingJSONEmitter(ResultEmitterMixin, JSONEmitter):
+    """JSON emitter that streams a `StreamedQuerySet` as a JSON array.
+
+    Results that fit in a single chunk, and JSONP requests, are rendered as
+    usual. Otherwise the elements of the array are emitted a chunk at a time
+    in a `StreamingHttpResponse`, so the whole response is never built in
+    memory.
+    """
+
+    def render(self, request):
+        self.unwrap_sparse()
+        if isinstance(self.data, StreamedQuerySet):
+            streamed = self.data
+            callback = request.GET.get('callback', None)
+            if callback is None and (
+                    streamed.queryset.count() > streamed.chunk_size):
+                # Piston wraps anything render returns that is not an
+                # HttpResponse, so the response is returned by raising it.
+                raise HttpStatusCode(StreamingHttpResponse(
+                    self._render_chunks(streamed),
+                    content_type=JSON_CONTENT_TYPE))
+        return super(StreamingJSONEmitter, self).render(request)
+
+    def _render_chunks(self, streamed):
+        # The response is streamed after the request's transaction has been
+        # committed, so the chunks are read in a transaction of their own.
+        with transaction.atomic():
+            separator = b"\n"
+            yield b"["
+            for chunk in streamed.chunks():
+                emitter = type(self)(
+                    chunk, self.typemapper, self.handler, self.fields,
+                    self.anonymous)
+                emitter.sparse = self.sparse
+                elements = [
+                    json.dumps(
+                        element, cls=DjangoJSONEncoder, ensure_ascii=False,
+                        indent=4)
+                    for element in emitter.construct()
+                ]
+                yield separator + ",\n".join(elements).encode("utf-8")
+                separator = b",\n"
+            yield b"\n]"
+
+
+# Piston's other emitters, for formats such as XML and YAML, get the same
+# treatment of wrapped results, though without streaming.
+for _format, (_emitter, _content_type) in list(Emitter.EMITTERS.items()):
+    if not (_format == 'json' or issubclass(_emitter, ResultEmitterMixin)):
+        Emitter.register(_format, type(
+            _emitter.__name__, (ResultEmitterMixin, _emitter), {}),
+            _content_type)
+
+Emitter.register('json', StreamingJSONEmitter, JSON_CONTENT_TYPE)
+
+
 class ModelOperationsHandlerType(OperationsHandlerType, ABCMeta):
     """Metaclass for ModelOperationsHandler"""
 
@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for maas endpoint in the API."""
@@ -24,6 +24,10 @@ from maasserver.testing.osystems import (
     patch_usable_osystems,
 )
 from maasserver.utils.django_urls import reverse
+from maasserver.websockets.statistics import (
+    record_request,
+    reset_websocket_statistics,
+)
 from maastesting.matchers import DocTestMatches
 from maastesting.testcase import MAASTestCase
 from testtools.content import text_content
@@ -305,3 +309,23 @@ class MAASHandlerAPITest(APITestCase.ForUser):
             })
         self.assertEqual(http.client.OK, response.status_code)
         self.assertTrue(Config.objects.get_config("prefer_v4_proxy"))
+
+    def test_websocket_stats(self):
+        self.become_admin()
+        reset_websocket_statistics()
+        self.addCleanup(reset_websocket_statistics)
+        record_request("machine", "list", 0.2, 5000)
+        response = self.client.get(
+            reverse('maas_handler'), {"op": "websocket_stats"})
+        self.assertEqual(
+            http.client.OK, response.status_code, response.content)
+        stats = json.loads(response.content.decode(settings.DEFAULT_CHARSET))
+        self.assertThat(stats["notifications"], Equals({}))
+        self.assertThat(
+            stats["requests"]["machine.list"]["seconds"]["count"], Equals(1))
+
+    def test_websocket_stats_requires_admin(self):
+        response = self.client.get(
+            reverse('maas_handler'), {"op": "websocket_stats"})
+        self.assertEqual(
+            http.client.FORBIDDEN, response.status_code, response.content)
@@ -1,4 +1,4 @@
-# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the Machine API."""
@@ -146,6 +146,19 @@ class TestMachineAPI(APITestCase.ForUser):
             parsed_result['fqdn'])
         self.assertEqual(machine.system_id, parsed_result['system_id'])
 
+    def test_GET_with_fields_returns_only_those_fields(self):
+        machine = factory.make_Node()
+        response = self.client.get(
+            self.get_machine_uri(machine),
+            {'fields': ['system_id', 'hostname']})
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json_load_bytes(response.content)
+        self.assertEqual({
+            'system_id': machine.system_id,
+            'hostname': machine.hostname,
+            'resource_uri': self.get_machine_uri(machine),
+        }, parsed_result)
+
     def test_GET_returns_boot_interface_object(self):
         # The api allows for fetching a single Machine (using system_id).
         machine = factory.make_Node(interface=True)
@@ -8,12 +8,17 @@ __all__ = []
 import http.client
 import json
 import random
+from unittest.mock import (
+    ANY,
+    Mock,
+)
 
 from django.conf import settings
 from django.test import RequestFactory
 from maasserver import (
     eventloop,
     middleware,
+    node_constraint_filter_forms,
 )
 from maasserver.api import machines as machines_module
 from maasserver.enum import (
@@ -348,10 +353,88 @@ class TestMachinesAPI(APITestCase.ForUser):
         # Because of fields `status_action`, `status_message`,
         # `default_gateways`, and `health_status` the number of queries is not
         # the same but it is proportional to the number of machines.
-        DEFAULT_NUM = 61
+        DEFAULT_NUM = 62
         self.assertEqual(DEFAULT_NUM + (10 * 4), num_queries1)
         self.assertEqual(DEFAULT_NUM + (20 * 4), num_queries2)
 
+    def test_GET_with_fields_returns_only_those_fields(self):
+        machine = factory.make_Node(power_state=POWER_STATE.ON)
+        response = self.client.get(
+            reverse('machines_handler'),
+            {'fields': 'system_id,hostname,status,power_state'})
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        self.assertEqual([{
+            'system_id': machine.system_id,
+            'hostname': machine.hostname,
+            'status': machine.status,
+            'power_state': POWER_STATE.ON,
+            'resource_uri': reverse(
+                'machine_handler', args=[machine.system_id]),
+        }], parsed_result)
+
+    def test_GET_with_unknown_fields_returns_only_system_id(self):
+        machine = factory.make_Node()
+        response = self.client.get(
+            reverse('machines_handler'), {'fields': 'bogus'})
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        self.assertEqual([{
+            'system_id': machine.system_id,
+            'resource_uri': reverse(
+                'machine_handler', args=[machine.system_id]),
+        }], parsed_result)
+
+    def test_GET_with_fields_issues_constant_number_of_queries(self):
+        # Patch middleware so it does not affect query counting.
+        self.patch(
+            middleware.ExternalComponentsMiddleware,
+            '_check_rack_controller_connectivity')
+        fields = {'fields': 'system_id,hostname,status,power_state'}
+
+        for _ in range(10):
+            node = factory.make_Node_with_Interface_on_Subnet()
+            factory.make_VirtualBlockDevice(node=node)
+        num_queries1, response1 = count_queries(
+            self.client.get, reverse('machines_handler'), fields)
+
+        for _ in range(10):
+            node = factory.make_Node_with_Interface_on_Subnet()
+            factory.make_VirtualBlockDevice(node=node)
+        num_queries2, response2 = count_queries(
+            self.client.get, reverse('machines_handler'), fields)
+
+        self.assertEqual(
+            [http.client.OK, http.client.OK],
+            [response1.status_code, response2.status_code])
+        self.assertEqual(num_queries1, num_queries2)
+
+    def test_GET_streams_machines_that_do_not_fit_in_one_chunk(self):
+        self.patch(machines_module.MachinesHandler, "read_chunk_size", 2)
+        machines = [factory.make_Node() for _ in range(5)]
+        response = self.client.get(reverse('machines_handler'))
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertTrue(response.streaming)
+        parsed_result = json.loads(b''.join(
+            response.streaming_content).decode(settings.DEFAULT_CHARSET))
+        self.assertSequenceEqual(
+            extract_system_ids_from_machines(machines),
+            extract_system_ids(parsed_result))
+
+    def test_GET_does_not_stream_machines_that_fit_in_one_chunk(self):
+        self.patch(machines_module.MachinesHandler, "read_chunk_size", 2)
+        machines = [factory.make_Node() for _ in range(2)]
+        response = self.client.get(reverse('machines_handler'))
+        self.assertEqual(http.client.OK, response.status_code)
+        self.assertFalse(response.streaming)
+        parsed_result = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        self.assertSequenceEqual(
+            extract_system_ids_from_machines(machines),
+            extract_system_ids(parsed_result))
+
     def test_GET_without_machines_returns_empty_list(self):
         # If there are no machines to list, the "read" op still works but
         # returns an empty list.
@@ -614,6 +697,54 @@ class TestMachinesAPI(APITestCase.ForUser):
             response.content.decode(settings.DEFAULT_CHARSET))
         self.assertEqual(machine.system_id, parsed_result['system_id'])
 
+    def test_POST_allocate_with_count_allocates_machines(self):
+        machines = [
+            factory.make_Node(
+                status=NODE_STATUS.READY, owner=None, with_boot_disk=True)
+            for _ in range(3)
+        ]
+        response = self.client.post(
+            reverse('machines_handler'), {'op': 'allocate', 'count': 2})
+        self.assertEqual(
+            http.client.OK, response.status_code, response.content)
+        parsed_result = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        system_ids = [machine['system_id'] for machine in parsed_result]
+        self.assertEqual(2, len(system_ids))
+        self.assertLessEqual(
+            set(system_ids), {machine.system_id for machine in machines})
+        self.assertItemsEqual(
+            system_ids,
+            Machine.objects.filter(owner=self.user).values_list(
+                'system_id', flat=True))
+
+    def test_POST_allocate_with_count_returns_machines_available(self):
+        machine = factory.make_Node(
+            status=NODE_STATUS.READY, owner=None, with_boot_disk=True)
+        response = self.client.post(
+            reverse('machines_handler'), {'op': 'allocate', 'count': 5})
+        self.assertEqual(
+            http.client.OK, response.status_code, response.content)
+        parsed_result = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        self.assertEqual(
+            [machine.system_id],
+            [machine['system_id'] for machine in parsed_result])
+
+    def test_POST_allocate_with_count_fails_if_no_machine_present(self):
+        response = self.client.post(
+            reverse('machines_handler'), {'op': 'allocate', 'count': 5})
+        self.assertEqual(
+            http.client.CONFLICT, response.status_code, response.content)
+
+    def test_POST_allocate_rejects_invalid_count(self):
+        factory.make_Node(
+            status=NODE_STATUS.READY, owner=None, with_boot_disk=True)
+        response = self.client.post(
+            reverse('machines_handler'), {'op': 'allocate', 'count': 0})
+        self.assertEqual(
+            http.client.BAD_REQUEST, response.status_code, response.content)
+
     def test_POST_allocate_returns_a_composed_machine_no_constraints(self):
         # The "allocate" operation returns a composed machine.
         available_status = NODE_STATUS.READY
@@ -1050,16 +1181,22 @@ class TestMachinesAPI(APITestCase.ForUser):
         machine = Machine.objects.get(system_id=machine.system_id)
         self.assertEqual(self.user, machine.owner)
 
-    def test_POST_allocate_uses_machine_acquire_lock(self):
-        # The "allocate" operation allocates the machine it returns.
+    def test_POST_allocate_locks_machine_instead_of_acquire_lock(self):
+        # The "allocate" operation locks only the machine it picks, so that
+        # concurrent allocations do not wait for each other.
         available_status = NODE_STATUS.READY
-        factory.make_Node(
+        machine = factory.make_Node(
             status=available_status, owner=None, with_boot_disk=True)
         machine_acquire = self.patch(machines_module.locks, 'node_acquire')
-        self.client.post(reverse('machines_handler'), {'op': 'allocate'})
-        self.assertThat(machine_acquire.__enter__, MockCalledOnceWith())
-        self.assertThat(
-            machine_acquire.__exit__, MockCalledOnceWith(None, None, None))
+        lock_first_available = self.patch(
+            Machine.objects, 'lock_first_available')
+        lock_first_available.return_value = machine
+        response = self.client.post(
+            reverse('machines_handler'), {'op': 'allocate'})
+        self.assertEqual(
+            http.client.OK, response.status_code, response.content)
+        self.assertThat(lock_first_available, MockCalledOnceWith(ANY))
+        self.assertThat(machine_acquire.__enter__, MockNotCalled())
 
     def test_POST_allocate_sets_agent_name(self):
         available_status = NODE_STATUS.READY
@@ -1476,6 +1613,32 @@ class TestMachinesAPI(APITestCase.ForUser):
         self.expectThat(constraints['storage']['needed'], Contains(device_id))
         self.expectThat(constraints, Not(Contains('verbose_storage')))
 
+    def test_POST_allocate_gets_storage_of_allocated_machine_only(self):
+        machines = [
+            factory.make_Node(status=NODE_STATUS.READY, with_boot_disk=False)
+            for _ in range(3)
+        ]
+        for machine in machines:
+            factory.make_PhysicalBlockDevice(
+                node=machine, size=11 * (1000 ** 3), formatted_root=True)
+        nodes_by_storage = self.patch(
+            node_constraint_filter_forms, "nodes_by_storage",
+            Mock(wraps=node_constraint_filter_forms.nodes_by_storage))
+        response = self.client.post(reverse('machines_handler'), {
+            'op': 'allocate',
+            'storage': 'needed:10',
+        })
+        self.assertThat(response, HasStatusCode(http.client.OK))
+        response_json = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        machine = Machine.objects.get(system_id=response_json['system_id'])
+        device_id = response_json['physicalblockdevice_set'][0]['id']
+        constraints = response_json['constraints_by_type']
+        self.expectThat(constraints['storage']['needed'], Contains(device_id))
+        self.assertThat(
+            nodes_by_storage,
+            MockCalledOnceWith('needed:10', node_ids=[machine.id]))
+
     def test_POST_allocate_allocates_machine_by_storage_with_verbose(self):
         """Storage label is returned alongside machine data"""
         machine = factory.make_Node(
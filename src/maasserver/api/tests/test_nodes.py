@@ -1,4 +1,4 @@
-# Copyright 2013-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2013-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for the nodes API."""
@@ -25,6 +25,7 @@ from maasserver.testing.factory import factory
 from maasserver.utils import ignore_unused
 from maasserver.utils.django_urls import reverse
 from maasserver.utils.orm import reload_object
+from maastesting.testcase import MAASTestCase
 
 
 class TestIsRegisteredAPI(APITestCase.ForAnonymousAndUserAndAdmin):
@@ -132,6 +133,50 @@ class RequestFixture:
         self.GET = get_overridden_query_dict(dict, QueryDict(''), fields)
 
 
+class TestGetRequestedFields(MAASTestCase):
+
+    def test_returns_None_without_fields(self):
+        request = RequestFixture({}, 'fields')
+        self.assertIsNone(nodes_module.get_requested_fields(request))
+
+    def test_returns_fields_given_separately_or_comma_separated(self):
+        request = RequestFixture(
+            {'fields': ['system_id', 'hostname, status,']}, 'fields')
+        self.assertEqual(
+            ['system_id', 'hostname', 'status'],
+            nodes_module.get_requested_fields(request))
+
+    def test_always_includes_system_id(self):
+        request = RequestFixture({'fields': ['hostname']}, 'fields')
+        self.assertEqual(
+            ['system_id', 'hostname'],
+            nodes_module.get_requested_fields(request))
+
+
+class TestGetNodesPrefetch(MAASTestCase):
+
+    def test_returns_all_prefetches_without_fields(self):
+        self.assertEqual(
+            nodes_module.NODES_PREFETCH, nodes_module.get_nodes_prefetch())
+
+    def test_returns_no_prefetches_for_plain_fields(self):
+        self.assertEqual(
+            [], nodes_module.get_nodes_prefetch(
+                ['system_id', 'hostname', 'status', 'power_state']))
+
+    def test_returns_prefetches_of_relations_used_by_fields(self):
+        self.assertEqual(
+            ['ownerdata_set', 'tags'],
+            nodes_module.get_nodes_prefetch(['tag_names', 'owner_data']))
+
+    def test_returns_prefetch_objects_of_relations_used_by_fields(self):
+        prefetches = nodes_module.get_nodes_prefetch(['boot_disk'])
+        self.assertNotEqual([], prefetches)
+        self.assertTrue(all(
+            prefetch.prefetch_through.startswith('blockdevice_set__')
+            for prefetch in prefetches))
+
+
 class TestFilteredNodesListFromRequest(APITestCase.ForUser):
 
     def test_node_list_with_id_returns_matching_nodes(self):
@@ -355,6 +400,37 @@ class TestNodesAPI(APITestCase.ForUser):
         self.assertEqual(http.client.OK, response.status_code)
         self.assertItemsEqual(system_ids, extract_system_ids(parsed_result))
 
+    def test_GET_with_fields_returns_only_those_fields(self):
+        factory.make_Node()
+        factory.make_Device(owner=self.user)
+        response = self.client.get(
+            reverse('nodes_handler'),
+            {'fields': ['system_id', 'hostname', 'power_state']})
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        # Devices have no power state, so it is left out for them.
+        self.assertItemsEqual(
+            [
+                {'system_id', 'hostname', 'power_state', 'resource_uri'},
+                {'system_id', 'hostname', 'resource_uri'},
+            ],
+            [set(node) for node in parsed_result])
+
+    def test_GET_with_fields_no_node_has_returns_only_system_ids(self):
+        # Nodes are never emitted with every column of the model, which
+        # would include the owner's token.
+        factory.make_Node(owner=self.user)
+        factory.make_Device(owner=self.user)
+        response = self.client.get(
+            reverse('nodes_handler'), {'fields': 'bogus'})
+        self.assertEqual(http.client.OK, response.status_code)
+        parsed_result = json.loads(
+            response.content.decode(settings.DEFAULT_CHARSET))
+        self.assertItemsEqual(
+            [{'system_id', 'resource_uri'}, {'system_id', 'resource_uri'}],
+            [set(node) for node in parsed_result])
+
     def test_GET_without_nodes_returns_empty_list(self):
         # If there are no nodes to list, the "list" op still works but
         # returns an empty list.
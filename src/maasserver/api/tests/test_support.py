@@ -1,4 +1,4 @@
-# Copyright 2013-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2013-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for API helpers."""
@@ -16,13 +16,17 @@ from unittest.mock import (
 
 from django.core.exceptions import PermissionDenied
 from maasserver.api.doc import get_api_description_hash
+from maasserver.api.machines import MachinesHandler
 from maasserver.api.support import (
     admin_method,
     AdminRestrictedResource,
     OperationsHandlerMixin,
     OperationsResource,
     RestrictedResource,
+    SparseHandler,
+    StreamedQuerySet,
 )
+from maasserver.models import Node
 from maasserver.models.config import (
     Config,
     ConfigManager,
@@ -191,3 +195,94 @@ class TestOperationsHandlerMixin(MAASTestCase):
         handler.decorate(lambda thing: str(thing).upper())
         self.assertEqual({"foo": "SENTINEL.FOO"}, handler.exports)
         self.assertEqual({"bar": "SENTINEL.BAR"}, handler.anonymous.exports)
+
+
+class TestSparseHandler(MAASTestCase):
+
+    def make_handler(self, fields, **attributes):
+        return type("Handler", (), dict(attributes, fields=fields))
+
+    def test_keeps_only_named_fields(self):
+        handler = self.make_handler(('a', ('b', ('x', 'y')), 'c'))
+        sparse = SparseHandler(handler, {'b', 'c', 'd'})
+        self.assertThat(sparse.fields, Equals((('b', ('x', 'y')), 'c')))
+
+    def test_delegates_to_handler(self):
+        handler = self.make_handler(('a',), exclude=sentinel.exclude)
+        sparse = SparseHandler(handler, {'a'})
+        self.assertThat(sparse.exclude, Is(sentinel.exclude))
+
+    def test_rejects_names_of_no_fields(self):
+        # Piston would emit every column of the model instead.
+        handler = self.make_handler(('a', 'b'))
+        self.assertRaises(ValueError, SparseHandler, handler, {'c'})
+
+
+class TestStreamedQuerySet(MAASServerTestCase):
+
+    def test_chunks_yields_objects_in_chunks(self):
+        nodes = [factory.make_Node() for _ in range(5)]
+        streamed = StreamedQuerySet(Node.objects.order_by('id'), chunk_size=2)
+        self.assertThat(
+            [list(chunk) for chunk in streamed.chunks()],
+            Equals([nodes[0:2], nodes[2:4], nodes[4:]]))
+
+    def test_chunks_prefetches_each_chunk(self):
+        for _ in range(3):
+            factory.make_Node_with_Interface_on_Subnet()
+        streamed = StreamedQuerySet(
+            Node.objects.prefetch_related('interface_set'), chunk_size=2)
+        for chunk in streamed.chunks():
+            for node in chunk:
+                self.assertIn('interface_set', node._prefetched_objects_cache)
+
+    def test_chunks_passes_each_chunk_to_prepare(self):
+        for _ in range(3):
+            factory.make_Node()
+        prepare = Mock()
+        streamed = StreamedQuerySet(
+            Node.objects.order_by('id'), prepare=prepare, chunk_size=2)
+        chunks = list(streamed.chunks())
+        self.assertThat(
+            prepare.call_args_list, Equals([call(chunk) for chunk in chunks]))
+
+
+class TestStreamingJSONEmitter(APITestCase.ForUser):
+
+    def test_streams_results_that_do_not_fit_in_one_chunk(self):
+        self.patch(MachinesHandler, "read_chunk_size", 2)
+        for _ in range(3):
+            factory.make_Node()
+        response = self.client.get(reverse('machines_handler'))
+        self.assertThat(response.status_code, Equals(http.client.OK))
+        self.assertThat(response.streaming, Is(True))
+        self.assertThat(
+            response["Content-Type"],
+            Equals("application/json; charset=utf-8"))
+        self.assertIn("X-MAAS-API-Hash", response)
+
+    def test_other_formats_emit_plain_data(self):
+        self.patch(MachinesHandler, "read_chunk_size", 2)
+        machines = [factory.make_Node() for _ in range(3)]
+        response = self.client.get(
+            reverse('machines_handler'),
+            {'format': 'xml', 'fields': 'hostname'})
+        self.assertThat(response.status_code, Equals(http.client.OK))
+        self.assertThat(response.streaming, Is(False))
+        self.assertNotIn(b"StreamedQuerySet", response.content)
+        self.assertNotIn(b"SparseFields", response.content)
+        for machine in machines:
+            self.assertIn(
+                ("<hostname>%s</hostname>" % machine.hostname).encode(),
+                response.content)
+        self.assertNotIn(b"<power_state>", response.content)
+
+    def test_does_not_stream_jsonp(self):
+        self.patch(MachinesHandler, "read_chunk_size", 2)
+        for _ in range(3):
+            factory.make_Node()
+        response = self.client.get(
+            reverse('machines_handler'), {'callback': 'cb'})
+        self.assertThat(response.status_code, Equals(http.client.OK))
+        self.assertThat(response.streaming, Is(False))
+        self.assertTrue(response.content.startswith(b'cb('))
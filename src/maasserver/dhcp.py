@@ -12,8 +12,10 @@ from collections import (
     defaultdict,
     namedtuple,
 )
+import copy
 from itertools import groupby
 from operator import itemgetter
+import threading
 from typing import (
     Iterable,
     Optional,
@@ -488,18 +490,29 @@ def get_ntp_servers(ntp_servers, subnet, peer_rack):
         return ntp_servers
 
 
-@typed
-def get_dhcp_configure_for(
-        ip_version: int, rack_controller, vlan, subnets: list,
-        ntp_servers: Union[list, dict], domain, search_list=None,
-        dhcp_snippets: Iterable=None):
-    """Get the DHCP configuration for `ip_version`."""
+def get_maas_dns_servers(rack_controller, ip_version):
+    """Return the MAAS DNS servers to advertise for `ip_version`, or `None`
+    if they cannot be resolved."""
     try:
-        maas_dns_servers = get_dns_server_addresses(
+        return get_dns_server_addresses(
             rack_controller, ipv4=(ip_version == 4), ipv6=(ip_version == 6),
             include_alternates=True)
     except UnresolvableHost:
-        maas_dns_servers = None
+        return None
+
+
+@typed
+def get_dhcp_configure_for(
+        ip_version: int, rack_controller, vlan, subnets: list,
+        ntp_servers: Union[list, dict], domain, search_list=None,
+        dhcp_snippets: Iterable=None, maas_dns_servers=None):
+    """Get the DHCP configuration for `ip_version`.
+
+    :param maas_dns_servers: The MAAS DNS servers to advertise, as returned
+        by `get_maas_dns_servers`. These are looked up when not given.
+    """
+    if maas_dns_servers is None:
+        maas_dns_servers = get_maas_dns_servers(rack_controller, ip_version)
 
     # Select the best interface for this VLAN. This is an interface that
     # at least has an IP address.
@@ -542,11 +555,107 @@ def get_dhcp_configure_for(
         hosts, None if interface is None else interface.name)
 
 
+class DHCPConfigurationCache:
+    """Cache of the DHCP configuration for each VLAN on each rack controller.
+
+    Entries are keyed by rack controller, VLAN, and IP version, and hold the
+    output of `get_dhcp_configure_for`. They are dropped when the database
+    notifies the region that a VLAN's configuration has changed; see
+    `RackControllerService.dhcpHandler`. Only rack controllers that this
+    process is watching -- and hence receiving notifications for -- have
+    their configuration cached.
+
+    Each entry also records the context it was generated in, such as NTP and
+    DNS servers, which are not tied to any VLAN. An entry is used only when
+    that context has not changed.
+    """
+
+    def __init__(self):
+        super(DHCPConfigurationCache, self).__init__()
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generations = {}
+
+    def watch(self, rack_id):
+        """Start caching configuration for `rack_id`."""
+        with self._lock:
+            self._entries[rack_id] = {}
+            self._generations[rack_id] = (
+                self._generations.get(rack_id, 0) + 1)
+
+    def unwatch(self, rack_id):
+        """Stop caching configuration for `rack_id`."""
+        with self._lock:
+            self._entries.pop(rack_id, None)
+            self._generations.pop(rack_id, None)
+
+    def invalidate(self, rack_id, vlan_id=None):
+        """Drop the cached configuration for `vlan_id` on `rack_id`.
+
+        :param vlan_id: The VLAN whose configuration has changed, or `None`
+            to drop all configuration for `rack_id`.
+        """
+        with self._lock:
+            entries = self._entries.get(rack_id)
+            if entries is not None:
+                self._generations[rack_id] += 1
+                if vlan_id is None:
+                    entries.clear()
+                else:
+                    for key in [key for key in entries if key[0] == vlan_id]:
+                        del entries[key]
+
+    def get_generation(self, rack_id):
+        """Return the current generation of the cache for `rack_id`.
+
+        This changes with every invalidation. It is `None` when `rack_id` is
+        not being cached.
+        """
+        with self._lock:
+            return self._generations.get(rack_id)
+
+    def get(self, rack_id, vlan_id, ip_version, context):
+        """Return the cached configuration, or `None` if there is none for
+        `context`."""
+        with self._lock:
+            entries = self._entries.get(rack_id, {})
+            entry = entries.get((vlan_id, ip_version))
+        if entry is None or entry[0] != context:
+            return None
+        else:
+            # Callers are free to mutate the configuration.
+            return copy.deepcopy(entry[1])
+
+    def put(self, rack_id, generation, vlan_id, ip_version, context, config):
+        """Cache `config`, unless the cache for `rack_id` has been
+        invalidated since `generation` was obtained."""
+        with self._lock:
+            if generation is None:
+                return
+            elif self._generations.get(rack_id) != generation:
+                return
+            else:
+                self._entries[rack_id][vlan_id, ip_version] = (
+                    context, copy.deepcopy(config))
+
+
+dhcp_configuration_cache = DHCPConfigurationCache()
+
+
 @synchronous
 @transactional
-def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
+def get_dhcp_configuration(
+        rack_controller, test_dhcp_snippet=None, cache_generation=None):
     """Return tuple with IPv4 and IPv6 configurations for the
-    rack controller."""
+    rack controller.
+
+    :param cache_generation: The generation of `dhcp_configuration_cache`
+        for `rack_controller`, read before this transaction began. Cached
+        configuration is used, and newly generated configuration cached,
+        only when this is given. If it were read once this transaction had
+        taken its snapshot, an invalidation committed in between would be
+        missed and stale configuration cached under the new generation.
+    """
     # Get list of all vlans that are being managed by the rack controller.
     vlans = gen_managed_vlans_for(rack_controller)
 
@@ -606,13 +715,46 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
         for name in sorted(get_dns_search_paths())
         if name != default_domain.name
     ]
+    maas_dns_servers = {
+        4: get_maas_dns_servers(rack_controller, 4),
+        6: get_maas_dns_servers(rack_controller, 6),
+    }
+
+    # Configuration is not cached when testing a DHCP snippet.
+    if test_dhcp_snippet is not None:
+        cache_generation = None
+    snippets_in_use = sorted(
+        (dhcp_snippet.id, dhcp_snippet.value_id, dhcp_snippet.subnet_id,
+         dhcp_snippet.node_id)
+        for dhcp_snippet in dhcp_snippets
+        if dhcp_snippet.subnet_id is not None or
+        dhcp_snippet.node_id is not None)
+
+    def get_configure_for(ip_version, vlan, subnets):
+        context = (
+            vlan.mtu, vlan.space_id, vlan.primary_rack_id,
+            vlan.secondary_rack_id, [subnet.id for subnet in subnets],
+            maas_dns_servers[ip_version], ntp_servers, default_domain.name,
+            search_list, snippets_in_use)
+        if cache_generation is not None:
+            config = dhcp_configuration_cache.get(
+                rack_controller.id, vlan.id, ip_version, context)
+            if config is not None:
+                return config
+        config = get_dhcp_configure_for(
+            ip_version, rack_controller, vlan, subnets, ntp_servers,
+            default_domain, search_list=search_list,
+            dhcp_snippets=dhcp_snippets,
+            maas_dns_servers=maas_dns_servers[ip_version])
+        dhcp_configuration_cache.put(
+            rack_controller.id, cache_generation, vlan.id, ip_version,
+            context, config)
+        return config
+
     for vlan, (subnets_v4, subnets_v6) in vlan_subnets.items():
         # IPv4
         if len(subnets_v4) > 0:
-            config = get_dhcp_configure_for(
-                4, rack_controller, vlan, subnets_v4, ntp_servers,
-                default_domain, search_list=search_list,
-                dhcp_snippets=dhcp_snippets)
+            config = get_configure_for(4, vlan, subnets_v4)
             failover_peer, subnets, hosts, interface = config
             if failover_peer is not None:
                 failover_peers_v4.append(failover_peer)
@@ -626,10 +768,7 @@ def get_dhcp_configuration(rack_controller, test_dhcp_snippet=None):
                 interfaces_v4.add(interface)
         # IPv6
         if len(subnets_v6) > 0:
-            config = get_dhcp_configure_for(
-                6, rack_controller, vlan, subnets_v6,
-                ntp_servers, default_domain, search_list=search_list,
-                dhcp_snippets=dhcp_snippets)
+            config = get_configure_for(6, vlan, subnets_v6)
             failover_peer, subnets, hosts, interface = config
             if failover_peer is not None:
                 failover_peers_v6.append(failover_peer)
@@ -678,8 +817,13 @@ def configure_dhcp(rack_controller):
     # exception, meaning we can avoid some work if it fails.
     client = yield getClientFor(rack_controller.system_id)
 
-    # Get configuration for both IPv4 and IPv6.
-    config = yield deferToDatabase(get_dhcp_configuration, rack_controller)
+    # Get configuration for both IPv4 and IPv6. The cache generation must be
+    # read before the transaction that generates the configuration starts.
+    cache_generation = dhcp_configuration_cache.get_generation(
+        rack_controller.id)
+    config = yield deferToDatabase(
+        get_dhcp_configuration, rack_controller,
+        cache_generation=cache_generation)
 
     # Fix interfaces to go over the wire.
     interfaces_v4 = [
@@ -6,6 +6,8 @@
 __all__ = [
     'dns_force_reload',
     'dns_update_all_zones',
+    'dns_update_zones',
+    'get_dynamic_dns_updates',
     ]
 
 from django.conf import settings
@@ -15,13 +17,23 @@ from maasserver.models.config import Config
 from maasserver.models.dnspublication import DNSPublication
 from maasserver.models.domain import Domain
 from maasserver.models.subnet import Subnet
+from netaddr import (
+    IPAddress,
+    IPNetwork,
+)
 from provisioningserver.dns.actions import (
+    bind_freeze_zones,
     bind_reload,
+    bind_reload_changed_zones,
     bind_reload_with_retries,
+    bind_reload_zones,
+    bind_thaw_zones,
     bind_write_configuration,
     bind_write_options,
     bind_write_zones,
 )
+from provisioningserver.dns.config import DynamicDNSUpdate
+from provisioningserver.dns.zoneconfig import DNSReverseZoneConfig
 from provisioningserver.logger import get_maas_logger
 
 
@@ -37,6 +49,11 @@ def is_dns_enabled():
     return settings.DNS_CONNECT
 
 
+def is_dns_dynamic_updates_enabled():
+    """Are records sent to the DNS server as dynamic updates?"""
+    return Config.objects.get_config('dns_dynamic_updates')
+
+
 def dns_force_reload():
     """Force the DNS to be regenerated."""
     DNSPublication(source="Force reload").save()
@@ -59,10 +76,15 @@ def dns_update_all_zones(reload_retry=False):
     subnets = Subnet.objects.exclude(rdns_mode=RDNS_MODE.DISABLED)
     default_ttl = Config.objects.get_config('default_dns_ttl')
     serial = current_zone_serial()
+    dynamic_updates = is_dns_dynamic_updates_enabled()
     zones = ZoneGenerator(
         domains, subnets, default_ttl,
         serial).as_list()
-    bind_write_zones(zones)
+    # Dynamic updates held in BIND's journals must be written out, and no
+    # more accepted, before the zone files are replaced.
+    if dynamic_updates:
+        bind_freeze_zones()
+    changed_zone_names = bind_write_zones(zones)
 
     # We should not be calling bind_write_options() here; call-sites should be
     # making a separate call. It's a historical legacy, where many sites now
@@ -77,7 +99,9 @@ def dns_update_all_zones(reload_retry=False):
     # recursive queries to the upstream DNS servers. Again, this is legacy,
     # where the "trusted" ACL ended up in the same configuration file as the
     # zone stanzas, and so both need to be rewritten at the same time.
-    bind_write_configuration(zones, trusted_networks=get_trusted_networks())
+    bind_write_configuration(
+        zones, trusted_networks=get_trusted_networks(),
+        dynamic_updates=dynamic_updates)
 
     # Reloading with retries may be a legacy from Celery days, or it may be
     # necessary to recover from races during start-up. We're not sure if it is
@@ -85,14 +109,131 @@ def dns_update_all_zones(reload_retry=False):
     # have a better understanding.
     if reload_retry:
         bind_reload_with_retries()
-    else:
+    elif dynamic_updates:
         bind_reload()
+    else:
+        # Zones whose records did not change were not rewritten, so there's
+        # no need for BIND to look at them again.
+        bind_reload_changed_zones(changed_zone_names)
+    if dynamic_updates:
+        bind_thaw_zones()
+
+    # Return the current serial and list of domain names. Zones that were
+    # not rewritten still have an older serial, so only the domains whose
+    # zones were written can be expected to be served with this one.
+    return serial, [
+        domain.name
+        for domain in domains
+        if domain.name in changed_zone_names
+    ]
+
+
+def dns_update_zones(domain_ids, subnet_ids):
+    """Update the zone files for only the given domains and subnets.
+
+    Only the forward zones for the authoritative domains in `domain_ids`, and
+    the reverse zones for the subnets in `subnet_ids`, are rewritten; BIND is
+    then asked to reload just those zones, or to freeze and thaw them when
+    they accept dynamic updates. BIND's configuration is left alone,
+    so this must only be used when the set of zones being served is unchanged.
+    Use `dns_update_all_zones` for anything else.
+
+    :param domain_ids: The ids of the domains whose zones have changed.
+    :param subnet_ids: The ids of the subnets whose reverse zones have
+        changed.
+    :return: The current serial and list of the names of the domains
+        whose zones were rewritten.
+    """
+    if not is_dns_enabled():
+        return
 
-    # Return the current serial and list of domain names.
+    domains = Domain.objects.filter(authoritative=True, id__in=domain_ids)
+    rdns_subnets = Subnet.objects.exclude(rdns_mode=RDNS_MODE.DISABLED)
+    subnets = rdns_subnets.filter(id__in=subnet_ids)
+    default_ttl = Config.objects.get_config('default_dns_ttl')
+    serial = current_zone_serial()
+    # All the subnets are needed to work out the RFC2317 glue that belongs in
+    # the reverse zones of the updated subnets.
+    zones = ZoneGenerator(
+        domains, subnets, default_ttl, serial,
+        glue_subnets=rdns_subnets).as_list()
+    zone_names = [
+        zone_info.zone_name
+        for zone in zones
+        for zone_info in zone.zone_info
+    ]
+    if is_dns_dynamic_updates_enabled():
+        bind_freeze_zones(zone_names)
+        changed_zone_names = bind_write_zones(zones)
+        bind_thaw_zones(zone_names)
+    else:
+        # Only zones whose records changed are rewritten, and only those
+        # need to be reloaded.
+        changed_zone_names = bind_write_zones(zones)
+        if len(changed_zone_names) > 0:
+            bind_reload_zones(changed_zone_names)
+
+    # Return the current serial and list of the domain names whose zones
+    # were written; the others are still served with an older serial.
     return serial, [
         domain.name
         for domain in domains
+        if domain.name in changed_zone_names
+    ]
+
+
+def _get_reverse_zone_name(network, address):
+    """Return the name of the reverse zone of `network` holding `address`.
+
+    Returns `None` when the zone boundaries do not fall on a label boundary,
+    i.e. when the reverse zone depends on RFC2317 glue.
+    """
+    if network.version == 4:
+        label_bits, max_prefixlen = 8, 32
+    else:
+        label_bits, max_prefixlen = 4, 128
+    if (network.prefixlen % label_bits != 0 or
+            network.prefixlen == max_prefixlen):
+        return None
+    for zone_info in DNSReverseZoneConfig.compose_zone_info(network):
+        if address in zone_info.subnetwork:
+            return zone_info.zone_name
+    return None
+
+
+def get_dynamic_dns_updates(update):
+    """Return the dynamic DNS updates for a `sys_dns_updates` message.
+
+    :param update: The decoded message, as sent by `sys_dns_dynamic_update`.
+    :return: A tuple of the list of :py:class:`DynamicDNSUpdate` to send, and
+        the set of ids of the subnets whose reverse zones cannot be updated
+        dynamically and must be rewritten instead.
+    """
+    operation = update["operation"]
+    address = IPAddress(update["address"])
+    if update["name"] == "@":
+        fqdn = update["zone"]
+    else:
+        fqdn = "%s.%s" % (update["name"], update["zone"])
+    rrtype = "A" if address.version == 4 else "AAAA"
+    updates = [
+        DynamicDNSUpdate(
+            operation, update["zone"], fqdn, rrtype,
+            update["ttl"], str(address)),
     ]
+    reverse_zones = {
+        int(subnet_id): _get_reverse_zone_name(IPNetwork(cidr), address)
+        for subnet_id, cidr in update["subnets"].items()
+    }
+    if None in reverse_zones.values():
+        # The address is covered by RFC2317 glue, which a PTR record cannot
+        # be added alongside, so leave all its reverse zones to be rewritten.
+        return updates, set(reverse_zones)
+    for zone_name in sorted(set(reverse_zones.values())):
+        updates.append(DynamicDNSUpdate(
+            operation, zone_name, address.reverse_dns.rstrip("."), "PTR",
+            update["ttl"], "%s." % fqdn))
+    return updates, set()
 
 
 def get_upstream_dns():
@@ -17,6 +17,8 @@ from maasserver.dns.config import (
     current_zone_serial,
     dns_force_reload,
     dns_update_all_zones,
+    dns_update_zones,
+    get_dynamic_dns_updates,
     get_trusted_networks,
     get_upstream_dns,
 )
@@ -33,11 +35,15 @@ from maasserver.models.dnspublication import DNSPublication
 from maasserver.testing.config import RegionConfigurationFixture
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from netaddr import IPAddress
 from provisioningserver.dns.config import (
     compose_config_path,
     DNSConfig,
+    DynamicDNSUpdate,
 )
 from provisioningserver.dns.testing import (
     patch_dns_config_path,
@@ -53,8 +59,10 @@ from testtools.matchers import (
     Contains,
     Equals,
     FileContains,
+    MatchesAll,
     MatchesSetwise,
     MatchesStructure,
+    Not,
 )
 
 
@@ -321,6 +329,109 @@ class TestDNSConfigModifications(TestDNSServer):
             for domain in Domain.objects.filter(authoritative=True)
         ]))
 
+    def test_dns_update_all_zones_reloads_only_changed_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        dns_update_all_zones()
+        bind_reload_changed_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_changed_zones")
+        self.create_node_with_static_ip(domain=domain)
+        dns_update_all_zones()
+        default_domain = Domain.objects.get_default_domain()
+        self.assertThat(
+            bind_reload_changed_zones, MockCalledOnceWith(MatchesAll(
+                Contains(domain.name),
+                Not(Contains(default_domain.name)))))
+
+    def test_dns_update_all_zones_returns_only_domains_of_changed_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        dns_update_all_zones()
+        self.create_node_with_static_ip(domain=domain)
+        serial, domains = dns_update_all_zones()
+        self.assertEqual([domain.name], domains)
+        # Nothing changed, so no domain gets the new serial.
+        serial, domains = dns_update_all_zones()
+        self.assertEqual([], domains)
+
+    def test_dns_update_zones_loads_changed_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        dns_update_all_zones()
+        node, static = self.create_node_with_static_ip()
+        dns_update_zones([node.domain.id], [static.subnet.id])
+        self.assertDNSMatches(node.hostname, node.domain.name, static.ip)
+
+    def test_dns_update_zones_reloads_only_changed_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        other_domain = factory.make_Domain()
+        bind_reload = self.patch_autospec(dns_config_module, "bind_reload")
+        bind_reload_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_zones")
+        dns_update_zones([domain.id, other_domain.id], [])
+        self.assertThat(bind_reload, MockNotCalled())
+        self.assertThat(
+            bind_reload_zones, MockCalledOnceWith(MatchesSetwise(
+                Equals(domain.name), Equals(other_domain.name))))
+
+    def test_dns_update_zones_skips_non_authoritative_domains(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain(authoritative=False)
+        bind_reload_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_zones")
+        serial, domains = dns_update_zones([domain.id], [])
+        self.assertEqual([], domains)
+        self.assertThat(bind_reload_zones, MockNotCalled())
+
+    def test_dns_update_zones_skips_unchanged_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        dns_update_zones([domain.id], [])
+        bind_reload_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_zones")
+        self.patch(
+            dns_config_module, "current_zone_serial").return_value = (
+                random.randint(1, 1000))
+        dns_update_zones([domain.id], [])
+        self.assertThat(bind_reload_zones, MockNotCalled())
+
+    def test_dns_update_zones_returns_only_domains_of_changed_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        domain = factory.make_Domain()
+        other_domain = factory.make_Domain()
+        dns_update_zones([domain.id], [])
+        serial, domains = dns_update_zones([domain.id, other_domain.id], [])
+        self.assertEqual([other_domain.name], domains)
+
+    def test_dns_update_zones_freezes_and_thaws_dynamic_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        Config.objects.set_config('dns_dynamic_updates', True)
+        domain = factory.make_Domain()
+        bind_reload_zones = self.patch_autospec(
+            dns_config_module, "bind_reload_zones")
+        bind_freeze_zones = self.patch_autospec(
+            dns_config_module, "bind_freeze_zones")
+        bind_thaw_zones = self.patch_autospec(
+            dns_config_module, "bind_thaw_zones")
+        dns_update_zones([domain.id], [])
+        self.assertThat(bind_reload_zones, MockNotCalled())
+        self.assertThat(bind_freeze_zones, MockCalledOnceWith([domain.name]))
+        self.assertThat(bind_thaw_zones, MockCalledOnceWith([domain.name]))
+
+    def test_dns_update_all_zones_freezes_and_thaws_dynamic_zones(self):
+        self.patch(settings, 'DNS_CONNECT', True)
+        Config.objects.set_config('dns_dynamic_updates', True)
+        bind_freeze_zones = self.patch_autospec(
+            dns_config_module, "bind_freeze_zones")
+        bind_thaw_zones = self.patch_autospec(
+            dns_config_module, "bind_thaw_zones")
+        dns_update_all_zones()
+        self.assertThat(bind_freeze_zones, MockCalledOnceWith())
+        self.assertThat(bind_thaw_zones, MockCalledOnceWith())
+        self.assertThat(
+            compose_config_path(DNSConfig.target_file_name),
+            FileContains(matcher=Contains("allow-update")))
+
 
 class TestDNSDynamicIPAddresses(TestDNSServer):
     """Allocated nodes with IP addresses in the dynamic range get a DNS
@@ -375,6 +486,66 @@ class TestIPv6DNS(TestDNSServer):
             node.hostname, node.domain.name, static.ip, version=6)
 
 
+class TestGetDynamicDNSUpdates(MAASServerTestCase):
+    """Test for maasserver/dns/config.py:get_dynamic_dns_updates()"""
+
+    def make_update(self, **kwargs):
+        update = {
+            "operation": "INSERT",
+            "zone": "example.com",
+            "name": "foo",
+            "address": "10.0.0.1",
+            "ttl": 30,
+            "subnets": {},
+        }
+        update.update(kwargs)
+        return update
+
+    def test__returns_address_record(self):
+        self.assertEqual(([
+            DynamicDNSUpdate(
+                "INSERT", "example.com", "foo.example.com", "A", 30,
+                "10.0.0.1"),
+        ], set()), get_dynamic_dns_updates(self.make_update()))
+
+    def test__returns_ipv6_address_record_for_apex(self):
+        update = self.make_update(
+            operation="DELETE", name="@", address="2001:db8::1")
+        self.assertEqual(([
+            DynamicDNSUpdate(
+                "DELETE", "example.com", "example.com", "AAAA", 30,
+                "2001:db8::1"),
+        ], set()), get_dynamic_dns_updates(update))
+
+    def test__returns_ptr_records(self):
+        update = self.make_update(subnets={
+            "1": "10.0.0.0/24", "2": "10.0.0.0/16"})
+        updates, subnet_ids = get_dynamic_dns_updates(update)
+        self.assertEqual(set(), subnet_ids)
+        self.assertEqual([
+            DynamicDNSUpdate(
+                "INSERT", "example.com", "foo.example.com", "A", 30,
+                "10.0.0.1"),
+            DynamicDNSUpdate(
+                "INSERT", "0.0.10.in-addr.arpa", "1.0.0.10.in-addr.arpa",
+                "PTR", 30, "foo.example.com."),
+            DynamicDNSUpdate(
+                "INSERT", "0.10.in-addr.arpa", "1.0.0.10.in-addr.arpa",
+                "PTR", 30, "foo.example.com."),
+        ], updates)
+
+    def test__returns_subnets_needing_rfc2317_glue(self):
+        update = self.make_update(subnets={
+            "1": "10.0.0.0/24", "2": "10.0.0.0/26"})
+        updates, subnet_ids = get_dynamic_dns_updates(update)
+        self.assertEqual({1, 2}, subnet_ids)
+        self.assertEqual([
+            DynamicDNSUpdate(
+                "INSERT", "example.com", "foo.example.com", "A", 30,
+                "10.0.0.1"),
+        ], updates)
+
+
 class TestGetUpstreamDNS(MAASServerTestCase):
     """Test for maasserver/dns/config.py:get_upstream_dns()"""
 
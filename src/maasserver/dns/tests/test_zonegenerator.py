@@ -457,8 +457,8 @@ class TestZoneGenerator(MAASServerTestCase):
             '%s.%s' % (interfaces[0].name, node.fqdn): HostnameIPMapping(
                 node.system_id, default_ttl,
                 {'%s' % sip.ip}, node.node_type)},
-            zones[1]._mapping)
-        self.assertEqual({}, zones[2]._mapping)
+            zones[1]._mapping.mapping)
+        self.assertEqual({}, zones[2]._mapping.mapping)
 
     def rfc2317_network(self, network):
         """Returns the network that rfc2317 glue goes in, if any."""
@@ -502,6 +502,28 @@ class TestZoneGenerator(MAASServerTestCase):
         self.assertEqual(set(), zones[1]._rfc2317_ranges)
         self.assertEqual({net}, zones[2]._rfc2317_ranges)
 
+    def test_glue_subnets_supply_rfc2317_glue_for_supernet(self):
+        domain = Domain.objects.get_default_domain()
+        subnet1 = factory.make_Subnet(
+            cidr="10.0.0.0/29", rdns_mode=RDNS_MODE.RFC2317)
+        subnet2 = factory.make_Subnet(cidr="10.0.0.0/24")
+        zones = ZoneGenerator(
+            (), [subnet2], serial=random.randint(0, 65535),
+            glue_subnets=[subnet1, subnet2]).as_list()
+        self.assertThat(
+            zones, MatchesSetwise(reverse_zone(domain.name, subnet2.cidr)))
+        self.assertEqual({IPNetwork("10.0.0.0/29")}, zones[0]._rfc2317_ranges)
+
+    def test_glue_subnets_omits_glue_only_zones(self):
+        domain = Domain.objects.get_default_domain()
+        subnet = factory.make_Subnet(
+            cidr="10.0.0.0/29", rdns_mode=RDNS_MODE.RFC2317)
+        zones = ZoneGenerator(
+            (), [subnet], serial=random.randint(0, 65535),
+            glue_subnets=[subnet]).as_list()
+        self.assertThat(
+            zones, MatchesSetwise(reverse_zone(domain.name, subnet.cidr)))
+
     def test_two_managed_interfaces_yields_one_forward_two_reverse_zones(self):
         default_domain = Domain.objects.get_default_domain().name
         domain = factory.make_Domain()
@@ -552,6 +574,21 @@ class TestZoneGenerator(MAASServerTestCase):
             domains, subnets, serial=random.randint(0, 65535)).as_list()
         self.assertThat(actual_zones, MatchesSetwise(*expected_zones))
 
+    def test_fetches_domain_mappings_in_bulk(self):
+        domains = [factory.make_Domain() for _ in range(3)]
+        for domain in domains:
+            factory.make_DNSData(domain=domain)
+        get_ip_mapping = self.patch(zonegenerator, "get_hostname_ip_mapping")
+        get_dnsdata_mapping = self.patch(
+            zonegenerator, "get_hostname_dnsdata_mapping")
+        actual_zones = ZoneGenerator(
+            domains, [], serial=random.randint(0, 65535)).as_list()
+        self.assertThat(
+            actual_zones,
+            MatchesSetwise(*(forward_zone(domain.name) for domain in domains)))
+        self.assertThat(get_ip_mapping, MockNotCalled())
+        self.assertThat(get_dnsdata_mapping, MockNotCalled())
+
     def test_zone_generator_handles_rdns_mode_equal_enabled(self):
         Domain.objects.get_or_create(name="one")
         subnet = factory.make_Subnet(cidr="10.0.0.0/29")
@@ -594,7 +631,7 @@ class TestZoneGeneratorTTL(MAASTransactionServerTestCase):
             domain, subnet, default_ttl=global_ttl,
             serial=random.randint(0, 65535)).as_list()
         self.assertEqual(expected_forward, zones[0]._mapping)
-        self.assertEqual(expected_reverse, zones[1]._mapping)
+        self.assertEqual(expected_reverse, zones[1]._mapping.mapping)
 
     @transactional
     def test_node_ttl_overrides_domain(self):
@@ -619,7 +656,7 @@ class TestZoneGeneratorTTL(MAASTransactionServerTestCase):
             domain, subnet, default_ttl=global_ttl,
             serial=random.randint(0, 65535)).as_list()
         self.assertEqual(expected_forward, zones[0]._mapping)
-        self.assertEqual(expected_reverse, zones[1]._mapping)
+        self.assertEqual(expected_reverse, zones[1]._mapping.mapping)
 
     @transactional
     def test_dnsresource_address_does_not_affect_addresses_when_node_set(self):
@@ -651,7 +688,7 @@ class TestZoneGeneratorTTL(MAASTransactionServerTestCase):
             domain, subnet, default_ttl=global_ttl,
             serial=random.randint(0, 65535)).as_list()
         self.assertEqual(expected_forward, zones[0]._mapping)
-        self.assertEqual(expected_reverse, zones[1]._mapping)
+        self.assertEqual(expected_reverse, zones[1]._mapping.mapping)
 
     @transactional
     def test_dnsresource_address_overrides_domain(self):
@@ -687,7 +724,7 @@ class TestZoneGeneratorTTL(MAASTransactionServerTestCase):
             domain, subnet, default_ttl=global_ttl,
             serial=random.randint(0, 65535)).as_list()
         self.assertEqual(expected_forward, zones[0]._mapping)
-        self.assertEqual(expected_reverse, zones[1]._mapping)
+        self.assertEqual(expected_reverse, zones[1]._mapping.mapping)
 
     @transactional
     def test_dnsdata_inherits_global(self):
@@ -708,7 +745,7 @@ class TestZoneGeneratorTTL(MAASTransactionServerTestCase):
             serial=random.randint(0, 65535)).as_list()
         self.assertEqual(expected_forward, zones[0]._other_mapping)
         self.assertEqual({}, zones[0]._mapping)
-        self.assertEqual({}, zones[1]._mapping)
+        self.assertEqual({}, zones[1]._mapping.mapping)
         self.assertEqual(None, dnsdata.ttl)
 
     @transactional
@@ -730,7 +767,7 @@ class TestZoneGeneratorTTL(MAASTransactionServerTestCase):
             serial=random.randint(0, 65535)).as_list()
         self.assertEqual(expected_forward, zones[0]._other_mapping)
         self.assertEqual({}, zones[0]._mapping)
-        self.assertEqual({}, zones[1]._mapping)
+        self.assertEqual({}, zones[1]._mapping.mapping)
         self.assertEqual(None, dnsdata.ttl)
 
     @transactional
@@ -752,7 +789,7 @@ class TestZoneGeneratorTTL(MAASTransactionServerTestCase):
             serial=random.randint(0, 65535)).as_list()
         self.assertEqual(expected_forward, zones[0]._other_mapping)
         self.assertEqual({}, zones[0]._mapping)
-        self.assertEqual({}, zones[1]._mapping)
+        self.assertEqual({}, zones[1]._mapping.mapping)
 
     @transactional
     def test_domain_ttl_overrides_default_ttl(self):
@@ -32,6 +32,7 @@ from netaddr import (
 from provisioningserver.dns.zoneconfig import (
     DNSForwardZoneConfig,
     DNSReverseZoneConfig,
+    IPMappingIndex,
 )
 
 
@@ -84,6 +85,25 @@ def get_hostname_dnsdata_mapping(domain):
         domain, with_ids=False)
 
 
+def get_hostname_ip_mappings(domains):
+    """Return a dict of {domain -> mapping} for each of `domains`.
+
+    Each mapping is as returned from `get_hostname_ip_mapping`, but all of
+    the domains are fetched from the database together.
+    """
+    return StaticIPAddress.objects.get_hostname_ip_mappings(domains)
+
+
+def get_hostname_dnsdata_mappings(domains):
+    """Return a dict of {domain -> mapping} for each of `domains`.
+
+    Each mapping is as returned from `get_hostname_dnsdata_mapping`, but all
+    of the domains are fetched from the database together.
+    """
+    return DNSData.objects.get_hostname_dnsdata_mappings(
+        domains, with_ids=False)
+
+
 WARNING_MESSAGE = (
     "The DNS server will use the address '%s',  which is inside the "
     "loopback network.  This may not be a problem if you're not using "
@@ -175,12 +195,23 @@ class ZoneGenerator:
     We generate zones for the domains (forward), and subnets (reverse) passed.
     """
 
-    def __init__(self, domains, subnets, default_ttl=None, serial=None):
+    def __init__(
+            self, domains, subnets, default_ttl=None, serial=None,
+            glue_subnets=None):
         """
         :param serial: A serial number to reuse when creating zones in bulk.
+        :param glue_subnets: The subnets to consider when working out the
+            RFC2317 glue for the reverse zones of `subnets`. When given, only
+            the reverse zones for `subnets` are generated; glue-only zones
+            for parent networks that are not themselves subnets are left
+            out. Defaults to `subnets`.
         """
         self.domains = sequence(domains)
         self.subnets = sequence(subnets)
+        if glue_subnets is None:
+            self.glue_subnets = None
+        else:
+            self.glue_subnets = sequence(glue_subnets)
         if default_ttl is None:
             self.default_ttl = Config.objects.get_config('default_dns_ttl')
         else:
@@ -189,14 +220,27 @@ class ZoneGenerator:
         self.serial = serial
 
     @staticmethod
-    def _get_mappings():
-        """Return a lazily evaluated mapping dict."""
-        return lazydict(get_hostname_ip_mapping)
+    def _get_mappings(domains=()):
+        """Return a lazily evaluated mapping dict.
+
+        The mappings for `domains` are fetched up-front in bulk; anything
+        else (e.g. subnets) is fetched on demand.
+        """
+        mappings = lazydict(get_hostname_ip_mapping)
+        if len(domains) > 0:
+            mappings.update(get_hostname_ip_mappings(domains))
+        return mappings
 
     @staticmethod
-    def _get_rrset_mappings():
-        """Return a lazily evaluated mapping dict."""
-        return lazydict(get_hostname_dnsdata_mapping)
+    def _get_rrset_mappings(domains=()):
+        """Return a lazily evaluated mapping dict.
+
+        The mappings for `domains` are fetched up-front in bulk.
+        """
+        mappings = lazydict(get_hostname_dnsdata_mapping)
+        if len(domains) > 0:
+            mappings.update(get_hostname_dnsdata_mappings(domains))
+        return mappings
 
     @staticmethod
     def _gen_forward_zones(
@@ -266,15 +310,20 @@ class ZoneGenerator:
 
     @staticmethod
     def _gen_reverse_zones(
-            subnets, serial, ns_host_name, mappings, default_ttl):
+            subnets, serial, ns_host_name, mappings, default_ttl,
+            glue_subnets=None):
         """Generator of reverse zones, sorted by network."""
 
         subnets = set(subnets)
+        if glue_subnets is None:
+            all_subnets = subnets
+        else:
+            all_subnets = subnets.union(glue_subnets)
         # Generate the list of parent networks for rfc2317 glue.  Note that we
         # need to handle the case where we are controlling both the small net
         # and a bigger network containing the /24, not just a /24 network.
         rfc2317_glue = {}
-        for subnet in subnets:
+        for subnet in all_subnets:
             network = IPNetwork(subnet.cidr)
             if subnet.rdns_mode == RDNS_MODE.RFC2317:
                 # If this is a small subnet and  we are doing RFC2317 glue for
@@ -295,8 +344,11 @@ class ZoneGenerator:
 
         # Since get_hostname_ip_mapping(Subnet) ignores Subnet.id, so we can
         # just do it once and be happy.  LP#1600259
+        # It is indexed by address, once, so that each reverse zone can pick
+        # out its own addresses without scanning the whole mapping.
         if len(subnets):
-            mappings['reverse'] = mappings[Subnet.objects.first()]
+            mappings['reverse'] = IPMappingIndex(
+                mappings[Subnet.objects.first()])
 
         # For each of the zones that we are generating (one or more per
         # subnet), compile the zone from:
@@ -308,7 +360,7 @@ class ZoneGenerator:
         # means that we wind up grabbing (and deleting) the rfc2317 glue info
         # while processing the wrong network.
         for subnet in sorted(
-                subnets,
+                all_subnets,
                 key=lambda subnet: IPNetwork(subnet.cidr).prefixlen,
                 reverse=True):
             network = IPNetwork(subnet.cidr)
@@ -319,19 +371,6 @@ class ZoneGenerator:
                     "%s disabled subnet in DNS config list" % subnet.cidr)
                 continue
 
-            # 1. Figure out the dynamic ranges.
-            dynamic_ranges = [
-                ip_range.netaddr_iprange
-                for ip_range in subnet.get_dynamic_ranges()
-            ]
-
-            # 2. Start with the map of all of the nodes, including all
-            # DNSResource-associated addresses.  We will prune this to just
-            # entries for the subnet when we actually generate the zonefile.
-            # If we get here, then we have subnets, so we noticed that above
-            # and created mappings['reverse'].  LP#1600259
-            mapping = mappings['reverse']
-
             # Use the default_domain as the name for the NS host in the reverse
             # zones.  If this network is actually a parent rfc2317 glue
             # network, then we need to generate the glue records.
@@ -351,6 +390,23 @@ class ZoneGenerator:
                 del(rfc2317_glue[network])
             else:
                 glue = set()
+            if subnet not in subnets:
+                # This subnet is only here so that the glue is claimed by the
+                # correct network; its zone is not being generated.
+                continue
+
+            # 1. Figure out the dynamic ranges.
+            dynamic_ranges = [
+                ip_range.netaddr_iprange
+                for ip_range in subnet.get_dynamic_ranges()
+            ]
+
+            # 2. Start with the map of all of the nodes, including all
+            # DNSResource-associated addresses.  We will prune this to just
+            # entries for the subnet when we actually generate the zonefile.
+            # If we get here, then we have subnets, so we noticed that above
+            # and created mappings['reverse'].  LP#1600259
+            mapping = mappings['reverse']
             yield DNSReverseZoneConfig(
                 ns_host_name, serial=serial,
                 default_ttl=default_ttl,
@@ -359,7 +415,11 @@ class ZoneGenerator:
                 dynamic_ranges=dynamic_ranges,
                 rfc2317_ranges=glue,
             )
-        # Now provide any remaining rfc2317 glue networks.
+        # Now provide any remaining rfc2317 glue networks. These only change
+        # along with the set of subnets, so they are left out when generating
+        # zones for only some of the subnets.
+        if glue_subnets is not None:
+            return
         for network, ranges in rfc2317_glue.items():
             yield DNSReverseZoneConfig(
                 ns_host_name, serial=serial,
@@ -378,9 +438,9 @@ class ZoneGenerator:
         # we get to this point, we really need one.
         assert not (self.serial is None), ("No serial number specified.")
 
-        mappings = self._get_mappings()
+        mappings = self._get_mappings(self.domains)
         ns_host_name = self.default_domain.name
-        rrset_mappings = self._get_rrset_mappings()
+        rrset_mappings = self._get_rrset_mappings(self.domains)
         serial = self.serial
         default_ttl = self.default_ttl
         return chain(
@@ -388,7 +448,8 @@ class ZoneGenerator:
                 self.domains, serial, ns_host_name, mappings,
                 rrset_mappings, default_ttl),
             self._gen_reverse_zones(
-                self.subnets, serial, ns_host_name, mappings, default_ttl),
+                self.subnets, serial, ns_host_name, mappings, default_ttl,
+                self.glue_subnets),
             )
 
     def as_list(self):
@@ -116,9 +116,23 @@ def make_ImportResourcesProgressService():
     return bootresources.ImportResourcesProgressService()
 
 
+# Seconds for which the listeners merge notifications on busy channels. Bulk
+# operations on nodes notify about every node, and about every interface and
+# IP address via its node, and about subnets via every IP address.
+LISTENER_COALESCING_WINDOWS = {
+    "controller": 0.25,
+    "device": 0.25,
+    "machine": 0.25,
+    "subnet": 0.25,
+}
+
+
 def make_PostgresListenerService():
     from maasserver.listener import PostgresListenerService
-    return PostgresListenerService()
+    listener = PostgresListenerService()
+    for channel, window in LISTENER_COALESCING_WINDOWS.items():
+        listener.setCoalescingWindow(channel, window)
+    return listener
 
 
 def make_RackControllerService(ipcWorker, postgresListener):
@@ -157,6 +171,13 @@ def make_ReverseDNSService(postgresListener):
     return ReverseDNSService(postgresListener)
 
 
+def make_SubnetIndexService(postgresListener):
+    from maasserver.regiondservices.subnet_index import (
+        SubnetIndexService
+    )
+    return SubnetIndexService(postgresListener)
+
+
 def make_NetworkTimeProtocolService():
     from maasserver.regiondservices import ntp
     return ntp.RegionNetworkTimeProtocolService(reactor)
@@ -323,6 +344,11 @@ class RegionEventLoop:
             "factory": make_ReverseDNSService,
             "requires": ["postgres-listener-master"],
         },
+        "subnet-index": {
+            "only_on_master": False,
+            "factory": make_SubnetIndexService,
+            "requires": ["postgres-listener-worker"],
+        },
         "rack-controller": {
             "only_on_master": False,
             "factory": make_RackControllerService,
@@ -1527,6 +1527,7 @@ class DNSForm(ConfigForm):
     """Settings page, DNS section."""
     upstream_dns = get_config_field('upstream_dns')
     dnssec_validation = get_config_field('dnssec_validation')
+    dns_dynamic_updates = get_config_field('dns_dynamic_updates')
 
 
 class NTPForm(ConfigForm):
@@ -300,6 +300,20 @@ CONFIG_ITEMS = {
                 "server config.")
         }
     },
+    'dns_dynamic_updates': {
+        'default': False,
+        'form': forms.BooleanField,
+        'form_kwargs': {
+            'label': "Update DNS records dynamically",
+            'required': False,
+            'help_text': normalise_whitespace("""\
+                Only used when MAAS is running its own DNS server. Send the
+                records for DHCP leases and discovered addresses to the DNS
+                server as RFC 2136 dynamic updates, instead of rewriting and
+                reloading whole zones.
+            """),
+        }
+    },
     'ntp_servers': {
         'default': None,
         'form': HostListFormField,
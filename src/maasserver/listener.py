@@ -61,6 +61,37 @@ class PostgresListenerUnregistrationError(Exception):
     """Error raised when unregistering a handler fails."""
 
 
+class BatchHandler:
+    """Wraps a handler that consumes notifications in batches.
+
+    The handler is called once per channel and action for each cycle of
+    `PostgresListenerService.handleNotifies`, with the set of payloads that
+    were received for that action, instead of once per notification.
+
+    It compares equal to the handler it wraps, so it can be unregistered with
+    `PostgresListenerService.unregister` like any other handler.
+    """
+
+    def __init__(self, handler):
+        super(BatchHandler, self).__init__()
+        self.handler = handler
+
+    def __call__(self, action, payloads):
+        return self.handler(action, payloads)
+
+    def __eq__(self, other):
+        if isinstance(other, BatchHandler):
+            return self.handler == other.handler
+        else:
+            return self.handler == other
+
+    def __hash__(self):
+        return hash(self.handler)
+
+    def __repr__(self):
+        return "<BatchHandler %r>" % (self.handler,)
+
+
 @implementer(interfaces.IReadDescriptor)
 class PostgresListenerService(Service, object):
     """Listens for NOTIFY messages from postgres.
@@ -92,6 +123,13 @@ class PostgresListenerService(Service, object):
         self.connection = None
         self.connectionFileno = None
         self.notifications = set()
+        # Channel -> seconds to hold notifications before handling them.
+        self.coalescingWindows = {}
+        # Notifications held back, and the calls that will release them, by
+        # the channel whose window they are held for.
+        self.coalescing = defaultdict(set)
+        self.coalescingCalls = {}
+        self.clock = reactor
         self.notifier = task.LoopingCall(self.handleNotifies)
         self.notifierDone = None
         self.connecting = None
@@ -177,8 +215,8 @@ class PostgresListenerService(Service, object):
                             self.unregisterChannel(notify.channel)
                     else:
                         # Place non-system messages into the queue to be
-                        # processed.
-                        self.notifications.add(
+                        # processed, perhaps after a coalescing window.
+                        self.queueNotification(
                             (notify.channel, notify.payload))
                 # Delete the contents of the connection's notifies list so
                 # that we don't process them a second time.
@@ -206,13 +244,75 @@ class PostgresListenerService(Service, object):
         finally:
             self.connectionFileno = None
 
-    def register(self, channel, handler):
+    def setCoalescingWindow(self, channel, window):
+        """Hold notifications on `channel` for `window` seconds.
+
+        Notifications for the same object, received within `window` seconds
+        of the first notification on the channel, are merged and handled
+        once. This trades a little latency for much less work during bulk
+        operations, which can notify about thousands of objects.
+
+        :param channel: A channel, e.g. "machine", to apply the window to
+            every action on the channel, or a channel and action, e.g.
+            "machine_update", to apply it to only that action.
+        :param window: The number of seconds, or `None` to handle
+            notifications as soon as possible again.
+        """
+        if self.isSystemChannel(channel):
+            raise PostgresListenerRegistrationError(
+                "System channel '%s' cannot be coalesced." % channel)
+        elif window is None:
+            self.coalescingWindows.pop(channel, None)
+            self.flushCoalesced(channel)
+        else:
+            self.coalescingWindows[channel] = window
+
+    def queueNotification(self, notification):
+        """Queue `notification`, or hold it if its channel is coalesced."""
+        channel = notification[0]
+        if channel not in self.coalescingWindows:
+            channel = channel.split('_', 1)[0]
+        window = self.coalescingWindows.get(channel)
+        if window is None:
+            self.notifications.add(notification)
+        else:
+            self.coalescing[channel].add(notification)
+            if channel not in self.coalescingCalls:
+                self.coalescingCalls[channel] = self.clock.callLater(
+                    window, self.flushCoalesced, channel)
+
+    def flushCoalesced(self, channel):
+        """Queue the notifications held for `channel`."""
+        call = self.coalescingCalls.pop(channel, None)
+        if call is not None and call.active():
+            call.cancel()
+        self.notifications.update(self.coalescing.pop(channel, ()))
+
+    def cancelCoalesced(self):
+        """Drop all held notifications."""
+        for call in self.coalescingCalls.values():
+            if call.active():
+                call.cancel()
+        self.coalescingCalls.clear()
+        self.coalescing.clear()
+
+    def register(self, channel, handler, batch=False):
         """Register listening for notifications from a channel.
 
         When a notification is received for that `channel` the `handler` will
         be called with the action and object id.
+
+        :param batch: If true, `handler` will instead be called with the
+            action and a set of object ids, once for each action that has
+            been notified since the last batch; see `BatchHandler`.
         """
         handlers = self.listeners[channel]
+        if batch:
+            if self.isSystemChannel(channel):
+                raise PostgresListenerRegistrationError(
+                    "System channel '%s' cannot be handled in batches." % (
+                        channel))
+            handler = BatchHandler(handler)
         if self.isSystemChannel(channel) and len(handlers) > 0:
             # A system can only be registered once. This is because the
             # message is passed directly to the handler and the `doRead`
@@ -319,6 +419,7 @@ class PostgresListenerService(Service, object):
         if self.disconnecting is None:
             d = self.disconnecting = Deferred()
             d.addBoth(callOut, self.stopReading)
+            d.addBoth(callOut, self.cancelCoalesced)
             d.addBoth(callOut, self.cancelHandleNotify)
             d.addBoth(callOut, deferToThread, self.stopConnection)
             d.addBoth(callOut, self.connectionLost, reason)
@@ -408,16 +509,33 @@ class PostgresListenerService(Service, object):
             return succeed(None)
 
     def handleNotifies(self, clock=reactor):
-        """Process all notify message in the notifications set."""
+        """Process all notify message in the notifications set.
+
+        Payloads for batch handlers are gathered as the notifications are
+        processed, and the batch handlers are called at the end.
+        """
+        batches = defaultdict(set)
+
         def gen_notifications(notifications):
             while len(notifications) != 0:
                 yield notifications.pop()
-        return task.coiterate(
-            self.handleNotify(notification, clock=clock)
-            for notification in gen_notifications(self.notifications))
 
-    def handleNotify(self, notification, clock=reactor):
-        """Process a notify message in the notifications set."""
+        def gen_handling():
+            for notification in gen_notifications(self.notifications):
+                yield self.handleNotify(
+                    notification, clock=clock, batches=batches)
+            for (channel, action), payloads in batches.items():
+                yield self.handleBatch(channel, action, payloads)
+
+        return task.coiterate(gen_handling())
+
+    def handleNotify(self, notification, clock=reactor, batches=None):
+        """Process a notify message in the notifications set.
+
+        :param batches: A dict to which to add the payload, keyed by channel
+            and action, for any batch handlers on the channel. When `None`,
+            batch handlers are called immediately with just this payload.
+        """
         channel, payload = notification
         try:
             channel, action = self.convertChannel(channel)
@@ -432,9 +550,29 @@ class PostgresListenerService(Service, object):
             # XXX: There could be an arbitrary number of listeners. Should we
             # limit concurrency here? Perhaps even do one at a time.
             for handler in handlers:
-                d = defer.maybeDeferred(handler, action, payload)
+                if isinstance(handler, BatchHandler):
+                    if batches is not None:
+                        batches[channel, action].add(payload)
+                        continue
+                    else:
+                        d = defer.maybeDeferred(handler, action, {payload})
+                else:
+                    d = defer.maybeDeferred(handler, action, payload)
                 d.addErrback(lambda failure: self.log.failure(
                     "Failure while handling notification to {channel!r}: "
                     "{payload!r}", failure, channel=channel, payload=payload))
                 defers.append(d)
             return defer.DeferredList(defers)
+
+    def handleBatch(self, channel, action, payloads):
+        """Call the batch handlers for `channel` with `payloads`."""
+        defers = []
+        for handler in self.listeners[channel]:
+            if isinstance(handler, BatchHandler):
+                d = defer.maybeDeferred(handler, action, payloads)
+                d.addErrback(lambda failure: self.log.failure(
+                    "Failure while handling {count} notifications to "
+                    "{channel!r}.", failure, channel=channel,
+                    count=len(payloads)))
+                defers.append(d)
+        return defer.DeferredList(defers)
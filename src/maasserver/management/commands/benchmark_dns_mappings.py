@@ -0,0 +1,80 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Django command: benchmark the DNS hostname mapping queries.
+
+Compares fetching the forward zone mappings one domain at a time with
+fetching them for all domains in bulk.  Run it against a populated database,
+e.g. after `make sampledata`.
+"""
+
+__all__ = [
+    "Command",
+]
+
+from textwrap import dedent
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from maasserver.models import (
+    DNSData,
+    Domain,
+    StaticIPAddress,
+)
+
+
+def fetch_per_domain(domains):
+    """Fetch the mappings with one set of queries per domain."""
+    for domain in domains:
+        StaticIPAddress.objects.get_hostname_ip_mapping(domain)
+        DNSData.objects.get_hostname_dnsdata_mapping(domain, with_ids=False)
+
+
+def fetch_in_bulk(domains):
+    """Fetch the mappings for all domains together."""
+    StaticIPAddress.objects.get_hostname_ip_mappings(domains)
+    DNSData.objects.get_hostname_dnsdata_mappings(domains, with_ids=False)
+
+
+def measure(func, domains, iterations):
+    """Run `func` `iterations` times.
+
+    :return: A tuple of (queries per iteration, seconds per iteration).
+    """
+    with CaptureQueriesContext(connection) as context:
+        start = time.monotonic()
+        for _ in range(iterations):
+            func(domains)
+        elapsed = time.monotonic() - start
+    return (
+        len(context.captured_queries) / iterations,
+        elapsed / iterations)
+
+
+class Command(BaseCommand):
+
+    help = dedent("""\
+        Compare the cost of fetching DNS hostname mappings per domain with
+        fetching them for all domains at once.""")
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--iterations', type=int, default=10,
+            help="Number of times to repeat each measurement.")
+
+    def handle(self, *args, **options):
+        iterations = max(1, options.get('iterations'))
+        domains = list(Domain.objects.filter(authoritative=True))
+        self.stdout.write(
+            "%d authoritative domains, %d iterations." % (
+                len(domains), iterations))
+        for name, func in (
+                ("per-domain", fetch_per_domain),
+                ("bulk", fetch_in_bulk)):
+            queries, seconds = measure(func, domains, iterations)
+            self.stdout.write(
+                "%-10s %8.1f queries %10.4f seconds" % (
+                    name, queries, seconds))
@@ -0,0 +1,30 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Test the `benchmark_dns_mappings` management command."""
+
+__all__ = []
+
+from io import StringIO
+
+from django.core.management import call_command
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from testtools.matchers import (
+    Contains,
+    MatchesAll,
+)
+
+
+class TestBenchmarkDNSMappings(MAASServerTestCase):
+
+    def test__reports_per_domain_and_bulk(self):
+        for _ in range(3):
+            factory.make_DNSData(domain=factory.make_Domain())
+        stdout = StringIO()
+        call_command("benchmark_dns_mappings", iterations=1, stdout=stdout)
+        self.assertThat(stdout.getvalue(), MatchesAll(
+            Contains("4 authoritative domains, 1 iterations."),
+            Contains("per-domain"),
+            Contains("bulk"),
+        ))
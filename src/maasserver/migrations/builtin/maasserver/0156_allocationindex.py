@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.11 on 2018-04-20 09:12
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import (
+    migrations,
+    models,
+)
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('maasserver', '0155_add_globaldefaults_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationIndex',
+            fields=[
+                ('node', models.OneToOneField(db_constraint=False, editable=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='maasserver.Node')),
+                ('root_size', models.BigIntegerField(editable=False, null=True)),
+                ('root_tags', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), editable=False, size=None)),
+                ('unused_sizes', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), editable=False, size=None)),
+                ('unused_tags', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), editable=False, size=None)),
+                ('fabric_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), editable=False, size=None)),
+                ('fabric_classes', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), editable=False, size=None)),
+                ('space_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), editable=False, size=None)),
+                ('vlan_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), editable=False, size=None)),
+                ('subnet_ids', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), editable=False, size=None)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=models.Index(fields=['root_size'], name='allocidx_root_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['root_tags'], name='allocidx_root_tags_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['unused_tags'], name='allocidx_unused_tags_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['fabric_ids'], name='allocidx_fabric_ids_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['fabric_classes'], name='allocidx_fabric_classes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['space_ids'], name='allocidx_space_ids_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['vlan_ids'], name='allocidx_vlan_ids_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allocationindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['subnet_ids'], name='allocidx_subnet_ids_idx'),
+        ),
+    ]
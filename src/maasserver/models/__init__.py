@@ -4,6 +4,7 @@
 """Model export and helpers for maasserver."""
 
 __all__ = [
+    'AllocationIndex',
     'Bcache',
     'BlockDevice',
     'BMC',
@@ -102,6 +103,7 @@ from maasserver.enum import (
     NODE_PERMISSION,
     NODE_TYPE,
 )
+from maasserver.models.allocationindex import AllocationIndex
 from maasserver.models.blockdevice import BlockDevice
 from maasserver.models.bmc import (
     BMC,
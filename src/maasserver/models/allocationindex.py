@@ -0,0 +1,183 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Index of the storage and networking of nodes, for allocation."""
+
+__all__ = [
+    "AllocationIndex",
+    ]
+
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.db.models import (
+    BigIntegerField,
+    DO_NOTHING,
+    Index,
+    IntegerField,
+    Manager,
+    Model,
+    OneToOneField,
+    TextField,
+)
+from maasserver import DefaultMeta
+
+
+class AllocationIndexManager(Manager):
+    """Matches storage and interface constraints against the index."""
+
+    def match_storage(self, constraints):
+        """Return the entries for nodes that match storage `constraints`.
+
+        :param constraints: A list of ``(label, size, tags)`` tuples, as
+            returned by `get_storage_constraints_from_string`. The first is
+            for the block device holding the root filesystem, the rest for
+            distinct unused block devices.
+        :return: A tuple of the matching entries, and whether they match
+            exactly. When they do not, every node that matches the
+            constraints has an entry, but not every entry's node matches.
+        """
+        (_, root_size, root_tags), others = constraints[0], constraints[1:]
+        entries = self.filter(root_size__gte=root_size)
+        # Size constraints can be satisfied by distinct devices exactly when
+        # the nth largest unused device is at least the nth largest size.
+        sizes = sorted((size for _, size, _ in others), reverse=True)
+        for index, size in enumerate(sizes):
+            entries = entries.filter(**{
+                "unused_sizes__%d__gte" % index: size})
+        # Tags are indexed for all the devices together, so matching them
+        # does not ensure that a device with the tags is also large enough.
+        exact = root_tags is None
+        if root_tags is not None:
+            entries = entries.filter(root_tags__contains=root_tags)
+        for _, _, tags in others:
+            if tags is not None:
+                entries = entries.filter(unused_tags__contains=tags)
+                exact = False
+        return entries, exact
+
+    def match_interfaces(self, interfaces_label_map):
+        """Return the entries for nodes that match interface constraints.
+
+        :param interfaces_label_map: A `LabeledConstraintMap` of interface
+            constraints.
+        :return: A tuple of the matching entries, and whether they match
+            exactly. When they do not, every node that matches the
+            constraints has an entry, but not every entry's node matches.
+        """
+        entries = self.all()
+        exact = True
+        for label in interfaces_label_map:
+            constraints = interfaces_label_map[label]
+            for key, values in constraints.items():
+                lookup = self._get_interface_lookup(key, values)
+                if lookup is None:
+                    exact = False
+                else:
+                    entries = entries.filter(**lookup)
+            if len(constraints) > 1:
+                # Each constraint may be matched by a different interface.
+                exact = False
+        return entries, exact
+
+    def _get_interface_lookup(self, key, values):
+        """Return a lookup for entries with an interface matching any of
+        `values` for `key`, or `None` if the index cannot match `key`."""
+        # Circular imports.
+        from maasserver.models import (
+            Fabric,
+            Space,
+            Subnet,
+            VLAN,
+        )
+
+        def get_ids(manager):
+            return {
+                object_id
+                for value in values
+                for object_id in manager.filter_by_specifiers(
+                    value).values_list("id", flat=True)
+            }
+
+        if key == "fabric":
+            return {"fabric_ids__overlap": list(get_ids(Fabric.objects))}
+        elif key == "fabric_class":
+            return {"fabric_classes__overlap": values}
+        elif key == "space":
+            if Space.UNDEFINED in values:
+                return None
+            return {"space_ids__overlap": [
+                Space.objects.get_object_by_specifiers_or_raise(value).id
+                for value in values
+            ]}
+        elif key == "vlan":
+            return {"vlan_ids__overlap": list(get_ids(VLAN.objects))}
+        elif key == "subnet":
+            return {"subnet_ids__overlap": list(get_ids(Subnet.objects))}
+        else:
+            return None
+
+
+class AllocationIndex(Model):
+    """Summary of the storage and networking of a node.
+
+    Allocation matches storage and interface constraints against these
+    summaries rather than joining block devices, filesystems, partitions,
+    interfaces, and their links for every node.
+
+    Entries are maintained by the triggers in
+    `maasserver.triggers.allocation`, never saved from here. A node with
+    neither block devices nor interfaces may have no entry.
+
+    :ivar root_size: The size of the largest block device holding an
+        unacquired root filesystem, directly or in a partition, if there is
+        one.
+    :ivar root_tags: The tags of any of those block devices.
+    :ivar unused_sizes: The sizes, largest first, of the node's unused block
+        devices: those that are neither formatted nor partitioned.
+    :ivar unused_tags: The tags of any of those block devices.
+    :ivar fabric_ids: The fabrics of the node's interfaces.
+    :ivar fabric_classes: The classes of those fabrics.
+    :ivar space_ids: The spaces of the node's interfaces.
+    :ivar vlan_ids: The VLANs of the node's interfaces.
+    :ivar subnet_ids: The subnets of the IP addresses linked to the node's
+        interfaces.
+    """
+
+    class Meta(DefaultMeta):
+        indexes = [
+            Index(fields=["root_size"], name="allocidx_root_size_idx"),
+            GinIndex(fields=["root_tags"], name="allocidx_root_tags_idx"),
+            GinIndex(fields=["unused_tags"], name="allocidx_unused_tags_idx"),
+            GinIndex(fields=["fabric_ids"], name="allocidx_fabric_ids_idx"),
+            GinIndex(
+                fields=["fabric_classes"], name="allocidx_fabric_classes_idx"),
+            GinIndex(fields=["space_ids"], name="allocidx_space_ids_idx"),
+            GinIndex(fields=["vlan_ids"], name="allocidx_vlan_ids_idx"),
+            GinIndex(fields=["subnet_ids"], name="allocidx_subnet_ids_idx"),
+        ]
+
+    objects = AllocationIndexManager()
+
+    # The triggers remove the entry once the node is deleted, so there is no
+    # foreign key constraint that the entry could violate before then.
+    node = OneToOneField(
+        "Node", primary_key=True, db_constraint=False, on_delete=DO_NOTHING,
+        related_name="+", editable=False)
+
+    root_size = BigIntegerField(null=True, editable=False)
+
+    root_tags = ArrayField(TextField(), editable=False)
+
+    unused_sizes = ArrayField(BigIntegerField(), editable=False)
+
+    unused_tags = ArrayField(TextField(), editable=False)
+
+    fabric_ids = ArrayField(IntegerField(), editable=False)
+
+    fabric_classes = ArrayField(TextField(), editable=False)
+
+    space_ids = ArrayField(IntegerField(), editable=False)
+
+    vlan_ids = ArrayField(IntegerField(), editable=False)
+
+    subnet_ids = ArrayField(IntegerField(), editable=False)
@@ -77,6 +77,7 @@ def get_default_config():
         # DNS settings
         'upstream_dns': None,
         'dnssec_validation': "auto",
+        'dns_dynamic_updates': False,
         # NTP settings
         'ntp_servers': 'ntp.ubuntu.com',
         'ntp_external_only': False,
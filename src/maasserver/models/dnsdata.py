@@ -136,6 +136,19 @@ class DNSDataManager(Manager, DNSDataQueriesMixin):
     def get_hostname_dnsdata_mapping(
             self, domain, raw_ttl=False, with_ids=True):
         """Return hostname to RRset mapping for this domain."""
+        return self.get_hostname_dnsdata_mappings(
+            [domain], raw_ttl=raw_ttl, with_ids=with_ids)[domain]
+
+    def get_hostname_dnsdata_mappings(
+            self, domains, raw_ttl=False, with_ids=True):
+        """Return hostname to RRset mappings for each of the given domains.
+
+        This is the same as calling `get_hostname_dnsdata_mapping` for each
+        domain, but all of the domains are handled in a single query.
+
+        :return: a dict of Domain: mapping.
+        """
+        domains = list(domains)
         cursor = connection.cursor()
         default_ttl = "%d" % Config.objects.get_config('default_dns_ttl')
         if raw_ttl:
@@ -148,6 +161,7 @@ class DNSDataManager(Manager, DNSDataQueriesMixin):
                     %s)""" % default_ttl
         sql_query = """
             SELECT
+                target.id,
                 dnsresource.id,
                 dnsresource.name,
                 domain.name,
@@ -200,6 +214,7 @@ class DNSDataManager(Manager, DNSDataQueriesMixin):
                         node.fqdn = domain.name
                     )
                 )
+            CROSS JOIN unnest(%s::integer[]) AS target(id)
             WHERE
                 /* The entries must be in this domain (though node.domain_id
                  * may be out-of-domain and that's OK.
@@ -207,9 +222,11 @@ class DNSDataManager(Manager, DNSDataQueriesMixin):
                  * wins, and we drop the CNAME until the node no longer has the
                  * same name.
                  */
-                (dnsresource.domain_id = %s OR node.fqdn IS NOT NULL) AND
+                (dnsresource.domain_id = target.id OR
+                 node.fqdn IS NOT NULL) AND
                 (dnsdata.rrtype != 'CNAME' OR node.fqdn IS NULL)
             ORDER BY
+                target.id,
                 dnsresource.name,
                 dnsdata.rrtype,
                 dnsdata.rrdata
@@ -217,10 +234,16 @@ class DNSDataManager(Manager, DNSDataQueriesMixin):
         # N.B.: The "node.hostname IS NULL" above is actually checking that
         # no node exists with the same name, in order to make sure that we do
         # not spill CNAME and other data.
-        mapping = defaultdict(HostnameRRsetMapping)
-        cursor.execute(sql_query, (domain.id,))
-        for (dnsresource_id, name, d_name, system_id, node_type,
+        domains_by_id = {domain.id: domain for domain in domains}
+        mappings = {
+            domain.id: defaultdict(HostnameRRsetMapping)
+            for domain in domains
+        }
+        cursor.execute(sql_query, ([domain.id for domain in domains],))
+        for (domain_id, dnsresource_id, name, d_name, system_id, node_type,
                 dnsdata_id, ttl, rrtype, rrdata) in cursor.fetchall():
+            domain = domains_by_id[domain_id]
+            mapping = mappings[domain_id]
             if name == '@' and d_name != domain.name:
                 name, d_name = d_name.split('.', 1)
                 # Since we don't allow more than one label in dnsresource
@@ -236,7 +259,10 @@ class DNSDataManager(Manager, DNSDataQueriesMixin):
             else:
                 rrtuple = (ttl, rrtype, rrdata)
             mapping[name].rrset.add(rrtuple)
-        return mapping
+        return {
+            domain: mappings[domain.id]
+            for domain in domains
+        }
 
 
 class DNSData(CleanSave, TimestampedModel):
@@ -41,6 +41,7 @@ from django.db.models import (
     BigIntegerField,
     BooleanField,
     CASCADE,
+    Case,
     CharField,
     DateTimeField,
     ForeignKey,
@@ -55,6 +56,8 @@ from django.db.models import (
     SET_DEFAULT,
     SET_NULL,
     TextField,
+    Value,
+    When,
 )
 from django.db.models.query import QuerySet
 from django.shortcuts import get_object_or_404
@@ -574,6 +577,60 @@ class MachineManager(BaseNodeManager):
         available_machines = self.get_nodes(for_user, NODE_PERMISSION.VIEW)
         return available_machines.filter(status=NODE_STATUS.READY)
 
+    def lock_first_available(self, machines, chunk_size=10):
+        """Lock the first of `machines` that is still ready and that no other
+        transaction has locked.
+
+        See `lock_available`.
+
+        :return: The first machine locked, or None.
+        """
+        locked = self.lock_available(machines, 1, chunk_size)
+        return locked[0] if len(locked) > 0 else None
+
+    def lock_available(self, machines, count, chunk_size=10):
+        """Lock up to `count` of `machines` that are still ready and that no
+        other transaction has locked.
+
+        `machines` may be ordered, distinct, and joined to other tables, none
+        of which ``SELECT ... FOR UPDATE`` permits, so candidates are taken
+        from it a chunk at a time and locked by id with ``SKIP LOCKED``. A
+        machine that a concurrent allocation has locked is passed over rather
+        than waited for. The locks are held until the transaction ends.
+
+        :param machines: Candidate machines, in order of preference.
+        :type machines: `django.db.models.query.QuerySet`
+        :param count: The most machines to lock.
+        :param chunk_size: The least number of candidates to take at a time.
+        :return: A list of the machines locked, in order of preference.
+        """
+        chunk_size = max(chunk_size, count)
+        locked_machines = []
+        offset = 0
+        while len(locked_machines) < count:
+            candidates = list(machines[offset:offset + chunk_size])
+            if len(candidates) == 0:
+                break
+            offset += chunk_size
+            # Lock no more machines than are still needed, preferring them in
+            # the order of the candidates, so that concurrent allocations can
+            # have the rest.
+            ids = [candidate.id for candidate in candidates]
+            preference = Case(
+                *(When(id=machine_id, then=Value(index))
+                  for index, machine_id in enumerate(ids)),
+                output_field=IntegerField())
+            locked = set(
+                self.filter(id__in=ids, status=NODE_STATUS.READY)
+                .order_by(preference)
+                .select_for_update(skip_locked=True)
+                .values_list("id", flat=True)[
+                    :count - len(locked_machines)])
+            locked_machines.extend(
+                candidate for candidate in candidates
+                if candidate.id in locked)
+        return locked_machines
+
 
 class DeviceManager(BaseNodeManager):
     """Devices are all the non-deployable nodes."""
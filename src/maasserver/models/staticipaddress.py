@@ -313,6 +313,102 @@ class StaticIPAddressManager(Manager):
             zone generation.
         :return: a (default) dict of hostname: HostnameIPMapping entries.
         """
+        if isinstance(domain, Domain):
+            return self._get_special_mappings_by_domain(
+                [domain], raw_ttl)[domain]
+        # In the subnet map, addresses attached to nodes only map back to
+        # the node, since some things don't like multiple PTR RRs in
+        # answers from the DNS.
+        # Since that is handled in get_hostname_ip_mapping, we exclude
+        # anything where the node also has a link to the address.
+        sql_query = self._get_special_mappings_query(raw_ttl)
+        sql_query += """ ((
+                node.fqdn IS NULL AND dnsrr.fqdn IS NOT NULL
+            ) OR (
+                staticip.alloc_type = %s AND
+                dnsrr.fqdn IS NULL AND
+                node.fqdn IS NULL))"""
+        query_parms = [IPADDRESS_TYPE.USER_RESERVED]
+
+        default_domain = Domain.objects.get_default_domain()
+        mapping = defaultdict(HostnameIPMapping)
+        cursor = connection.cursor()
+        cursor.execute(sql_query, query_parms)
+        for result in cursor.fetchall():
+            self._add_special_mapping(
+                mapping, SpecialMappingQueryResult(*result), default_domain)
+        return mapping
+
+    def _get_special_mappings_by_domain(self, domains, raw_ttl=False):
+        """Get the special mappings for each of the given Domains.
+
+        This is the same as calling `_get_special_mappings` for each domain,
+        but all of the domains are handled in a single query.
+
+        :param domains: the Domains to return the mappings for.
+        :param raw_ttl: Boolean, if True then just return the address_ttl,
+            otherwise, coalesce the address_ttl to be the correct answer for
+            zone generation.
+        :return: a dict of Domain: (default) dict of hostname:
+            HostnameIPMapping entries.
+        """
+        sql_query = self._get_special_mappings_query(raw_ttl, by_domain=True)
+        # The default domain is extra special, since it needs to have A/AAAA
+        # RRs for any USER_RESERVED addresses that have no name otherwise
+        # attached to them.  For each domain, we need all of the entries that
+        # are:
+        # - in this domain and have a dnsrr associated, OR
+        # - (for the default domain) are USER_RESERVED and have NO fqdn
+        #   associated at all.
+        # These can possibly come from either the child or the parent for
+        # glue.  Anything with a node associated will be found inside of
+        # get_hostname_ip_mapping().
+        sql_query += """ ((
+                target.id = %s AND
+                staticip.alloc_type = %s AND
+                dnsrr.fqdn IS NULL AND
+                node.fqdn IS NULL
+            ) OR (
+                dnsrr.fqdn IS NOT NULL AND
+                (
+                    dnsrr.dom2_id = target.id OR
+                    node.dom2_id = target.id OR
+                    dnsrr.domain_id = target.id OR
+                    node.domain_id = target.id)))"""
+        default_domain = Domain.objects.get_default_domain()
+        query_parms = [
+            [domain.id for domain in domains],
+            default_domain.id,
+            IPADDRESS_TYPE.USER_RESERVED,
+        ]
+
+        mappings = {
+            domain.id: defaultdict(HostnameIPMapping)
+            for domain in domains
+        }
+        cursor = connection.cursor()
+        cursor.execute(sql_query, query_parms)
+        for domain_id, *result in cursor.fetchall():
+            self._add_special_mapping(
+                mappings[domain_id], SpecialMappingQueryResult(*result),
+                default_domain)
+        return {
+            domain: mappings[domain.id]
+            for domain in domains
+        }
+
+    def _get_special_mappings_query(self, raw_ttl, by_domain=False):
+        """Return the SQL for `_get_special_mappings`, up to its filter.
+
+        :param by_domain: if True, each row is repeated for each of the
+            domains in an array given as the first query parameter, and the id
+            of that domain (`target.id`) is returned as the first column.
+        """
+        if by_domain:
+            target_column = "target.id,"
+            target_join = "CROSS JOIN unnest(%s::integer[]) AS target(id)"
+        else:
+            target_column = target_join = ""
         default_ttl = "%d" % Config.objects.get_config('default_dns_ttl')
         # raw_ttl says that we don't coalesce, but we need to pick one, so we
         # go with DNSResource if it is involved.
@@ -332,6 +428,7 @@ class StaticIPAddressManager(Manager):
         # that we know.
         sql_query = """
             SELECT
+                """ + target_column + """
                 COALESCE(dnsrr.fqdn, node.fqdn) AS fqdn,
                 node.system_id,
                 node.node_type,
@@ -390,85 +487,31 @@ class StaticIPAddressManager(Manager):
                     CONCAT(nd.hostname, '.', dom.name) = dom2.name
                 ) AS node ON
                     node_sip_id = staticip.id
+            """ + target_join + """
             WHERE
                 (staticip.ip IS NOT NULL AND host(staticip.ip) != '') AND
                 """
+        return sql_query
 
-        query_parms = []
-        if isinstance(domain, Domain):
-            if domain.is_default():
-                # The default domain is extra special, since it needs to have
-                # A/AAAA RRs for any USER_RESERVED addresses that have no name
-                # otherwise attached to them.
-                # We need to get all of the entries that are:
-                # - in this domain and have a dnsrr associated, OR
-                # - are USER_RESERVED and have NO fqdn associated at all.
-                sql_query += """ ((
-                        staticip.alloc_type = %s AND
-                        dnsrr.fqdn IS NULL AND
-                        node.fqdn IS NULL
-                    ) OR (
-                        dnsrr.fqdn IS NOT NULL AND
-                        (
-                            dnsrr.dom2_id = %s OR
-                            node.dom2_id = %s OR
-                            dnsrr.domain_id = %s OR
-                            node.domain_id = %s)))"""
-                query_parms += [IPADDRESS_TYPE.USER_RESERVED]
-            else:
-                # For domains, we only need answers for the domain we were
-                # given.  These can can possibly come from either the child or
-                # the parent for glue.  Anything with a node associated will be
-                # found inside of get_hostname_ip_mapping() - we need any
-                # entries that are:
-                # - in this domain and have a dnsrr associated.
-                sql_query += """ (
-                    dnsrr.fqdn IS NOT NULL AND
-                    (
-                        dnsrr.dom2_id = %s OR
-                        node.dom2_id = %s OR
-                        dnsrr.domain_id = %s OR
-                        node.domain_id = %s))"""
-            query_parms += [domain.id, domain.id, domain.id, domain.id]
+    def _add_special_mapping(self, mapping, result, default_domain):
+        """Add a `SpecialMappingQueryResult` to `mapping`."""
+        if result.fqdn is None or result.fqdn == '':
+            fqdn = "%s.%s" % (
+                get_ip_based_hostname(result.ip), default_domain.name)
         else:
-            # In the subnet map, addresses attached to nodes only map back to
-            # the node, since some things don't like multiple PTR RRs in
-            # answers from the DNS.
-            # Since that is handled in get_hostname_ip_mapping, we exclude
-            # anything where the node also has a link to the address.
-            domain = None
-            sql_query += """ ((
-                    node.fqdn IS NULL AND dnsrr.fqdn IS NOT NULL
-                ) OR (
-                    staticip.alloc_type = %s AND
-                    dnsrr.fqdn IS NULL AND
-                    node.fqdn IS NULL))"""
-            query_parms += [IPADDRESS_TYPE.USER_RESERVED]
-
-        default_domain = Domain.objects.get_default_domain()
-        mapping = defaultdict(HostnameIPMapping)
-        cursor = connection.cursor()
-        cursor.execute(sql_query, query_parms)
-        for result in cursor.fetchall():
-            result = SpecialMappingQueryResult(*result)
-            if result.fqdn is None or result.fqdn == '':
-                fqdn = "%s.%s" % (
-                    get_ip_based_hostname(result.ip), default_domain.name)
-            else:
-                fqdn = result.fqdn
-            # It is possible that there are both Node and DNSResource entries
-            # for this fqdn.  If we have any system_id, preserve it.  Ditto for
-            # TTL.  It is left as an exercise for the admin to make sure that
-            # the any non-default TTL applied to the Node and DNSResource are
-            # equal.
-            if result.system_id is not None:
-                mapping[fqdn].node_type = result.node_type
-                mapping[fqdn].system_id = result.system_id
-            if result.ttl is not None:
-                mapping[fqdn].ttl = result.ttl
-            mapping[fqdn].ips.add(result.ip)
-            mapping[fqdn].dnsresource_id = result.dnsresource_id
-        return mapping
+            fqdn = result.fqdn
+        # It is possible that there are both Node and DNSResource entries
+        # for this fqdn.  If we have any system_id, preserve it.  Ditto for
+        # TTL.  It is left as an exercise for the admin to make sure that
+        # the any non-default TTL applied to the Node and DNSResource are
+        # equal.
+        if result.system_id is not None:
+            mapping[fqdn].node_type = result.node_type
+            mapping[fqdn].system_id = result.system_id
+        if result.ttl is not None:
+            mapping[fqdn].ttl = result.ttl
+        mapping[fqdn].ips.add(result.ip)
+        mapping[fqdn].dnsresource_id = result.dnsresource_id
 
     def get_hostname_ip_mapping(self, domain_or_subnet, raw_ttl=False):
         """Return hostname mappings for `StaticIPAddress` entries.
@@ -482,8 +525,69 @@ class StaticIPAddressManager(Manager):
 
         The returned name is an FQDN (no trailing dot.)
         """
+        if isinstance(domain_or_subnet, Domain):
+            return self.get_hostname_ip_mappings(
+                [domain_or_subnet], raw_ttl)[domain_or_subnet]
+        sql_query, iface_sql_query = self._get_hostname_ip_mapping_queries(
+            raw_ttl)
+        # We get user reserved et al mappings first, so that we can overwrite
+        # TTL as we process the return from the SQL horror above.
+        mapping = self._get_special_mappings(domain_or_subnet, raw_ttl)
+        cursor = connection.cursor()
+        cursor.execute(sql_query, [])
+        results = cursor.fetchall()
+        cursor.execute(iface_sql_query, [])
+        iface_results = cursor.fetchall()
+        return self._merge_hostname_ip_mapping(
+            mapping, results, iface_results)
+
+    def get_hostname_ip_mappings(self, domains, raw_ttl=False):
+        """Return hostname mappings for each of the given domains.
+
+        This is the same as calling `get_hostname_ip_mapping` for each
+        domain, but all of the domains are handled in a fixed number of
+        queries, no matter how many domains there are.
+
+        :return: a dict of Domain: mapping, where each mapping is as returned
+            from `get_hostname_ip_mapping`.
+        """
+        domains = list(domains)
+        sql_query, iface_sql_query = self._get_hostname_ip_mapping_queries(
+            raw_ttl, by_domain=True)
+        query_parms = [[domain.id for domain in domains]]
+        results = defaultdict(list)
+        iface_results = defaultdict(list)
         cursor = connection.cursor()
+        cursor.execute(sql_query, query_parms)
+        for domain_id, *result in cursor.fetchall():
+            results[domain_id].append(result)
+        cursor.execute(iface_sql_query, query_parms)
+        for domain_id, *result in cursor.fetchall():
+            iface_results[domain_id].append(result)
+        # We get user reserved et al mappings first, so that we can overwrite
+        # TTL as we process the return from the SQL horror above.
+        mappings = self._get_special_mappings_by_domain(domains, raw_ttl)
+        return {
+            domain: self._merge_hostname_ip_mapping(
+                mappings[domain], results[domain.id],
+                iface_results[domain.id])
+            for domain in domains
+        }
 
+    def _get_hostname_ip_mapping_queries(self, raw_ttl, by_domain=False):
+        """Return the SQL queries for `get_hostname_ip_mapping`.
+
+        :param by_domain: if True, the queries return the mappings for each
+            of the domains in an array given as the query parameter, with the
+            id of that domain (`target.id`) as the first column.  Otherwise,
+            they return the mappings for all subnets.
+        :return: a tuple of the node query and the interface query.
+        """
+        if by_domain:
+            target_column = "target.id,"
+            target_order = "target.id,"
+        else:
+            target_column = target_order = ""
         # DISTINCT ON returns the first matching row for any given
         # hostname, using the query's ordering.  Here, we're trying to
         # return the IPs for the oldest Interface address.
@@ -497,7 +601,10 @@ class StaticIPAddressManager(Manager):
                     domain.ttl,
                     %s)""" % default_ttl
         sql_query = """
-            SELECT DISTINCT ON (node.hostname, is_boot, family(staticip.ip))
+            SELECT DISTINCT ON (
+                    """ + target_order + """
+                    node.hostname, is_boot, family(staticip.ip))
+                """ + target_column + """
                 CONCAT(node.hostname, '.', domain.name) AS fqdn,
                 node.system_id,
                 node.node_type,
@@ -526,7 +633,7 @@ class StaticIPAddressManager(Manager):
             JOIN maasserver_staticipaddress AS staticip ON
                 staticip.id = link.staticipaddress_id
             """
-        if isinstance(domain_or_subnet, Domain):
+        if by_domain:
             # The model has nodes in the parent domain, but they actually live
             # in the child domain.  And the parent needs the glue.  So we
             # return such nodes addresses in _BOTH_ the parent and the child
@@ -537,10 +644,10 @@ class StaticIPAddressManager(Manager):
                 /* Pick up another copy of domain looking for instances of
                  * nodes a the top of a domain.
                  */ domain2.name = CONCAT(node.hostname, '.', domain.name)
+            CROSS JOIN unnest(%s::integer[]) AS target(id)
             WHERE
-                (domain2.id = %s OR node.domain_id = %s) AND
+                (domain2.id = target.id OR node.domain_id = target.id) AND
             """
-            query_parms = [domain_or_subnet.id, domain_or_subnet.id, ]
         else:
             # For subnets, we need ALL the names, so that we can correctly
             # identify which ones should have the FQDN.  dns/zonegenerator.py
@@ -549,11 +656,11 @@ class StaticIPAddressManager(Manager):
             sql_query += """
             WHERE
             """
-            query_parms = []
         sql_query += """
                 staticip.ip IS NOT NULL AND
                 host(staticip.ip) != ''
             ORDER BY
+                """ + target_order + """
                 node.hostname,
                 is_boot DESC,
                 family(staticip.ip),
@@ -591,6 +698,7 @@ class StaticIPAddressManager(Manager):
             """
         iface_sql_query = """
             SELECT
+                """ + target_column + """
                 CONCAT(node.hostname, '.', domain.name) AS fqdn,
                 node.system_id,
                 node.node_type,
@@ -609,7 +717,7 @@ class StaticIPAddressManager(Manager):
             JOIN maasserver_staticipaddress AS staticip ON
                 staticip.id = link.staticipaddress_id
             """
-        if isinstance(domain_or_subnet, Domain):
+        if by_domain:
             # This logic is similar to the logic in sql_query above.
             iface_sql_query += """
             LEFT JOIN maasserver_domain AS domain2 ON
@@ -618,8 +726,9 @@ class StaticIPAddressManager(Manager):
                  */
                 domain2.name = CONCAT(
                     interface.name, '.', node.hostname, '.', domain.name)
+            CROSS JOIN unnest(%s::integer[]) AS target(id)
             WHERE
-                (domain2.id = %s OR node.domain_id = %s) AND
+                (domain2.id = target.id OR node.domain_id = target.id) AND
             """
         else:
             # For subnets, we need ALL the names, so that we can correctly
@@ -633,27 +742,34 @@ class StaticIPAddressManager(Manager):
                 staticip.ip IS NOT NULL AND
                 host(staticip.ip) != ''
             ORDER BY
+                """ + target_order + """
                 node.hostname,
                 assigned DESC, /* Return all assigned IPs for a node first. */
                 interface.id
             """
-        # We get user reserved et al mappings first, so that we can overwrite
-        # TTL as we process the return from the SQL horror above.
-        mapping = self._get_special_mappings(domain_or_subnet, raw_ttl)
+        return sql_query, iface_sql_query
+
+    def _merge_hostname_ip_mapping(self, mapping, results, iface_results):
+        """Merge the results of the `get_hostname_ip_mapping` queries.
+
+        :param mapping: the special mappings, to which the node addresses are
+            added.
+        :param results: the rows from the node query.
+        :param iface_results: the rows from the interface query.
+        """
         # All of the mappings that we got mean that we will only want to add
         # addresses for the boot interface (is_boot == True).
         iface_is_boot = defaultdict(bool, {
             hostname: True for hostname in mapping.keys()
         })
         assigned_ips = defaultdict(bool)
-        cursor.execute(sql_query, query_parms)
         # The records from the query provide, for each hostname (after
         # stripping domain), the boot and non-boot interface ip address in ipv4
         # and ipv6.  Our task: if there are boot interace IPs, they win.  If
         # there are none, then whatever we got wins.  The ORDER BY means that
         # we will see all of the boot interfaces before we see any non-boot
         # interface IPs.  See Bug#1584850
-        for result in cursor.fetchall():
+        for result in results:
             result = MappingQueryResult(*result)
             mapping[result.fqdn].node_type = result.node_type
             mapping[result.fqdn].system_id = result.system_id
@@ -666,8 +782,7 @@ class StaticIPAddressManager(Manager):
         # Next, get all the addresses, on all the interfaces, and add the ones
         # that are not already present on the FQDN as $IFACE.$FQDN.  Exclude
         # any discovered addresses once there are any non-discovered addresses.
-        cursor.execute(iface_sql_query, query_parms)
-        for result in cursor.fetchall():
+        for result in iface_results:
             result = InterfaceMappingResult(*result)
             if result.assigned:
                 assigned_ips[result.fqdn] = True
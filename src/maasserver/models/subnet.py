@@ -8,6 +8,7 @@ __all__ = [
     'Subnet',
 ]
 
+from collections import defaultdict
 from operator import attrgetter
 from typing import (
     Iterable,
@@ -172,6 +173,48 @@ class SubnetQueriesMixin(MAASQueriesMixin):
         else:
             return None
 
+    find_best_subnets_for_ips_query = """
+        SELECT DISTINCT ON (target.ip)
+            subnet.*,
+            target.ip "target_ip",
+            masklen(subnet.cidr) "prefixlen",
+            vlan.dhcp_on "dhcp_on"
+        FROM unnest(%s::inet[]) AS target(ip)
+        INNER JOIN maasserver_subnet AS subnet
+            ON target.ip << subnet.cidr
+        INNER JOIN maasserver_vlan AS vlan
+            ON subnet.vlan_id = vlan.id
+        ORDER BY
+            target.ip,
+            /* As for find_best_subnet_for_ip_query. */
+            dhcp_on DESC,
+            prefixlen DESC
+        """
+
+    def get_best_subnets_for_ips(self, ips):
+        """Find the most-specific managed Subnet for each of the specified IP
+        addresses, in a single query.
+
+        :return: A dict mapping each IP address, as given, to its `Subnet`.
+            IP addresses that are not in any subnet are omitted.
+        """
+        targets = defaultdict(list)
+        for ip in ips:
+            address = IPAddress(ip)
+            if address.is_ipv4_mapped():
+                address = address.ipv4()
+            targets[address].append(ip)
+        if len(targets) == 0:
+            return {}
+        subnets = self.raw(
+            self.find_best_subnets_for_ips_query,
+            params=[[str(address) for address in targets]])
+        return {
+            ip: subnet
+            for subnet in subnets
+            for ip in targets[IPAddress(subnet.target_ip)]
+        }
+
     def validate_filter_specifiers(self, specifiers):
         """Validate the given filter string."""
         try:
@@ -0,0 +1,145 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `AllocationIndex`."""
+
+__all__ = []
+
+from maasserver.enum import INTERFACE_TYPE
+from maasserver.models import AllocationIndex
+from maasserver.node_constraint_filter_forms import (
+    get_storage_constraints_from_string,
+)
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from provisioningserver.utils.constraints import LabeledConstraintMap
+
+
+GB = 1000 ** 3
+
+
+class TestAllocationIndexManagerMatchStorage(MAASServerTestCase):
+
+    def make_node(self, root_size, *unused_sizes, tags=None):
+        node = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(
+            node=node, size=root_size, tags=[], formatted_root=True)
+        for size in unused_sizes:
+            factory.make_PhysicalBlockDevice(node=node, size=size, tags=tags)
+        return node
+
+    def match_storage(self, storage):
+        entries, exact = AllocationIndex.objects.match_storage(
+            get_storage_constraints_from_string(storage))
+        return {entry.node_id for entry in entries}, exact
+
+    def test_matches_root_size(self):
+        node = self.make_node(2 * GB)
+        self.make_node(1 * GB)
+        self.assertEqual(({node.id}, True), self.match_storage("2"))
+
+    def test_matches_unused_sizes_largest_first(self):
+        node = self.make_node(1 * GB, 3 * GB, 1 * GB)
+        self.make_node(1 * GB, 3 * GB)
+        self.make_node(1 * GB, 1 * GB, 1 * GB)
+        self.assertEqual(({node.id}, True), self.match_storage("0,1,2"))
+
+    def test_matches_tags_inexactly(self):
+        node = self.make_node(1 * GB, 1 * GB, tags=["ssd"])
+        self.make_node(1 * GB, 1 * GB, tags=["hdd"])
+        self.assertEqual(({node.id}, False), self.match_storage("0,1(ssd)"))
+
+    def test_matches_root_tags_inexactly(self):
+        node = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(
+            node=node, size=1 * GB, tags=["ssd"], formatted_root=True)
+        self.make_node(1 * GB)
+        self.assertEqual(({node.id}, False), self.match_storage("0(ssd)"))
+
+
+class TestAllocationIndexManagerMatchInterfaces(MAASServerTestCase):
+
+    def match_interfaces(self, interfaces):
+        entries, exact = AllocationIndex.objects.match_interfaces(
+            LabeledConstraintMap(interfaces))
+        return {entry.node_id for entry in entries}, exact
+
+    def make_node(self, vlan):
+        node = factory.make_Node(with_boot_disk=False)
+        factory.make_Interface(INTERFACE_TYPE.PHYSICAL, node=node, vlan=vlan)
+        return node
+
+    def test_matches_fabric(self):
+        fabric = factory.make_Fabric()
+        node = self.make_node(factory.make_VLAN(fabric=fabric))
+        self.make_node(factory.make_VLAN())
+        self.assertEqual(
+            ({node.id}, True),
+            self.match_interfaces("eth0:fabric=%s" % fabric.name))
+
+    def test_matches_fabric_class(self):
+        fabric = factory.make_Fabric(class_type="10g")
+        node = self.make_node(factory.make_VLAN(fabric=fabric))
+        self.make_node(factory.make_VLAN())
+        self.assertEqual(
+            ({node.id}, True), self.match_interfaces("eth0:fabric_class=10g"))
+
+    def test_matches_any_space(self):
+        space1 = factory.make_Space()
+        space2 = factory.make_Space()
+        node1 = self.make_node(factory.make_VLAN(space=space1))
+        node2 = self.make_node(factory.make_VLAN(space=space2))
+        self.make_node(factory.make_VLAN(space=factory.make_Space()))
+        self.assertEqual(
+            ({node1.id, node2.id}, True),
+            self.match_interfaces(
+                "eth0:space=%s,space=%s" % (space1.name, space2.name)))
+
+    def test_does_not_match_undefined_space(self):
+        node = self.make_node(factory.make_VLAN())
+        self.assertEqual(
+            ({node.id}, False), self.match_interfaces("eth0:space=undefined"))
+
+    def test_matches_vlan(self):
+        vlan = factory.make_VLAN()
+        node = self.make_node(vlan)
+        self.make_node(factory.make_VLAN())
+        self.assertEqual(
+            ({node.id}, True),
+            self.match_interfaces("eth0:vlan=id:%d" % vlan.id))
+
+    def test_matches_subnet(self):
+        subnet = factory.make_Subnet()
+        node = self.make_node(subnet.vlan)
+        factory.make_StaticIPAddress(
+            interface=node.interface_set.first(), subnet=subnet)
+        self.make_node(subnet.vlan)
+        self.assertEqual(
+            ({node.id}, True),
+            self.match_interfaces("eth0:subnet=%s" % subnet.cidr))
+
+    def test_matches_every_label(self):
+        fabric = factory.make_Fabric(class_type="10g")
+        vlan = factory.make_VLAN()
+        node = self.make_node(vlan)
+        factory.make_Interface(
+            INTERFACE_TYPE.PHYSICAL, node=node,
+            vlan=factory.make_VLAN(fabric=fabric))
+        self.make_node(vlan)
+        self.assertEqual(
+            ({node.id}, True), self.match_interfaces(
+                "eth0:vlan=id:%d;eth1:fabric_class=10g" % vlan.id))
+
+    def test_matches_several_constraints_of_a_label_inexactly(self):
+        fabric = factory.make_Fabric(class_type="10g")
+        vlan = factory.make_VLAN(fabric=fabric)
+        node = self.make_node(vlan)
+        self.assertEqual(
+            ({node.id}, False), self.match_interfaces(
+                "eth0:vlan=id:%d,fabric_class=10g" % vlan.id))
+
+    def test_does_not_match_other_constraints(self):
+        node = self.make_node(factory.make_VLAN())
+        name = node.interface_set.first().name
+        self.assertEqual(
+            ({node.id}, False), self.match_interfaces("eth0:name=%s" % name))
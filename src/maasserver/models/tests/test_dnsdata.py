@@ -23,6 +23,7 @@ from maasserver.models.domain import Domain
 from maasserver.models.node import Node
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.djangotestcase import count_queries
 from testtools import ExpectedException
 
 # duplicated from dnsdata.py so as to not export them
@@ -350,3 +351,27 @@ class TestDNSDataMapping(MAASServerTestCase):
             actual = DNSData.objects.get_hostname_dnsdata_mapping(
                 dom, raw_ttl=True)
             self.assertEqual(expected_mapping, actual)
+
+    def test_get_hostname_dnsdata_mappings_returns_mapping_per_domain(self):
+        domains = [factory.make_Domain() for _ in range(3)]
+        expected_mappings = {}
+        for dom in domains[:2]:
+            factory.make_DNSData(domain=dom)
+            factory.make_DNSData(domain=dom)
+            expected_mappings[dom] = {}
+            for dnsrr in dom.dnsresource_set.all():
+                expected_mappings[dom].update(self.make_mapping(dnsrr))
+        # The last domain has no data, but is still in the result.
+        expected_mappings[domains[2]] = {}
+        actual = DNSData.objects.get_hostname_dnsdata_mappings(domains)
+        self.assertEqual(expected_mappings, actual)
+
+    def test_get_hostname_dnsdata_mappings_query_count_is_constant(self):
+        domains = [factory.make_Domain() for _ in range(3)]
+        for dom in domains:
+            factory.make_DNSData(domain=dom)
+        count1, _ = count_queries(
+            DNSData.objects.get_hostname_dnsdata_mappings, domains[:1])
+        count3, _ = count_queries(
+            DNSData.objects.get_hostname_dnsdata_mappings, domains)
+        self.assertEqual(count1, count3)
@@ -29,8 +29,12 @@ from django.core.exceptions import (
     PermissionDenied,
     ValidationError,
 )
-from django.db import transaction
+from django.db import (
+    connection,
+    transaction,
+)
 from django.db.models.deletion import Collector
+from django.test.utils import CaptureQueriesContext
 from fixtures import LoggerFixture
 from maasserver import (
     bootresources,
@@ -495,6 +499,52 @@ class TestMachineManager(MAASServerTestCase):
             Machine.objects.get_available_machines_for_acquisition(user),
             [machine])
 
+    def test_lock_first_available_returns_first_machine(self):
+        machines = [self.make_machine() for _ in range(3)]
+        candidates = Machine.objects.filter(
+            id__in=[machine.id for machine in machines]).order_by("-id")
+        self.assertEqual(
+            machines[-1], Machine.objects.lock_first_available(candidates))
+
+    def test_lock_first_available_returns_None_if_empty(self):
+        self.assertIsNone(
+            Machine.objects.lock_first_available(Machine.objects.none()))
+
+    def test_lock_first_available_skips_machines_no_longer_ready(self):
+        machines = [self.make_machine() for _ in range(3)]
+        candidates = Machine.objects.filter(
+            id__in=[machine.id for machine in machines]).order_by("id")
+        taken = machines[0]
+        taken.status = NODE_STATUS.ALLOCATED
+        taken.save()
+        # Candidates are considered in order, a chunk at a time.
+        self.assertEqual(
+            machines[1],
+            Machine.objects.lock_first_available(candidates, chunk_size=1))
+
+    def test_lock_available_returns_machines_in_order(self):
+        machines = [self.make_machine() for _ in range(4)]
+        candidates = Machine.objects.filter(
+            id__in=[machine.id for machine in machines]).order_by("-id")
+        self.assertEqual(
+            machines[:1:-1],
+            Machine.objects.lock_available(candidates, 2, chunk_size=1))
+
+    def test_lock_available_returns_fewer_if_not_enough(self):
+        machines = [self.make_machine() for _ in range(2)]
+        candidates = Machine.objects.filter(
+            id__in=[machine.id for machine in machines]).order_by("id")
+        self.assertEqual(
+            machines, Machine.objects.lock_available(candidates, 5))
+
+    def test_lock_first_available_locks_with_skip_locked(self):
+        self.make_machine()
+        with CaptureQueriesContext(connection) as queries:
+            Machine.objects.lock_first_available(Machine.objects.all())
+        self.assertThat(
+            queries.captured_queries[-1]["sql"],
+            Contains("FOR UPDATE SKIP LOCKED"))
+
 
 class TestControllerManager(MAASServerTestCase):
 
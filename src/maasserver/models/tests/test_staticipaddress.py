@@ -47,6 +47,7 @@ from maasserver.utils.orm import (
     transactional,
 )
 from maasserver.websockets.base import dehydrate_datetime
+from maastesting.djangotestcase import count_queries
 from netaddr import IPAddress
 from psycopg2.errorcodes import FOREIGN_KEY_VIOLATION
 from testtools import ExpectedException
@@ -983,6 +984,48 @@ class TestStaticIPAddressManagerMapping(MAASServerTestCase):
                 HostnameIPMapping(None, 30, {sip3.ip}, None),
         }
 
+    def test_get_hostname_ip_mappings_returns_mapping_per_domain(self):
+        domain0 = Domain.objects.get_default_domain()
+        domain1 = factory.make_Domain()
+        domain2 = factory.make_Domain()
+        node = factory.make_Node(interface=True, domain=domain1)
+        boot_interface = node.get_boot_interface()
+        subnet = factory.make_Subnet()
+        staticip = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY,
+            ip=factory.pick_ip_in_Subnet(subnet),
+            subnet=subnet, interface=boot_interface)
+        ip0 = factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.USER_RESERVED)
+        mappings = StaticIPAddress.objects.get_hostname_ip_mappings(
+            [domain0, domain1, domain2])
+        self.assertEqual({
+            domain0: {
+                "%s.%s" % (get_ip_based_hostname(ip0.ip), domain0.name):
+                    HostnameIPMapping(None, 30, {ip0.ip}, None),
+            },
+            domain1: {
+                node.fqdn: HostnameIPMapping(
+                    node.system_id, 30, {staticip.ip}, node.node_type),
+            },
+            domain2: {},
+        }, mappings)
+
+    def test_get_hostname_ip_mappings_query_count_is_constant(self):
+        domains = [factory.make_Domain() for _ in range(3)]
+        for domain in domains:
+            node = factory.make_Node(interface=True, domain=domain)
+            subnet = factory.make_Subnet()
+            factory.make_StaticIPAddress(
+                alloc_type=IPADDRESS_TYPE.STICKY,
+                ip=factory.pick_ip_in_Subnet(subnet),
+                subnet=subnet, interface=node.get_boot_interface())
+        count1, _ = count_queries(
+            StaticIPAddress.objects.get_hostname_ip_mappings, domains[:1])
+        count3, _ = count_queries(
+            StaticIPAddress.objects.get_hostname_ip_mappings, domains)
+        self.assertEqual(count1, count3)
+
 
 class TestStaticIPAddress(MAASServerTestCase):
 
@@ -49,6 +49,7 @@ from maasserver.utils.orm import (
     get_one,
     reload_object,
 )
+from maastesting.djangotestcase import count_queries
 from maastesting.matchers import DocTestMatches
 from netaddr import (
     AddrFormatError,
@@ -713,6 +714,49 @@ class TestGetBestSubnetForIP(MAASServerTestCase):
         self.expectThat(subnet, Is(None))
 
 
+class TestGetBestSubnetsForIPs(MAASServerTestCase):
+
+    def test__returns_most_specific_subnet_for_each_ip(self):
+        factory.make_Subnet(cidr="10.0.0.0/8")
+        subnet_24 = factory.make_Subnet(cidr="10.1.1.0/24")
+        subnet_16 = factory.make_Subnet(cidr="10.1.0.0/16")
+        subnet_64 = factory.make_Subnet(cidr="2001:db8:1:2::/64")
+        subnets = Subnet.objects.get_best_subnets_for_ips(
+            ["10.1.1.1", "10.1.2.1", "2001:db8:1:2::1", "::ffff:10.1.1.2"])
+        self.assertThat(subnets, Equals({
+            "10.1.1.1": subnet_24,
+            "10.1.2.1": subnet_16,
+            "2001:db8:1:2::1": subnet_64,
+            "::ffff:10.1.1.2": subnet_24,
+        }))
+
+    def test__agrees_with_get_best_subnet_for_ip(self):
+        for _ in range(3):
+            factory.make_Subnet(vlan=factory.make_VLAN(dhcp_on=True))
+        ips = [
+            factory.pick_ip_in_Subnet(subnet)
+            for subnet in Subnet.objects.all()
+        ]
+        self.assertThat(
+            Subnet.objects.get_best_subnets_for_ips(ips),
+            Equals({
+                ip: Subnet.objects.get_best_subnet_for_ip(ip)
+                for ip in ips
+            }))
+
+    def test__omits_ips_not_in_any_subnet(self):
+        factory.make_Subnet(cidr="10.0.0.0/8")
+        self.assertThat(
+            Subnet.objects.get_best_subnets_for_ips(["192.168.0.1"]),
+            Equals({}))
+
+    def test__returns_empty_dict_without_querying_for_no_ips(self):
+        count, subnets = count_queries(
+            Subnet.objects.get_best_subnets_for_ips, [])
+        self.assertThat(subnets, Equals({}))
+        self.assertThat(count, Equals(0))
+
+
 class SubnetLabelTest(MAASServerTestCase):
 
     def test__returns_cidr_for_null_name(self):
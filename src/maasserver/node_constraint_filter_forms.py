@@ -29,6 +29,7 @@ from maasserver.forms import (
 )
 import maasserver.forms as maasserver_forms
 from maasserver.models import (
+    AllocationIndex,
     BlockDevice,
     Filesystem,
     Interface,
@@ -127,6 +128,7 @@ IGNORED_FIELDS = {
     'verbose',
     'op',
     'agent_name',
+    'count',
 }
 
 
@@ -418,7 +420,7 @@ def nodes_by_storage(storage, node_ids=None):
     return nodes
 
 
-def nodes_by_interface(interfaces_label_map):
+def nodes_by_interface(interfaces_label_map, node_ids=None):
     """Determines the set of nodes that match the specified
     LabeledConstraintMap (which must be a map of interface constraints.)
 
@@ -433,8 +435,12 @@ def nodes_by_interface(interfaces_label_map):
     }
 
     :param interfaces_label_map: LabeledConstraintMap
+    :param node_ids: Optional IDs of the only nodes to consider.
     :return: dict
     """
+    interfaces = Interface.objects.all()
+    if node_ids is not None:
+        interfaces = interfaces.filter(node_id__in=node_ids)
     node_ids = None
     label_map = {}
     for label in interfaces_label_map:
@@ -442,7 +448,7 @@ def nodes_by_interface(interfaces_label_map):
         if node_ids is None:
             # The first time through the filter, build the list
             # of candidate nodes.
-            node_ids, node_map = Interface.objects.get_matching_node_map(
+            node_ids, node_map = interfaces.get_matching_node_map(
                 constraints)
             label_map[label] = node_map
         else:
@@ -453,7 +459,7 @@ def nodes_by_interface(interfaces_label_map):
             # If a more efficient approach is desired, this could be changed
             # to filter the nodes starting from an 'id__in' filter using the
             # current 'node_ids' set.
-            new_node_ids, node_map = Interface.objects.get_matching_node_map(
+            new_node_ids, node_map = interfaces.get_matching_node_map(
                 constraints)
             label_map[label] = node_map
             node_ids &= new_node_ids
@@ -752,12 +758,16 @@ class AcquireNodeForm(RenamableFieldsForm):
             for constraint in constraints
             if constraint is not None)
 
-    def filter_nodes(self, nodes):
+    def filter_nodes(self, nodes, constraint_maps=True):
         """Return the subset of nodes that match the form's constraints.
 
         :param nodes:  The set of nodes on which the form should apply
             constraints.
         :type nodes: `django.db.models.query.QuerySet`
+        :param constraint_maps: Whether to return the storage and interface
+            constraint maps of all the matching nodes. When `False`, they
+            are returned empty, and `get_constraint_maps` can be used to get
+            them for only the nodes that are picked.
         :return: A QuerySet of the nodes that match the form's constraints.
         :rtype: `django.db.models.query.QuerySet`
         """
@@ -775,12 +785,32 @@ class AcquireNodeForm(RenamableFieldsForm):
         filtered_nodes = self.filter_by_fabrics(filtered_nodes)
         filtered_nodes = self.filter_by_fabric_classes(filtered_nodes)
         compatible_nodes, filtered_nodes = self.filter_by_storage(
-            filtered_nodes)
+            filtered_nodes, constraint_maps)
         compatible_interfaces, filtered_nodes = self.filter_by_interfaces(
-            filtered_nodes)
+            filtered_nodes, constraint_maps)
         filtered_nodes = self.reorder_nodes_by_cost(filtered_nodes)
         return filtered_nodes, compatible_nodes, compatible_interfaces
 
+    def get_constraint_maps(self, nodes):
+        """Return the storage and interface constraint maps of `nodes`.
+
+        :param nodes: Nodes that match the form's constraints.
+        :return: A tuple of the storage and interface constraint maps, as
+            returned by `filter_nodes`, for `nodes` only.
+        """
+        node_ids = [node.id for node in nodes]
+        compatible_nodes = {}
+        storage = self.cleaned_data.get(self.get_field_name('storage'))
+        if storage:
+            compatible_nodes = nodes_by_storage(storage, node_ids=node_ids)
+        compatible_interfaces = {}
+        interfaces_label_map = self.cleaned_data.get(
+            self.get_field_name('interfaces'))
+        if interfaces_label_map is not None:
+            _, compatible_interfaces = nodes_by_interface(
+                interfaces_label_map, node_ids=node_ids)
+        return compatible_nodes, compatible_interfaces
+
     def reorder_nodes_by_cost(self, filtered_nodes):
         # This uses a very simple procedure to compute a machine's
         # cost. This procedure is loosely based on how ec2 computes
@@ -792,27 +822,56 @@ class AcquireNodeForm(RenamableFieldsForm):
             select={'cost': "cpu_count + memory / 1024."})
         return filtered_nodes.order_by("cost")
 
-    def filter_by_interfaces(self, filtered_nodes):
+    def get_candidate_ids(self, filtered_nodes):
+        """Return a subquery for the IDs of the nodes that passed the other
+        filters.
+
+        Matching storage and interface constraints exactly considers every
+        block device and interface, which is costly when there are many, so
+        it only considers these nodes instead.
+        """
+        return filtered_nodes.order_by().values('id')
+
+    def filter_by_interfaces(self, filtered_nodes, constraint_maps=True):
         compatible_interfaces = {}
         interfaces_label_map = self.cleaned_data.get(
             self.get_field_name('interfaces'))
         if interfaces_label_map is not None:
-            node_ids, compatible_interfaces = nodes_by_interface(
+            entries, exact = AllocationIndex.objects.match_interfaces(
                 interfaces_label_map)
-            if node_ids is not None:
-                filtered_nodes = filtered_nodes.filter(id__in=node_ids)
+            filtered_nodes = filtered_nodes.filter(
+                id__in=entries.values('node_id'))
+            # The index is enough to filter on when it matches exactly, so
+            # only the constraint maps need the interfaces themselves.
+            if constraint_maps or not exact:
+                node_ids, compatible_interfaces = nodes_by_interface(
+                    interfaces_label_map,
+                    node_ids=self.get_candidate_ids(filtered_nodes))
+                if node_ids is not None:
+                    filtered_nodes = filtered_nodes.filter(id__in=node_ids)
+            if not constraint_maps:
+                compatible_interfaces = {}
 
         return compatible_interfaces, filtered_nodes
 
-    def filter_by_storage(self, filtered_nodes):
+    def filter_by_storage(self, filtered_nodes, constraint_maps=True):
         compatible_nodes = {}  # Maps node/storage to named storage constraints
         storage = self.cleaned_data.get(
             self.get_field_name('storage'))
         if storage:
-            compatible_nodes = nodes_by_storage(storage)
-            node_ids = list(compatible_nodes)
-            if node_ids is not None:
-                filtered_nodes = filtered_nodes.filter(id__in=node_ids)
+            entries, exact = AllocationIndex.objects.match_storage(
+                get_storage_constraints_from_string(storage))
+            filtered_nodes = filtered_nodes.filter(
+                id__in=entries.values('node_id'))
+            # The index is enough to filter on when it matches exactly, so
+            # only the constraint maps need the block devices themselves.
+            if constraint_maps or not exact:
+                compatible_nodes = nodes_by_storage(
+                    storage, node_ids=self.get_candidate_ids(filtered_nodes))
+                filtered_nodes = filtered_nodes.filter(
+                    id__in=list(compatible_nodes))
+            if not constraint_maps:
+                compatible_nodes = {}
         return compatible_nodes, filtered_nodes
 
     def filter_by_fabric_classes(self, filtered_nodes):
@@ -29,7 +29,10 @@ DHCP:
     Once a 'watch_{id}' message is sent to this process it will start listening
     for messages on 'sys_dhcp_{id}' channel and set that rack controller as
     needing an update. Any time a message is received on this queue that rack
-    controller is marked as needing an update.
+    controller is marked as needing an update. The message is the ID of the
+    VLAN whose configuration changed, or empty if any might have; the cached
+    configuration for that VLAN (or all VLANs) is discarded, and the rest is
+    reused when the configuration is next generated.
 """
 
 __all__ = [
@@ -157,6 +160,7 @@ class RackControllerService(Service):
                 except PostgresListenerUnregistrationError:
                     # Error is acceptable as it might not have been called yet.
                     pass
+                dhcp.dhcp_configuration_cache.unwatch(rack_id)
 
             self.watching = set()
             self.needsDHCPUpdate = set()
@@ -180,12 +184,14 @@ class RackControllerService(Service):
             if rack_id in self.watching:
                 self.postgresListener.unregister(
                     "sys_dhcp_%s" % rack_id, self.dhcpHandler)
+                dhcp.dhcp_configuration_cache.unwatch(rack_id)
             self.needsDHCPUpdate.discard(rack_id)
             self.watching.discard(rack_id)
         elif action == "watch":
             if rack_id not in self.watching:
                 self.postgresListener.register(
                     "sys_dhcp_%s" % rack_id, self.dhcpHandler)
+                dhcp.dhcp_configuration_cache.watch(rack_id)
             self.watching.add(rack_id)
             self.needsDHCPUpdate.add(rack_id)
             self.startProcessing()
@@ -197,6 +203,8 @@ class RackControllerService(Service):
         _, rack_id = channel.split("sys_dhcp_")
         rack_id = int(rack_id)
         if rack_id in self.watching:
+            vlan_id = int(message) if message else None
+            dhcp.dhcp_configuration_cache.invalidate(rack_id, vlan_id)
             self.needsDHCPUpdate.add(rack_id)
             self.startProcessing()
 
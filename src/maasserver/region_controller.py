@@ -12,6 +12,17 @@ DNS:
     as requiring an update. Once marked for update the DNS configuration is
     updated and bind9 is told to reload.
 
+    Changes that only touch records within existing zones are preceded by a
+    message on channel 'sys_dns_zones' that names the domains and subnets
+    that changed. When every pending publication was announced this way only
+    those zones are rewritten, and bind9 is told to reload only those zones.
+
+    When dynamic DNS updates are enabled, records for discovered IP addresses
+    (such as those of DHCP leases) are instead sent on channel
+    'sys_dns_updates' and passed on to bind9 as RFC 2136 dynamic updates,
+    without rewriting any zones. Should an update fail, all zones are
+    rewritten.
+
 Proxy:
     The regiond process listens for messages from Postgres on channel
     'sys_proxy'. Any time a message is recieved on that channel the maas-proxy
@@ -23,11 +34,18 @@ __all__ = [
     "RegionControllerService",
 ]
 
-from maasserver.dns.config import dns_update_all_zones
+import json
+
+from maasserver.dns.config import (
+    dns_update_all_zones,
+    dns_update_zones,
+    get_dynamic_dns_updates,
+)
 from maasserver.models.dnspublication import DNSPublication
 from maasserver.proxyconfig import proxy_update_config
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
+from provisioningserver.dns.actions import bind_update_records
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils.twisted import (
     asynchronous,
@@ -41,6 +59,7 @@ from twisted.internet.defer import (
     inlineCallbacks,
 )
 from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
 from twisted.names.client import Resolver
 
 
@@ -72,6 +91,11 @@ class RegionControllerService(Service):
         self.processing.clock = self.clock
         self.processingDefer = None
         self.needsDNSUpdate = False
+        self.needsFullDNSUpdate = False
+        self.dirtyDomains = set()
+        self.dirtySubnets = set()
+        self.pendingDNSZones = {}
+        self.pendingDNSRecords = []
         self.needsProxyUpdate = False
         self.postgresListener = postgresListener
         self.dnsResolver = Resolver(
@@ -84,6 +108,10 @@ class RegionControllerService(Service):
         """Start listening for messages."""
         super(RegionControllerService, self).startService()
         self.postgresListener.register("sys_dns", self.markDNSForUpdate)
+        self.postgresListener.register(
+            "sys_dns_zones", self.markDNSZonesForUpdate)
+        self.postgresListener.register(
+            "sys_dns_updates", self.markDNSRecordsForUpdate)
         self.postgresListener.register("sys_proxy", self.markProxyForUpdate)
 
         # Update DNS and proxy on first start.
@@ -95,6 +123,10 @@ class RegionControllerService(Service):
         """Close the controller."""
         super(RegionControllerService, self).stopService()
         self.postgresListener.unregister("sys_dns", self.markDNSForUpdate)
+        self.postgresListener.unregister(
+            "sys_dns_zones", self.markDNSZonesForUpdate)
+        self.postgresListener.unregister(
+            "sys_dns_updates", self.markDNSRecordsForUpdate)
         self.postgresListener.unregister("sys_proxy", self.markProxyForUpdate)
         if self.processingDefer is not None:
             self.processingDefer, d = None, self.processingDefer
@@ -102,10 +134,49 @@ class RegionControllerService(Service):
             return d
 
     def markDNSForUpdate(self, channel, message):
-        """Called when the `sys_dns` message is received."""
+        """Called when the `sys_dns` message is received.
+
+        The message is the serial of the new publication. When a matching
+        `sys_dns_zones` message has been received then only those zones are
+        marked for update, otherwise all zones are.
+        """
+        zones = self.pendingDNSZones.pop(message, None)
+        if zones is None:
+            self.needsFullDNSUpdate = True
+        else:
+            domain_ids, subnet_ids = zones
+            self.dirtyDomains.update(domain_ids)
+            self.dirtySubnets.update(subnet_ids)
         self.needsDNSUpdate = True
         self.startProcessing()
 
+    def markDNSZonesForUpdate(self, channel, message):
+        """Called when the `sys_dns_zones` message is received.
+
+        The message holds the serial of the publication that is about to be
+        made, followed by the comma-separated ids of the domains and subnets
+        whose zones have changed.
+        """
+        serial, domain_ids, subnet_ids = message.split(" ")
+        self.pendingDNSZones[serial] = (
+            {int(obj_id) for obj_id in domain_ids.split(",") if obj_id},
+            {int(obj_id) for obj_id in subnet_ids.split(",") if obj_id},
+        )
+
+    def markDNSRecordsForUpdate(self, channel, message):
+        """Called when the `sys_dns_updates` message is received.
+
+        The message is a JSON object describing a record to insert or delete.
+        The dynamic updates for it are queued, and the reverse zones that
+        cannot be updated dynamically are marked for update.
+        """
+        updates, subnet_ids = get_dynamic_dns_updates(json.loads(message))
+        self.pendingDNSRecords.extend(updates)
+        if len(subnet_ids) > 0:
+            self.dirtySubnets.update(subnet_ids)
+            self.needsDNSUpdate = True
+        self.startProcessing()
+
     def markProxyForUpdate(self, channel, message):
         """Called when the `sys_proxy` message is received."""
         self.needsProxyUpdate = True
@@ -119,9 +190,27 @@ class RegionControllerService(Service):
     def process(self):
         """Process the DNS and/or proxy update."""
         defers = []
+        if self.needsDNSUpdate and self.needsFullDNSUpdate:
+            # Rewriting all the zones includes any pending records.
+            self.pendingDNSRecords = []
+        if len(self.pendingDNSRecords) > 0:
+            updates, self.pendingDNSRecords = self.pendingDNSRecords, []
+            d = deferToThread(bind_update_records, updates)
+            d.addCallback(
+                lambda _: log.msg(
+                    "Sent %d dynamic DNS update(s)." % len(updates)))
+            d.addErrback(self._dynamicDNSUpdateFailed)
+            defers.append(d)
         if self.needsDNSUpdate:
             self.needsDNSUpdate = False
-            d = deferToDatabase(transactional(dns_update_all_zones))
+            domain_ids, self.dirtyDomains = self.dirtyDomains, set()
+            subnet_ids, self.dirtySubnets = self.dirtySubnets, set()
+            if self.needsFullDNSUpdate or not (domain_ids or subnet_ids):
+                self.needsFullDNSUpdate = False
+                d = deferToDatabase(transactional(dns_update_all_zones))
+            else:
+                d = deferToDatabase(
+                    transactional(dns_update_zones), domain_ids, subnet_ids)
             d.addCallback(self._checkSerial)
             d.addCallback(self._logDNSReload)
             d.addErrback(
@@ -145,6 +234,13 @@ class RegionControllerService(Service):
         else:
             return DeferredList(defers)
 
+    def _dynamicDNSUpdateFailed(self, failure):
+        """Rewrite all zones when dynamic updates could not be sent."""
+        log.err(failure, "Failed sending dynamic DNS updates.")
+        self.needsFullDNSUpdate = True
+        self.needsDNSUpdate = True
+        self.startProcessing()
+
     @inlineCallbacks
     def _checkSerial(self, result):
         """Check that the serial of the domain is updated."""
@@ -0,0 +1,65 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Subnet index service."""
+
+__all__ = [
+    "SubnetIndexService"
+]
+
+from maasserver.listener import PostgresListenerService
+from maasserver.subnet_index import (
+    subnet_index,
+    SubnetIndex,
+)
+from twisted.application.service import Service
+
+
+class SubnetIndexService(Service):
+    """Service to keep this process's `SubnetIndex` up to date.
+
+    The index is live only while this service is running.
+    """
+
+    def __init__(
+            self, postgresListener: PostgresListenerService=None,
+            index: SubnetIndex=subnet_index):
+        super().__init__()
+        self.listener = postgresListener
+        self.index = index
+
+    def startService(self):
+        super().startService()
+        if self.listener is not None:
+            self.listener.register('subnet', self.consumeSubnetEvent)
+            self.listener.register('vlan', self.consumeVLANEvent)
+            self.listener.register('iprange', self.consumeIPRangeEvent)
+            self.index.invalidate()
+            self.index.live = True
+
+    def stopService(self):
+        if self.listener is not None:
+            self.index.live = False
+            self.listener.unregister('subnet', self.consumeSubnetEvent)
+            self.listener.unregister('vlan', self.consumeVLANEvent)
+            self.listener.unregister('iprange', self.consumeIPRangeEvent)
+        return super().stopService()
+
+    def consumeSubnetEvent(self, action: str, obj_id: str):
+        """Called when a subnet is created, updated, or deleted.
+
+        Updates are frequent -- they are also sent when IP addresses in the
+        subnet change -- so only the updated subnet is reloaded.
+        """
+        if action == 'update':
+            self.index.invalidate_subnet(int(obj_id))
+        else:
+            self.index.invalidate()
+
+    def consumeVLANEvent(self, action: str, obj_id: str):
+        """Called when a VLAN is changed, perhaps turning DHCP on or off."""
+        self.index.invalidate()
+
+    def consumeIPRangeEvent(self, action: str, obj_id: str):
+        """Called when an IP range is created, updated, or deleted."""
+        self.index.invalidate_ranges()
@@ -0,0 +1,92 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the subnet index service."""
+
+__all__ = []
+
+from unittest.mock import (
+    call,
+    Mock,
+)
+
+from maasserver.regiondservices.subnet_index import SubnetIndexService
+from maasserver.subnet_index import (
+    subnet_index,
+    SubnetIndex,
+)
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+    MockNotCalled,
+)
+from maastesting.testcase import MAASTestCase
+from testtools.matchers import (
+    Equals,
+    Is,
+)
+
+
+class TestSubnetIndexService(MAASTestCase):
+
+    def make_service(self):
+        listener = Mock()
+        index = Mock(SubnetIndex)
+        index.live = False
+        return SubnetIndexService(listener, index), listener, index
+
+    def test__registers_and_unregisters_channels(self):
+        service, listener, _ = self.make_service()
+        service.startService()
+        self.assertThat(listener.register, MockCallsMatch(
+            call('subnet', service.consumeSubnetEvent),
+            call('vlan', service.consumeVLANEvent),
+            call('iprange', service.consumeIPRangeEvent)))
+        service.stopService()
+        self.assertThat(listener.unregister, MockCallsMatch(
+            call('subnet', service.consumeSubnetEvent),
+            call('vlan', service.consumeVLANEvent),
+            call('iprange', service.consumeIPRangeEvent)))
+
+    def test__index_is_live_while_running(self):
+        service, _, index = self.make_service()
+        service.startService()
+        self.assertThat(index.live, Is(True))
+        self.assertThat(index.invalidate, MockCalledOnceWith())
+        service.stopService()
+        self.assertThat(index.live, Is(False))
+
+    def test__index_is_not_live_without_listener(self):
+        index = Mock(SubnetIndex)
+        index.live = False
+        service = SubnetIndexService(None, index)
+        service.startService()
+        self.assertThat(index.live, Is(False))
+        service.stopService()
+
+    def test__uses_module_index_by_default(self):
+        service = SubnetIndexService(Mock())
+        self.assertThat(service.index, Is(subnet_index))
+
+    def test_consumeSubnetEvent_invalidates_subnet_on_update(self):
+        service, _, index = self.make_service()
+        service.consumeSubnetEvent('update', '42')
+        self.assertThat(index.invalidate_subnet, MockCalledOnceWith(42))
+        self.assertThat(index.invalidate, MockNotCalled())
+
+    def test_consumeSubnetEvent_invalidates_index_on_create_and_delete(self):
+        service, _, index = self.make_service()
+        service.consumeSubnetEvent('create', '42')
+        service.consumeSubnetEvent('delete', '42')
+        self.assertThat(index.invalidate.call_count, Equals(2))
+        self.assertThat(index.invalidate_subnet, MockNotCalled())
+
+    def test_consumeVLANEvent_invalidates_index(self):
+        service, _, index = self.make_service()
+        service.consumeVLANEvent('update', '7')
+        self.assertThat(index.invalidate, MockCalledOnceWith())
+
+    def test_consumeIPRangeEvent_invalidates_ranges(self):
+        service, _, index = self.make_service()
+        service.consumeIPRangeEvent('create', '3')
+        self.assertThat(index.invalidate_ranges, MockCalledOnceWith())
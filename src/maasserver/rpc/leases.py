@@ -5,10 +5,13 @@
 
 __all__ = [
     "update_lease",
+    "update_leases",
 ]
 
+from collections import defaultdict
 from datetime import datetime
 
+from django.db import DatabaseError
 from maasserver.enum import (
     IPADDRESS_FAMILY,
     IPADDRESS_TYPE,
@@ -18,11 +21,18 @@ from maasserver.models import (
     Interface,
     Node,
     StaticIPAddress,
-    Subnet,
     UnknownInterface,
 )
-from maasserver.utils.orm import transactional
-from netaddr import IPAddress
+from maasserver.subnet_index import subnet_index
+from maasserver.utils.orm import (
+    is_retryable_failure,
+    savepoint,
+    transactional,
+)
+from netaddr import (
+    EUI,
+    IPAddress,
+)
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils.network import coerce_to_valid_hostname
 from provisioningserver.utils.twisted import synchronous
@@ -83,9 +93,72 @@ def update_lease(
     if action not in ["commit", "expiry", "release"]:
         raise LeaseUpdateError("Unknown lease action: %s" % action)
 
-    # Get the subnet for this IP address. If no subnet exists then something
-    # is wrong as we should not be recieving message about unknown subnets.
-    subnet = Subnet.objects.get_best_subnet_for_ip(ip)
+    subnet = subnet_index.get_best_subnet_for_ip(ip)
+    interfaces = list(Interface.objects.filter(mac_address=mac))
+    _update_lease(
+        action, mac, ip_family, ip, timestamp, lease_time, hostname,
+        subnet, interfaces)
+    return {}
+
+
+@synchronous
+@transactional
+def update_leases(updates):
+    """Update a batch of DHCP leases from a cluster.
+
+    The updates are applied in order, in one transaction, each in a
+    savepoint of its own so that one that fails does not prevent the rest
+    from being applied. The subnets and interfaces for all the updates are
+    looked up together, up front.
+
+    :param updates: A list of dicts, each with the arguments to
+        `update_lease`, as found in
+        :py:class`~provisioningserver.rpc.region.UpdateLeases`.
+    """
+    subnets = subnet_index.get_best_subnets_for_ips(
+        update["ip"] for update in updates)
+    interfaces_by_mac = defaultdict(list)
+    macs = {update["mac"] for update in updates}
+    for interface in Interface.objects.filter(mac_address__in=macs):
+        interfaces_by_mac[EUI(str(interface.mac_address))].append(interface)
+
+    for update in updates:
+        action, mac, ip = update["action"], update["mac"], update["ip"]
+        try:
+            if action not in ["commit", "expiry", "release"]:
+                raise LeaseUpdateError("Unknown lease action: %s" % action)
+            with savepoint():
+                # A commit for an unknown MAC creates an interface, which
+                # later updates in the batch for the same MAC need to see.
+                interfaces_by_mac[EUI(mac)] = _update_lease(
+                    action, mac, update["ip_family"], ip, update["timestamp"],
+                    update.get("lease_time"), update.get("hostname"),
+                    subnets.get(ip), interfaces_by_mac[EUI(mac)])
+        except LeaseUpdateError as error:
+            # Anything written for this update has been rolled back, so
+            # carry on with the rest of the batch.
+            log.msg("Lease update for %s on %s failed: %s" % (ip, mac, error))
+        except DatabaseError as error:
+            if is_retryable_failure(error):
+                # Retry the whole batch.
+                raise
+            else:
+                log.err(None, "Lease update for %s on %s failed." % (ip, mac))
+    return {}
+
+
+def _update_lease(
+        action, mac, ip_family, ip, timestamp, lease_time, hostname,
+        subnet, interfaces):
+    """Update one DHCP lease, as described in `update_lease`.
+
+    :param subnet: The best subnet for `ip`, or `None`.
+    :param interfaces: The interfaces with `mac`.
+    :return: The interfaces with `mac`, including one that is created for a
+        MAC address that was not already known.
+    """
+    # If no subnet exists for this IP address then something is wrong as we
+    # should not be recieving message about unknown subnets.
     if subnet is None:
         raise LeaseUpdateError("No subnet exists for: %s" % ip)
 
@@ -107,12 +180,12 @@ def update_lease(
 
     # We will recieve actions on all addresses in the subnet. We only want
     # to update the addresses in the dynamic range.
-    dynamic_range = subnet.get_dynamic_range_for_ip(IPAddress(ip))
+    dynamic_range = subnet_index.get_dynamic_range_for_ip(
+        subnet, IPAddress(ip))
     if dynamic_range is None:
         # Do nothing.
-        return {}
+        return interfaces
 
-    interfaces = list(Interface.objects.filter(mac_address=mac))
     if len(interfaces) == 0 and action == "commit":
         # A MAC address that is unknown to MAAS was given an IP address. Create
         # an unknown interface for this lease.
@@ -122,7 +195,7 @@ def update_lease(
         interfaces = [unknown_interface]
     elif len(interfaces) == 0:
         # No interfaces and not commit action so nothing needs to be done.
-        return {}
+        return interfaces
 
     sip = None
     # Delete all discovered IP addresses attached to all interfaces of the same
@@ -187,4 +260,4 @@ def update_lease(
             sip.save()
         for interface in interfaces:
             interface.ip_addresses.add(sip)
-    return {}
+    return interfaces
@@ -9,6 +9,7 @@ from datetime import datetime
 import random
 import time
 
+from django.db import DatabaseError
 from maasserver.enum import (
     INTERFACE_TYPE,
     IPADDRESS_FAMILY,
@@ -17,9 +18,11 @@ from maasserver.enum import (
 from maasserver.models import DNSResource
 from maasserver.models.interface import UnknownInterface
 from maasserver.models.staticipaddress import StaticIPAddress
+from maasserver.rpc import leases as leases_module
 from maasserver.rpc.leases import (
     LeaseUpdateError,
     update_lease,
+    update_leases,
 )
 from maasserver.testing.factory import factory
 from maasserver.testing.testcase import MAASServerTestCase
@@ -27,6 +30,8 @@ from maasserver.utils.orm import (
     get_one,
     reload_object,
 )
+from maastesting.djangotestcase import count_queries
+from maastesting.twisted import TwistedLoggerFixture
 from netaddr import IPAddress
 from testtools.matchers import (
     Contains,
@@ -381,3 +386,97 @@ class TestUpdateLease(MAASServerTestCase):
         self.assertItemsEqual(
             [boot_interface.id],
             sip.interface_set.values_list("id", flat=True))
+
+
+class TestUpdateLeases(MAASServerTestCase):
+
+    def make_update(self, subnet, action="commit", mac=None):
+        ip = factory.pick_ip_in_IPRange(subnet.get_dynamic_ranges()[0])
+        return {
+            "action": action,
+            "mac": factory.make_mac_address() if mac is None else mac,
+            "ip_family": "ipv4",
+            "ip": ip,
+            "timestamp": int(time.time()),
+            "lease_time": random.randint(30, 1000),
+            "hostname": None,
+        }
+
+    def make_managed_subnet(self):
+        return factory.make_ipv4_Subnet_with_IPRanges(
+            with_static_range=False, dhcp_on=True)
+
+    def get_discovered_ips(self, mac):
+        return [
+            sip.ip for sip in StaticIPAddress.objects.filter(
+                alloc_type=IPADDRESS_TYPE.DISCOVERED,
+                interface__mac_address=mac)
+        ]
+
+    def test_applies_each_update(self):
+        subnet = self.make_managed_subnet()
+        node = factory.make_Node_with_Interface_on_Subnet(subnet=subnet)
+        mac = str(node.get_boot_interface().mac_address)
+        updates = [self.make_update(subnet, mac=mac), self.make_update(subnet)]
+        update_leases(updates)
+        self.assertItemsEqual([updates[0]["ip"]], self.get_discovered_ips(mac))
+        self.assertItemsEqual(
+            [updates[1]["ip"]], self.get_discovered_ips(updates[1]["mac"]))
+
+    def test_applies_updates_in_order(self):
+        subnet = self.make_managed_subnet()
+        commit = self.make_update(subnet, action="commit")
+        release = dict(commit, action="release")
+        update_leases([commit, release])
+        # The interface created by the commit is seen by the release.
+        self.assertItemsEqual([None], self.get_discovered_ips(commit["mac"]))
+        self.assertThat(
+            UnknownInterface.objects.filter(mac_address=commit["mac"]).count(),
+            Equals(1))
+
+    def test_skips_invalid_updates(self):
+        subnet = self.make_managed_subnet()
+        bad_action = dict(self.make_update(subnet), action="bogus")
+        no_subnet = dict(self.make_update(subnet), ip="2001:db8::1")
+        good = self.make_update(subnet)
+        update_leases([bad_action, no_subnet, good])
+        self.assertItemsEqual([], self.get_discovered_ips(bad_action["mac"]))
+        self.assertItemsEqual([], self.get_discovered_ips(no_subnet["mac"]))
+        self.assertItemsEqual(
+            [good["ip"]], self.get_discovered_ips(good["mac"]))
+
+    def test_skips_updates_that_fail_with_database_errors(self):
+        subnet = self.make_managed_subnet()
+        bad = self.make_update(subnet)
+        good = self.make_update(subnet)
+        real_update_lease = leases_module._update_lease
+
+        def _update_lease(action, mac, *args):
+            interfaces = real_update_lease(action, mac, *args)
+            if mac == bad["mac"]:
+                raise DatabaseError("Broken.")
+            return interfaces
+
+        self.patch(leases_module, "_update_lease", _update_lease)
+        with TwistedLoggerFixture() as logger:
+            update_leases([bad, good])
+        # What was written for the failed update has been rolled back.
+        self.assertItemsEqual([], self.get_discovered_ips(bad["mac"]))
+        self.assertItemsEqual(
+            [good["ip"]], self.get_discovered_ips(good["mac"]))
+        self.assertThat(logger.output, Contains(
+            "Lease update for %s on %s failed." % (bad["ip"], bad["mac"])))
+
+    def test_looks_up_subnets_and_interfaces_once_per_batch(self):
+        subnet = self.make_managed_subnet()
+        count_one, _ = count_queries(
+            update_leases, [self.make_update(subnet, action="expiry")])
+        count_many, _ = count_queries(
+            update_leases, [
+                self.make_update(subnet, action="expiry")
+                for _ in range(5)
+            ])
+        # Expiries for unknown MAC addresses only need the lookups, and the
+        # dynamic range check for each lease, which is made in a savepoint
+        # of its own.
+        self.assertThat(count_many - count_one, Equals(4 * 3))
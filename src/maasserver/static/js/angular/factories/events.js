@@ -117,9 +117,9 @@ angular.module('MAAS').factory(
 
         // Called when the RegionConnection gets a notification for an event.
         EventsManagerFactory.prototype.onNotify = function(action, data) {
-            if(action === "delete") {
-                // Send all delete actions to all managers. Only one will
-                // remove the event with the given id.
+            if(action === "delete" || action === "patch") {
+                // Send all delete and patch actions to all managers. Only
+                // one will have the event with the given id.
                 angular.forEach(this._managers, function(manager) {
                     manager.onNotify(action, data);
                 });
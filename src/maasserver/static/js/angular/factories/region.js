@@ -16,7 +16,9 @@ angular.module('MAAS').factory(
         var MSG_TYPE = {
             REQUEST: 0,
             RESPONSE: 1,
-            NOTIFY: 2
+            NOTIFY: 2,
+            PATCH: 3,
+            BATCH: 4
         };
 
         // Response types
@@ -210,6 +212,11 @@ angular.module('MAAS').factory(
             }
             if(angular.isDefined(csrftoken)) {
                 url += '?csrftoken=' + encodeURIComponent(csrftoken);
+                // Ask for updates to be sent as patches with only the
+                // changed fields.
+                url += '&patches=1';
+                // Ask for notifications to be batched together.
+                url += '&batch=1';
             }
 
             return url;
@@ -264,6 +271,15 @@ angular.module('MAAS').factory(
             // Notify
             } else if(msg.type === MSG_TYPE.NOTIFY) {
                 this.onNotify(msg);
+            // Patch
+            } else if(msg.type === MSG_TYPE.PATCH) {
+                this.onPatch(msg);
+            // Batch of notify and patch messages
+            } else if(msg.type === MSG_TYPE.BATCH) {
+                var self = this;
+                angular.forEach(msg.data, function(batched) {
+                    self.onMessage(batched);
+                });
             }
         };
 
@@ -305,6 +321,18 @@ angular.module('MAAS').factory(
             }
         };
 
+        // Called when a patch message is recieved. The notifiers are called
+        // with the "patch" action and only the changed fields of the item,
+        // including its primary key.
+        RegionConnection.prototype.onPatch = function(msg) {
+            var handlers = this.notifiers[msg.name];
+            if(angular.isArray(handlers)) {
+                angular.forEach(handlers, function(handler) {
+                    handler("patch", msg.data);
+                });
+            }
+        };
+
         // Call method on the region.
         RegionConnection.prototype.callMethod = function(
                 method, params, remember) {
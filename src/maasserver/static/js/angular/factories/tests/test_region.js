@@ -405,7 +405,7 @@ describe("RegionConnection", function() {
             expect(RegionConnection._buildUrl()).toBe(
                 "ws://" + $window.location.hostname + ":" +
                 $window.location.port + $window.location.pathname + "/ws" +
-                '?csrftoken=' + csrftoken);
+                '?csrftoken=' + csrftoken + '&patches=1&batch=1');
         });
 
     });
@@ -456,6 +456,23 @@ describe("RegionConnection", function() {
             RegionConnection.onMessage(msg);
             expect(RegionConnection.onNotify).toHaveBeenCalledWith(msg);
         });
+
+        it("calls onPatch for a patch message", function() {
+            spyOn(RegionConnection, "onPatch");
+            var msg = { type: 3 };
+            RegionConnection.onMessage(msg);
+            expect(RegionConnection.onPatch).toHaveBeenCalledWith(msg);
+        });
+
+        it("calls onMessage for each message in a batch", function() {
+            spyOn(RegionConnection, "onNotify");
+            spyOn(RegionConnection, "onPatch");
+            var notify = { type: 2 };
+            var patch = { type: 3 };
+            RegionConnection.onMessage({ type: 4, data: [notify, patch] });
+            expect(RegionConnection.onNotify).toHaveBeenCalledWith(notify);
+            expect(RegionConnection.onPatch).toHaveBeenCalledWith(patch);
+        });
     });
 
     describe("onResponse", function() {
@@ -532,6 +549,23 @@ describe("RegionConnection", function() {
 
     });
 
+    describe("onPatch", function() {
+
+        it("calls handler with patch action", function() {
+            var name = "test";
+            var data = { id: 1, name: makeName("name") };
+            var handler = jasmine.createSpy();
+            RegionConnection.registerNotifier(name, handler);
+            RegionConnection.onPatch({
+                type: 3,
+                name: name,
+                action: "update",
+                data: data
+            });
+            expect(handler).toHaveBeenCalledWith("patch", data);
+        });
+    });
+
     describe("onNotify", function() {
 
         it("calls handler for notification", function(done) {
@@ -354,6 +354,20 @@ angular.module('MAAS').service(
             this._replaceItemInArray(this._items, item);
         };
 
+        // Apply the changed fields in patch to the item in the items list.
+        // Patches for items that are not in the list are ignored.
+        Manager.prototype._patchItem = function(patch) {
+            var idx = this._getIndexOfItem(this._items, patch[this._pk]);
+            if(idx >= 0) {
+                var item = angular.copy(this._items[idx]);
+                angular.forEach(patch, function(value, key) {
+                    item[key] = value;
+                });
+                this._replaceItem(item);
+                this._processItem(item);
+            }
+        };
+
         // Remove item in the items and selectedItems list.
         Manager.prototype._removeItem = function(pk_value) {
             var idx = this._getIndexOfItem(this._items, pk_value);
@@ -513,6 +527,8 @@ angular.module('MAAS').service(
                 } else if(action.action === "update") {
                     this._replaceItem(action.data);
                     this._processItem(action.data);
+                } else if(action.action === "patch") {
+                    this._patchItem(action.data);
                 } else if(action.action === "delete") {
                     this._removeItem(action.data);
                 }
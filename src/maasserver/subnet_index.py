@@ -0,0 +1,298 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""In-memory index of subnets and dynamic ranges.
+
+Lease processing has to find the best subnet, and then the dynamic range,
+for every IP address that a rack controller reports. The index answers those
+questions from memory instead of querying the database each time.
+"""
+
+__all__ = [
+    "subnet_index",
+    "SubnetIndex",
+]
+
+from bisect import bisect_right
+from operator import itemgetter
+import threading
+import time
+
+from maasserver.enum import IPRANGE_TYPE
+from maasserver.models import (
+    IPRange,
+    Subnet,
+)
+from maasserver.utils.orm import has_snapshot
+from netaddr import (
+    IPAddress,
+    IPNetwork,
+)
+
+
+# The number of bits in an address, by IP version.
+ADDRESS_BITS = {4: 32, 6: 128}
+
+
+def _get_field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+class SubnetIndex:
+    """Index of subnets, by network, and of their dynamic ranges.
+
+    The index is only consulted while it is *live*, i.e. while something --
+    `SubnetIndexService` -- is telling it about changes to subnets, VLANs,
+    and IP ranges. At other times, and for addresses that the index does not
+    know about, lookups go to the database.
+
+    Subnets are hashed by network for each prefix length in use, so the best
+    subnet for an address is found with one dictionary lookup per prefix
+    length. Dynamic ranges are kept sorted by start address for each subnet
+    and searched by bisection.
+
+    Changes are applied lazily: notifications only mark parts of the index as
+    stale, and the next lookup reloads them. Lookups must therefore happen in
+    a thread where database access is permitted. A reload only sees the
+    notified changes when it runs at the start of a transaction, before its
+    snapshot is taken; a reload later in a transaction leaves the index
+    marked as stale, to be reloaded again at the start of the next. The whole
+    index is also reloaded once it is older than `max_age` seconds, in case
+    notifications have been missed.
+    """
+
+    max_age = 600
+
+    def __init__(self):
+        super(SubnetIndex, self).__init__()
+        # Held while reading or rebuilding the index.
+        self._lock = threading.Lock()
+        # Held while marking the index as stale. Notifications only need
+        # this one, so they never wait for a reload.
+        self._stale_lock = threading.Lock()
+        self.live = False
+        # When parts of the index were last marked as stale, or None.
+        self._stale = None
+        self._stale_ranges = None
+        # Subnet ID -> when it was last marked as stale.
+        self._stale_subnets = {}
+        # When the index was last loaded in full, or None.
+        self._loaded = None
+        # Subnet ID -> (field values, dhcp_on, network key).
+        self._subnets = {}
+        # (IP version, prefix length) -> {network >> host bits: subnet ID}.
+        self._networks = {}
+        # Subnet ID -> ([start], [(start, end, field values)]).
+        self._ranges = {}
+
+    def invalidate(self):
+        """Mark the whole index as stale."""
+        with self._stale_lock:
+            self._stale = time.monotonic()
+
+    def invalidate_subnet(self, subnet_id):
+        """Mark the subnet with `subnet_id` as stale."""
+        with self._stale_lock:
+            self._stale_subnets[subnet_id] = time.monotonic()
+
+    def invalidate_ranges(self):
+        """Mark all dynamic ranges as stale."""
+        with self._stale_lock:
+            self._stale_ranges = time.monotonic()
+
+    def get_best_subnet_for_ip(self, ip):
+        """Find the most-specific managed Subnet the specified IP address
+        belongs to.
+
+        This gives the same answer as
+        `SubnetManager.get_best_subnet_for_ip`. The returned `Subnet` is a
+        new object, so callers are free to modify it.
+        """
+        if not self.live:
+            return Subnet.objects.get_best_subnet_for_ip(ip)
+        ip = IPAddress(ip)
+        if ip.is_ipv4_mapped():
+            ip = ip.ipv4()
+        with self._lock:
+            self._refresh()
+            values = self._find(ip)
+        if values is None:
+            # The index may be behind the database.
+            return Subnet.objects.get_best_subnet_for_ip(ip)
+        else:
+            return Subnet.from_db(
+                "default", _get_field_names(Subnet), values)
+
+    def get_best_subnets_for_ips(self, ips):
+        """Find the most-specific managed Subnet for each of the specified IP
+        addresses.
+
+        This gives the same answer as
+        `SubnetManager.get_best_subnets_for_ips`.
+        """
+        if not self.live:
+            return Subnet.objects.get_best_subnets_for_ips(ips)
+        found, missing = {}, []
+        with self._lock:
+            self._refresh()
+            for ip in ips:
+                address = IPAddress(ip)
+                if address.is_ipv4_mapped():
+                    address = address.ipv4()
+                values = self._find(address)
+                if values is None:
+                    missing.append(ip)
+                else:
+                    found[ip] = Subnet.from_db(
+                        "default", _get_field_names(Subnet), values)
+        if len(missing) > 0:
+            # The index may be behind the database.
+            found.update(Subnet.objects.get_best_subnets_for_ips(missing))
+        return found
+
+    def get_dynamic_range_for_ip(self, subnet, ip):
+        """Return the dynamic `IPRange` in `subnet` for the provided `ip`.
+
+        This gives the same answer as `Subnet.get_dynamic_range_for_ip`.
+        """
+        if not self.live:
+            return subnet.get_dynamic_range_for_ip(ip)
+        ip = IPAddress(ip)
+        with self._lock:
+            self._refresh()
+            if subnet.id not in self._subnets:
+                values = None
+                indexed = False
+            else:
+                values = self._find_range(subnet.id, ip)
+                indexed = True
+        if not indexed:
+            return subnet.get_dynamic_range_for_ip(ip)
+        elif values is None:
+            return None
+        else:
+            return IPRange.from_db(
+                "default", _get_field_names(IPRange), values)
+
+    def _find(self, ip):
+        """Return the field values of the best subnet for `ip`, or `None`."""
+        bits = ADDRESS_BITS[ip.version]
+        best, best_rank = None, None
+        for (version, prefixlen), networks in self._networks.items():
+            # An address is strictly within a network in PostgreSQL's
+            # terms, so a host route never contains its own address.
+            if version == ip.version and prefixlen < bits:
+                subnet_id = networks.get(ip.value >> (bits - prefixlen))
+                if subnet_id is not None:
+                    values, dhcp_on, _ = self._subnets[subnet_id]
+                    rank = (dhcp_on, prefixlen)
+                    if best_rank is None or rank > best_rank:
+                        best, best_rank = values, rank
+        return best
+
+    def _find_range(self, subnet_id, ip):
+        """Return the field values of the dynamic range in the subnet with
+        `subnet_id` containing `ip`, or `None`."""
+        starts, ranges = self._ranges.get(subnet_id, ((), ()))
+        index = bisect_right(starts, ip.value) - 1
+        if index >= 0:
+            _, end, values = ranges[index]
+            if ip.value <= end:
+                return values
+        return None
+
+    def _refresh(self):
+        """Reload the stale parts of the index. Call with `_lock` held."""
+        now = time.monotonic()
+        if has_snapshot():
+            # This transaction's snapshot may predate any of the changes
+            # notified so far, so a reload cannot be relied upon to see them.
+            snapshot = None
+        else:
+            # The snapshot will be taken by the first query below.
+            snapshot = now
+        with self._stale_lock:
+            stale = self._stale
+            stale_ranges = self._stale_ranges
+            stale_subnets = dict(self._stale_subnets)
+        try:
+            if (stale is not None or self._loaded is None or
+                    now - self._loaded > self.max_age):
+                self._subnets.clear()
+                self._networks.clear()
+                self._load_subnets(Subnet.objects.all())
+                self._load_ranges()
+                self._loaded = now
+            else:
+                if len(stale_subnets) > 0:
+                    for subnet_id in stale_subnets:
+                        self._forget_subnet(subnet_id)
+                    self._load_subnets(
+                        Subnet.objects.filter(id__in=stale_subnets))
+                if stale_ranges is not None:
+                    self._load_ranges()
+        except:
+            # Start again from scratch next time.
+            self._loaded = None
+            raise
+        if snapshot is not None:
+            self._clear_stale(snapshot)
+
+    def _clear_stale(self, snapshot):
+        """Unmark the parts of the index marked as stale at or before
+        `snapshot`. They were all reloaded, and with the notified changes.
+        """
+        with self._stale_lock:
+            if self._stale is not None and self._stale <= snapshot:
+                self._stale = None
+            if self._stale_ranges is not None and (
+                    self._stale_ranges <= snapshot):
+                self._stale_ranges = None
+            self._stale_subnets = {
+                subnet_id: stale
+                for subnet_id, stale in self._stale_subnets.items()
+                if stale > snapshot
+            }
+
+    def _load_subnets(self, subnets):
+        field_names = _get_field_names(Subnet)
+        rows = subnets.values_list(*field_names, "vlan__dhcp_on")
+        for row in rows:
+            values, dhcp_on = row[:-1], row[-1]
+            subnet_id = values[field_names.index("id")]
+            network = IPNetwork(values[field_names.index("cidr")])
+            bits = ADDRESS_BITS[network.version]
+            key = (
+                (network.version, network.prefixlen),
+                network.value >> (bits - network.prefixlen))
+            self._subnets[subnet_id] = values, dhcp_on, key
+            self._networks.setdefault(key[0], {})[key[1]] = subnet_id
+
+    def _forget_subnet(self, subnet_id):
+        entry = self._subnets.pop(subnet_id, None)
+        if entry is not None:
+            _, _, (prefix, network) = entry
+            networks = self._networks[prefix]
+            if networks.get(network) == subnet_id:
+                del networks[network]
+            if len(networks) == 0:
+                del self._networks[prefix]
+
+    def _load_ranges(self):
+        field_names = _get_field_names(IPRange)
+        rows = IPRange.objects.filter(
+            type=IPRANGE_TYPE.DYNAMIC).values_list(*field_names)
+        ranges = {}
+        for values in rows:
+            subnet_id = values[field_names.index("subnet_id")]
+            start = IPAddress(values[field_names.index("start_ip")]).value
+            end = IPAddress(values[field_names.index("end_ip")]).value
+            ranges.setdefault(subnet_id, []).append((start, end, values))
+        self._ranges.clear()
+        for subnet_id, subnet_ranges in ranges.items():
+            subnet_ranges.sort(key=itemgetter(0))
+            starts = [start for start, _, _ in subnet_ranges]
+            self._ranges[subnet_id] = starts, subnet_ranges
+
+
+subnet_index = SubnetIndex()
@@ -7,7 +7,10 @@ __all__ = []
 
 from operator import itemgetter
 import random
-from unittest.mock import ANY
+from unittest.mock import (
+    ANY,
+    sentinel,
+)
 
 from crochet import wait_for
 from django.core.exceptions import ValidationError
@@ -41,6 +44,7 @@ from maastesting.matchers import (
     MockCalledOnceWith,
     MockNotCalled,
 )
+from maastesting.testcase import MAASTestCase
 from maastesting.twisted import (
     always_fail_with,
     always_succeed_with,
@@ -1683,6 +1687,162 @@ class TestGetDHCPConfiguration(MAASServerTestCase):
         self.assertHasConfigurationForNTP(
             config.shared_networks_v6, addr6.subnet, [addr6.ip])
 
+    def watch(self, rack):
+        dhcp.dhcp_configuration_cache.watch(rack.id)
+        self.addCleanup(dhcp.dhcp_configuration_cache.unwatch, rack.id)
+
+    def get_configuration(self, rack, *args):
+        """Get the configuration for `rack` as `configure_dhcp` would."""
+        return dhcp.get_dhcp_configuration(
+            rack, *args, cache_generation=(
+                dhcp.dhcp_configuration_cache.get_generation(rack.id)))
+
+    def make_host(self, subnet):
+        node = factory.make_Node(interface=False)
+        interface = factory.make_Interface(
+            INTERFACE_TYPE.PHYSICAL, node=node, vlan=subnet.vlan)
+        factory.make_StaticIPAddress(
+            alloc_type=IPADDRESS_TYPE.STICKY, subnet=subnet,
+            interface=interface)
+        return str(interface.mac_address)
+
+    def test__reuses_cached_configuration_for_watched_rack(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.watch(rack)
+        count_first, config_first = count_queries(
+            self.get_configuration, rack)
+        count_second, config_second = count_queries(
+            self.get_configuration, rack)
+        self.assertThat(config_second, Equals(config_first))
+        self.assertLess(count_second, count_first)
+
+    def test__does_not_cache_configuration_for_unwatched_rack(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.get_configuration(rack)
+        mac = self.make_host(addr4.subnet)
+        config = self.get_configuration(rack)
+        self.assertIn(mac, [host["mac"] for host in config.hosts_v4])
+
+    def test__does_not_cache_configuration_without_generation(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.watch(rack)
+        dhcp.get_dhcp_configuration(rack)
+        mac = self.make_host(addr4.subnet)
+        config = self.get_configuration(rack)
+        self.assertIn(mac, [host["mac"] for host in config.hosts_v4])
+
+    def test__regenerates_configuration_for_invalidated_vlan(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.watch(rack)
+        self.get_configuration(rack)
+        mac = self.make_host(addr4.subnet)
+        # Without a notification the cached configuration is used.
+        config = self.get_configuration(rack)
+        self.assertNotIn(mac, [host["mac"] for host in config.hosts_v4])
+        dhcp.dhcp_configuration_cache.invalidate(
+            rack.id, addr4.subnet.vlan_id)
+        config = self.get_configuration(rack)
+        self.assertIn(mac, [host["mac"] for host in config.hosts_v4])
+
+    def test__does_not_cache_configuration_invalidated_before_generating(
+            self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.watch(rack)
+        generation = dhcp.dhcp_configuration_cache.get_generation(rack.id)
+        # A notification arrives after the generation has been read but
+        # before the configuration is generated from an older snapshot.
+        dhcp.dhcp_configuration_cache.invalidate(
+            rack.id, addr4.subnet.vlan_id)
+        dhcp.get_dhcp_configuration(rack, cache_generation=generation)
+        # Nothing was cached under the old generation, so the configuration
+        # generated next reflects the change.
+        mac = self.make_host(addr4.subnet)
+        config = self.get_configuration(rack)
+        self.assertIn(mac, [host["mac"] for host in config.hosts_v4])
+
+    def test__regenerates_configuration_when_context_changes(self):
+        Config.objects.set_config("ntp_external_only", True)
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.watch(rack)
+        self.get_configuration(rack)
+        ntp_servers = [factory.make_ip_address()]
+        Config.objects.set_config("ntp_servers", ", ".join(ntp_servers))
+        config = self.get_configuration(rack)
+        self.assertHasConfigurationForNTP(
+            config.shared_networks_v4, addr4.subnet, ntp_servers)
+
+    def test__does_not_use_cache_when_testing_dhcp_snippet(self):
+        rack, (addr4, addr6) = self.make_RackController_ready_for_DHCP()
+        self.watch(rack)
+        self.get_configuration(rack)
+        mac = self.make_host(addr4.subnet)
+        dhcp_snippet = factory.make_DHCPSnippet(subnet=addr4.subnet)
+        config = self.get_configuration(rack, dhcp_snippet)
+        self.assertIn(mac, [host["mac"] for host in config.hosts_v4])
+
+
+class TestDHCPConfigurationCache(MAASTestCase):
+    """Tests for `DHCPConfigurationCache`."""
+
+    def test_does_not_cache_unwatched_rack(self):
+        cache = dhcp.DHCPConfigurationCache()
+        generation = cache.get_generation(1)
+        self.assertIsNone(generation)
+        cache.put(1, generation, 2, 4, sentinel.context, sentinel.config)
+        self.assertIsNone(cache.get(1, 2, 4, sentinel.context))
+
+    def test_returns_copy_of_config_for_same_context(self):
+        cache = dhcp.DHCPConfigurationCache()
+        cache.watch(1)
+        config = {"hosts": []}
+        cache.put(1, cache.get_generation(1), 2, 4, ["context"], config)
+        cached = cache.get(1, 2, 4, ["context"])
+        self.assertThat(cached, Equals(config))
+        cached["hosts"].append("host")
+        self.assertThat(cache.get(1, 2, 4, ["context"]), Equals(config))
+
+    def test_returns_None_for_different_context(self):
+        cache = dhcp.DHCPConfigurationCache()
+        cache.watch(1)
+        cache.put(1, cache.get_generation(1), 2, 4, ["context"], {})
+        self.assertIsNone(cache.get(1, 2, 4, ["other"]))
+        self.assertIsNone(cache.get(1, 2, 6, ["context"]))
+
+    def test_invalidate_drops_only_that_vlan(self):
+        cache = dhcp.DHCPConfigurationCache()
+        cache.watch(1)
+        generation = cache.get_generation(1)
+        cache.put(1, generation, 2, 4, [], {})
+        cache.put(1, generation, 2, 6, [], {})
+        cache.put(1, generation, 3, 4, [], {})
+        cache.invalidate(1, 2)
+        self.assertIsNone(cache.get(1, 2, 4, []))
+        self.assertIsNone(cache.get(1, 2, 6, []))
+        self.assertThat(cache.get(1, 3, 4, []), Equals({}))
+
+    def test_invalidate_without_vlan_drops_all(self):
+        cache = dhcp.DHCPConfigurationCache()
+        cache.watch(1)
+        cache.put(1, cache.get_generation(1), 2, 4, [], {})
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1, 2, 4, []))
+
+    def test_put_ignores_config_generated_before_invalidation(self):
+        cache = dhcp.DHCPConfigurationCache()
+        cache.watch(1)
+        generation = cache.get_generation(1)
+        cache.invalidate(1, 3)
+        cache.put(1, generation, 2, 4, [], {})
+        self.assertIsNone(cache.get(1, 2, 4, []))
+
+    def test_unwatch_drops_all(self):
+        cache = dhcp.DHCPConfigurationCache()
+        cache.watch(1)
+        cache.put(1, cache.get_generation(1), 2, 4, [], {})
+        cache.unwatch(1)
+        self.assertIsNone(cache.get(1, 2, 4, []))
+        self.assertIsNone(cache.get_generation(1))
+
 
 class TestConfigureDHCP(MAASTransactionServerTestCase):
     """Tests for `configure_dhcp`."""
@@ -1808,6 +1968,30 @@ class TestConfigureDHCP(MAASTransactionServerTestCase):
                 global_dhcp_snippets=config.global_dhcp_snippets,
                 ))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__passes_cache_generation_read_before_generating(self):
+        self.patch(dhcp.settings, "DHCP_CONNECT", True)
+        rack_controller, config = yield deferToDatabase(
+            self.create_rack_controller)
+        protocol, ipv4_stub, ipv6_stub = yield deferToThread(
+            self.prepare_rpc, rack_controller)
+        ipv4_stub.side_effect = always_succeed_with({})
+        ipv6_stub.side_effect = always_succeed_with({})
+        dhcp.dhcp_configuration_cache.watch(rack_controller.id)
+        self.addCleanup(
+            dhcp.dhcp_configuration_cache.unwatch, rack_controller.id)
+        generation = dhcp.dhcp_configuration_cache.get_generation(
+            rack_controller.id)
+        get_dhcp_configuration = self.patch(dhcp, "get_dhcp_configuration")
+        get_dhcp_configuration.return_value = config
+
+        yield dhcp.configure_dhcp(rack_controller)
+
+        self.assertThat(
+            get_dhcp_configuration, MockCalledOnceWith(
+                rack_controller, cache_generation=generation))
+
     @wait_for_reactor
     @inlineCallbacks
     def test__doesnt_call_configure_for_both_ipv4_and_ipv6(self):
@@ -30,7 +30,10 @@ from maasserver.eventloop import (
     DEFAULT_PORT,
     MAASServices,
 )
-from maasserver.regiondservices import service_monitor_service
+from maasserver.regiondservices import (
+    service_monitor_service,
+    subnet_index,
+)
 from maasserver.rpc import regionservice
 from maasserver.testing.eventloop import RegionEventLoopFixture
 from maasserver.testing.listener import FakePostgresListenerService
@@ -428,6 +431,12 @@ class TestFactories(MAASTestCase):
         self.assertFalse(
             eventloop.loop.factories["web"]["only_on_master"])
 
+    def test_make_PostgresListenerService_sets_coalescing_windows(self):
+        listener = eventloop.make_PostgresListenerService()
+        self.assertEquals(
+            eventloop.LISTENER_COALESCING_WINDOWS,
+            listener.coalescingWindows)
+
     def test_make_RackControllerService(self):
         service = eventloop.make_RackControllerService(
             FakePostgresListenerService(), sentinel.rpc_advertise)
@@ -444,6 +453,23 @@ class TestFactories(MAASTestCase):
         self.assertFalse(
             eventloop.loop.factories["rack-controller"]["only_on_master"])
 
+    def test_make_SubnetIndexService(self):
+        listener = FakePostgresListenerService()
+        service = eventloop.make_SubnetIndexService(listener)
+        self.assertThat(service, IsInstance(
+            subnet_index.SubnetIndexService))
+        self.assertIs(listener, service.listener)
+        # It is registered as a factory in RegionEventLoop.
+        self.assertIs(
+            eventloop.make_SubnetIndexService,
+            eventloop.loop.factories["subnet-index"]["factory"])
+        # Has a dependency of postgres-listener.
+        self.assertEquals(
+            ["postgres-listener-worker"],
+            eventloop.loop.factories["subnet-index"]["requires"])
+        self.assertFalse(
+            eventloop.loop.factories["subnet-index"]["only_on_master"])
+
     def test_make_ServiceMonitorService(self):
         service = eventloop.make_ServiceMonitorService()
         self.assertThat(service, IsInstance(
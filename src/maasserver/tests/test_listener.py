@@ -18,6 +18,7 @@ from crochet import wait_for
 from django.db import connection
 from maasserver import listener as listener_module
 from maasserver.listener import (
+    BatchHandler,
     PostgresListenerNotifyError,
     PostgresListenerRegistrationError,
     PostgresListenerService,
@@ -56,6 +57,7 @@ from twisted.internet.defer import (
     DeferredQueue,
     inlineCallbacks,
 )
+from twisted.internet.task import Clock
 from twisted.logger import LogLevel
 from twisted.python.failure import Failure
 
@@ -597,3 +599,150 @@ class TestPostgresListenerService(MAASServerTestCase):
                 call("UNLISTEN %s_create;" % channel),
                 call("UNLISTEN %s_delete;" % channel),
                 call("UNLISTEN %s_update;" % channel)))
+
+
+class TestPostgresListenerServiceCoalescing(MAASServerTestCase):
+
+    def make_listener(self):
+        listener = PostgresListenerService()
+        listener.clock = Clock()
+        return listener
+
+    def read_notifications(self, listener, *notifications):
+        connection = self.patch(listener, "connection")
+        connection.connection.poll.return_value = None
+        connection.connection.notifies = [
+            FakeNotify(channel=channel, payload=payload)
+            for channel, payload in notifications
+        ]
+        listener.doRead()
+
+    def test_setCoalescingWindow_rejects_system_channels(self):
+        listener = self.make_listener()
+        with ExpectedException(PostgresListenerRegistrationError):
+            listener.setCoalescingWindow("sys_core", 1)
+
+    def test__holds_notifications_for_window(self):
+        listener = self.make_listener()
+        listener.setCoalescingWindow("machine", 0.25)
+        self.read_notifications(
+            listener, ("machine_update", "1"), ("machine_update", "2"))
+        listener.clock.advance(0.2)
+        self.read_notifications(
+            listener, ("machine_update", "1"), ("machine_delete", "3"))
+        self.assertThat(listener.notifications, HasLength(0))
+        listener.clock.advance(0.05)
+        self.assertItemsEqual(
+            listener.notifications, {
+                ("machine_update", "1"), ("machine_update", "2"),
+                ("machine_delete", "3")})
+        self.assertThat(listener.coalescingCalls, Equals({}))
+
+    def test__holds_notifications_for_channel_and_action(self):
+        listener = self.make_listener()
+        listener.setCoalescingWindow("machine_update", 0.25)
+        self.read_notifications(
+            listener, ("machine_update", "1"), ("machine_create", "2"))
+        self.assertItemsEqual(
+            listener.notifications, {("machine_create", "2")})
+        listener.clock.advance(0.25)
+        self.assertItemsEqual(
+            listener.notifications, {
+                ("machine_update", "1"), ("machine_create", "2")})
+
+    def test__does_not_hold_other_channels(self):
+        listener = self.make_listener()
+        listener.setCoalescingWindow("machine", 0.25)
+        self.read_notifications(listener, ("device_update", "1"))
+        self.assertItemsEqual(
+            listener.notifications, {("device_update", "1")})
+
+    def test_setCoalescingWindow_None_releases_held_notifications(self):
+        listener = self.make_listener()
+        listener.setCoalescingWindow("machine", 0.25)
+        self.read_notifications(listener, ("machine_update", "1"))
+        listener.setCoalescingWindow("machine", None)
+        self.assertItemsEqual(
+            listener.notifications, {("machine_update", "1")})
+        self.assertThat(listener.clock.getDelayedCalls(), HasLength(0))
+        self.read_notifications(listener, ("machine_update", "2"))
+        self.assertThat(listener.notifications, HasLength(2))
+
+    def test_cancelCoalesced_drops_held_notifications(self):
+        listener = self.make_listener()
+        listener.setCoalescingWindow("machine", 0.25)
+        self.read_notifications(listener, ("machine_update", "1"))
+        listener.cancelCoalesced()
+        self.assertThat(listener.clock.getDelayedCalls(), HasLength(0))
+        listener.clock.advance(0.25)
+        self.assertThat(listener.notifications, HasLength(0))
+
+
+class TestPostgresListenerServiceBatches(MAASServerTestCase):
+
+    def test_register_wraps_batch_handler(self):
+        listener = PostgresListenerService()
+        listener.register("machine", sentinel.handler, batch=True)
+        [handler] = listener.listeners["machine"]
+        self.assertThat(handler, IsInstance(BatchHandler))
+        self.assertThat(handler.handler, Is(sentinel.handler))
+
+    def test_register_rejects_batch_handler_for_system_channel(self):
+        listener = PostgresListenerService()
+        with ExpectedException(PostgresListenerRegistrationError):
+            listener.register("sys_core", sentinel.handler, batch=True)
+
+    def test_unregister_removes_batch_handler(self):
+        listener = PostgresListenerService()
+        listener.register("machine", sentinel.handler, batch=True)
+        listener.unregister("machine", sentinel.handler)
+        self.assertThat(listener.listeners["machine"], Equals([]))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_handleNotifies_calls_batch_handler_once_per_action(self):
+        listener = PostgresListenerService()
+        calls = []
+        listener.register(
+            "machine", lambda *args: calls.append(args), batch=True)
+        listener.notifications.update({
+            ("machine_update", "1"), ("machine_update", "2"),
+            ("machine_delete", "3")})
+        yield listener.handleNotifies()
+        self.assertItemsEqual(
+            [("update", {"1", "2"}), ("delete", {"3"})], calls)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_handleNotifies_calls_other_handlers_per_notification(self):
+        listener = PostgresListenerService()
+        batch_calls, calls = [], []
+        listener.register(
+            "machine", lambda *args: batch_calls.append(args), batch=True)
+        listener.register("machine", lambda *args: calls.append(args))
+        listener.notifications.update({
+            ("machine_update", "1"), ("machine_update", "2")})
+        yield listener.handleNotifies()
+        self.assertItemsEqual(
+            [("update", "1"), ("update", "2")], calls)
+        self.assertEqual([("update", {"1", "2"})], batch_calls)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_handleNotifies_logs_batch_handler_failure(self):
+        listener = PostgresListenerService()
+        listener.register(
+            "machine", lambda *args: 1 / 0, batch=True)
+        listener.notifications.add(("machine_update", "1"))
+        with TwistedLoggerFixture() as logger:
+            yield listener.handleNotifies()
+        self.assertThat(logger.output, DocTestMatches(
+            "...Failure while handling 1 notifications to 'machine'..."))
+
+    def test_handleNotify_calls_batch_handler_without_batches(self):
+        listener = PostgresListenerService()
+        calls = []
+        listener.register(
+            "machine", lambda *args: calls.append(args), batch=True)
+        listener.handleNotify(("machine_update", "1"))
+        self.assertEqual([("update", {"1"})], calls)
@@ -16,6 +16,7 @@ from maasserver.enum import (
     IPADDRESS_TYPE,
     NODE_STATUS,
 )
+from maasserver import node_constraint_filter_forms
 from maasserver.models import (
     Domain,
     Machine,
@@ -39,6 +40,10 @@ from maasserver.testing.factory import (
 )
 from maasserver.testing.testcase import MAASServerTestCase
 from maasserver.utils import ignore_unused
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockNotCalled,
+)
 from testtools.matchers import (
     Contains,
     ContainsAll,
@@ -888,6 +893,18 @@ class TestAcquireNodeForm(MAASServerTestCase):
         factory.make_Filesystem(mount_point='/srv', partition=partition)
         self.assertConstrainedNodes([node1], {'storage': '0'})
 
+    def test_storage_only_considers_candidate_nodes(self):
+        node1 = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(node=node1, formatted_root=True)
+        node2 = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(node=node2, formatted_root=True)
+        form = AcquireNodeForm({'storage': '0'})
+        self.assertTrue(form.is_valid(), dict(form.errors))
+        filtered_nodes, constraint_map, _ = form.filter_nodes(
+            Machine.objects.filter(id=node1.id))
+        self.assertItemsEqual([node1], filtered_nodes)
+        self.assertItemsEqual([node1.id], constraint_map)
+
     def test_storage_single_contraint_matches_all_sizes_larger(self):
         node1 = factory.make_Node(with_boot_disk=False)
         # 1gb block device
@@ -1250,6 +1267,99 @@ class TestAcquireNodeForm(MAASServerTestCase):
         filtered_nodes, _, _ = form.filter_nodes(Machine.objects)
         self.assertItemsEqual([node1], filtered_nodes)
 
+    def test_interfaces_only_considers_candidate_nodes(self):
+        fabric = factory.make_Fabric(class_type="10g")
+        node1 = factory.make_Node_with_Interface_on_Subnet(fabric=fabric)
+        factory.make_Node_with_Interface_on_Subnet(fabric=fabric)
+        form = AcquireNodeForm({
+            'interfaces': 'label:fabric_class=10g'})
+        self.assertTrue(form.is_valid(), dict(form.errors))
+        filtered_nodes, _, interfaces = form.filter_nodes(
+            Machine.objects.filter(id=node1.id))
+        self.assertItemsEqual([node1], filtered_nodes)
+        self.assertItemsEqual([node1.id], interfaces['label'])
+
+    def test_storage_without_constraint_maps_uses_exact_index(self):
+        node1 = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(
+            node=node1, size=2 * (1000 ** 3), formatted_root=True)
+        factory.make_PhysicalBlockDevice(node=node1, size=2 * (1000 ** 3))
+        node2 = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(
+            node=node2, size=2 * (1000 ** 3), formatted_root=True)
+        nodes_by_storage = self.patch(
+            node_constraint_filter_forms, "nodes_by_storage")
+        form = AcquireNodeForm({'storage': '1,1'})
+        self.assertTrue(form.is_valid(), dict(form.errors))
+        filtered_nodes, constraint_map, _ = form.filter_nodes(
+            Machine.objects, constraint_maps=False)
+        self.assertItemsEqual([node1], filtered_nodes)
+        self.assertEqual({}, constraint_map)
+        self.assertThat(nodes_by_storage, MockNotCalled())
+
+    def test_storage_without_constraint_maps_checks_inexact_index(self):
+        # The index shows an unused device with the tag and one that is
+        # large enough, but no device is both.
+        node = factory.make_Node(with_boot_disk=False)
+        factory.make_PhysicalBlockDevice(node=node, formatted_root=True)
+        factory.make_PhysicalBlockDevice(
+            node=node, size=2 * (1000 ** 3), tags=[])
+        factory.make_PhysicalBlockDevice(
+            node=node, size=1 * (1000 ** 3), tags=['ssd'])
+        form = AcquireNodeForm({'storage': '0,2(ssd)'})
+        self.assertTrue(form.is_valid(), dict(form.errors))
+        filtered_nodes, constraint_map, _ = form.filter_nodes(
+            Machine.objects, constraint_maps=False)
+        self.assertItemsEqual([], filtered_nodes)
+        self.assertEqual({}, constraint_map)
+
+    def test_interfaces_without_constraint_maps_uses_exact_index(self):
+        fabric = factory.make_Fabric(class_type="10g")
+        node1 = factory.make_Node_with_Interface_on_Subnet(fabric=fabric)
+        factory.make_Node_with_Interface_on_Subnet()
+        nodes_by_interface = self.patch(
+            node_constraint_filter_forms, "nodes_by_interface")
+        form = AcquireNodeForm({
+            'interfaces': 'label:fabric_class=10g'})
+        self.assertTrue(form.is_valid(), dict(form.errors))
+        filtered_nodes, _, interfaces = form.filter_nodes(
+            Machine.objects, constraint_maps=False)
+        self.assertItemsEqual([node1], filtered_nodes)
+        self.assertEqual({}, interfaces)
+        self.assertThat(nodes_by_interface, MockNotCalled())
+
+    def test_interfaces_without_constraint_maps_checks_inexact_index(self):
+        # Each constraint is met by an interface, but not the same one.
+        fabric = factory.make_Fabric(class_type="10g")
+        space = factory.make_Space()
+        node = factory.make_Node_with_Interface_on_Subnet(fabric=fabric)
+        factory.make_Interface(
+            INTERFACE_TYPE.PHYSICAL, node=node,
+            vlan=factory.make_VLAN(space=space))
+        form = AcquireNodeForm({
+            'interfaces': 'label:fabric_class=10g,space=%s' % space.name})
+        self.assertTrue(form.is_valid(), dict(form.errors))
+        filtered_nodes, _, interfaces = form.filter_nodes(
+            Machine.objects, constraint_maps=False)
+        self.assertItemsEqual([], filtered_nodes)
+        self.assertEqual({}, interfaces)
+
+    def test_get_constraint_maps_only_considers_given_nodes(self):
+        fabric = factory.make_Fabric(class_type="10g")
+        node1 = factory.make_Node_with_Interface_on_Subnet(fabric=fabric)
+        node2 = factory.make_Node_with_Interface_on_Subnet(fabric=fabric)
+        nodes_by_storage = self.patch_autospec(
+            node_constraint_filter_forms, "nodes_by_storage")
+        nodes_by_storage.return_value = {}
+        form = AcquireNodeForm({
+            'storage': '0', 'interfaces': 'label:fabric_class=10g'})
+        self.assertTrue(form.is_valid(), dict(form.errors))
+        constraint_map, interfaces = form.get_constraint_maps([node1])
+        self.assertThat(
+            nodes_by_storage, MockCalledOnceWith('0', node_ids=[node1.id]))
+        self.assertItemsEqual([node1.id], interfaces['label'])
+        self.assertNotIn(node2.id, interfaces['label'])
+
     def test_interfaces_filters_work_with_multiple_labels(self):
         fabric1 = factory.make_Fabric(class_type="1g")
         fabric2 = factory.make_Fabric(class_type="10g")
@@ -111,6 +111,7 @@ class TestRegionWorkerServiceMaker(TestServiceMaker):
             "rack-controller",
             "rpc",
             "status-worker",
+            "subnet-index",
             "web",
             "ipc-worker",
         ]
@@ -141,6 +142,7 @@ class TestRegionWorkerServiceMaker(TestServiceMaker):
             "rack-controller",
             "rpc",
             "status-worker",
+            "subnet-index",
             "web",
             "ipc-worker",
             "import-resources",
@@ -279,6 +281,7 @@ class TestRegionAllInOneServiceMaker(TestServiceMaker):
             "rpc",
             "service-monitor",
             "status-worker",
+            "subnet-index",
             "web",
             "ipc-worker",
             # Master services.
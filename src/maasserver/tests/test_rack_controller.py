@@ -247,6 +247,18 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         self.assertEquals(set([rack_id]), service.needsDHCPUpdate)
         self.assertThat(mock_startProcessing, MockCalledOnceWith())
 
+    def test_coreHandler_watch_and_unwatch_update_dhcp_cache(self):
+        processId = random.randint(0, 100)
+        rack_id = random.randint(0, 100)
+        cache = self.patch(rack_controller.dhcp, "dhcp_configuration_cache")
+        service = RackControllerService(sentinel.ipcWorker, Mock())
+        service.processId = processId
+        self.patch(service, "startProcessing")
+        service.coreHandler("sys_core_%d" % processId, "watch_%d" % rack_id)
+        self.assertThat(cache.watch, MockCalledOnceWith(rack_id))
+        service.coreHandler("sys_core_%d" % processId, "unwatch_%d" % rack_id)
+        self.assertThat(cache.unwatch, MockCalledOnceWith(rack_id))
+
     def test_coreHandler_raises_ValueError_for_unknown_action(self):
         processId = random.randint(0, 100)
         rack_id = random.randint(0, 100)
@@ -269,6 +281,26 @@ class TestRackControllerService(MAASTransactionServerTestCase):
         self.assertEquals(set([rack_id]), service.needsDHCPUpdate)
         self.assertThat(mock_startProcessing, MockCalledOnceWith())
 
+    def test_dhcpHandler_invalidates_cached_config_for_vlan(self):
+        rack_id = random.randint(0, 100)
+        vlan_id = random.randint(0, 100)
+        cache = self.patch(rack_controller.dhcp, "dhcp_configuration_cache")
+        service = RackControllerService(sentinel.ipcWorker, Mock())
+        service.watching = set([rack_id])
+        self.patch(service, "startProcessing")
+        service.dhcpHandler("sys_dhcp_%d" % rack_id, "%d" % vlan_id)
+        self.assertThat(
+            cache.invalidate, MockCalledOnceWith(rack_id, vlan_id))
+
+    def test_dhcpHandler_invalidates_all_cached_config(self):
+        rack_id = random.randint(0, 100)
+        cache = self.patch(rack_controller.dhcp, "dhcp_configuration_cache")
+        service = RackControllerService(sentinel.ipcWorker, Mock())
+        service.watching = set([rack_id])
+        self.patch(service, "startProcessing")
+        service.dhcpHandler("sys_dhcp_%d" % rack_id, "")
+        self.assertThat(cache.invalidate, MockCalledOnceWith(rack_id, None))
+
     def test_dhcpHandler_doesnt_add_to_needsDHCPUpdate(self):
         rack_id = random.randint(0, 100)
         listener = Mock()
@@ -5,6 +5,7 @@
 
 __all__ = []
 
+import json
 import random
 from unittest.mock import (
     ANY,
@@ -26,6 +27,7 @@ from maasserver.testing.testcase import (
     MAASTransactionServerTestCase,
 )
 from maasserver.utils.threads import deferToDatabase
+from provisioningserver.dns.config import DynamicDNSUpdate
 from maastesting.matchers import (
     MockCalledOnceWith,
     MockCallsMatch,
@@ -73,6 +75,8 @@ class TestRegionControllerService(MAASServerTestCase):
             listener.register,
             MockCallsMatch(
                 call("sys_dns", service.markDNSForUpdate),
+                call("sys_dns_zones", service.markDNSZonesForUpdate),
+                call("sys_dns_updates", service.markDNSRecordsForUpdate),
                 call("sys_proxy", service.markProxyForUpdate)))
 
     @wait_for_reactor
@@ -104,6 +108,8 @@ class TestRegionControllerService(MAASServerTestCase):
             listener.unregister,
             MockCallsMatch(
                 call("sys_dns", service.markDNSForUpdate),
+                call("sys_dns_zones", service.markDNSZonesForUpdate),
+                call("sys_dns_updates", service.markDNSRecordsForUpdate),
                 call("sys_proxy", service.markProxyForUpdate)))
 
     @wait_for_reactor
@@ -123,6 +129,74 @@ class TestRegionControllerService(MAASServerTestCase):
         self.assertTrue(service.needsDNSUpdate)
         self.assertThat(mock_startProcessing, MockCalledOnceWith())
 
+    def test_markDNSForUpdate_without_zones_needs_full_update(self):
+        listener = MagicMock()
+        service = RegionControllerService(listener)
+        self.patch(service, "startProcessing")
+        service.markDNSForUpdate("sys_dns", "%d" % random.randint(1, 1000))
+        self.assertTrue(service.needsDNSUpdate)
+        self.assertTrue(service.needsFullDNSUpdate)
+
+    def test_markDNSZonesForUpdate_records_pending_zones(self):
+        service = RegionControllerService(sentinel.listener)
+        service.markDNSZonesForUpdate("sys_dns_zones", "42 1,2 3")
+        self.assertEqual(
+            {"42": ({1, 2}, {3})}, service.pendingDNSZones)
+
+    def test_markDNSZonesForUpdate_handles_no_domains_or_subnets(self):
+        service = RegionControllerService(sentinel.listener)
+        service.markDNSZonesForUpdate("sys_dns_zones", "42  ")
+        self.assertEqual({"42": (set(), set())}, service.pendingDNSZones)
+
+    def test_markDNSForUpdate_with_zones_marks_only_those_zones(self):
+        listener = MagicMock()
+        service = RegionControllerService(listener)
+        mock_startProcessing = self.patch(service, "startProcessing")
+        service.markDNSZonesForUpdate("sys_dns_zones", "42 1,2 3")
+        service.markDNSForUpdate("sys_dns", "42")
+        self.assertTrue(service.needsDNSUpdate)
+        self.assertFalse(service.needsFullDNSUpdate)
+        self.assertEqual({1, 2}, service.dirtyDomains)
+        self.assertEqual({3}, service.dirtySubnets)
+        self.assertEqual({}, service.pendingDNSZones)
+        self.assertThat(mock_startProcessing, MockCalledOnceWith())
+
+    def test_markDNSRecordsForUpdate_queues_dynamic_updates(self):
+        service = RegionControllerService(sentinel.listener)
+        mock_startProcessing = self.patch(service, "startProcessing")
+        service.markDNSRecordsForUpdate("sys_dns_updates", json.dumps({
+            "operation": "INSERT", "zone": "example.com", "name": "foo",
+            "address": "10.0.0.1", "ttl": 30,
+            "subnets": {"3": "10.0.0.0/24"},
+        }))
+        self.assertEqual([
+            DynamicDNSUpdate(
+                "INSERT", "example.com", "foo.example.com", "A", 30,
+                "10.0.0.1"),
+            DynamicDNSUpdate(
+                "INSERT", "0.0.10.in-addr.arpa", "1.0.0.10.in-addr.arpa",
+                "PTR", 30, "foo.example.com."),
+        ], service.pendingDNSRecords)
+        self.assertFalse(service.needsDNSUpdate)
+        self.assertThat(mock_startProcessing, MockCalledOnceWith())
+
+    def test_markDNSRecordsForUpdate_marks_rfc2317_subnets(self):
+        service = RegionControllerService(sentinel.listener)
+        self.patch(service, "startProcessing")
+        service.markDNSRecordsForUpdate("sys_dns_updates", json.dumps({
+            "operation": "DELETE", "zone": "example.com", "name": "foo",
+            "address": "10.0.0.1", "ttl": 30,
+            "subnets": {"3": "10.0.0.0/24", "4": "10.0.0.0/26"},
+        }))
+        self.assertEqual([
+            DynamicDNSUpdate(
+                "DELETE", "example.com", "foo.example.com", "A", 30,
+                "10.0.0.1"),
+        ], service.pendingDNSRecords)
+        self.assertTrue(service.needsDNSUpdate)
+        self.assertFalse(service.needsFullDNSUpdate)
+        self.assertEqual({3, 4}, service.dirtySubnets)
+
     def test_markProxyForUpdate_sets_needsProxyUpdate_and_starts_process(self):
         listener = MagicMock()
         service = RegionControllerService(listener)
@@ -203,6 +277,128 @@ class TestRegionControllerService(MAASServerTestCase):
             MockCalledOnceWith(
                 "Reloaded DNS configuration; regiond started."))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_updates_only_dirty_zones(self):
+        service = RegionControllerService(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.dirtyDomains = {1, 2}
+        service.dirtySubnets = {3}
+        dns_result = (
+            random.randint(1, 1000), [
+                factory.make_name('domain')
+                for _ in range(2)
+            ])
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones")
+        mock_dns_update_zones = self.patch(
+            region_controller, "dns_update_zones")
+        mock_dns_update_zones.return_value = dns_result
+        mock_check_serial = self.patch(service, "_checkSerial")
+        mock_check_serial.return_value = succeed(dns_result)
+        self.patch(region_controller.log, "msg")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(mock_dns_update_all_zones, MockNotCalled())
+        self.assertThat(
+            mock_dns_update_zones, MockCalledOnceWith({1, 2}, {3}))
+        self.assertThat(mock_check_serial, MockCalledOnceWith(dns_result))
+        self.assertEqual(set(), service.dirtyDomains)
+        self.assertEqual(set(), service.dirtySubnets)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_updates_all_zones_when_full_update_needed(self):
+        service = RegionControllerService(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.needsFullDNSUpdate = True
+        service.dirtyDomains = {1, 2}
+        service.dirtySubnets = {3}
+        dns_result = (
+            random.randint(1, 1000), [
+                factory.make_name('domain')
+                for _ in range(3)
+            ])
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones")
+        mock_dns_update_all_zones.return_value = dns_result
+        mock_dns_update_zones = self.patch(
+            region_controller, "dns_update_zones")
+        mock_check_serial = self.patch(service, "_checkSerial")
+        mock_check_serial.return_value = succeed(dns_result)
+        self.patch(region_controller.log, "msg")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(mock_dns_update_all_zones, MockCalledOnceWith())
+        self.assertThat(mock_dns_update_zones, MockNotCalled())
+        self.assertFalse(service.needsFullDNSUpdate)
+        self.assertEqual(set(), service.dirtyDomains)
+        self.assertEqual(set(), service.dirtySubnets)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_sends_dynamic_updates(self):
+        service = RegionControllerService(sentinel.listener)
+        service.pendingDNSRecords = [sentinel.update1, sentinel.update2]
+        mock_bind_update_records = self.patch(
+            region_controller, "bind_update_records")
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones")
+        self.patch(region_controller.log, "msg")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(
+            mock_bind_update_records,
+            MockCalledOnceWith([sentinel.update1, sentinel.update2]))
+        self.assertThat(mock_dns_update_all_zones, MockNotCalled())
+        self.assertEqual([], service.pendingDNSRecords)
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_updates_all_zones_when_dynamic_updates_fail(self):
+        service = RegionControllerService(sentinel.listener)
+        service.pendingDNSRecords = [sentinel.update]
+        mock_bind_update_records = self.patch(
+            region_controller, "bind_update_records")
+        mock_bind_update_records.side_effect = (
+            factory.make_exception_type())
+        dns_result = (random.randint(1, 1000), [])
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones")
+        mock_dns_update_all_zones.return_value = dns_result
+        mock_check_serial = self.patch(service, "_checkSerial")
+        mock_check_serial.return_value = succeed(dns_result)
+        mock_err = self.patch(region_controller.log, "err")
+        self.patch(region_controller.log, "msg")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(
+            mock_err, MockCalledOnceWith(
+                ANY, "Failed sending dynamic DNS updates."))
+        self.assertThat(mock_dns_update_all_zones, MockCalledOnceWith())
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_process_drops_dynamic_updates_when_full_update_needed(self):
+        service = RegionControllerService(sentinel.listener)
+        service.needsDNSUpdate = True
+        service.needsFullDNSUpdate = True
+        service.pendingDNSRecords = [sentinel.update]
+        dns_result = (random.randint(1, 1000), [])
+        mock_bind_update_records = self.patch(
+            region_controller, "bind_update_records")
+        mock_dns_update_all_zones = self.patch(
+            region_controller, "dns_update_all_zones")
+        mock_dns_update_all_zones.return_value = dns_result
+        mock_check_serial = self.patch(service, "_checkSerial")
+        mock_check_serial.return_value = succeed(dns_result)
+        self.patch(region_controller.log, "msg")
+        service.startProcessing()
+        yield service.processingDefer
+        self.assertThat(mock_bind_update_records, MockNotCalled())
+        self.assertThat(mock_dns_update_all_zones, MockCalledOnceWith())
+        self.assertEqual([], service.pendingDNSRecords)
+
     @wait_for_reactor
     @inlineCallbacks
     def test_process_updates_proxy(self):
@@ -320,6 +516,18 @@ class TestRegionControllerService(MAASServerTestCase):
         # Error should not be raised.
         return service._checkSerial((formatted_serial, dns_names))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test__check_serial_does_not_wait_when_no_zones_were_written(self):
+        service = RegionControllerService(sentinel.listener)
+        serial = random.randint(1, 1000)
+        mock_pause = self.patch(region_controller, "pause")
+        mock_lookup = self.patch(service.dnsResolver, "lookupAuthority")
+        result = yield service._checkSerial((serial, []))
+        self.assertEqual((serial, []), result)
+        self.assertThat(mock_lookup, MockNotCalled())
+        self.assertThat(mock_pause, MockNotCalled())
+
     @wait_for_reactor
     @inlineCallbacks
     def test__check_serial_raise_error_after_30_tries(self):
@@ -0,0 +1,291 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.subnet_index`."""
+
+__all__ = []
+
+from maasserver import subnet_index
+from maasserver.enum import IPRANGE_TYPE
+from maasserver.models import Subnet
+from maasserver.subnet_index import SubnetIndex
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maastesting.djangotestcase import count_queries
+from testtools.matchers import (
+    Equals,
+    GreaterThan,
+    Is,
+    Not,
+)
+
+
+def make_live_index():
+    index = SubnetIndex()
+    index.live = True
+    return index
+
+
+class TestSubnetIndexGetBestSubnetForIP(MAASServerTestCase):
+
+    def test__returns_most_specific_subnet(self):
+        factory.make_Subnet(cidr="10.0.0.0/8")
+        expected_subnet = factory.make_Subnet(cidr="10.1.1.0/24")
+        factory.make_Subnet(cidr="10.1.0.0/16")
+        index = make_live_index()
+        subnet = index.get_best_subnet_for_ip("10.1.1.1")
+        self.assertThat(subnet, Equals(expected_subnet))
+        self.assertThat(subnet.cidr, Equals(expected_subnet.cidr))
+
+    def test__returns_most_specific_ipv6_subnet(self):
+        factory.make_Subnet(cidr="2001::/16")
+        expected_subnet = factory.make_Subnet(cidr="2001:db8:1:2::/64")
+        factory.make_Subnet(cidr="2001:db8::/32")
+        index = make_live_index()
+        self.assertThat(
+            index.get_best_subnet_for_ip("2001:db8:1:2::1"),
+            Equals(expected_subnet))
+
+    def test__handles_ipv4_mapped_ipv6_addr(self):
+        expected_subnet = factory.make_Subnet(cidr="10.1.1.0/24")
+        index = make_live_index()
+        self.assertThat(
+            index.get_best_subnet_for_ip("::ffff:10.1.1.1"),
+            Equals(expected_subnet))
+
+    def test__prefers_subnet_with_dhcp_on(self):
+        expected_subnet = factory.make_Subnet(
+            cidr="10.0.0.0/8", vlan=factory.make_VLAN(dhcp_on=True))
+        factory.make_Subnet(cidr="10.1.1.0/24")
+        index = make_live_index()
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.1.1.1"),
+            Equals(expected_subnet))
+
+    def test__agrees_with_database(self):
+        for _ in range(3):
+            factory.make_Subnet(vlan=factory.make_VLAN(dhcp_on=True))
+            factory.make_Subnet()
+        ips = [
+            factory.pick_ip_in_Subnet(subnet)
+            for subnet in Subnet.objects.all()
+        ]
+        index = make_live_index()
+        self.assertThat(
+            {ip: index.get_best_subnet_for_ip(ip) for ip in ips},
+            Equals({
+                ip: Subnet.objects.get_best_subnet_for_ip(ip)
+                for ip in ips
+            }))
+
+    def test__returns_none_if_no_subnet_found(self):
+        factory.make_Subnet(cidr="10.0.0.0/8")
+        index = make_live_index()
+        self.assertThat(index.get_best_subnet_for_ip("::"), Is(None))
+
+    def test__does_not_query_database_once_loaded(self):
+        factory.make_Subnet(cidr="10.1.1.0/24")
+        index = make_live_index()
+        index.get_best_subnet_for_ip("10.1.1.1")
+        count, subnet = count_queries(
+            index.get_best_subnet_for_ip, "10.1.1.2")
+        self.assertThat(subnet, Not(Is(None)))
+        self.assertThat(count, Equals(0))
+
+    def test__returns_new_subnet_objects(self):
+        factory.make_Subnet(cidr="10.1.1.0/24")
+        index = make_live_index()
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.1.1.1"),
+            Not(Is(index.get_best_subnet_for_ip("10.1.1.1"))))
+
+    def test__falls_back_to_database_when_not_in_index(self):
+        index = make_live_index()
+        index.get_best_subnet_for_ip("10.1.1.1")
+        expected_subnet = factory.make_Subnet(cidr="10.1.1.0/24")
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.1.1.1"),
+            Equals(expected_subnet))
+
+    def test__uses_database_when_not_live(self):
+        factory.make_Subnet(cidr="10.1.1.0/24")
+        index = SubnetIndex()
+        index.get_best_subnet_for_ip("10.1.1.1")
+        count, _ = count_queries(index.get_best_subnet_for_ip, "10.1.1.2")
+        self.assertThat(count, Equals(1))
+
+    def test__invalidate_reloads_index(self):
+        old_subnet = factory.make_Subnet(cidr="10.1.0.0/16")
+        index = make_live_index()
+        index.get_best_subnet_for_ip("10.1.1.1")
+        new_subnet = factory.make_Subnet(cidr="10.1.1.0/24")
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.1.1.1"), Equals(old_subnet))
+        index.invalidate()
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.1.1.1"), Equals(new_subnet))
+
+    def test__invalidate_subnet_reloads_subnet(self):
+        subnet = factory.make_Subnet(cidr="10.1.0.0/16")
+        index = make_live_index()
+        index.get_best_subnet_for_ip("10.1.1.1")
+        subnet.cidr = "10.2.0.0/16"
+        subnet.gateway_ip = None
+        subnet.save()
+        index.invalidate_subnet(subnet.id)
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.2.1.1"), Equals(subnet))
+        self.assertThat(index.get_best_subnet_for_ip("10.1.1.1"), Is(None))
+
+    def test__reloads_index_when_too_old(self):
+        old_subnet = factory.make_Subnet(cidr="10.1.0.0/16")
+        index = make_live_index()
+        index.get_best_subnet_for_ip("10.1.1.1")
+        new_subnet = factory.make_Subnet(cidr="10.1.1.0/24")
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.1.1.1"), Equals(old_subnet))
+        index._loaded -= index.max_age + 1
+        self.assertThat(
+            index.get_best_subnet_for_ip("10.1.1.1"), Equals(new_subnet))
+
+
+class TestSubnetIndexRefresh(MAASServerTestCase):
+    """Tests for how `SubnetIndex` reloads within transactions."""
+
+    def make_loaded_index(self, snapshot):
+        self.patch(subnet_index, "has_snapshot").return_value = snapshot
+        factory.make_Subnet(cidr="10.1.1.0/24")
+        index = make_live_index()
+        index.get_best_subnet_for_ip("10.1.1.1")
+        return index
+
+    def count_reload_queries(self, index):
+        count, _ = count_queries(index.get_best_subnet_for_ip, "10.1.1.1")
+        return count
+
+    def test__reload_at_start_of_transaction_clears_stale(self):
+        index = self.make_loaded_index(snapshot=False)
+        index.invalidate()
+        index.invalidate_subnet(factory.make_Subnet().id)
+        index.invalidate_ranges()
+        self.assertThat(self.count_reload_queries(index), GreaterThan(0))
+        self.assertThat(self.count_reload_queries(index), Equals(0))
+
+    def test__reload_mid_transaction_keeps_stale(self):
+        # The notification arrives after the transaction has taken its
+        # snapshot, which may predate the notified change.
+        index = self.make_loaded_index(snapshot=True)
+        index.invalidate()
+        self.assertThat(self.count_reload_queries(index), GreaterThan(0))
+        self.assertThat(self.count_reload_queries(index), GreaterThan(0))
+        # The index is reloaded at the start of the next transaction, and
+        # only then is it no longer stale.
+        subnet_index.has_snapshot.return_value = False
+        self.assertThat(self.count_reload_queries(index), GreaterThan(0))
+        self.assertThat(self.count_reload_queries(index), Equals(0))
+
+    def test__reload_mid_transaction_keeps_stale_subnets_and_ranges(self):
+        index = self.make_loaded_index(snapshot=True)
+        index.invalidate_subnet(factory.make_Subnet().id)
+        index.invalidate_ranges()
+        self.assertThat(self.count_reload_queries(index), Equals(2))
+        self.assertThat(self.count_reload_queries(index), Equals(2))
+
+    def test__keeps_stale_when_notified_during_reload(self):
+        index = self.make_loaded_index(snapshot=False)
+        index.invalidate_ranges()
+        load_ranges = index._load_ranges
+
+        def notify_then_load_ranges():
+            # This notification may be for a change committed after the
+            # reload's snapshot was taken.
+            index.invalidate_ranges()
+            load_ranges()
+
+        self.patch(index, "_load_ranges", notify_then_load_ranges)
+        self.assertThat(self.count_reload_queries(index), Equals(1))
+        self.patch(index, "_load_ranges", load_ranges)
+        self.assertThat(self.count_reload_queries(index), Equals(1))
+        self.assertThat(self.count_reload_queries(index), Equals(0))
+
+
+class TestSubnetIndexGetBestSubnetsForIPs(MAASServerTestCase):
+
+    def test__agrees_with_database(self):
+        for _ in range(3):
+            factory.make_Subnet(vlan=factory.make_VLAN(dhcp_on=True))
+            factory.make_Subnet()
+        ips = [
+            factory.pick_ip_in_Subnet(subnet)
+            for subnet in Subnet.objects.all()
+        ]
+        ips.append("192.0.2.1")
+        index = make_live_index()
+        self.assertThat(
+            index.get_best_subnets_for_ips(ips),
+            Equals(Subnet.objects.get_best_subnets_for_ips(ips)))
+
+    def test__does_not_query_database_once_loaded(self):
+        factory.make_Subnet(cidr="10.1.1.0/24")
+        factory.make_Subnet(cidr="10.1.2.0/24")
+        index = make_live_index()
+        index.get_best_subnets_for_ips([])
+        count, subnets = count_queries(
+            index.get_best_subnets_for_ips, ["10.1.1.1", "10.1.2.1"])
+        self.assertThat(set(subnets), Equals({"10.1.1.1", "10.1.2.1"}))
+        self.assertThat(count, Equals(0))
+
+
+class TestSubnetIndexGetDynamicRangeForIP(MAASServerTestCase):
+
+    def make_subnet_with_range(self):
+        subnet = factory.make_Subnet(cidr="10.1.1.0/24", gateway_ip=None)
+        iprange = factory.make_IPRange(
+            subnet, "10.1.1.100", "10.1.1.149",
+            alloc_type=IPRANGE_TYPE.DYNAMIC)
+        factory.make_IPRange(
+            subnet, "10.1.1.200", "10.1.1.209",
+            alloc_type=IPRANGE_TYPE.RESERVED)
+        return subnet, iprange
+
+    def test__returns_dynamic_range(self):
+        subnet, iprange = self.make_subnet_with_range()
+        index = make_live_index()
+        subnet = index.get_best_subnet_for_ip("10.1.1.100")
+        for ip in ("10.1.1.100", "10.1.1.120", "10.1.1.149"):
+            self.assertThat(
+                index.get_dynamic_range_for_ip(subnet, ip), Equals(iprange))
+
+    def test__returns_none_outside_dynamic_ranges(self):
+        subnet, _ = self.make_subnet_with_range()
+        index = make_live_index()
+        subnet = index.get_best_subnet_for_ip("10.1.1.100")
+        for ip in ("10.1.1.99", "10.1.1.150", "10.1.1.200"):
+            self.assertThat(
+                index.get_dynamic_range_for_ip(subnet, ip), Is(None))
+
+    def test__agrees_with_subnet(self):
+        subnet, _ = self.make_subnet_with_range()
+        index = make_live_index()
+        for ip in ("10.1.1.1", "10.1.1.110", "10.1.1.205"):
+            self.assertThat(
+                index.get_dynamic_range_for_ip(subnet, ip),
+                Equals(subnet.get_dynamic_range_for_ip(ip)))
+
+    def test__does_not_query_database_once_loaded(self):
+        subnet, _ = self.make_subnet_with_range()
+        index = make_live_index()
+        subnet = index.get_best_subnet_for_ip("10.1.1.100")
+        count, iprange = count_queries(
+            index.get_dynamic_range_for_ip, subnet, "10.1.1.101")
+        self.assertThat(iprange, Not(Is(None)))
+        self.assertThat(count, Equals(0))
+
+    def test__invalidate_ranges_reloads_ranges(self):
+        subnet, iprange = self.make_subnet_with_range()
+        index = make_live_index()
+        index.get_dynamic_range_for_ip(subnet, "10.1.1.100")
+        iprange.delete()
+        index.invalidate_ranges()
+        self.assertThat(
+            index.get_dynamic_range_for_ip(subnet, "10.1.1.100"), Is(None))
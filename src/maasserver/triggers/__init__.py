@@ -160,7 +160,9 @@ def register_trigger(
 @transactional
 def register_all_triggers():
     """Register all triggers into the database."""
+    from maasserver.triggers.allocation import register_allocation_triggers
     from maasserver.triggers.system import register_system_triggers
     from maasserver.triggers.websocket import register_websocket_triggers
     register_system_triggers()
     register_websocket_triggers()
+    register_allocation_triggers()
@@ -0,0 +1,282 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""
+Allocation Triggers
+
+These triggers maintain `AllocationIndex`. Each change to the storage or
+networking of a node recomputes the node's entry, within the transaction
+that made the change, so allocation can match constraints against the index
+without recomputing anything itself.
+"""
+
+__all__ = [
+    "register_allocation_triggers"
+    ]
+
+from contextlib import closing
+from textwrap import dedent
+
+from django.db import connection
+from maasserver.triggers import (
+    register_procedure,
+    register_trigger,
+)
+
+# Recomputes the entry of the given node, or removes it if the node has been
+# deleted. See `AllocationIndex` for what is indexed.
+ALLOCATION_INDEX_REFRESH = dedent("""\
+    CREATE OR REPLACE FUNCTION allocation_index_refresh(target_node_id integer)
+    RETURNS void AS $$
+    BEGIN
+      IF NOT EXISTS (
+          SELECT 1 FROM maasserver_node WHERE id = target_node_id) THEN
+        DELETE FROM maasserver_allocationindex
+        WHERE node_id = target_node_id;
+        RETURN;
+      END IF;
+      INSERT INTO maasserver_allocationindex (
+        node_id, root_size, root_tags, unused_sizes, unused_tags,
+        fabric_ids, fabric_classes, space_ids, vlan_ids, subnet_ids)
+      WITH root_devices AS (
+        SELECT DISTINCT blockdevice.id, blockdevice.size, blockdevice.tags
+        FROM maasserver_blockdevice AS blockdevice
+        LEFT JOIN maasserver_partitiontable AS partitiontable
+          ON partitiontable.block_device_id = blockdevice.id
+        LEFT JOIN maasserver_partition AS partition
+          ON partition.partition_table_id = partitiontable.id
+        JOIN maasserver_filesystem AS filesystem
+          ON filesystem.block_device_id = blockdevice.id
+          OR filesystem.partition_id = partition.id
+        WHERE blockdevice.node_id = target_node_id
+          AND filesystem.mount_point = '/'
+          AND NOT filesystem.acquired
+      ), unused_devices AS (
+        SELECT blockdevice.size, blockdevice.tags
+        FROM maasserver_blockdevice AS blockdevice
+        WHERE blockdevice.node_id = target_node_id
+          AND NOT EXISTS (
+            SELECT 1 FROM maasserver_filesystem
+            WHERE block_device_id = blockdevice.id)
+          AND NOT EXISTS (
+            SELECT 1 FROM maasserver_partitiontable
+            WHERE block_device_id = blockdevice.id)
+      ), interfaces AS (
+        SELECT
+          vlan.id AS vlan_id, vlan.space_id,
+          fabric.id AS fabric_id, fabric.class_type
+        FROM maasserver_interface AS interface
+        JOIN maasserver_vlan AS vlan ON vlan.id = interface.vlan_id
+        JOIN maasserver_fabric AS fabric ON fabric.id = vlan.fabric_id
+        WHERE interface.node_id = target_node_id
+      )
+      SELECT
+        target_node_id,
+        (SELECT max(size) FROM root_devices),
+        ARRAY(SELECT DISTINCT unnest(tags) FROM root_devices),
+        ARRAY(SELECT size FROM unused_devices ORDER BY size DESC),
+        ARRAY(SELECT DISTINCT unnest(tags) FROM unused_devices),
+        ARRAY(SELECT DISTINCT fabric_id FROM interfaces),
+        ARRAY(
+          SELECT DISTINCT class_type FROM interfaces
+          WHERE class_type IS NOT NULL),
+        ARRAY(
+          SELECT DISTINCT space_id FROM interfaces
+          WHERE space_id IS NOT NULL),
+        ARRAY(SELECT DISTINCT vlan_id FROM interfaces),
+        ARRAY(
+          SELECT DISTINCT staticipaddress.subnet_id
+          FROM maasserver_interface AS interface
+          JOIN maasserver_interface_ip_addresses AS link
+            ON link.interface_id = interface.id
+          JOIN maasserver_staticipaddress AS staticipaddress
+            ON staticipaddress.id = link.staticipaddress_id
+          WHERE interface.node_id = target_node_id
+            AND staticipaddress.subnet_id IS NOT NULL)
+      ON CONFLICT (node_id) DO UPDATE SET
+        root_size = EXCLUDED.root_size,
+        root_tags = EXCLUDED.root_tags,
+        unused_sizes = EXCLUDED.unused_sizes,
+        unused_tags = EXCLUDED.unused_tags,
+        fabric_ids = EXCLUDED.fabric_ids,
+        fabric_classes = EXCLUDED.fabric_classes,
+        space_ids = EXCLUDED.space_ids,
+        vlan_ids = EXCLUDED.vlan_ids,
+        subnet_ids = EXCLUDED.subnet_ids;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Helper that returns the node of the given block device.
+ALLOCATION_BLOCK_DEVICE_NODE = dedent("""\
+    CREATE OR REPLACE FUNCTION allocation_block_device_node(
+      target_block_device_id integer)
+    RETURNS integer AS $$
+    BEGIN
+      RETURN (
+        SELECT node_id FROM maasserver_blockdevice
+        WHERE id = target_block_device_id);
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Helper that returns the node of the given partition table.
+ALLOCATION_PARTITION_TABLE_NODE = dedent("""\
+    CREATE OR REPLACE FUNCTION allocation_partition_table_node(
+      target_partition_table_id integer)
+    RETURNS integer AS $$
+    BEGIN
+      RETURN (
+        SELECT allocation_block_device_node(block_device_id)
+        FROM maasserver_partitiontable
+        WHERE id = target_partition_table_id);
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Helper that returns the node of the given partition.
+ALLOCATION_PARTITION_NODE = dedent("""\
+    CREATE OR REPLACE FUNCTION allocation_partition_node(
+      target_partition_id integer)
+    RETURNS integer AS $$
+    BEGIN
+      RETURN (
+        SELECT allocation_partition_table_node(partition_table_id)
+        FROM maasserver_partition
+        WHERE id = target_partition_id);
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Removes the entry of a deleted node.
+ALLOCATION_NODE_DELETE = dedent("""\
+    CREATE OR REPLACE FUNCTION allocation_node_delete()
+    RETURNS trigger AS $$
+    BEGIN
+      DELETE FROM maasserver_allocationindex WHERE node_id = OLD.id;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+# Recomputes every entry, and removes those left for deleted nodes.
+ALLOCATION_INDEX_REBUILD = dedent("""\
+    SELECT allocation_index_refresh(id) FROM maasserver_node;
+    DELETE FROM maasserver_allocationindex
+    WHERE node_id NOT IN (SELECT id FROM maasserver_node);
+    """)
+
+
+def render_refresh_procedure(proc_name, node_ids):
+    """Render a trigger procedure that refreshes the entries of nodes.
+
+    :param proc_name: Name of the procedure.
+    :param node_ids: The nodes to refresh, as the SQL to select their IDs
+        from the changed row.
+    """
+    return dedent("""\
+        CREATE OR REPLACE FUNCTION %s()
+        RETURNS trigger AS $$
+        BEGIN
+          PERFORM allocation_index_refresh(node_id)
+          FROM (%s) AS nodes (node_id)
+          WHERE node_id IS NOT NULL;
+          RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """) % (proc_name, node_ids)
+
+
+def register_refresh_triggers(
+        table, name, node_ids, events=("insert", "update", "delete"),
+        fields=None):
+    """Register triggers that refresh the entries of the nodes affected by
+    changes to `table`.
+
+    :param table: The table name to create the triggers on.
+    :param name: A short name for the table, for the procedures.
+    :param node_ids: A list of the nodes to refresh, as SQL selecting their
+        IDs from the row in `{row}`. For an update, the nodes for both the
+        old and new row are refreshed.
+    :param events: The events that refresh the nodes.
+    :param fields: The fields whose update refreshes the nodes.
+    """
+    for event in events:
+        if event == "insert":
+            rows = ["NEW"]
+        elif event == "update":
+            rows = ["OLD", "NEW"]
+        else:
+            rows = ["OLD"]
+        proc_name = "allocation_%s_%s" % (name, event)
+        register_procedure(render_refresh_procedure(proc_name, " UNION ".join(
+            "SELECT " + node_id.format(row=row)
+            for row in rows
+            for node_id in node_ids
+        )))
+        register_trigger(table, proc_name, event, fields=fields)
+
+
+def register_allocation_triggers():
+    """Register all allocation triggers into the database, and rebuild the
+    index they maintain."""
+    register_procedure(ALLOCATION_INDEX_REFRESH)
+    register_procedure(ALLOCATION_BLOCK_DEVICE_NODE)
+    register_procedure(ALLOCATION_PARTITION_TABLE_NODE)
+    register_procedure(ALLOCATION_PARTITION_NODE)
+
+    # Storage
+    register_refresh_triggers(
+        "maasserver_blockdevice", "blockdevice", ["{row}.node_id"],
+        fields=["node_id", "size", "tags"])
+    register_refresh_triggers(
+        "maasserver_partitiontable", "partitiontable",
+        ["allocation_block_device_node({row}.block_device_id)"],
+        fields=["block_device_id"])
+    register_refresh_triggers(
+        "maasserver_partition", "partition",
+        ["allocation_partition_table_node({row}.partition_table_id)"],
+        events=["update"], fields=["partition_table_id"])
+    register_refresh_triggers(
+        "maasserver_filesystem", "filesystem", [
+            "allocation_block_device_node({row}.block_device_id)",
+            "allocation_partition_node({row}.partition_id)",
+        ],
+        fields=["block_device_id", "partition_id", "mount_point", "acquired"])
+
+    # Networking
+    register_refresh_triggers(
+        "maasserver_interface", "interface", ["{row}.node_id"],
+        fields=["node_id", "vlan_id"])
+    register_refresh_triggers(
+        "maasserver_interface_ip_addresses", "nic_ip", [
+            "node_id FROM maasserver_interface WHERE id = {row}.interface_id",
+        ],
+        events=["insert", "delete"])
+    register_refresh_triggers(
+        "maasserver_staticipaddress", "staticipaddress", [
+            "interface.node_id FROM maasserver_interface AS interface "
+            "JOIN maasserver_interface_ip_addresses AS link "
+            "ON link.interface_id = interface.id "
+            "WHERE link.staticipaddress_id = {row}.id",
+        ],
+        events=["update"], fields=["subnet_id"])
+    register_refresh_triggers(
+        "maasserver_vlan", "vlan", [
+            "node_id FROM maasserver_interface WHERE vlan_id = {row}.id",
+        ],
+        events=["update"], fields=["fabric_id", "space_id"])
+    register_refresh_triggers(
+        "maasserver_fabric", "fabric", [
+            "interface.node_id FROM maasserver_interface AS interface "
+            "JOIN maasserver_vlan AS vlan ON vlan.id = interface.vlan_id "
+            "WHERE vlan.fabric_id = {row}.id",
+        ],
+        events=["update"], fields=["class_type"])
+
+    # Node
+    register_procedure(ALLOCATION_NODE_DELETE)
+    register_trigger("maasserver_node", "allocation_node_delete", "delete")
+
+    with closing(connection.cursor()) as cursor:
+        cursor.execute(ALLOCATION_INDEX_REBUILD)
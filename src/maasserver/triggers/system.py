@@ -373,6 +373,9 @@ DHCP_VLAN_UPDATE = dedent("""\
     """)
 
 # Helper that alerts the primary and secondary rack controller for a VLAN.
+# The payload is the ID of the VLAN whose DHCP configuration changed, so that
+# the region need only regenerate that part of the configuration. Messages
+# with an empty payload mean that everything for the rack must be rebuilt.
 DHCP_ALERT = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dhcp_alert(vlan maasserver_vlan)
     RETURNS void AS $$
@@ -380,9 +383,12 @@ DHCP_ALERT = dedent("""\
       relay_vlan maasserver_vlan;
     BEGIN
       IF vlan.dhcp_on THEN
-        PERFORM pg_notify(CONCAT('sys_dhcp_', vlan.primary_rack_id), '');
+        PERFORM pg_notify(
+          CONCAT('sys_dhcp_', vlan.primary_rack_id), CAST(vlan.id AS text));
         IF vlan.secondary_rack_id IS NOT NULL THEN
-          PERFORM pg_notify(CONCAT('sys_dhcp_', vlan.secondary_rack_id), '');
+          PERFORM pg_notify(
+            CONCAT('sys_dhcp_', vlan.secondary_rack_id),
+            CAST(vlan.id AS text));
         END IF;
       END IF;
       IF vlan.relay_vlan_id IS NOT NULL THEN
@@ -391,10 +397,11 @@ DHCP_ALERT = dedent("""\
         WHERE maasserver_vlan.id = vlan.relay_vlan_id;
         IF relay_vlan.dhcp_on THEN
           PERFORM pg_notify(CONCAT(
-            'sys_dhcp_', relay_vlan.primary_rack_id), '');
+            'sys_dhcp_', relay_vlan.primary_rack_id), CAST(vlan.id AS text));
           IF relay_vlan.secondary_rack_id IS NOT NULL THEN
             PERFORM pg_notify(CONCAT(
-              'sys_dhcp_', relay_vlan.secondary_rack_id), '');
+              'sys_dhcp_', relay_vlan.secondary_rack_id),
+              CAST(vlan.id AS text));
           END IF;
         END IF;
       END IF;
@@ -879,12 +886,14 @@ DHCP_CONFIG_NTP_SERVERS_DELETE = dedent("""\
 
 
 # Triggered when DNS needs to be published. In essense this means on insert
-# into maasserver_dnspublication.
+# into maasserver_dnspublication. The serial is sent as the payload so that
+# the region can match the publication with any zones that were marked as
+# dirty by `sys_dns_publish_zones_update`.
 DNS_PUBLISH = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dns_publish()
     RETURNS trigger AS $$
     BEGIN
-      PERFORM pg_notify('sys_dns', '');
+      PERFORM pg_notify('sys_dns', text(NEW.serial));
       RETURN NEW;
     END;
     $$ LANGUAGE plpgsql;
@@ -906,6 +915,149 @@ DNS_PUBLISH_UPDATE = dedent("""\
     """)
 
 
+# Procedure to mark DNS as needing an update of only the given domains
+# (forward zones) and subnets (reverse zones). The 'sys_dns_zones' message is
+# sent before the publication is inserted so the region receives it before
+# the matching 'sys_dns' message. The payload is the serial of the
+# publication, followed by a comma-separated list of domain ids and a
+# comma-separated list of subnet ids.
+DNS_PUBLISH_ZONES_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_publish_zones_update(
+      reason text, domain_ids integer[], subnet_ids integer[])
+    RETURNS void as $$
+    DECLARE
+      publication_serial bigint;
+    BEGIN
+      publication_serial := nextval('maasserver_zone_serial_seq');
+      PERFORM pg_notify(
+        'sys_dns_zones',
+        text(publication_serial) || ' ' ||
+        COALESCE(array_to_string(domain_ids, ','), '') || ' ' ||
+        COALESCE(array_to_string(subnet_ids, ','), ''));
+      INSERT INTO maasserver_dnspublication
+        (serial, created, source)
+      VALUES
+        (publication_serial, now(), substring(reason FOR 255));
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Helper that returns the ids of the subnets with reverse DNS enabled that
+# contain any of the given IP addresses.
+DNS_GET_SUBNETS_FOR_IPS = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_get_subnets_for_ips(ips inet[])
+    RETURNS integer[] as $$
+    BEGIN
+      RETURN ARRAY(
+        SELECT DISTINCT subnet.id
+        FROM maasserver_subnet AS subnet, unnest(ips) AS address
+        WHERE
+          subnet.rdns_mode != 0 AND
+          address IS NOT NULL AND
+          subnet.cidr >>= address);
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Helper that returns the ids of the subnets with reverse DNS enabled that
+# contain an IP address assigned to an interface on the given node.
+DNS_GET_SUBNETS_FOR_NODE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_get_subnets_for_node(
+      target_node_id integer)
+    RETURNS integer[] as $$
+    BEGIN
+      RETURN sys_dns_get_subnets_for_ips(ARRAY(
+        SELECT staticipaddress.ip
+        FROM maasserver_staticipaddress AS staticipaddress
+        JOIN maasserver_interface_ip_addresses AS iia ON
+          iia.staticipaddress_id = staticipaddress.id
+        JOIN maasserver_interface AS interface ON
+          iia.interface_id = interface.id
+        WHERE interface.node_id = target_node_id));
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Helper that returns the ids of the subnets with reverse DNS enabled that
+# contain an IP address linked to the given DNS resource.
+DNS_GET_SUBNETS_FOR_DNSRESOURCE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_get_subnets_for_dnsresource(
+      target_dnsresource_id integer)
+    RETURNS integer[] as $$
+    BEGIN
+      RETURN sys_dns_get_subnets_for_ips(ARRAY(
+        SELECT staticipaddress.ip
+        FROM maasserver_staticipaddress AS staticipaddress
+        JOIN maasserver_dnsresource_ip_addresses AS dia ON
+          dia.staticipaddress_id = staticipaddress.id
+        WHERE dia.dnsresource_id = target_dnsresource_id));
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Helper that returns true when DNS records for discovered IP addresses are to
+# be sent to BIND as RFC 2136 dynamic updates, rather than causing zones to be
+# rewritten.
+DNS_DYNAMIC_UPDATES_ENABLED = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_dynamic_updates_enabled()
+    RETURNS boolean as $$
+    BEGIN
+      RETURN EXISTS (
+        SELECT 1
+        FROM maasserver_config
+        WHERE
+          maasserver_config.name = 'dns_dynamic_updates' AND
+          maasserver_config.value = 'true');
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+# Procedure to send a dynamic update that inserts or deletes the address
+# record (and any PTR records) for the given IP address on the given DNS
+# resource. The payload is a JSON object holding the operation, the zone, the
+# name, the address, the TTL, and a mapping of the ids to the CIDRs of the
+# subnets with reverse DNS enabled that contain the address.
+DNS_DYNAMIC_UPDATE = dedent("""\
+    CREATE OR REPLACE FUNCTION sys_dns_dynamic_update(
+      operation text, target_dnsresource_id integer, address inet)
+    RETURNS void as $$
+    DECLARE
+      resource maasserver_dnsresource;
+      domain maasserver_domain;
+    BEGIN
+      SELECT maasserver_dnsresource.* INTO resource
+      FROM maasserver_dnsresource
+      WHERE maasserver_dnsresource.id = target_dnsresource_id;
+      SELECT maasserver_domain.* INTO domain
+      FROM maasserver_domain
+      WHERE maasserver_domain.id = resource.domain_id;
+      IF domain.authoritative THEN
+        PERFORM pg_notify('sys_dns_updates', json_build_object(
+          'operation', operation,
+          'zone', domain.name,
+          'name', resource.name,
+          'address', host(address),
+          'ttl', COALESCE(
+            resource.address_ttl, domain.ttl, (
+              SELECT maasserver_config.value::integer
+              FROM maasserver_config
+              WHERE maasserver_config.name = 'default_dns_ttl'), 30),
+          'subnets', COALESCE((
+            SELECT json_object_agg(subnet.id, text(subnet.cidr))
+            FROM maasserver_subnet AS subnet
+            WHERE subnet.rdns_mode != 0 AND subnet.cidr >>= address),
+            '{}'::json))::text);
+      END IF;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
 # Triggered when a new domain is added. Increments the zone serial and
 # notifies that DNS needs to be updated.
 DNS_DOMAIN_INSERT = dedent("""\
@@ -979,13 +1131,41 @@ DNS_DOMAIN_DELETE = dedent("""\
 DNS_STATICIPADDRESS_UPDATE = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dns_staticipaddress_update()
     RETURNS trigger as $$
+    DECLARE
+      domain_ids integer[];
+      subnet_ids integer[];
+      resource_id integer;
     BEGIN
       IF ((OLD.ip IS NULL and NEW.ip IS NOT NULL) OR
           (OLD.ip IS NOT NULL and NEW.ip IS NULL) OR
           (OLD.ip != NEW.ip)) OR
           (OLD.alloc_type != NEW.alloc_type) THEN
-        IF EXISTS (
-            SELECT
+        -- A discovered address that is not on a node's interface is only in
+        -- DNS through DNS resources, so it can be updated dynamically.
+        IF (OLD.alloc_type = 6 AND NEW.alloc_type = 6 AND
+            sys_dns_dynamic_updates_enabled() AND NOT EXISTS (
+              SELECT 1
+              FROM maasserver_interface_ip_addresses AS iia
+              JOIN maasserver_interface AS interface ON
+                iia.interface_id = interface.id
+              WHERE
+                iia.staticipaddress_id = NEW.id AND
+                interface.node_id IS NOT NULL)) THEN
+          FOR resource_id IN (
+              SELECT dia.dnsresource_id
+              FROM maasserver_dnsresource_ip_addresses AS dia
+              WHERE dia.staticipaddress_id = NEW.id) LOOP
+            IF OLD.ip IS NOT NULL THEN
+              PERFORM sys_dns_dynamic_update('DELETE', resource_id, OLD.ip);
+            END IF;
+            IF NEW.ip IS NOT NULL THEN
+              PERFORM sys_dns_dynamic_update('INSERT', resource_id, NEW.ip);
+            END IF;
+          END LOOP;
+          RETURN NEW;
+        END IF;
+        domain_ids := ARRAY(
+            SELECT DISTINCT
               domain.id
             FROM maasserver_staticipaddress AS staticipaddress
             LEFT JOIN (
@@ -1005,28 +1185,33 @@ DNS_STATICIPADDRESS_UPDATE = dedent("""\
             WHERE
               domain.authoritative = TRUE AND
               (staticipaddress.id = OLD.id OR
-               staticipaddress.id = NEW.id))
-        THEN
+               staticipaddress.id = NEW.id));
+        IF array_length(domain_ids, 1) > 0 THEN
+          subnet_ids := sys_dns_get_subnets_for_ips(ARRAY[OLD.ip, NEW.ip]);
           IF OLD.ip IS NULL and NEW.ip IS NOT NULL THEN
-            PERFORM sys_dns_publish_update(
-              'ip ' || host(NEW.ip) || ' allocated');
+            PERFORM sys_dns_publish_zones_update(
+              'ip ' || host(NEW.ip) || ' allocated',
+              domain_ids, subnet_ids);
             RETURN NEW;
           ELSIF OLD.ip IS NOT NULL and NEW.ip IS NULL THEN
-            PERFORM sys_dns_publish_update(
-              'ip ' || host(OLD.ip) || ' released');
+            PERFORM sys_dns_publish_zones_update(
+              'ip ' || host(OLD.ip) || ' released',
+              domain_ids, subnet_ids);
             RETURN NEW;
           ELSIF OLD.ip != NEW.ip THEN
-            PERFORM sys_dns_publish_update(
-              'ip ' || host(OLD.ip) || ' changed to ' || host(NEW.ip));
+            PERFORM sys_dns_publish_zones_update(
+              'ip ' || host(OLD.ip) || ' changed to ' || host(NEW.ip),
+              domain_ids, subnet_ids);
             RETURN NEW;
           END IF;
 
           -- Made it this far then only alloc_type has changed. Only send
           -- a notification is the IP address is assigned.
           IF NEW.ip IS NOT NULL THEN
-            PERFORM sys_dns_publish_update(
+            PERFORM sys_dns_publish_zones_update(
               'ip ' || host(OLD.ip) || ' alloc_type changed to ' ||
-              NEW.alloc_type);
+              NEW.alloc_type,
+              domain_ids, subnet_ids);
           END IF;
         END IF;
       END IF;
@@ -1062,9 +1247,10 @@ DNS_NIC_IP_LINK = dedent("""\
               maasserver_domain.id = node.domain_id AND
               maasserver_domain.authoritative = TRUE))
       THEN
-        PERFORM sys_dns_publish_update(
+        PERFORM sys_dns_publish_zones_update(
           'ip ' || host(ip.ip) || ' connected to ' || node.hostname ||
-          ' on ' || nic.name);
+          ' on ' || nic.name,
+          ARRAY[node.domain_id], sys_dns_get_subnets_for_ips(ARRAY[ip.ip]));
       END IF;
       RETURN NEW;
     END;
@@ -1099,9 +1285,10 @@ DNS_NIC_IP_UNLINK = dedent("""\
               maasserver_domain.id = node.domain_id AND
               maasserver_domain.authoritative = TRUE))
       THEN
-        PERFORM sys_dns_publish_update(
+        PERFORM sys_dns_publish_zones_update(
           'ip ' || host(ip.ip) || ' disconnected from ' || node.hostname ||
-          ' on ' || nic.name);
+          ' on ' || nic.name,
+          ARRAY[node.domain_id], sys_dns_get_subnets_for_ips(ARRAY[ip.ip]));
       END IF;
       RETURN OLD;
     END;
@@ -1185,9 +1372,10 @@ DNS_NODE_UPDATE = dedent("""\
             WHERE
               maasserver_domain.authoritative = TRUE AND
               maasserver_domain.id = NEW.domain_id) THEN
-          PERFORM sys_dns_publish_update(
+          PERFORM sys_dns_publish_zones_update(
             'node ' || OLD.hostname || ' changed hostname to ' ||
-            NEW.hostname);
+            NEW.hostname,
+            ARRAY[NEW.domain_id], sys_dns_get_subnets_for_node(NEW.id));
         END IF;
       ELSIF OLD.domain_id != NEW.domain_id THEN
         -- Domains have changed. If either one is authoritative then DNS
@@ -1199,9 +1387,11 @@ DNS_NODE_UPDATE = dedent("""\
         FROM maasserver_domain
         WHERE maasserver_domain.id = NEW.domain_id;
         IF domain.authoritative = TRUE OR new_domain.authoritative = TRUE THEN
-            PERFORM sys_dns_publish_update(
+            PERFORM sys_dns_publish_zones_update(
               'node ' || NEW.hostname || ' changed zone to ' ||
-              new_domain.name);
+              new_domain.name,
+              ARRAY[OLD.domain_id, NEW.domain_id],
+              sys_dns_get_subnets_for_node(NEW.id));
         END IF;
       END IF;
       RETURN NEW;
@@ -1226,8 +1416,9 @@ DNS_NODE_DELETE = dedent("""\
           WHERE
             maasserver_domain.authoritative = TRUE AND
             maasserver_domain.id = OLD.domain_id) THEN
-        PERFORM sys_dns_publish_update(
-          'removed node ' || OLD.hostname);
+        PERFORM sys_dns_publish_zones_update(
+          'removed node ' || OLD.hostname,
+          ARRAY[OLD.domain_id], sys_dns_get_subnets_for_node(OLD.id));
       END IF;
       RETURN NEW;
     END;
@@ -1256,9 +1447,10 @@ DNS_INTERFACE_UPDATE = dedent("""\
                 WHERE
                   maasserver_domain.authoritative = TRUE AND
                   maasserver_domain.id = node.domain_id) THEN
-              PERFORM sys_dns_publish_update(
+              PERFORM sys_dns_publish_zones_update(
                 'node ' || node.hostname || ' renamed interface ' ||
-                OLD.name || ' to ' || NEW.name);
+                OLD.name || ' to ' || NEW.name,
+                ARRAY[node.domain_id], sys_dns_get_subnets_for_node(node.id));
             END IF;
         END IF;
       ELSIF OLD.node_id IS NULL and NEW.node_id IS NOT NULL THEN
@@ -1271,8 +1463,9 @@ DNS_INTERFACE_UPDATE = dedent("""\
             WHERE
               maasserver_domain.authoritative = TRUE AND
               maasserver_domain.id = node.domain_id) THEN
-          PERFORM sys_dns_publish_update(
-            'node ' || node.hostname || ' added interface ' || NEW.name);
+          PERFORM sys_dns_publish_zones_update(
+            'node ' || node.hostname || ' added interface ' || NEW.name,
+            ARRAY[node.domain_id], sys_dns_get_subnets_for_node(node.id));
         END IF;
       ELSIF OLD.node_id IS NOT NULL and NEW.node_id IS NULL THEN
         SELECT maasserver_node.* INTO node
@@ -1284,8 +1477,9 @@ DNS_INTERFACE_UPDATE = dedent("""\
             WHERE
               maasserver_domain.authoritative = TRUE AND
               maasserver_domain.id = node.domain_id) THEN
-          PERFORM sys_dns_publish_update(
-            'node ' || node.hostname || ' removed interface ' || NEW.name);
+          PERFORM sys_dns_publish_zones_update(
+            'node ' || node.hostname || ' removed interface ' || NEW.name,
+            ARRAY[node.domain_id], sys_dns_get_subnets_for_node(node.id));
         END IF;
       ELSIF OLD.node_id != NEW.node_id THEN
         SELECT maasserver_node.* INTO node
@@ -1297,8 +1491,9 @@ DNS_INTERFACE_UPDATE = dedent("""\
             WHERE
               maasserver_domain.authoritative = TRUE AND
               maasserver_domain.id = node.domain_id) THEN
-          PERFORM sys_dns_publish_update(
-            'node ' || node.hostname || ' removed interface ' || NEW.name);
+          PERFORM sys_dns_publish_zones_update(
+            'node ' || node.hostname || ' removed interface ' || NEW.name,
+            ARRAY[node.domain_id], sys_dns_get_subnets_for_node(node.id));
         END IF;
         SELECT maasserver_node.* INTO node
         FROM maasserver_node
@@ -1309,8 +1504,9 @@ DNS_INTERFACE_UPDATE = dedent("""\
             WHERE
               maasserver_domain.authoritative = TRUE AND
               maasserver_domain.id = node.domain_id) THEN
-          PERFORM sys_dns_publish_update(
-            'node ' || node.hostname || ' added interface ' || NEW.name);
+          PERFORM sys_dns_publish_zones_update(
+            'node ' || node.hostname || ' added interface ' || NEW.name,
+            ARRAY[node.domain_id], sys_dns_get_subnets_for_node(node.id));
         END IF;
       END IF;
       RETURN NEW;
@@ -1321,7 +1517,8 @@ DNS_INTERFACE_UPDATE = dedent("""\
 
 # Triggered when a config is inserted. Increments the zone serial and notifies
 # that DNS needs to be updated. Only watches for inserts on config
-# upstream_dns, dnssec_validation, default_dns_ttl, and windows_kms_host.
+# upstream_dns, dnssec_validation, dns_dynamic_updates, default_dns_ttl, and
+# windows_kms_host.
 DNS_CONFIG_INSERT = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dns_config_insert()
     RETURNS trigger as $$
@@ -1329,6 +1526,7 @@ DNS_CONFIG_INSERT = dedent("""\
       -- Only care about the
       IF (NEW.name = 'upstream_dns' OR
           NEW.name = 'dnssec_validation' OR
+          NEW.name = 'dns_dynamic_updates' OR
           NEW.name = 'default_dns_ttl' OR
           NEW.name = 'windows_kms_host')
       THEN
@@ -1343,7 +1541,8 @@ DNS_CONFIG_INSERT = dedent("""\
 
 # Triggered when a config is updated. Increments the zone serial and notifies
 # that DNS needs to be updated. Only watches for updates on config
-# upstream_dns, dnssec_validation, default_dns_ttl, and windows_kms_host.
+# upstream_dns, dnssec_validation, dns_dynamic_updates, default_dns_ttl, and
+# windows_kms_host.
 DNS_CONFIG_UPDATE = dedent("""\
     CREATE OR REPLACE FUNCTION sys_dns_config_update()
     RETURNS trigger as $$
@@ -1353,6 +1552,7 @@ DNS_CONFIG_UPDATE = dedent("""\
       IF (OLD.value != NEW.value AND (
           NEW.name = 'upstream_dns' OR
           NEW.name = 'dnssec_validation' OR
+          NEW.name = 'dns_dynamic_updates' OR
           NEW.name = 'default_dns_ttl' OR
           NEW.name = 'windows_kms_host'))
       THEN
@@ -1373,12 +1573,18 @@ DNS_DNSRESOURCE_INSERT = dedent("""\
     DECLARE
       domain maasserver_domain;
     BEGIN
+      -- A new resource has no records until addresses or data are linked to
+      -- it, so there is nothing to publish when updating dynamically.
+      IF sys_dns_dynamic_updates_enabled() THEN
+        RETURN NEW;
+      END IF;
       SELECT maasserver_domain.* INTO domain
       FROM maasserver_domain
       WHERE maasserver_domain.id = NEW.domain_id;
-      PERFORM sys_dns_publish_update(
+      PERFORM sys_dns_publish_zones_update(
         'zone ' || domain.name || ' added resource ' ||
-        COALESCE(NEW.name, 'NULL'));
+        COALESCE(NEW.name, 'NULL'),
+        ARRAY[domain.id], ARRAY[]::integer[]);
       RETURN NEW;
     END;
     $$ LANGUAGE plpgsql;
@@ -1397,15 +1603,17 @@ DNS_DNSRESOURCE_UPDATE = dedent("""\
         SELECT maasserver_domain.* INTO domain
         FROM maasserver_domain
         WHERE maasserver_domain.id = OLD.domain_id;
-        PERFORM sys_dns_publish_update(
+        PERFORM sys_dns_publish_zones_update(
           'zone ' || domain.name || ' removed resource ' ||
-          COALESCE(NEW.name, 'NULL'));
+          COALESCE(NEW.name, 'NULL'),
+          ARRAY[domain.id], sys_dns_get_subnets_for_dnsresource(NEW.id));
         SELECT maasserver_domain.* INTO domain
         FROM maasserver_domain
         WHERE maasserver_domain.id = NEW.domain_id;
-        PERFORM sys_dns_publish_update(
+        PERFORM sys_dns_publish_zones_update(
           'zone ' || domain.name || ' added resource ' ||
-          COALESCE(NEW.name, 'NULL'));
+          COALESCE(NEW.name, 'NULL'),
+          ARRAY[domain.id], sys_dns_get_subnets_for_dnsresource(NEW.id));
       ELSIF ((OLD.name IS NULL AND NEW.name IS NOT NULL) OR
           (OLD.name IS NOT NULL AND NEW.name IS NULL) OR
           (OLD.name != NEW.name) OR
@@ -1415,9 +1623,10 @@ DNS_DNSRESOURCE_UPDATE = dedent("""\
         SELECT maasserver_domain.* INTO domain
         FROM maasserver_domain
         WHERE maasserver_domain.id = NEW.domain_id;
-        PERFORM sys_dns_publish_update(
+        PERFORM sys_dns_publish_zones_update(
           'zone ' || domain.name || ' updated resource ' ||
-          COALESCE(NEW.name, 'NULL'));
+          COALESCE(NEW.name, 'NULL'),
+          ARRAY[domain.id], sys_dns_get_subnets_for_dnsresource(NEW.id));
       END IF;
       RETURN NEW;
     END;
@@ -1433,12 +1642,19 @@ DNS_DNSRESOURCE_DELETE = dedent("""\
     DECLARE
       domain maasserver_domain;
     BEGIN
+      -- The addresses and data of a resource are removed before it is, and
+      -- they publish their own changes, so there is nothing left to publish
+      -- when updating dynamically.
+      IF sys_dns_dynamic_updates_enabled() THEN
+        RETURN OLD;
+      END IF;
       SELECT maasserver_domain.* INTO domain
       FROM maasserver_domain
       WHERE maasserver_domain.id = OLD.domain_id;
-      PERFORM sys_dns_publish_update(
+      PERFORM sys_dns_publish_zones_update(
         'zone ' || domain.name || ' removed resource ' ||
-        COALESCE(OLD.name, 'NULL'));
+        COALESCE(OLD.name, 'NULL'),
+        ARRAY[domain.id], sys_dns_get_subnets_for_dnsresource(OLD.id));
       RETURN OLD;
     END;
     $$ LANGUAGE plpgsql;
@@ -1464,10 +1680,14 @@ DNS_DNSRESOURCE_IP_LINK = dedent("""\
       SELECT maasserver_domain.* INTO domain
       FROM maasserver_domain
       WHERE maasserver_domain.id = resource.domain_id;
-      IF sip.ip IS NOT NULL THEN
-          PERFORM sys_dns_publish_update(
+      IF (sip.ip IS NOT NULL AND sip.alloc_type = 6 AND
+          sys_dns_dynamic_updates_enabled()) THEN
+          PERFORM sys_dns_dynamic_update('INSERT', resource.id, sip.ip);
+      ELSIF sip.ip IS NOT NULL THEN
+          PERFORM sys_dns_publish_zones_update(
             'ip ' || host(sip.ip) || ' linked to resource ' ||
-            COALESCE(resource.name, 'NULL') || ' on zone ' || domain.name);
+            COALESCE(resource.name, 'NULL') || ' on zone ' || domain.name,
+            ARRAY[domain.id], sys_dns_get_subnets_for_ips(ARRAY[sip.ip]));
       END IF;
       RETURN NEW;
     END;
@@ -1494,10 +1714,14 @@ DNS_DNSRESOURCE_IP_UNLINK = dedent("""\
       SELECT maasserver_domain.* INTO domain
       FROM maasserver_domain
       WHERE maasserver_domain.id = resource.domain_id;
-      IF sip.ip IS NOT NULL THEN
-          PERFORM sys_dns_publish_update(
+      IF (sip.ip IS NOT NULL AND sip.alloc_type = 6 AND
+          sys_dns_dynamic_updates_enabled()) THEN
+          PERFORM sys_dns_dynamic_update('DELETE', resource.id, sip.ip);
+      ELSIF sip.ip IS NOT NULL THEN
+          PERFORM sys_dns_publish_zones_update(
             'ip ' || host(sip.ip) || ' unlinked from resource ' ||
-            COALESCE(resource.name, 'NULL') || ' on zone ' || domain.name);
+            COALESCE(resource.name, 'NULL') || ' on zone ' || domain.name,
+            ARRAY[domain.id], sys_dns_get_subnets_for_ips(ARRAY[sip.ip]));
       END IF;
       RETURN OLD;
     END;
@@ -1520,9 +1744,10 @@ DNS_DNSDATA_INSERT = dedent("""\
       SELECT maasserver_domain.* INTO domain
       FROM maasserver_domain
       WHERE maasserver_domain.id = resource.domain_id;
-      PERFORM sys_dns_publish_update(
+      PERFORM sys_dns_publish_zones_update(
         'added ' || NEW.rrtype || ' to resource ' || resource.name ||
-        ' on zone ' || domain.name);
+        ' on zone ' || domain.name,
+        ARRAY[domain.id], ARRAY[]::integer[]);
       RETURN NEW;
     END;
     $$ LANGUAGE plpgsql;
@@ -1544,9 +1769,10 @@ DNS_DNSDATA_UPDATE = dedent("""\
       SELECT maasserver_domain.* INTO domain
       FROM maasserver_domain
       WHERE maasserver_domain.id = resource.domain_id;
-      PERFORM sys_dns_publish_update(
+      PERFORM sys_dns_publish_zones_update(
         'updated ' || NEW.rrtype || ' in resource ' || resource.name ||
-        ' on zone ' || domain.name);
+        ' on zone ' || domain.name,
+        ARRAY[domain.id], ARRAY[]::integer[]);
       RETURN NEW;
     END;
     $$ LANGUAGE plpgsql;
@@ -1568,9 +1794,10 @@ DNS_DNSDATA_DELETE = dedent("""\
       SELECT maasserver_domain.* INTO domain
       FROM maasserver_domain
       WHERE maasserver_domain.id = resource.domain_id;
-      PERFORM sys_dns_publish_update(
+      PERFORM sys_dns_publish_zones_update(
         'removed ' || OLD.rrtype || ' from resource ' || resource.name ||
-        ' on zone ' || domain.name);
+        ' on zone ' || domain.name,
+        ARRAY[domain.id], ARRAY[]::integer[]);
       RETURN OLD;
     END;
     $$ LANGUAGE plpgsql;
@@ -1755,6 +1982,12 @@ def register_system_triggers():
         "maasserver_dnspublication",
         "sys_dns_publish", "insert")
     register_procedure(DNS_PUBLISH_UPDATE)
+    register_procedure(DNS_PUBLISH_ZONES_UPDATE)
+    register_procedure(DNS_GET_SUBNETS_FOR_IPS)
+    register_procedure(DNS_GET_SUBNETS_FOR_NODE)
+    register_procedure(DNS_GET_SUBNETS_FOR_DNSRESOURCE)
+    register_procedure(DNS_DYNAMIC_UPDATES_ENABLED)
+    register_procedure(DNS_DYNAMIC_UPDATE)
 
     # - Domain
     register_procedure(DNS_DOMAIN_INSERT)
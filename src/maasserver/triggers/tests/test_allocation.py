@@ -0,0 +1,155 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.triggers.allocation`."""
+
+__all__ = []
+
+from contextlib import closing
+
+from django.db import connection
+from maasserver.enum import INTERFACE_TYPE
+from maasserver.models import AllocationIndex
+from maasserver.testing.factory import factory
+from maasserver.testing.testcase import MAASServerTestCase
+from maasserver.triggers.allocation import register_allocation_triggers
+from testtools.matchers import (
+    AfterPreprocessing,
+    Equals,
+    Is,
+    MatchesStructure,
+)
+
+
+class TestAllocationTriggers(MAASServerTestCase):
+
+    def get_entry(self, node):
+        return AllocationIndex.objects.get(node_id=node.id)
+
+    def test_indexes_root_device(self):
+        node = factory.make_Node(with_boot_disk=False)
+        device = factory.make_PhysicalBlockDevice(node=node)
+        factory.make_Filesystem(block_device=device, mount_point='/')
+        self.assertThat(self.get_entry(node), MatchesStructure(
+            root_size=Equals(device.size),
+            root_tags=AfterPreprocessing(sorted, Equals(sorted(device.tags))),
+            unused_sizes=Equals([])))
+
+    def test_indexes_root_device_of_partition(self):
+        node = factory.make_Node(with_boot_disk=False)
+        device = factory.make_PhysicalBlockDevice(node=node)
+        partition = factory.make_Partition(
+            partition_table=factory.make_PartitionTable(block_device=device))
+        factory.make_Filesystem(partition=partition, mount_point='/')
+        self.assertThat(self.get_entry(node), MatchesStructure(
+            root_size=Equals(device.size),
+            root_tags=AfterPreprocessing(sorted, Equals(sorted(device.tags)))))
+
+    def test_does_not_index_acquired_root_device(self):
+        node = factory.make_Node(with_boot_disk=False)
+        device = factory.make_PhysicalBlockDevice(node=node)
+        filesystem = factory.make_Filesystem(
+            block_device=device, mount_point='/')
+        filesystem.acquired = True
+        filesystem.save()
+        self.assertThat(self.get_entry(node).root_size, Is(None))
+
+    def test_indexes_unused_devices_largest_first(self):
+        node = factory.make_Node(with_boot_disk=False)
+        devices = [
+            factory.make_PhysicalBlockDevice(node=node)
+            for _ in range(3)
+        ]
+        self.assertThat(self.get_entry(node), MatchesStructure(
+            root_size=Is(None),
+            unused_sizes=Equals(sorted(
+                (device.size for device in devices), reverse=True)),
+            unused_tags=AfterPreprocessing(sorted, Equals(sorted(
+                tag for device in devices for tag in device.tags)))))
+
+    def test_does_not_index_used_devices_as_unused(self):
+        node = factory.make_Node(with_boot_disk=False)
+        factory.make_PartitionTable(
+            block_device=factory.make_PhysicalBlockDevice(node=node))
+        factory.make_Filesystem(
+            block_device=factory.make_PhysicalBlockDevice(node=node))
+        self.assertThat(self.get_entry(node).unused_sizes, Equals([]))
+
+    def test_updates_device_size(self):
+        node = factory.make_Node(with_boot_disk=False)
+        device = factory.make_PhysicalBlockDevice(node=node)
+        device.size += 1024 ** 3
+        device.save()
+        self.assertThat(
+            self.get_entry(node).unused_sizes, Equals([device.size]))
+
+    def test_updates_when_device_is_deleted(self):
+        node = factory.make_Node(with_boot_disk=False)
+        device = factory.make_PhysicalBlockDevice(node=node)
+        factory.make_Filesystem(block_device=device, mount_point='/')
+        device.delete()
+        self.assertThat(self.get_entry(node).root_size, Is(None))
+
+    def test_indexes_interfaces(self):
+        node = factory.make_Node(with_boot_disk=False)
+        fabric = factory.make_Fabric(class_type=factory.make_name("class"))
+        vlan = factory.make_VLAN(fabric=fabric, space=factory.make_Space())
+        factory.make_Interface(INTERFACE_TYPE.PHYSICAL, node=node, vlan=vlan)
+        self.assertThat(self.get_entry(node), MatchesStructure(
+            fabric_ids=Equals([fabric.id]),
+            fabric_classes=Equals([fabric.class_type]),
+            space_ids=Equals([vlan.space_id]),
+            vlan_ids=Equals([vlan.id])))
+
+    def test_indexes_subnets_of_linked_addresses(self):
+        node = factory.make_Node(with_boot_disk=False)
+        interface = factory.make_Interface(
+            INTERFACE_TYPE.PHYSICAL, node=node)
+        subnet = factory.make_Subnet(vlan=interface.vlan)
+        address = factory.make_StaticIPAddress(
+            interface=interface, subnet=subnet)
+        self.assertThat(self.get_entry(node).subnet_ids, Equals([subnet.id]))
+        interface.ip_addresses.remove(address)
+        self.assertThat(self.get_entry(node).subnet_ids, Equals([]))
+
+    def test_updates_when_vlan_changes_space(self):
+        node = factory.make_Node(with_boot_disk=False)
+        vlan = factory.make_VLAN(space=factory.make_Space())
+        factory.make_Interface(INTERFACE_TYPE.PHYSICAL, node=node, vlan=vlan)
+        vlan.space = factory.make_Space()
+        vlan.save()
+        self.assertThat(
+            self.get_entry(node).space_ids, Equals([vlan.space_id]))
+
+    def test_updates_when_fabric_changes_class(self):
+        node = factory.make_Node(with_boot_disk=False)
+        fabric = factory.make_Fabric()
+        factory.make_Interface(
+            INTERFACE_TYPE.PHYSICAL, node=node, fabric=fabric)
+        fabric.class_type = factory.make_name("class")
+        fabric.save()
+        self.assertThat(
+            self.get_entry(node).fabric_classes, Equals([fabric.class_type]))
+
+    def test_removes_entry_of_deleted_node(self):
+        node = factory.make_Node(interface=True)
+        node_id = node.id
+        node.delete()
+        self.assertFalse(
+            AllocationIndex.objects.filter(node_id=node_id).exists())
+
+    def test_register_rebuilds_index(self):
+        node = factory.make_Node(with_boot_disk=False)
+        device = factory.make_PhysicalBlockDevice(node=node)
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("DELETE FROM maasserver_allocationindex")
+            cursor.execute(
+                "INSERT INTO maasserver_allocationindex ("
+                "  node_id, root_tags, unused_sizes, unused_tags, fabric_ids,"
+                "  fabric_classes, space_ids, vlan_ids, subnet_ids) "
+                "VALUES (-1, '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}')")
+        register_allocation_triggers()
+        self.assertThat(
+            self.get_entry(node).unused_sizes, Equals([device.size]))
+        self.assertFalse(
+            AllocationIndex.objects.filter(node_id=-1).exists())
@@ -13,6 +13,7 @@ from maasserver.triggers import (
     register_procedure,
     register_trigger,
 )
+from maasserver.triggers.allocation import register_allocation_triggers
 from maasserver.triggers.system import register_system_triggers
 from maasserver.triggers.websocket import (
     register_websocket_triggers,
@@ -266,7 +267,30 @@ class TestTriggersUsed(MAASServerTestCase):
         "zone_zone_update_notify",
     }
 
-    triggers_all = triggers_system | triggers_websocket
+    triggers_allocation = {
+        "blockdevice_allocation_blockdevice_delete",
+        "blockdevice_allocation_blockdevice_insert",
+        "blockdevice_allocation_blockdevice_update",
+        "fabric_allocation_fabric_update",
+        "filesystem_allocation_filesystem_delete",
+        "filesystem_allocation_filesystem_insert",
+        "filesystem_allocation_filesystem_update",
+        "interface_allocation_interface_delete",
+        "interface_allocation_interface_insert",
+        "interface_allocation_interface_update",
+        "interface_ip_addresses_allocation_nic_ip_delete",
+        "interface_ip_addresses_allocation_nic_ip_insert",
+        "node_allocation_node_delete",
+        "partition_allocation_partition_update",
+        "partitiontable_allocation_partitiontable_delete",
+        "partitiontable_allocation_partitiontable_insert",
+        "partitiontable_allocation_partitiontable_update",
+        "staticipaddress_allocation_staticipaddress_update",
+        "vlan_allocation_vlan_update",
+    }
+
+    triggers_all = (
+        triggers_system | triggers_websocket | triggers_allocation)
 
     def find_triggers_in_database(self):
         with connection.cursor() as cursor:
@@ -298,3 +322,7 @@ class TestTriggersUsed(MAASServerTestCase):
     def test_register_websocket_triggers_does_not_introduce_more(self):
         register_websocket_triggers()
         self.check_triggers_in_database()
+
+    def test_register_allocation_triggers_does_not_introduce_more(self):
+        register_allocation_triggers()
+        self.check_triggers_in_database()
@@ -43,7 +43,10 @@ from maasserver.utils.threads import deferToDatabase
 from netaddr import IPAddress
 from provisioningserver.utils.twisted import DeferredValue
 from testtools import ExpectedException
-from testtools.matchers import Equals
+from testtools.matchers import (
+    ContainsDict,
+    Equals,
+)
 from twisted.internet.defer import (
     CancelledError,
     DeferredList,
@@ -1738,8 +1741,15 @@ class TestDHCPStaticIPAddressListener(
                 "alloc_type": IPADDRESS_TYPE.USER_RESERVED,
                 "user": user,
             })
-            yield primary_dv.get(timeout=2)
-            yield secondary_dv.get(timeout=2)
+            primary_message = yield primary_dv.get(timeout=2)
+            secondary_message = yield secondary_dv.get(timeout=2)
+            # The VLAN that changed is passed along.
+            self.assertEqual(
+                ("sys_dhcp_%s" % primary_rack.id, "%s" % vlan.id),
+                primary_message)
+            self.assertEqual(
+                ("sys_dhcp_%s" % secondary_rack.id, "%s" % vlan.id),
+                secondary_message)
         finally:
             yield listener.stopService()
 
@@ -3532,6 +3542,69 @@ class TestDNSDNSResourceStaticIPAddressListener(
             Equals("ip %s unlinked from resource %s on zone %s" % (
                 sip.ip, resource.name, domain.name)))
 
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_dynamic_update_for_discovered_ip_link(self):
+        yield deferToDatabase(register_system_triggers)
+        yield deferToDatabase(
+            Config.objects.set_config, "dns_dynamic_updates", True)
+        domain = yield deferToDatabase(self.create_domain)
+        resource = yield deferToDatabase(
+            self.create_dnsresource, {
+                'domain': domain, 'no_ip_addresses': True})
+        sip = yield deferToDatabase(
+            self.create_staticipaddress, {
+                'alloc_type': IPADDRESS_TYPE.DISCOVERED})
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_dns_updates", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(resource.ip_addresses.add, sip)
+            channel, message = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        update = json.loads(message)
+        self.assertThat(update, ContainsDict({
+            "operation": Equals("INSERT"),
+            "zone": Equals(domain.name),
+            "name": Equals(resource.name),
+            "address": Equals(str(sip.ip)),
+        }))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_sends_dynamic_update_for_discovered_ip_unlink(self):
+        yield deferToDatabase(register_system_triggers)
+        yield deferToDatabase(
+            Config.objects.set_config, "dns_dynamic_updates", True)
+        domain = yield deferToDatabase(self.create_domain)
+        resource = yield deferToDatabase(
+            self.create_dnsresource, {
+                'domain': domain, 'no_ip_addresses': True})
+        sip = yield deferToDatabase(
+            self.create_staticipaddress, {
+                'alloc_type': IPADDRESS_TYPE.DISCOVERED})
+        yield deferToDatabase(resource.ip_addresses.add, sip)
+        dv = DeferredValue()
+        listener = self.make_listener_without_delay()
+        listener.register(
+            "sys_dns_updates", lambda *args: dv.set(args))
+        yield listener.startService()
+        try:
+            yield deferToDatabase(resource.ip_addresses.remove, sip)
+            channel, message = yield dv.get(timeout=2)
+        finally:
+            yield listener.stopService()
+        update = json.loads(message)
+        self.assertThat(update, ContainsDict({
+            "operation": Equals("DELETE"),
+            "zone": Equals(domain.name),
+            "name": Equals(resource.name),
+            "address": Equals(str(sip.ip)),
+        }))
+
 
 class TestDNSDNSDataListener(
         MAASTransactionServerTestCase, TransactionalHelpersMixin,
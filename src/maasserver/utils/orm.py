@@ -12,6 +12,7 @@ __all__ = [
     'get_exception_class',
     'get_first',
     'get_one',
+    'has_snapshot',
     'in_transaction',
     'is_deadlock_failure',
     'is_retryable_failure',
@@ -802,6 +803,25 @@ def in_transaction(_connection=None):
         return _connection.in_atomic_block
 
 
+def has_snapshot(_connection=None):
+    """Has `_connection` begun a transaction in the database?
+
+    psycopg2 begins a transaction only when the first statement is executed,
+    and that is when PostgreSQL takes the snapshot of a REPEATABLE READ
+    transaction. Until then, what the transaction reads will include every
+    change committed before the read.
+
+    :return: bool
+    """
+    if _connection is None:
+        _connection = connection
+    if _connection.connection is None:
+        return False
+    else:
+        status = _connection.connection.get_transaction_status()
+        return status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
 def validate_in_transaction(connection):
     """Ensure that `connection` is within a transaction.
 
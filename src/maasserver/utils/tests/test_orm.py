@@ -54,6 +54,7 @@ from maasserver.utils.orm import (
     get_psycopg2_foreign_key_violation_exception,
     get_psycopg2_serialization_exception,
     get_psycopg2_unique_violation_exception,
+    has_snapshot,
     in_transaction,
     is_deadlock_failure,
     is_foreign_key_violation,
@@ -1309,6 +1310,25 @@ class TestInTransaction(MAASTransactionServerTestCase):
         self.assertFalse(in_transaction())
 
 
+class TestHasSnapshot(MAASTransactionServerTestCase):
+    """Tests for `has_snapshot`."""
+
+    def test__false_before_first_statement_in_transaction(self):
+        with transaction.atomic():
+            self.assertFalse(has_snapshot())
+
+    def test__true_after_first_statement_in_transaction(self):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            self.assertTrue(has_snapshot())
+
+    def test__false_when_no_transaction_is_active(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertFalse(has_snapshot())
+
+
 class TestValidateInTransaction(MAASTransactionServerTestCase):
     """Tests for `validate_in_transaction`."""
 
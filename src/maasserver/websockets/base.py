@@ -22,6 +22,10 @@ from maasserver.enum import NODE_PERMISSION
 from maasserver.utils.forms import get_QueryDict
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
+from maasserver.websockets.statistics import (
+    Measurement,
+    record_queries,
+)
 from provisioningserver.utils.twisted import (
     asynchronous,
     IAsynchronous,
@@ -39,6 +43,14 @@ def dehydrate_datetime(datetime):
         return datetime.strftime(DATETIME_FORMAT)
 
 
+def wants_fields(fields, *names):
+    """Return True if any of `names` is in the `fields` projection.
+
+    A `fields` projection of None asks for every field.
+    """
+    return fields is None or not fields.isdisjoint(names)
+
+
 class HandlerError(Exception):
     """Generic exception a handler can raise."""
 
@@ -92,7 +104,9 @@ class HandlerOptions(object):
     form = None
     form_requires_request = True
     listen_channels = []
+    listen_batch = False
     batch_key = 'id'
+    dehydrate_per_user = True
 
     def __new__(cls, meta=None):
         overrides = {}
@@ -157,6 +171,11 @@ class Handler(metaclass=HandlerMetaclass):
 
     """
 
+    # Objects dehydrated for a notification, shared between the handlers of
+    # all the connections notified of the same change. Set by the protocol
+    # while it processes a notification.
+    notify_cache = None
+
     def __init__(self, user, cache):
         self.user = user
         self.cache = cache
@@ -166,11 +185,13 @@ class Handler(metaclass=HandlerMetaclass):
         if "loaded_pks" not in self.cache:
             self.cache["loaded_pks"] = set()
 
-    def full_dehydrate(self, obj, for_list=False):
+    def full_dehydrate(self, obj, for_list=False, fields=None):
         """Convert the given object into a dictionary.
 
         :param for_list: True when the object is being converted to belong
             in a list.
+        :param fields: Set of the field names to include, or None to include
+            all of them.
         """
         if for_list:
             allowed_fields = self._meta.list_fields
@@ -189,6 +210,8 @@ class Handler(metaclass=HandlerMetaclass):
                 continue
             if exclude_fields is not None and field_name in exclude_fields:
                 continue
+            if fields is not None and field_name not in fields:
+                continue
 
             # Get the value from the field and set it in data. The value
             # will pass through the dehydrate method if present.
@@ -206,16 +229,26 @@ class Handler(metaclass=HandlerMetaclass):
                 else:
                     data[field_name] = field.value_to_string(obj)
 
-        # Return the data after the final dehydrate.
-        return self.dehydrate(obj, data, for_list=for_list)
+        # Return the data after the final dehydrate, keeping only the
+        # requested fields.
+        data = self.dehydrate(obj, data, for_list=for_list, fields=fields)
+        if fields is not None:
+            data = {
+                key: value
+                for key, value in data.items()
+                if key in fields
+            }
+        return data
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add any extra info to the `data` before finalizing the final object.
 
         :param obj: object being dehydrated.
         :param data: dictionary to place extra info.
         :param for_list: True when the object is being converted to belong
             in a list.
+        :param fields: Set of the field names requested, or None when all of
+            them are. Extra info that is not requested can be skipped.
         """
         return data
 
@@ -299,6 +332,13 @@ class Handler(metaclass=HandlerMetaclass):
         else:
             return self._meta.queryset
 
+    def project_queryset(self, queryset, fields):
+        """Return `queryset` loading only what the `fields` projection needs.
+
+        Override to skip related objects that are not needed.
+        """
+        return queryset
+
     def get_form_class(self, action):
         """Return the form class used for `action`.
 
@@ -336,11 +376,23 @@ class Handler(metaclass=HandlerMetaclass):
                     # This is going to block and hold a database connection so
                     # we limit its concurrency.
                     return concurrency.webapp.run(
-                        deferToDatabase, transactional(method), params)
+                        deferToDatabase, self._execute_measured, method_name,
+                        transactional(method), params)
         else:
             raise HandlerNoSuchMethodError(method_name)
 
-    def _cache_pks(self, objs):
+    def _execute_measured(self, method_name, method, params):
+        """Call `method` with `params`, recording the database queries it
+        makes in the websocket statistics."""
+        measurement = Measurement()
+        try:
+            with measurement:
+                return method(params)
+        finally:
+            record_queries(
+                self._meta.handler_name, method_name, measurement.queries)
+
+    def _cache_pks(self, objs, fields=None):
         """Cache all loaded object pks."""
         getpk = attrgetter(self._meta.pk)
         self.cache["loaded_pks"].update(getpk(obj) for obj in objs)
@@ -353,8 +405,20 @@ class Handler(metaclass=HandlerMetaclass):
             also understands this distinction.
         :param offset: Offset into the queryset to return.
         :param limit: Maximum number of objects to return.
+        :param fields: List of the field names to return for each object. The
+            `pk` is always returned. All fields are returned when omitted.
         """
+        fields = params.get("fields")
+        if fields is not None:
+            if (not isinstance(fields, list) or
+                    not all(isinstance(field, str) for field in fields)):
+                raise HandlerValidationError({
+                    "fields": ["Must be a list of field names."]
+                })
+            fields = set(fields)
+            fields.add(self._meta.pk)
         queryset = self.get_queryset(for_list=True)
+        queryset = self.project_queryset(queryset, fields)
         queryset = queryset.order_by(self._meta.batch_key)
         if "start" in params:
             queryset = queryset.filter(**{
@@ -363,9 +427,9 @@ class Handler(metaclass=HandlerMetaclass):
         if "limit" in params:
             queryset = queryset[:params["limit"]]
         objs = list(queryset)
-        self._cache_pks(objs)
+        self._cache_pks(objs, fields=fields)
         return [
-            self.full_dehydrate(obj, for_list=True)
+            self.full_dehydrate(obj, for_list=True, fields=fields)
             for obj in objs
             ]
 
@@ -470,6 +534,32 @@ class Handler(metaclass=HandlerMetaclass):
             obj = self.listen(channel, action, pk)
         except HandlerDoesNotExistError:
             obj = None
+        return self.on_listen_for_object(action, pk, obj)
+
+    def on_listen_many(self, channel, action, pks):
+        """Called by the protocol with the pks of a batch of notifications.
+
+        Only used when `Meta.listen_batch` is True. Do not override this
+        method instead override `listen_many`.
+
+        :return: List of the messages for the client.
+        """
+        pks = sorted(self._meta.pk_type(pk) for pk in pks)
+        if action == "delete":
+            results = [self.on_listen(channel, action, pk) for pk in pks]
+        else:
+            objs = self.listen_many(channel, action, pks)
+            results = [
+                self.on_listen_for_object(action, pk, objs.get(pk))
+                for pk in pks
+            ]
+        return [result for result in results if result is not None]
+
+    def on_listen_for_object(self, action, pk, obj):
+        """Return the message for the client about `obj` for `action`.
+
+        :param obj: The object, or None when the user cannot view it.
+        """
         if action == "create" and obj is not None:
             if pk in self.cache['loaded_pks']:
                 # The user already knows about this node, so its not a create
@@ -510,7 +600,7 @@ class Handler(metaclass=HandlerMetaclass):
             return (
                 self._meta.handler_name,
                 action,
-                self.full_dehydrate(obj, for_list=False),
+                self.full_dehydrate_for_notify(pk, obj, for_list=False),
                 )
         else:
             # Not active so only send the data like it was comming from
@@ -518,9 +608,39 @@ class Handler(metaclass=HandlerMetaclass):
             return (
                 self._meta.handler_name,
                 action,
-                self.full_dehydrate(obj, for_list=True),
+                self.full_dehydrate_for_notify(pk, obj, for_list=True),
                 )
 
+    def get_dehydrate_view(self):
+        """Return a key for how objects are dehydrated for this user.
+
+        Handlers with the same key dehydrate an object in the same way, so
+        can share the result. Unless `Meta.dehydrate_per_user` is False,
+        every user has their own view.
+        """
+        if self._meta.dehydrate_per_user:
+            return self.user.id
+        else:
+            return None
+
+    def full_dehydrate_for_notify(self, pk, obj, for_list=False):
+        """Convert `obj` into a dictionary to send in a notification.
+
+        The result is shared, through `notify_cache`, with the other
+        connections notified of the same change that have the same view of
+        the object. It must not be modified.
+        """
+        if self.notify_cache is None:
+            return self.full_dehydrate(obj, for_list=for_list)
+        key = (
+            self._meta.handler_name, pk, for_list, self.get_dehydrate_view())
+        try:
+            return self.notify_cache[key]
+        except KeyError:
+            data = self.notify_cache[key] = self.full_dehydrate(
+                obj, for_list=for_list)
+            return data
+
     def listen(self, channel, action, pk):
         """Called when the handler listens for events on channels with
         `Meta.listen_channels`.
@@ -533,6 +653,25 @@ class Handler(metaclass=HandlerMetaclass):
             self._meta.pk: pk
             })
 
+    def listen_many(self, channel, action, pks):
+        """Called when the handler listens for a batch of events on channels
+        with `Meta.listen_channels`, when `Meta.listen_batch` is True.
+
+        Override to load the objects together.
+
+        :param channel: Channel events occured on.
+        :param action: Action that caused these events.
+        :param pks: Ids of the objects.
+        :return: Dict of the objects the user can view, by id.
+        """
+        objs = {}
+        for pk in pks:
+            try:
+                objs[pk] = self.listen(channel, action, pk)
+            except HandlerDoesNotExistError:
+                pass
+        return objs
+
 
 class AdminOnlyMixin(Handler):
 
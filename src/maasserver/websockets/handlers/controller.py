@@ -103,9 +103,10 @@ class ControllerHandler(MachineHandler):
         return Controller.controllers.get_nodes(
             self.user, NODE_PERMISSION.VIEW, from_nodes=qs)
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         obj = obj.as_self()
-        data = super().dehydrate(obj, data, for_list=for_list)
+        data = super().dehydrate(
+            obj, data, for_list=for_list, fields=fields)
         data["version"] = obj.version
         if obj.version is not None and len(obj.version) > 0:
             version = get_version_tuple(obj.version)
@@ -32,7 +32,6 @@ from maasserver.models.subnet import Subnet
 from maasserver.node_action import compile_node_actions
 from maasserver.utils.orm import reload_object
 from maasserver.websockets.base import (
-    HandlerDoesNotExistError,
     HandlerError,
     HandlerPermissionError,
     HandlerValidationError,
@@ -145,8 +144,9 @@ class DeviceHandler(NodeHandler):
         listen_channels = [
             "device",
             ]
+        listen_batch = True
 
-    def _cache_pks(self, objs):
+    def _cache_pks(self, objs, fields=None):
         """Cache all loaded object pks."""
         # Copy from base.py as devices don't have ScriptResults
         getpk = attrgetter(self._meta.pk)
@@ -164,9 +164,10 @@ class DeviceHandler(NodeHandler):
         else:
             return parent.system_id
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
-        data = super().dehydrate(obj, data, for_list=for_list)
+        data = super().dehydrate(
+            obj, data, for_list=for_list, fields=fields)
 
         # We handle interfaces ourselves, because of ip_assignment.
         boot_interface = obj.get_boot_interface()
@@ -248,12 +249,10 @@ class DeviceHandler(NodeHandler):
         # Currently has no assigned IP address.
         return None
 
-    def get_object(self, params):
-        """Get object by using the `pk` in `params`."""
-        obj = super(DeviceHandler, self).get_object(params)
-        if reload_object(self.user).is_superuser or obj.owner == self.user:
-            return obj
-        raise HandlerDoesNotExistError(params[self._meta.pk])
+    def can_view_node(self, obj):
+        """Return True if the user owns the device `obj`, or is an admin."""
+        return super().can_view_node(obj) and (
+            obj.owner == self.user or reload_object(self.user).is_superuser)
 
     def get_form_class(self, action):
         """Return the form class used for `action`."""
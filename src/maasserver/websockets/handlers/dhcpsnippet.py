@@ -53,7 +53,7 @@ class DHCPSnippetHandler(TimestampedModelHandler):
         """Return the real value instead of the object relation."""
         return value.data
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add DHCPSnippet value history to `data`."""
         data['history'] = [
             {
@@ -45,7 +45,7 @@ class DiscoveryHandler(ViewModelHandler):
             params["start"] = datetime.fromtimestamp(float(params['start']))
         return super(DiscoveryHandler, self).list(params)
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
         data["mac_organization"] = obj.mac_organization
         return data
@@ -54,8 +54,9 @@ class DomainHandler(TimestampedModelHandler, AdminOnlyMixin):
         listen_channels = [
             "domain",
         ]
+        dehydrate_per_user = False
 
-    def dehydrate(self, domain, data, for_list=False):
+    def dehydrate(self, domain, data, for_list=False, fields=None):
         rrsets = domain.render_json_for_related_rrdata(for_list=for_list)
         if not for_list:
             data["rrsets"] = rrsets
@@ -50,7 +50,7 @@ class EventHandler(TimestampedModelHandler):
             "description": event_type.description,
         }
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
         data['node_id'] = obj.node_id
         return data
@@ -35,8 +35,9 @@ class FabricHandler(TimestampedModelHandler):
         listen_channels = [
             "fabric",
             ]
+        dehydrate_per_user = False
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         data["name"] = obj.get_name()
         # The default VLAN always has the lowest ID. We sort to place the
         # lowest ID first.
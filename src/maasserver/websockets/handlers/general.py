@@ -1,4 +1,4 @@
-# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """The general handler for the WebSocket connection."""
@@ -33,7 +33,11 @@ from maasserver.utils.osystems import (
     list_osystem_choices,
     list_release_choices,
 )
-from maasserver.websockets.base import Handler
+from maasserver.websockets.base import (
+    Handler,
+    HandlerPermissionError,
+)
+from maasserver.websockets.statistics import get_websocket_statistics
 import petname
 from provisioningserver.utils.version import get_maas_version_ui
 
@@ -61,6 +65,7 @@ class GeneralHandler(Handler):
             'version',
             'power_types',
             'release_options',
+            'stats',
             ]
 
     def architectures(self, params):
@@ -196,3 +201,10 @@ class GeneralHandler(Handler):
             "quick_erase": Config.objects.get_config(
                 "disk_erase_with_quick_erase"),
         }
+
+    def stats(self, params):
+        """Return the latency, query and response size statistics of the
+        websocket handlers. Only administrators may see them."""
+        if not reload_object(self.user).is_superuser:
+            raise HandlerPermissionError()
+        return get_websocket_statistics()
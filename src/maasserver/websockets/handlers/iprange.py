@@ -34,8 +34,9 @@ class IPRangeHandler(TimestampedModelHandler):
         listen_channels = [
             "iprange",
         ]
+        dehydrate_per_user = False
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
         data['vlan'] = None if obj.subnet is None else obj.subnet.vlan_id
         data['user'] = '' if obj.user is None else obj.user.username
@@ -73,6 +73,7 @@ from maasserver.websockets.base import (
     HandlerError,
     HandlerPermissionError,
     HandlerValidationError,
+    wants_fields,
 )
 from maasserver.websockets.handlers.node import (
     node_prefetch,
@@ -188,6 +189,19 @@ class MachineHandler(NodeHandler):
         listen_channels = [
             "machine",
         ]
+        listen_batch = True
+
+    script_result_fields = NodeHandler.script_result_fields + (
+        "cpu_test_status",
+        "cpu_test_status_tooltip",
+        "memory_test_status",
+        "memory_test_status_tooltip",
+        "storage_test_status",
+        "storage_test_status_tooltip",
+        "other_test_status",
+        "other_test_status_tooltip",
+        "status_tooltip",
+    )
 
     def get_queryset(self, for_list=False):
         """Return `QuerySet` for devices only viewable by `user`."""
@@ -195,12 +209,13 @@ class MachineHandler(NodeHandler):
             self.user, NODE_PERMISSION.VIEW,
             from_nodes=super().get_queryset(for_list=for_list))
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
         data = super(MachineHandler, self).dehydrate(
-            obj, data, for_list=for_list)
+            obj, data, for_list=for_list, fields=fields)
 
-        if obj.is_machine or not for_list:
+        if (obj.is_machine or not for_list) and wants_fields(
+                fields, "pxe_mac", "pxe_mac_vendor"):
             boot_interface = obj.get_boot_interface()
             if boot_interface is not None:
                 data["pxe_mac"] = "%s" % boot_interface.mac_address
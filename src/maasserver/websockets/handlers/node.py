@@ -41,6 +41,7 @@ from maasserver.websockets.base import (
     dehydrate_datetime,
     HandlerDoesNotExistError,
     HandlerError,
+    wants_fields,
 )
 from maasserver.websockets.handlers.event import dehydrate_event_type_level
 from maasserver.websockets.handlers.timestampedmodel import (
@@ -93,9 +94,25 @@ class NodeHandler(TimestampedModelHandler):
         pk = 'system_id'
         pk_type = str
 
+    # Fields that list() only computes, and only prefetches the block
+    # devices, interfaces, tags, or script results for, when requested.
+    storage_fields = ("physical_disk_count", "storage", "storage_tags")
+    network_fields = ("subnets", "fabrics", "spaces", "extra_macs")
+    script_result_fields = (
+        "commissioning_script_count",
+        "commissioning_status",
+        "commissioning_status_tooltip",
+        "testing_script_count",
+        "testing_status",
+        "testing_status_tooltip",
+        "has_logs",
+    )
+
     def __init__(self, user, cache):
         super().__init__(user, cache)
         self._script_results = {}
+        # Ids of the nodes whose script results listen_many() has cached.
+        self._script_results_loaded = set()
 
     def dehydrate_owner(self, user):
         """Return owners username."""
@@ -180,10 +197,15 @@ class NodeHandler(TimestampedModelHandler):
 
         return tooltip
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
+        if not for_list:
+            # Only list() skips the fields that are not requested.
+            fields = None
         data["fqdn"] = obj.fqdn
-        data["actions"] = list(compile_node_actions(obj, self.user).keys())
+        if wants_fields(fields, "actions"):
+            data["actions"] = list(
+                compile_node_actions(obj, self.user).keys())
         data["node_type_display"] = obj.get_node_type_display()
         data["link_type"] = NODE_TYPE_TO_LINK_TYPE[obj.node_type]
 
@@ -191,7 +213,10 @@ class NodeHandler(TimestampedModelHandler):
                 obj.is_controller and not for_list):
             # Disk count and storage amount is shown on the machine listing
             # page and the machine and controllers details page.
-            blockdevices = self.get_blockdevices_for(obj)
+            if wants_fields(fields, *self.storage_fields):
+                blockdevices = self.get_blockdevices_for(obj)
+            else:
+                blockdevices = []
             physical_blockdevices = [
                 blockdevice for blockdevice in blockdevices
                 if isinstance(blockdevice, PhysicalBlockDevice)
@@ -258,18 +283,20 @@ class NodeHandler(TimestampedModelHandler):
         # Filters are only available on machines and devices.
         if not obj.is_controller:
             # For filters
-            subnets = self.get_all_subnets(obj)
-            data["subnets"] = [subnet.cidr for subnet in subnets]
-            data["fabrics"] = self.get_all_fabric_names(obj, subnets)
-            data["spaces"] = self.get_all_space_names(subnets)
-            data["tags"] = [
-                tag.name
-                for tag in obj.tags.all()
-            ]
-            data["extra_macs"] = [
-                "%s" % mac_address
-                for mac_address in obj.get_extra_macs()
-            ]
+            if wants_fields(fields, *self.network_fields):
+                subnets = self.get_all_subnets(obj)
+                data["subnets"] = [subnet.cidr for subnet in subnets]
+                data["fabrics"] = self.get_all_fabric_names(obj, subnets)
+                data["spaces"] = self.get_all_space_names(subnets)
+                data["extra_macs"] = [
+                    "%s" % mac_address
+                    for mac_address in obj.get_extra_macs()
+                ]
+            if wants_fields(fields, "tags"):
+                data["tags"] = [
+                    tag.name
+                    for tag in obj.tags.all()
+                ]
 
         if not for_list:
             data["on_network"] = obj.on_network()
@@ -398,14 +425,55 @@ class NodeHandler(TimestampedModelHandler):
                 self._script_results[node_id][hardware_type].append(
                     script_result)
 
-    def _cache_pks(self, nodes):
-        super()._cache_pks(nodes)
-        self._cache_script_results(nodes)
+    def _cache_pks(self, nodes, fields=None):
+        super()._cache_pks(nodes, fields=fields)
+        if wants_fields(fields, *self.script_result_fields):
+            self._cache_script_results(nodes)
+
+    def project_queryset(self, queryset, fields):
+        """Don't prefetch what only the fields not requested need."""
+        queryset = super().project_queryset(queryset, fields)
+        if fields is None:
+            return queryset
+        unwanted = tuple(
+            lookup
+            for lookup, names in (
+                ("blockdevice_set", self.storage_fields),
+                ("interface_set", self.network_fields),
+                ("tags", ("tags",)),
+            )
+            if not wants_fields(fields, *names)
+        )
+        lookups = [
+            lookup
+            for lookup in queryset._prefetch_related_lookups
+            if not (isinstance(lookup, str) and lookup.startswith(unwanted))
+        ]
+        return queryset.prefetch_related(None).prefetch_related(*lookups)
 
     def on_listen_for_active_pk(self, action, pk, obj):
-        self._cache_script_results([obj])
+        if obj.id in self._script_results_loaded:
+            self._script_results_loaded.discard(obj.id)
+        else:
+            self._cache_script_results([obj])
         return super().on_listen_for_active_pk(action, pk, obj)
 
+    def on_listen_many(self, channel, action, pks):
+        try:
+            return super().on_listen_many(channel, action, pks)
+        finally:
+            self._script_results_loaded.clear()
+
+    def listen_many(self, channel, action, pks):
+        """Load the nodes with `pks`, and their script results, together."""
+        nodes = self.get_queryset(for_list=False).filter(**{
+            "%s__in" % self._meta.pk: pks,
+            })
+        nodes = [node.as_self() for node in nodes if self.can_view_node(node)]
+        self._cache_script_results(nodes)
+        self._script_results_loaded.update(node.id for node in nodes)
+        return {getattr(node, self._meta.pk): node for node in nodes}
+
     def dehydrate_blockdevice(self, blockdevice, obj):
         """Return `BlockDevice` formatted for JSON encoding."""
         # model and serial are currently only avalible on physical block
@@ -690,15 +758,17 @@ class NodeHandler(TimestampedModelHandler):
     def get_object(self, params):
         """Get object by using the `pk` in `params`."""
         obj = super(NodeHandler, self).get_object(params)
+        if self.can_view_node(obj):
+            return obj.as_self()
+        raise HandlerDoesNotExistError(params[self._meta.pk])
 
-        can_access_node = (
+    def can_view_node(self, obj):
+        """Return True if the user can view the node `obj`."""
+        return (
             self.user.is_superuser or obj.owner == self.user or
             (obj.owner is None and obj.pool is not None and
              ResourcePool.objects.user_can_access_pool(
                  self.user, obj.pool)))
-        if can_access_node:
-            return obj.as_self()
-        raise HandlerDoesNotExistError(params[self._meta.pk])
 
     def get_mac_addresses(self, data):
         """Convert the given `data` into a list of mac addresses.
@@ -76,7 +76,7 @@ class NodeResultHandler(TimestampedModelHandler):
     def dehydrate_ended(self, ended):
         return dehydrate_datetime(ended)
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
         data["name"] = obj.name
         data["status_name"] = obj.status_name
@@ -26,7 +26,7 @@ class NotificationHandler(TimestampedModelHandler):
         """Return `Notifications` for the current user."""
         return Notification.objects.find_for_user(self.user)
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         data["message"] = obj.render()
         return data
 
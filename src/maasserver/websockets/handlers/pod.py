@@ -78,7 +78,7 @@ class PodHandler(TimestampedModelHandler):
         }
         return super(PodHandler, self).preprocess_form(action, new_params)
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add extra fields to `data`."""
         if reload_object(self.user).is_superuser:
             data.update(obj.power_parameters)
@@ -35,8 +35,9 @@ class SpaceHandler(TimestampedModelHandler):
         listen_channels = [
             "space",
         ]
+        dehydrate_per_user = False
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         data["name"] = obj.get_name()
         data["vlan_ids"] = list(obj.vlan_set.order_by("id").values_list(
             'id', flat=True))
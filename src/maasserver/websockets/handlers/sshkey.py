@@ -63,7 +63,7 @@ class SSHKeyHandler(TimestampedModelHandler):
                 "auth_id": keysource.auth_id,
             }
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         """Add display to the SSH key."""
         data["display"] = obj.display_html(70)
         return data
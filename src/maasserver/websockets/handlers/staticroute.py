@@ -33,6 +33,7 @@ class StaticRouteHandler(TimestampedModelHandler):
         listen_channels = [
             "staticroute",
         ]
+        dehydrate_per_user = False
 
     def create(self, params):
         """Create a static route."""
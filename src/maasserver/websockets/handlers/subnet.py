@@ -52,13 +52,14 @@ class SubnetHandler(TimestampedModelHandler):
         listen_channels = [
             "subnet",
         ]
+        dehydrate_per_user = False
 
     def dehydrate_dns_servers(self, dns_servers):
         if dns_servers is None:
             return ""
         return " ".join(sorted(dns_servers))
 
-    def dehydrate(self, subnet, data, for_list=False):
+    def dehydrate(self, subnet, data, for_list=False, fields=None):
         full_range = subnet.get_iprange_usage()
         metadata = IPRangeStatistics(full_range)
         data['statistics'] = metadata.render_json(
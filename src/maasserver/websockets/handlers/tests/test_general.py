@@ -1,4 +1,4 @@
-# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `maasserver.websockets.handlers.general`"""
@@ -22,6 +22,7 @@ from maasserver.node_action import ACTIONS_DICT
 from maasserver.testing.factory import factory
 from maasserver.testing.osystems import make_osystem_with_releases
 from maasserver.testing.testcase import MAASServerTestCase
+from maasserver.websockets.base import HandlerPermissionError
 from maasserver.websockets.handlers import general
 from maasserver.websockets.handlers.general import GeneralHandler
 import petname
@@ -253,3 +254,14 @@ class TestGeneralHandler(MAASServerTestCase):
             "secure_erase": secure_erase,
             "quick_erase": quick_erase,
         }, handler.release_options({}))
+
+    def test_stats(self):
+        handler = GeneralHandler(factory.make_admin(), {})
+        self.patch_autospec(
+            general,
+            "get_websocket_statistics").return_value = sentinel.stats
+        self.assertEqual(sentinel.stats, handler.stats({}))
+
+    def test_stats_requires_admin(self):
+        handler = GeneralHandler(factory.make_User(), {})
+        self.assertRaises(HandlerPermissionError, handler.stats, {})
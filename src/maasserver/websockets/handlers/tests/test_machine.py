@@ -565,6 +565,46 @@ class TestMachineHandler(MAASServerTestCase):
         self.assertEquals(ret['commissioning_script_count'], 10)
         self.assertEquals(ret['testing_script_count'], 10)
 
+    def test_listen_many_loads_nodes_and_script_results_together(self):
+        owner = factory.make_User()
+        nodes = [factory.make_Node(owner=owner) for _ in range(10)]
+        for node in nodes:
+            factory.make_ScriptResult(
+                status=SCRIPT_STATUS.PASSED,
+                script_set=factory.make_ScriptSet(node=node))
+        pks = {node.system_id for node in nodes}
+        handler = MachineHandler(owner, {})
+        queries_one, _ = count_queries(
+            handler.listen_many, "machine", "update", [nodes[0].system_id])
+        queries_all, objs = count_queries(
+            handler.listen_many, "machine", "update", pks)
+        self.expectThat(set(objs), Equals(pks))
+        self.expectThat(queries_all, Equals(queries_one))
+        self.expectThat(
+            set(handler._script_results), Equals(
+                {node.id for node in nodes}))
+
+    def test_listen_many_skips_nodes_the_user_cannot_view(self):
+        owner = factory.make_User()
+        node = factory.make_Node(owner=owner)
+        other_node = factory.make_Node(owner=factory.make_User())
+        handler = MachineHandler(owner, {})
+        self.assertItemsEqual(
+            [node.system_id],
+            handler.listen_many(
+                "machine", "update", [node.system_id, other_node.system_id]))
+
+    def test_on_listen_many_does_not_reload_script_results(self):
+        owner = factory.make_User()
+        nodes = [factory.make_Node(owner=owner) for _ in range(3)]
+        handler = MachineHandler(owner, {})
+        mock_cache = self.patch(handler, "_cache_script_results")
+        messages = handler.on_listen_many(
+            "machine", "update", {node.system_id for node in nodes})
+        self.expectThat(messages, HasLength(3))
+        self.expectThat(mock_cache.call_count, Equals(1))
+        self.expectThat(handler._script_results_loaded, Equals(set()))
+
     def test_cache_clears_on_reload(self):
         owner = factory.make_User()
         node = factory.make_Node(owner=owner)
@@ -1677,6 +1717,58 @@ class TestMachineHandler(MAASServerTestCase):
                 script_result.script.hardware_type: [script_result]}},
             handler._script_results)
 
+    def test_list_fields(self):
+        user = factory.make_User()
+        node = factory.make_Node(status=NODE_STATUS.ALLOCATED, owner=user)
+        handler = MachineHandler(user, {})
+        full = self.dehydrate_node(node, handler, for_list=True)
+        self.assertItemsEqual([{
+            "system_id": node.system_id,
+            "hostname": node.hostname,
+            "storage": full["storage"],
+            "tags": full["tags"],
+            }],
+            handler.list({"fields": ["hostname", "storage", "tags"]}))
+
+    def test_list_fields_skips_script_results_not_requested(self):
+        user = factory.make_User()
+        node = factory.make_Node(status=NODE_STATUS.ALLOCATED, owner=user)
+        factory.make_ScriptResult(
+            script_set=factory.make_ScriptSet(node=node),
+            status=SCRIPT_STATUS.PASSED)
+        handler = MachineHandler(user, {})
+        handler.list({"fields": ["hostname"]})
+        self.assertDictEqual({}, handler._script_results)
+
+    def test_list_fields_uses_fewer_queries(self):
+        owner = factory.make_User()
+        for _ in range(10):
+            node = factory.make_Node(owner=owner)
+            factory.make_PhysicalBlockDevice(node)
+            factory.make_ScriptResult(
+                status=SCRIPT_STATUS.PASSED,
+                script_set=factory.make_ScriptSet(node=node))
+        handler = MachineHandler(owner, {})
+        queries_all, _ = count_queries(handler.list, {})
+        queries_fields, _ = count_queries(
+            handler.list, {"fields": ["hostname", "status"]})
+        self.assertLess(queries_fields, queries_all)
+
+    def test_list_fields_issues_constant_number_of_queries(self):
+        owner = factory.make_User()
+        handler = MachineHandler(owner, {})
+        params = {"fields": ["hostname", "status"]}
+
+        for _ in range(5):
+            factory.make_Node_with_Interface_on_Subnet(owner=owner)
+        queries_one, _ = count_queries(handler.list, params)
+
+        for _ in range(5):
+            factory.make_Node_with_Interface_on_Subnet(owner=owner)
+        queries_two, _ = count_queries(handler.list, params)
+
+        self.assertEqual(queries_one, queries_two)
+
     def test_list_ignores_devices(self):
         owner = factory.make_User()
         handler = MachineHandler(owner, {})
@@ -70,7 +70,7 @@ class UserHandler(Handler):
         else:
             raise HandlerDoesNotExistError(params[self._meta.pk])
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         data["sshkeys_count"] = obj.sshkey_set.count()
         return data
 
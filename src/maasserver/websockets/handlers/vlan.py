@@ -55,6 +55,7 @@ class VLANHandler(TimestampedModelHandler):
         listen_channels = [
             "vlan",
         ]
+        dehydrate_per_user = False
 
     def dehydrate_primary_rack(self, rack):
         if rack is None:
@@ -68,7 +69,7 @@ class VLANHandler(TimestampedModelHandler):
         else:
             return rack.system_id
 
-    def dehydrate(self, obj, data, for_list=False):
+    def dehydrate(self, obj, data, for_list=False, fields=None):
         nodes = {
             interface.node
             for interface in obj.interface_set.all()
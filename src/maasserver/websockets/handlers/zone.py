@@ -38,6 +38,7 @@ class ZoneHandler(TimestampedModelHandler):
         listen_channels = [
             "zone",
             ]
+        dehydrate_per_user = False
 
     def delete(self, parameters):
         """Delete this Zone."""
@@ -45,7 +46,7 @@ class ZoneHandler(TimestampedModelHandler):
         assert self.user.is_superuser, "Permission denied."
         zone.delete()
 
-    def dehydrate(self, zone, data, for_list=False):
+    def dehydrate(self, zone, data, for_list=False, fields=None):
         node_count_by_type = defaultdict(
             int,
             zone.node_set.values('node_type').annotate(
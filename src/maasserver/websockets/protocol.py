@@ -1,4 +1,4 @@
-# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """The MAAS WebSockets protocol."""
@@ -7,7 +7,10 @@ __all__ = [
     "WebSocketProtocol",
 ]
 
-from collections import deque
+from collections import (
+    deque,
+    OrderedDict,
+)
 from functools import partial
 from http.cookies import SimpleCookie
 import json
@@ -17,6 +20,11 @@ from urllib.parse import (
     urlparse,
 )
 
+from bson import BSON
+from bson.errors import (
+    BSONError,
+    InvalidDocument,
+)
 from django.conf import settings
 from django.contrib.auth import (
     BACKEND_SESSION_KEY,
@@ -29,13 +37,23 @@ from maasserver.eventloop import services
 from maasserver.utils.orm import transactional
 from maasserver.utils.threads import deferToDatabase
 from maasserver.websockets import handlers
-from maasserver.websockets.websockets import STATUSES
+from maasserver.websockets.statistics import (
+    Measurement,
+    record_notify,
+    record_request,
+    record_request_error,
+)
+from maasserver.websockets.websockets import (
+    CONTROLS,
+    STATUSES,
+)
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils import typed
 from provisioningserver.utils.twisted import (
     deferred,
     synchronous,
 )
+from twisted.internet import reactor
 from twisted.internet.defer import (
     fail,
     inlineCallbacks,
@@ -61,6 +79,14 @@ class MSG_TYPE:
     #: Notify message from server.
     NOTIFY = 2
 
+    #: Notify message from server with only the changed fields of an
+    #: updated object. Only sent to clients that ask for patches.
+    PATCH = 3
+
+    #: Notify and patch messages from server sent together. Only sent to
+    #: clients that ask for batching.
+    BATCH = 4
+
 
 class RESPONSE_TYPE:
     #:
@@ -70,6 +96,50 @@ class RESPONSE_TYPE:
     ERROR = 1
 
 
+# Websocket subprotocols the client can ask for. Messages are encoded as
+# JSON in text frames by default, or as BSON in binary frames.
+SUBPROTOCOL_JSON = b"maas.json"
+SUBPROTOCOL_BSON = b"maas.bson"
+SUBPROTOCOLS = frozenset({SUBPROTOCOL_JSON, SUBPROTOCOL_BSON})
+
+
+# Handler methods whose results the client keeps as its copy of the
+# objects returned.
+TRACKED_METHODS = frozenset({
+    "create", "get", "list", "set_active", "update"})
+
+
+def get_changes(old, new):
+    """Return the fields in `new` that differ from those in `old`.
+
+    Returns `None` when `new` is missing fields that are in `old`, as the
+    client would then keep fields it should have dropped.
+    """
+    if not old.keys() <= new.keys():
+        return None
+    return {
+        key: value
+        for key, value in new.items()
+        if key not in old or old[key] != value
+    }
+
+
+def collapse_messages(previous, message):
+    """Return one message with the effect of `previous` then `message`.
+
+    Both are notify or patch messages for the same object. An object that
+    is created and then updated is still new to the client, and a patch is
+    merged into the message before it.
+    """
+    if message["type"] == MSG_TYPE.PATCH and isinstance(
+            previous["data"], dict):
+        return dict(previous, data=dict(previous["data"], **message["data"]))
+    elif previous["action"] == "create" and message["action"] == "update":
+        return dict(message, action="create")
+    else:
+        return message
+
+
 @typed
 def get_cookie(cookies: Optional[str], cookie_name: str) -> Optional[str]:
     """Return the sessionid value from `cookies`."""
@@ -88,10 +158,39 @@ class WebSocketProtocol(Protocol):
     :ivar factory: Set by the factory that spawned this protocol.
     """
 
+    # Seconds for which notifications are held to be sent as one batch.
+    batchInterval = 0.1
+
+    clock = reactor
+
     def __init__(self):
         self.messages = deque()
         self.user = None
         self.cache = {}
+        # True when the client asked for updates to be sent as patches.
+        self.patches = False
+        # Handler name -> {pk: object} as last sent to the client, only
+        # tracked when sending patches.
+        self.sent = {}
+        # True when the client asked for notifications to be batched.
+        self.batch = False
+        # (Handler name, pk) -> message waiting to be sent in the next
+        # batch, and the delayed call that sends it.
+        self.pending = OrderedDict()
+        self.pendingCall = None
+        # The subprotocol negotiated with the client, if any.
+        self.subprotocol = None
+
+    def selectSubprotocol(self, names):
+        """Select the first of the subprotocols in `names` that is supported.
+
+        Called by the websocket resource while it connects the client.
+        """
+        for name in names:
+            if name in SUBPROTOCOLS:
+                self.subprotocol = name
+                return name
+        return None
 
     def connectionMade(self):
         """Connection has been made to client."""
@@ -99,6 +198,11 @@ class WebSocketProtocol(Protocol):
         # the client. If this fails or if the CSRF token can't be found, it
         # will call loseConnection. A websocket connection is only allowed
         # from an authenticated user.
+        if self.subprotocol == SUBPROTOCOL_BSON:
+            self.transport.defaultOpcode = CONTROLS.BINARY
+        options = parse_qs(urlparse(self.transport.uri).query)
+        self.patches = options.get(b'patches') == [b'1']
+        self.batch = options.get(b'batch') == [b'1']
         cookies = self.transport.cookies.decode("ascii")
         d = self.authenticate(
             get_cookie(cookies, 'sessionid'),
@@ -127,6 +231,11 @@ class WebSocketProtocol(Protocol):
         # 'client' will not have been added to the list.
         if self in self.factory.clients:
             self.factory.clients.remove(self)
+        self.sent.clear()
+        if self.pendingCall is not None and self.pendingCall.active():
+            self.pendingCall.cancel()
+        self.pendingCall = None
+        self.pending.clear()
 
     def loseConnection(self, status, reason):
         """Close connection with status and reason."""
@@ -218,12 +327,15 @@ class WebSocketProtocol(Protocol):
     def dataReceived(self, data):
         """Received message from client and queue up the message."""
         try:
-            message = json.loads(data.decode('utf-8'))
-        except ValueError:
-            # Only accept JSON data over the protocol. Close the connect
-            # with invalid data.
-            self.loseConnection(
-                STATUSES.PROTOCOL_ERROR, "Invalid data expecting JSON object.")
+            message = self.decodeMessage(data)
+        except (ValueError, BSONError):
+            # Only accept JSON, or BSON, data over the protocol. Close the
+            # connect with invalid data.
+            if self.subprotocol == SUBPROTOCOL_BSON:
+                reason = "Invalid data expecting BSON document."
+            else:
+                reason = "Invalid data expecting JSON object."
+            self.loseConnection(STATUSES.PROTOCOL_ERROR, reason)
             return ""
         self.messages.append(message)
         self.processMessages()
@@ -283,13 +395,24 @@ class WebSocketProtocol(Protocol):
                 "Handler %s does not exist." % handler_name)
             return None
 
+        started = self.clock.seconds()
         handler = self.buildHandler(handler_class)
         d = handler.execute(method, message.get("params", {}))
+        if self.patches:
+            d.addCallback(partial(self.trackResult, handler._meta, method))
         d.addCallbacks(
             partial(self.sendResult, request_id),
             partial(self.sendError, request_id, handler, method))
+        d.addCallback(partial(
+            self.recordRequest, handler._meta.handler_name, method, started))
         return d
 
+    def recordRequest(self, handler_name, method, started, response_bytes):
+        """Record the latency and response size of a request."""
+        record_request(
+            handler_name, method, self.clock.seconds() - started,
+            response_bytes)
+
     def _json_encode(self, obj):
         """Allow byte strings embedded in the 'result' object passed to
         `sendResult` to be seamlessly decoded.
@@ -299,17 +422,39 @@ class WebSocketProtocol(Protocol):
         else:
             raise TypeError("Could not convert object to JSON: %r" % obj)
 
+    def decodeMessage(self, data):
+        """Decode a message received from the client."""
+        if self.subprotocol == SUBPROTOCOL_BSON:
+            return BSON.decode(data)
+        else:
+            return json.loads(data.decode('utf-8'))
+
+    def encodeMessage(self, message):
+        """Encode `message` to send to the client."""
+        if self.subprotocol == SUBPROTOCOL_BSON:
+            try:
+                return BSON.encode(message)
+            except InvalidDocument:
+                # BSON only allows string keys, which JSON coerces to.
+                return BSON.encode(json.loads(json.dumps(
+                    message, default=self._json_encode)))
+        else:
+            return json.dumps(
+                message, default=self._json_encode).encode("ascii")
+
     def sendResult(self, request_id, result):
         """Send final result to client."""
+        # Notifications from before the result must not arrive after it.
+        self.sendPending()
         result_msg = {
             "type": MSG_TYPE.RESPONSE,
             "request_id": request_id,
             "rtype": RESPONSE_TYPE.SUCCESS,
             "result": result,
             }
-        self.transport.write(json.dumps(
-            result_msg, default=self._json_encode).encode("ascii"))
-        return result
+        data = self.encodeMessage(result_msg)
+        self.transport.write(data)
+        return len(data)
 
     def sendError(self, request_id, handler, method, failure):
         """Log and send error to client."""
@@ -326,27 +471,168 @@ class WebSocketProtocol(Protocol):
         why = "Error on request (%s) %s.%s: %s" % (
             request_id, handler._meta.handler_name, method, error)
         log.err(failure, why)
+        record_request_error(handler._meta.handler_name, method)
 
+        self.sendPending()
         error_msg = {
             "type": MSG_TYPE.RESPONSE,
             "request_id": request_id,
             "rtype": RESPONSE_TYPE.ERROR,
             "error": error,
             }
-        self.transport.write(
-            json.dumps(error_msg, default=self._json_encode).encode("ascii"))
-        return None
+        data = self.encodeMessage(error_msg)
+        self.transport.write(data)
+        return len(data)
+
+    def trackResult(self, meta, method, result):
+        """Track the objects in `result` as last sent to the client.
+
+        Results of other methods than `TRACKED_METHODS` may or may not be
+        kept by the client, so the objects in them are forgotten; the next
+        notification for each is then sent in full.
+        """
+        sent = self.sent.setdefault(meta.handler_name, {})
+        objs = result if isinstance(result, list) else [result]
+        for obj in objs:
+            if isinstance(obj, dict) and meta.pk in obj:
+                if method in TRACKED_METHODS:
+                    sent[obj[meta.pk]] = obj
+                else:
+                    sent.pop(obj[meta.pk], None)
+        return result
 
-    def sendNotify(self, name, action, data):
-        """Send the notify message with data."""
-        notify_msg = {
-            "type": MSG_TYPE.NOTIFY,
+    def trackNotify(self, name, action, data):
+        """Track the object in the notification as last sent to the client.
+
+        :return: The changed fields, with the primary key, when `data` can
+            be sent as a patch of what the client already has; otherwise
+            `None`. The dict is empty when nothing has changed.
+        """
+        handler_class = self.factory.getHandler(name)
+        if handler_class is None:
+            return None
+        pk_name = handler_class._meta.pk
+        sent = self.sent.setdefault(name, {})
+        if action == "delete":
+            sent.pop(data, None)
+            return None
+        elif not isinstance(data, dict) or pk_name not in data:
+            return None
+        pk = data[pk_name]
+        previous = sent.get(pk)
+        sent[pk] = data
+        if action != "update" or previous is None:
+            return None
+        changes = get_changes(previous, data)
+        if changes:
+            changes[pk_name] = pk
+        return changes
+
+    def sendNotify(self, name, action, data, encoded=None):
+        """Send the notify message with data.
+
+        When the client asked for patches, updates to objects it already
+        has are sent as a `MSG_TYPE.PATCH` message with only the changed
+        fields, and not sent at all when nothing has changed.
+
+        When the client asked for batching, the message is held to be sent
+        with the others in the next batch.
+
+        :param encoded: Optional dict in which encoded messages are shared
+            between the connections notified of the same change.
+        """
+        if self.patches:
+            changes = self.trackNotify(name, action, data)
+            if changes is not None:
+                if len(changes) > 0:
+                    self.sendPatch(name, action, changes)
+                return
+        if self.batch:
+            self.queueMessage({
+                "type": MSG_TYPE.NOTIFY,
+                "name": name,
+                "action": action,
+                "data": data,
+                })
+            return
+        # Connections with the same view of an object are given the same
+        # `data`. The entry holds a reference to it, so its id is not reused
+        # while `encoded` is alive. Messages are only shared between
+        # connections with the same encoding.
+        key = (id(data), self.subprotocol == SUBPROTOCOL_BSON)
+        entry = None if encoded is None else encoded.get(key)
+        if entry is None or entry[2] is not data or (
+                entry[:2] != (name, action)):
+            notify_msg = {
+                "type": MSG_TYPE.NOTIFY,
+                "name": name,
+                "action": action,
+                "data": data,
+                }
+            message = self.encodeMessage(notify_msg)
+            if encoded is not None:
+                encoded[key] = (name, action, data, message)
+        else:
+            message = entry[3]
+        self.transport.write(message)
+
+    def sendPatch(self, name, action, changes):
+        """Send the patch message with the changed fields of an object."""
+        patch_msg = {
+            "type": MSG_TYPE.PATCH,
             "name": name,
             "action": action,
-            "data": data,
+            "data": changes,
             }
-        self.transport.write(
-            json.dumps(notify_msg, default=self._json_encode).encode("ascii"))
+        if self.batch:
+            self.queueMessage(patch_msg)
+        else:
+            self.transport.write(self.encodeMessage(patch_msg))
+
+    def queueMessage(self, message):
+        """Hold the notify or patch `message` to be sent in the next batch.
+
+        Messages for an object that already has one waiting are collapsed
+        into that one.
+        """
+        name, data = message["name"], message["data"]
+        handler_class = self.factory.getHandler(name)
+        if message["action"] == "delete":
+            pk = data
+        elif handler_class is not None and isinstance(data, dict):
+            pk = data.get(handler_class._meta.pk)
+        else:
+            pk = None
+        if isinstance(pk, (int, str)):
+            key = (name, pk)
+        else:
+            # The object cannot be identified so it is never collapsed.
+            key = object()
+        previous = self.pending.get(key)
+        if previous is not None:
+            message = collapse_messages(previous, message)
+        self.pending[key] = message
+        if self.pendingCall is None:
+            self.pendingCall = self.clock.callLater(
+                self.batchInterval, self.sendPending)
+
+    def sendPending(self):
+        """Send the messages held for the next batch."""
+        if self.pendingCall is not None and self.pendingCall.active():
+            self.pendingCall.cancel()
+        self.pendingCall = None
+        if len(self.pending) == 0:
+            return
+        messages = list(self.pending.values())
+        self.pending.clear()
+        if len(messages) == 1:
+            batch_msg = messages[0]
+        else:
+            batch_msg = {
+                "type": MSG_TYPE.BATCH,
+                "data": messages,
+                }
+        self.transport.write(self.encodeMessage(batch_msg))
 
     def buildHandler(self, handler_class):
         """Return an initialised instance of `handler_class`."""
@@ -410,22 +696,64 @@ class WebSocketFactory(Factory):
         """Registers all of the postgres channels in the handlers."""
         for handler in self.handlers.values():
             for channel in handler._meta.listen_channels:
-                self.listener.register(
-                    channel, partial(self.onNotify, handler, channel))
+                if handler._meta.listen_batch:
+                    self.listener.register(
+                        channel, partial(self.onNotifyMany, handler, channel),
+                        batch=True)
+                else:
+                    self.listener.register(
+                        channel, partial(self.onNotify, handler, channel))
 
     @inlineCallbacks
     def onNotify(self, handler_class, channel, action, obj_id):
+        # Objects dehydrated, and messages encoded, for one client are
+        # reused for the others with the same view of the object.
+        dehydrated, encoded = {}, {}
         for client in self.clients:
             handler = client.buildHandler(handler_class)
             data = yield deferToDatabase(
-                self.processNotify, handler, channel, action, obj_id)
+                self.processNotify, handler, channel, action, obj_id,
+                dehydrated)
             if data is not None:
                 (name, client_action, data) = data
-                client.sendNotify(name, client_action, data)
+                client.sendNotify(name, client_action, data, encoded)
+
+    @inlineCallbacks
+    def onNotifyMany(self, handler_class, channel, action, obj_ids):
+        """Like `onNotify`, for a batch of notifications for `action`."""
+        dehydrated, encoded = {}, {}
+        for client in self.clients:
+            handler = client.buildHandler(handler_class)
+            messages = yield deferToDatabase(
+                self.processNotifyMany, handler, channel, action, obj_ids,
+                dehydrated)
+            for (name, client_action, data) in messages:
+                client.sendNotify(name, client_action, data, encoded)
+
+    @transactional
+    def processNotify(
+            self, handler, channel, action, obj_id, dehydrated=None):
+        handler.notify_cache = dehydrated
+        return self.measureNotify(
+            channel, handler.on_listen, channel, action, obj_id)
 
     @transactional
-    def processNotify(self, handler, channel, action, obj_id):
-        return handler.on_listen(channel, action, obj_id)
+    def processNotifyMany(
+            self, handler, channel, action, obj_ids, dehydrated=None):
+        handler.notify_cache = dehydrated
+        return self.measureNotify(
+            channel, handler.on_listen_many, channel, action, obj_ids)
+
+    def measureNotify(self, channel, func, *args):
+        """Call `func` with `args`, recording the time it takes and the
+        database queries it makes for `channel`."""
+        measurement = Measurement()
+        try:
+            with measurement:
+                return func(*args)
+        finally:
+            record_notify(
+                channel, measurement.seconds, measurement.queries)
 
     def registerRPCEvents(self):
         """Register for connected and disconnected events from the RPC
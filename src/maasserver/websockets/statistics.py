@@ -0,0 +1,206 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Statistics about the websocket handlers."""
+
+__all__ = [
+    "get_websocket_statistics",
+    "Measurement",
+    "record_notify",
+    "record_queries",
+    "record_request",
+    "record_request_error",
+    "reset_websocket_statistics",
+]
+
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+import time
+
+from django.db import connection
+
+
+# Upper bounds of the buckets of each kind of histogram. The last bucket of
+# each is unbounded.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (
+    2 ** 10, 2 ** 12, 2 ** 14, 2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24)
+
+
+class Histogram:
+    """Counts observed values in buckets with the given upper bounds."""
+
+    def __init__(self, buckets):
+        super(Histogram, self).__init__()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        """Count `value` in the bucket with the least bound that holds it."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        """Return the histogram as a dict.
+
+        Buckets are keyed by their upper bound, as a string so that the
+        dict can be encoded as JSON or BSON; the last is keyed by "+Inf".
+        """
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(bounds, self.counts)),
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+
+class RequestStatistics:
+    """Statistics for the calls to one method of one handler."""
+
+    def __init__(self):
+        super(RequestStatistics, self).__init__()
+        # Seconds from receiving a request to sending its response.
+        self.seconds = Histogram(LATENCY_BUCKETS)
+        # Database queries made by the method, not counting asynchronous
+        # methods, which do not run in a database thread.
+        self.queries = Histogram(QUERY_BUCKETS)
+        # Bytes in each encoded response, whether a result or an error.
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+        # Number of calls that raised an error.
+        self.errors = 0
+
+    def as_dict(self):
+        """Return the statistics as a dict."""
+        return {
+            "seconds": self.seconds.as_dict(),
+            "queries": self.queries.as_dict(),
+            "response_bytes": self.response_bytes.as_dict(),
+            "errors": self.errors,
+        }
+
+
+class NotifyStatistics:
+    """Statistics for the processing of notifications on one channel."""
+
+    def __init__(self):
+        super(NotifyStatistics, self).__init__()
+        # Seconds spent in `on_listen` or `on_listen_many` for one client.
+        self.seconds = Histogram(LATENCY_BUCKETS)
+        # Database queries made by them.
+        self.queries = Histogram(QUERY_BUCKETS)
+
+    def as_dict(self):
+        """Return the statistics as a dict."""
+        return {
+            "seconds": self.seconds.as_dict(),
+            "queries": self.queries.as_dict(),
+        }
+
+
+# Holds the statistics for each handler method, keyed by "handler.method",
+# and for each notification channel. They are updated from the reactor and
+# from database threads, so must be used with the lock held.
+_statistics_lock = Lock()
+_request_statistics = defaultdict(RequestStatistics)
+_notify_statistics = defaultdict(NotifyStatistics)
+
+
+def _request_key(handler_name, method):
+    return "%s.%s" % (handler_name, method)
+
+
+def record_request(handler_name, method, seconds, response_bytes):
+    """Record a response to a call to `handler_name`.`method`."""
+    with _statistics_lock:
+        statistics = _request_statistics[_request_key(handler_name, method)]
+        statistics.seconds.observe(seconds)
+        statistics.response_bytes.observe(response_bytes)
+
+
+def record_request_error(handler_name, method):
+    """Record that a call to `handler_name`.`method` raised an error."""
+    with _statistics_lock:
+        _request_statistics[_request_key(handler_name, method)].errors += 1
+
+
+def record_queries(handler_name, method, queries):
+    """Record the database queries made by `handler_name`.`method`."""
+    with _statistics_lock:
+        statistics = _request_statistics[_request_key(handler_name, method)]
+        statistics.queries.observe(queries)
+
+
+def record_notify(channel, seconds, queries):
+    """Record the processing of notifications on `channel`."""
+    with _statistics_lock:
+        statistics = _notify_statistics[channel]
+        statistics.seconds.observe(seconds)
+        statistics.queries.observe(queries)
+
+
+def get_websocket_statistics():
+    """Return the statistics for the websocket handlers.
+
+    Calls are keyed by "handler.method" under "requests", and notifications
+    by channel under "notifications".
+    """
+    with _statistics_lock:
+        return {
+            "requests": {
+                key: statistics.as_dict()
+                for key, statistics in _request_statistics.items()
+            },
+            "notifications": {
+                channel: statistics.as_dict()
+                for channel, statistics in _notify_statistics.items()
+            },
+        }
+
+
+def reset_websocket_statistics():
+    """Forget all statistics recorded so far."""
+    with _statistics_lock:
+        _request_statistics.clear()
+        _notify_statistics.clear()
+
+
+class Measurement:
+    """Measures the time taken and the database queries made by the thread
+    in a `with` block.
+
+    Queries are counted from the connection's query log, as `count_queries`
+    does, so the debug cursor is forced on for the duration of the block.
+    When nothing else is using the log, it is emptied afterwards so that it
+    does not hold on to the SQL.
+    """
+
+    def __init__(self):
+        super(Measurement, self).__init__()
+        self.seconds = None
+        self.queries = None
+
+    def __enter__(self):
+        self._force_debug_cursor = connection.force_debug_cursor
+        self._owns_log = not connection.queries_logged
+        connection.force_debug_cursor = True
+        if self._owns_log:
+            connection.queries_log.clear()
+        self._queries_before = len(connection.queries_log)
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.monotonic() - self._started
+        self.queries = len(connection.queries_log) - self._queries_before
+        connection.force_debug_cursor = self._force_debug_cursor
+        if self._owns_log:
+            connection.queries_log.clear()
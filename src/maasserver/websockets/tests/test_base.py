@@ -34,6 +34,10 @@ from maasserver.websockets.base import (
     HandlerNoSuchMethodError,
     HandlerValidationError,
 )
+from maasserver.websockets.statistics import (
+    get_websocket_statistics,
+    reset_websocket_statistics,
+)
 from maastesting.matchers import (
     MockCalledOnceWith,
     MockNotCalled,
@@ -45,6 +49,7 @@ from testtools.matchers import (
     Is,
     IsInstance,
     MatchesStructure,
+    Not,
 )
 from testtools.testcase import ExpectedException
 
@@ -185,6 +190,22 @@ class TestHandler(MAASServerTestCase):
             mock_dehydrate_hostname,
             MockCalledOnceWith(node.hostname))
 
+    def test_full_dehydrate_only_includes_requested_fields(self):
+        handler = self.make_nodes_handler(fields=["hostname", "power_state"])
+        node = factory.make_Node()
+        self.assertEqual({
+            "hostname": node.hostname,
+            }, handler.full_dehydrate(node, fields={"hostname"}))
+
+    def test_full_dehydrate_drops_extra_info_not_requested(self):
+        handler = self.make_nodes_handler(fields=["hostname"])
+        self.patch(handler, "dehydrate").side_effect = (
+            lambda obj, data, for_list, fields: dict(data, extra="info"))
+        node = factory.make_Node()
+        self.assertEqual({
+            "extra": "info",
+            }, handler.full_dehydrate(node, fields={"extra"}))
+
     def test_full_dehydrate_calls_final_dehydrate_method(self):
         handler = self.make_nodes_handler(fields=["hostname"])
         mock_dehydrate = self.patch_autospec(handler, "dehydrate")
@@ -195,7 +216,8 @@ class TestHandler(MAASServerTestCase):
         self.expectThat(
             mock_dehydrate,
             MockCalledOnceWith(
-                node, {"hostname": node.hostname}, for_list=False))
+                node, {"hostname": node.hostname}, for_list=False,
+                fields=None))
 
     def test_dehydrate_does_nothing(self):
         handler = self.make_nodes_handler()
@@ -374,10 +396,23 @@ class TestHandler(MAASServerTestCase):
         self.patch(base, "deferToDatabase").return_value = sentinel.thing
         result = handler.execute("get", params).wait(30)
         self.assertThat(result, Is(sentinel.thing))
-        self.assertThat(base.deferToDatabase, MockCalledOnceWith(ANY, params))
-        [func, _] = base.deferToDatabase.call_args[0]
+        self.assertThat(base.deferToDatabase, MockCalledOnceWith(
+            handler._execute_measured, "get", ANY, params))
+        [_, _, func, _] = base.deferToDatabase.call_args[0]
         self.assertThat(func.func, Equals(handler.get))
 
+    def test_execute_measured_records_queries(self):
+        reset_websocket_statistics()
+        self.addCleanup(reset_websocket_statistics)
+        handler = self.make_nodes_handler()
+        handler._execute_measured(
+            "get", lambda params: list(Node.objects.all()), {})
+        statistics = get_websocket_statistics()["requests"]
+        key = "%s.get" % handler._meta.handler_name
+        queries = statistics[key]["queries"]
+        self.assertThat(queries["count"], Equals(1))
+        self.assertThat(queries["sum"], Equals(1))
+
     def test_execute_calls_asynchronous_method_with_params(self):
         # An asynchronous method -- decorated with @asynchronous -- is called
         # directly, not in a thread.
@@ -425,6 +460,21 @@ class TestHandler(MAASServerTestCase):
         self.assertItemsEqual(
             output, handler.list({"start": nodes[2].id, "limit": 3}))
 
+    def test_list_fields(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        output = [
+            {"system_id": node.system_id, "hostname": node.hostname}
+            for node in nodes
+            ]
+        handler = self.make_nodes_handler(
+            fields=["system_id", "hostname", "power_state"])
+        self.assertItemsEqual(output, handler.list({"fields": ["hostname"]}))
+
+    def test_list_fields_must_be_a_list_of_names(self):
+        handler = self.make_nodes_handler(fields=["hostname"])
+        self.assertRaises(
+            HandlerValidationError, handler.list, {"fields": "hostname"})
+
     def test_list_adds_to_loaded_pks(self):
         pks = [factory.make_Node().system_id for _ in range(3)]
         handler = self.make_nodes_handler(fields=['hostname'])
@@ -725,6 +775,40 @@ class TestHandler(MAASServerTestCase):
             node.system_id in handler.cache["loaded_pks"],
             "on_listen update didnt add system_id to loaded_pks")
 
+    def test_on_listen_many_returns_messages_for_viewable_objects(self):
+        nodes = [factory.make_Node() for _ in range(3)]
+        handler = self.make_nodes_handler(fields=["hostname"])
+        handler.cache["loaded_pks"].add(nodes[0].system_id)
+        self.patch(handler, "listen_many").return_value = {
+            node.system_id: node
+            for node in nodes[:2]
+        }
+        self.assertItemsEqual([
+            (handler._meta.handler_name, "update",
+             {"hostname": nodes[0].hostname}),
+            (handler._meta.handler_name, "create",
+             {"hostname": nodes[1].hostname}),
+            ], handler.on_listen_many(
+                sentinel.channel, "update",
+                {node.system_id for node in nodes}))
+
+    def test_on_listen_many_delete_returns_delete_for_loaded_pks(self):
+        handler = self.make_nodes_handler()
+        handler.cache["loaded_pks"].update({"abc", "def"})
+        self.assertEqual(
+            [(handler._meta.handler_name, "delete", "abc")],
+            handler.on_listen_many(sentinel.channel, "delete", {"abc", "xyz"}))
+        self.assertEqual({"def"}, handler.cache["loaded_pks"])
+
+    def test_listen_many_calls_listen_for_each_pk(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler()
+        self.assertEqual(
+            {node.system_id: node},
+            handler.listen_many(
+                sentinel.channel, "update",
+                [node.system_id, factory.make_name("system_id")]))
+
     def test_on_listen_update_call_full_dehydrate_for_list_if_not_active(self):
         node = factory.make_Node()
         handler = self.make_nodes_handler()
@@ -754,6 +838,57 @@ class TestHandler(MAASServerTestCase):
             mock_dehydrate,
             MockCalledOnceWith(node, for_list=False))
 
+    def test_full_dehydrate_for_notify_dehydrates_without_cache(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler(fields=['hostname'])
+        self.assertThat(
+            handler.full_dehydrate_for_notify(node.system_id, node),
+            Equals({"hostname": node.hostname}))
+
+    def test_full_dehydrate_for_notify_shares_cache_for_same_user(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler(fields=['hostname'])
+        other_handler = self.make_nodes_handler(fields=['hostname'])
+        other_handler.user = handler.user
+        handler.notify_cache = other_handler.notify_cache = {}
+        data = handler.full_dehydrate_for_notify(node.system_id, node)
+        mock_dehydrate = self.patch(other_handler, "full_dehydrate")
+        self.expectThat(
+            other_handler.full_dehydrate_for_notify(node.system_id, node),
+            Is(data))
+        self.expectThat(mock_dehydrate, MockNotCalled())
+
+    def test_full_dehydrate_for_notify_does_not_share_between_users(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler(fields=['hostname'])
+        other_handler = self.make_nodes_handler(fields=['hostname'])
+        handler.notify_cache = other_handler.notify_cache = {}
+        handler.full_dehydrate_for_notify(node.system_id, node)
+        mock_dehydrate = self.patch(other_handler, "full_dehydrate")
+        mock_dehydrate.return_value = sentinel.data
+        self.expectThat(
+            other_handler.full_dehydrate_for_notify(node.system_id, node),
+            Is(sentinel.data))
+        self.expectThat(
+            mock_dehydrate, MockCalledOnceWith(node, for_list=False))
+
+    def test_full_dehydrate_for_notify_shares_if_not_per_user(self):
+        node = factory.make_Node()
+        handler = self.make_nodes_handler(
+            fields=['hostname'], dehydrate_per_user=False)
+        other_handler = self.make_nodes_handler(
+            fields=['hostname'], dehydrate_per_user=False)
+        handler.notify_cache = other_handler.notify_cache = {}
+        data = handler.full_dehydrate_for_notify(
+            node.system_id, node, for_list=True)
+        self.expectThat(
+            other_handler.full_dehydrate_for_notify(
+                node.system_id, node, for_list=True),
+            Is(data))
+        self.expectThat(
+            other_handler.full_dehydrate_for_notify(node.system_id, node),
+            Not(Is(data)))
+
     def test_listen_calls_get_object_with_pk_on_other_actions(self):
         handler = self.make_nodes_handler()
         mock_get_object = self.patch(handler, "get_object")
@@ -1,4 +1,4 @@
-# Copyright 2015-2017 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for `maasserver.websockets.protocol`"""
@@ -8,14 +8,18 @@ from collections import deque
 import json
 import random
 from unittest.mock import (
+    ANY,
+    call,
     MagicMock,
     sentinel,
 )
 
 from apiclient.utils import ascii_url
+from bson import BSON
 from crochet import wait_for
 from django.core.exceptions import ValidationError
 from maasserver.eventloop import services
+from maasserver.listener import BatchHandler
 from maasserver.testing.factory import factory as maas_factory
 from maasserver.testing.listener import FakePostgresListenerService
 from maasserver.testing.testcase import MAASTransactionServerTestCase
@@ -28,16 +32,25 @@ from maasserver.websockets.handlers import (
     MachineHandler,
 )
 from maasserver.websockets.protocol import (
+    collapse_messages,
+    get_changes,
     MSG_TYPE,
     RESPONSE_TYPE,
+    SUBPROTOCOL_BSON,
+    SUBPROTOCOL_JSON,
     WebSocketFactory,
     WebSocketProtocol,
 )
-from maasserver.websockets.websockets import STATUSES
+from maasserver.websockets.websockets import (
+    CONTROLS,
+    STATUSES,
+)
 from maastesting.matchers import (
     IsFiredDeferred,
     MockCalledOnceWith,
     MockCalledWith,
+    MockCallsMatch,
+    MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
 from maastesting.twisted import TwistedLoggerFixture
@@ -53,6 +66,7 @@ from twisted.internet.defer import (
     inlineCallbacks,
     succeed,
 )
+from twisted.internet.task import Clock
 from twisted.web.server import NOT_DONE_YET
 
 
@@ -328,6 +342,117 @@ class TestWebSocketProtocol(MAASTransactionServerTestCase):
                 json.dumps(message).encode("ascii")), Is(NOT_DONE_YET))
         self.expectThat(mock_processMessages, MockCalledOnceWith())
 
+    def test_selectSubprotocol_selects_first_supported(self):
+        protocol, factory = self.make_protocol()
+        self.expectThat(
+            protocol.selectSubprotocol(
+                [b"unknown", SUBPROTOCOL_BSON, SUBPROTOCOL_JSON]),
+            Equals(SUBPROTOCOL_BSON))
+        self.expectThat(protocol.subprotocol, Equals(SUBPROTOCOL_BSON))
+
+    def test_selectSubprotocol_selects_none_if_none_supported(self):
+        protocol, factory = self.make_protocol()
+        self.expectThat(protocol.selectSubprotocol([b"unknown"]), Is(None))
+        self.expectThat(protocol.subprotocol, Is(None))
+
+    def test_connectionMade_sends_binary_frames_for_bson(self):
+        uri = ascii_url("/MAAS/ws?csrftoken=token")
+        protocol, factory = self.make_protocol(transport_uri=uri)
+        protocol.selectSubprotocol([SUBPROTOCOL_BSON])
+        protocol.connectionMade()
+        self.addCleanup(protocol.connectionLost, "")
+        self.assertThat(
+            protocol.transport.defaultOpcode, Equals(CONTROLS.BINARY))
+
+    def test_dataReceived_decodes_bson(self):
+        protocol, factory = self.make_protocol()
+        protocol.selectSubprotocol([SUBPROTOCOL_BSON])
+        self.patch_autospec(protocol, "processMessages")
+        message = {"type": MSG_TYPE.REQUEST}
+        protocol.dataReceived(BSON.encode(message))
+        self.assertThat(protocol.messages, Equals(deque([message])))
+
+    def test_dataReceived_calls_loseConnection_if_bson_error(self):
+        protocol, factory = self.make_protocol()
+        protocol.selectSubprotocol([SUBPROTOCOL_BSON])
+        mock_loseConnection = self.patch_autospec(protocol, "loseConnection")
+        self.expectThat(protocol.dataReceived(b"{{{{"), Is(""))
+        self.expectThat(
+            mock_loseConnection,
+            MockCalledOnceWith(
+                STATUSES.PROTOCOL_ERROR,
+                "Invalid data expecting BSON document."))
+
+    def test_sendResult_encodes_bson(self):
+        protocol, factory = self.make_protocol()
+        protocol.selectSubprotocol([SUBPROTOCOL_BSON])
+        result = {"hostname": "host", "ids": [1, 2], "data": {1: None}}
+        protocol.sendResult(1, result)
+        [message] = protocol.transport.write.call_args[0]
+        self.assertThat(BSON.decode(message), Equals({
+            "type": MSG_TYPE.RESPONSE,
+            "request_id": 1,
+            "rtype": RESPONSE_TYPE.SUCCESS,
+            "result": {"hostname": "host", "ids": [1, 2], "data": {"1": None}},
+            }))
+
+    def test_sendResult_returns_size_of_message(self):
+        protocol, factory = self.make_protocol()
+        size = protocol.sendResult(1, {"hostname": "host"})
+        [message] = protocol.transport.write.call_args[0]
+        self.assertThat(size, Equals(len(message)))
+
+    def test_handleRequest_records_request(self):
+        protocol, factory = self.make_protocol()
+        protocol.user = MagicMock()
+        protocol.clock = Clock()
+        mock_record = self.patch(protocol_module, "record_request")
+        self.patch(Handler, "execute").return_value = succeed({})
+        protocol.handleRequest({
+            "type": MSG_TYPE.REQUEST,
+            "request_id": 1,
+            "method": "machine.get",
+            })
+        [message] = protocol.transport.write.call_args[0]
+        self.assertThat(mock_record, MockCalledOnceWith(
+            "machine", "get", 0, len(message)))
+
+    def test_handleRequest_records_request_error(self):
+        protocol, factory = self.make_protocol()
+        protocol.user = MagicMock()
+        mock_record = self.patch(protocol_module, "record_request")
+        mock_record_error = self.patch(
+            protocol_module, "record_request_error")
+        self.patch(Handler, "execute").return_value = fail(
+            ValidationError("bad"))
+        with TwistedLoggerFixture():
+            protocol.handleRequest({
+                "type": MSG_TYPE.REQUEST,
+                "request_id": 1,
+                "method": "machine.get",
+                })
+        [message] = protocol.transport.write.call_args[0]
+        self.expectThat(
+            mock_record_error, MockCalledOnceWith("machine", "get"))
+        self.expectThat(mock_record, MockCalledOnceWith(
+            "machine", "get", ANY, len(message)))
+
+    def test_sendNotify_does_not_share_message_with_other_encoding(self):
+        protocol, factory = self.make_protocol()
+        other_protocol, _ = self.make_protocol()
+        other_protocol.selectSubprotocol([SUBPROTOCOL_BSON])
+        data = {"id": random.randint(0, 100)}
+        encoded = {}
+        protocol.sendNotify("zone", "update", data, encoded)
+        other_protocol.sendNotify("zone", "update", data, encoded)
+        [other_message] = other_protocol.transport.write.call_args[0]
+        self.assertThat(BSON.decode(other_message), Equals({
+            "type": MSG_TYPE.NOTIFY,
+            "name": "zone",
+            "action": "update",
+            "data": data,
+            }))
+
     def test_processMessages_does_nothing_if_no_user(self):
         protocol = WebSocketProtocol()
         protocol.messages = deque([
@@ -663,6 +788,266 @@ class TestWebSocketProtocol(MAASTransactionServerTestCase):
         self.assertEquals(
             message, self.get_written_transport_message(protocol))
 
+    def test_connectionMade_enables_patches_when_asked(self):
+        uri = ascii_url("/MAAS/ws?csrftoken=token&patches=1")
+        protocol, factory = self.make_protocol(transport_uri=uri)
+        protocol.connectionMade()
+        self.addCleanup(protocol.connectionLost, "")
+        self.assertThat(protocol.patches, Is(True))
+
+    def test_connectionMade_does_not_enable_patches_by_default(self):
+        uri = ascii_url("/MAAS/ws?csrftoken=token")
+        protocol, factory = self.make_protocol(transport_uri=uri)
+        protocol.connectionMade()
+        self.addCleanup(protocol.connectionLost, "")
+        self.assertThat(protocol.patches, Is(False))
+
+    def make_patching_protocol(self, **sent):
+        protocol, factory = self.make_protocol()
+        protocol.patches = True
+        protocol.sent["machine"] = sent
+        return protocol
+
+    def test_sendNotify_sends_patch_with_changed_fields(self):
+        protocol = self.make_patching_protocol(
+            abc={"system_id": "abc", "hostname": "old", "power": "on"})
+        protocol.sendNotify(
+            "machine", "update",
+            {"system_id": "abc", "hostname": "new", "power": "on"})
+        self.assertEquals({
+            "type": MSG_TYPE.PATCH,
+            "name": "machine",
+            "action": "update",
+            "data": {"system_id": "abc", "hostname": "new"},
+            }, self.get_written_transport_message(protocol))
+
+    def test_sendNotify_sends_nothing_when_unchanged(self):
+        data = {"system_id": "abc", "hostname": "host"}
+        protocol = self.make_patching_protocol(abc=data)
+        protocol.sendNotify("machine", "update", dict(data))
+        self.assertThat(protocol.transport.write, MockNotCalled())
+
+    def test_sendNotify_sends_full_update_for_untracked_object(self):
+        protocol = self.make_patching_protocol()
+        data = {"system_id": "abc", "hostname": "host"}
+        protocol.sendNotify("machine", "update", data)
+        sent_obj = self.get_written_transport_message(protocol)
+        self.expectThat(sent_obj["type"], Equals(MSG_TYPE.NOTIFY))
+        self.expectThat(sent_obj["data"], Equals(data))
+        self.expectThat(protocol.sent["machine"]["abc"], Equals(data))
+
+    def test_sendNotify_sends_full_update_when_fields_are_dropped(self):
+        protocol = self.make_patching_protocol(
+            abc={"system_id": "abc", "hostname": "host", "events": []})
+        data = {"system_id": "abc", "hostname": "host"}
+        protocol.sendNotify("machine", "update", data)
+        sent_obj = self.get_written_transport_message(protocol)
+        self.expectThat(sent_obj["type"], Equals(MSG_TYPE.NOTIFY))
+        self.expectThat(sent_obj["data"], Equals(data))
+
+    def test_sendNotify_forgets_deleted_object(self):
+        protocol = self.make_patching_protocol(abc={"system_id": "abc"})
+        protocol.sendNotify("machine", "delete", "abc")
+        sent_obj = self.get_written_transport_message(protocol)
+        self.expectThat(sent_obj["type"], Equals(MSG_TYPE.NOTIFY))
+        self.expectThat(protocol.sent["machine"], Equals({}))
+
+    def test_sendNotify_sends_full_update_without_patches(self):
+        protocol, factory = self.make_protocol()
+        protocol.sent["machine"] = {"abc": {"system_id": "abc"}}
+        data = {"system_id": "abc", "hostname": "host"}
+        protocol.sendNotify("machine", "update", data)
+        sent_obj = self.get_written_transport_message(protocol)
+        self.expectThat(sent_obj["type"], Equals(MSG_TYPE.NOTIFY))
+        self.expectThat(sent_obj["data"], Equals(data))
+
+    def test_sendNotify_shares_encoded_message(self):
+        protocol, factory = self.make_protocol()
+        other_protocol, _ = self.make_protocol()
+        data = {"id": random.randint(0, 100)}
+        encoded = {}
+        protocol.sendNotify("zone", "update", data, encoded)
+        other_protocol.sendNotify("zone", "update", data, encoded)
+        [message] = protocol.transport.write.call_args[0]
+        [other_message] = other_protocol.transport.write.call_args[0]
+        self.expectThat(other_message, Is(message))
+        self.expectThat(json.loads(message.decode("ascii")), Equals({
+            "type": MSG_TYPE.NOTIFY,
+            "name": "zone",
+            "action": "update",
+            "data": data,
+            }))
+
+    def test_sendNotify_does_not_share_message_for_other_action(self):
+        protocol, factory = self.make_protocol()
+        data = {"id": random.randint(0, 100)}
+        encoded = {}
+        protocol.sendNotify("zone", "create", data, encoded)
+        protocol.sendNotify("zone", "update", data, encoded)
+        self.assertThat(
+            self.get_written_transport_message(protocol)["action"],
+            Equals("update"))
+
+    def test_connectionMade_enables_batch_when_asked(self):
+        uri = ascii_url("/MAAS/ws?csrftoken=token&batch=1")
+        protocol, factory = self.make_protocol(transport_uri=uri)
+        protocol.connectionMade()
+        self.addCleanup(protocol.connectionLost, "")
+        self.assertThat(protocol.batch, Is(True))
+
+    def make_batching_protocol(self):
+        protocol, factory = self.make_protocol()
+        protocol.batch = True
+        protocol.clock = Clock()
+        return protocol
+
+    def test_sendNotify_holds_messages_for_the_batch_interval(self):
+        protocol = self.make_batching_protocol()
+        protocol.sendNotify("machine", "update", {"system_id": "abc"})
+        protocol.sendNotify("machine", "update", {"system_id": "def"})
+        self.expectThat(protocol.transport.write, MockNotCalled())
+        protocol.clock.advance(protocol.batchInterval)
+        self.expectThat(
+            self.get_written_transport_message(protocol), Equals({
+                "type": MSG_TYPE.BATCH,
+                "data": [{
+                    "type": MSG_TYPE.NOTIFY,
+                    "name": "machine",
+                    "action": "update",
+                    "data": {"system_id": "abc"},
+                }, {
+                    "type": MSG_TYPE.NOTIFY,
+                    "name": "machine",
+                    "action": "update",
+                    "data": {"system_id": "def"},
+                }],
+            }))
+        self.expectThat(protocol.transport.write, MockNotCalled())
+
+    def test_sendNotify_sends_single_held_message_unbatched(self):
+        protocol = self.make_batching_protocol()
+        protocol.sendNotify("machine", "delete", "abc")
+        protocol.clock.advance(protocol.batchInterval)
+        self.assertThat(
+            self.get_written_transport_message(protocol), Equals({
+                "type": MSG_TYPE.NOTIFY,
+                "name": "machine",
+                "action": "delete",
+                "data": "abc",
+            }))
+
+    def test_sendNotify_collapses_messages_for_the_same_object(self):
+        protocol = self.make_batching_protocol()
+        protocol.sendNotify(
+            "machine", "create", {"system_id": "abc", "hostname": "a"})
+        protocol.sendNotify(
+            "machine", "update", {"system_id": "abc", "hostname": "b"})
+        protocol.clock.advance(protocol.batchInterval)
+        self.assertThat(
+            self.get_written_transport_message(protocol), Equals({
+                "type": MSG_TYPE.NOTIFY,
+                "name": "machine",
+                "action": "create",
+                "data": {"system_id": "abc", "hostname": "b"},
+            }))
+
+    def test_sendNotify_collapses_patches_for_the_same_object(self):
+        protocol = self.make_batching_protocol()
+        protocol.patches = True
+        protocol.sent["machine"] = {
+            "abc": {"system_id": "abc", "hostname": "a", "power": "off"}}
+        protocol.sendNotify(
+            "machine", "update",
+            {"system_id": "abc", "hostname": "b", "power": "off"})
+        protocol.sendNotify(
+            "machine", "update",
+            {"system_id": "abc", "hostname": "b", "power": "on"})
+        protocol.clock.advance(protocol.batchInterval)
+        self.assertThat(
+            self.get_written_transport_message(protocol), Equals({
+                "type": MSG_TYPE.PATCH,
+                "name": "machine",
+                "action": "update",
+                "data": {"system_id": "abc", "hostname": "b", "power": "on"},
+            }))
+
+    def test_sendResult_sends_held_messages_first(self):
+        protocol = self.make_batching_protocol()
+        protocol.sendNotify("machine", "delete", "abc")
+        protocol.sendResult(1, {})
+        result = self.get_written_transport_message(protocol)
+        notify = self.get_written_transport_message(protocol)
+        self.expectThat(result["type"], Equals(MSG_TYPE.RESPONSE))
+        self.expectThat(notify["type"], Equals(MSG_TYPE.NOTIFY))
+        self.expectThat(protocol.clock.getDelayedCalls(), Equals([]))
+
+    def test_connectionLost_drops_held_messages(self):
+        protocol = self.make_batching_protocol()
+        protocol.sendNotify("machine", "delete", "abc")
+        protocol.connectionLost("")
+        self.expectThat(protocol.pending, Equals({}))
+        self.expectThat(protocol.clock.getDelayedCalls(), Equals([]))
+
+    def test_trackResult_tracks_objects_the_client_keeps(self):
+        protocol = self.make_patching_protocol()
+        objs = [{"system_id": "abc"}, {"system_id": "def"}]
+        result = protocol.trackResult(MachineHandler._meta, "list", objs)
+        self.expectThat(result, Is(objs))
+        self.expectThat(protocol.sent["machine"], Equals({
+            "abc": objs[0], "def": objs[1]}))
+
+    def test_trackResult_forgets_objects_from_other_methods(self):
+        protocol = self.make_patching_protocol(abc={"system_id": "abc"})
+        protocol.trackResult(
+            MachineHandler._meta, "action", {"system_id": "abc"})
+        self.assertThat(protocol.sent["machine"], Equals({}))
+
+
+class TestGetChanges(MAASTestCase):
+
+    def test__returns_changed_and_added_fields(self):
+        self.assertThat(
+            get_changes({"a": 1, "b": 2}, {"a": 1, "b": 3, "c": None}),
+            Equals({"b": 3, "c": None}))
+
+    def test__returns_empty_dict_when_unchanged(self):
+        self.assertThat(get_changes({"a": [1]}, {"a": [1]}), Equals({}))
+
+    def test__returns_none_when_fields_are_dropped(self):
+        self.assertThat(get_changes({"a": 1, "b": 2}, {"a": 1}), Is(None))
+
+
+class TestCollapseMessages(MAASTestCase):
+
+    def make_message(self, msg_type, action, data):
+        return {
+            "type": msg_type, "name": "machine",
+            "action": action, "data": data,
+        }
+
+    def test__keeps_created_object_as_created(self):
+        self.assertThat(
+            collapse_messages(
+                self.make_message(MSG_TYPE.NOTIFY, "create", {"a": 1}),
+                self.make_message(MSG_TYPE.NOTIFY, "update", {"a": 2})),
+            Equals(self.make_message(MSG_TYPE.NOTIFY, "create", {"a": 2})))
+
+    def test__merges_patch_into_previous_message(self):
+        self.assertThat(
+            collapse_messages(
+                self.make_message(MSG_TYPE.NOTIFY, "update", {"a": 1}),
+                self.make_message(MSG_TYPE.PATCH, "update", {"b": 2})),
+            Equals(self.make_message(
+                MSG_TYPE.NOTIFY, "update", {"a": 1, "b": 2})))
+
+    def test__replaces_previous_message_with_delete(self):
+        delete = self.make_message(MSG_TYPE.NOTIFY, "delete", "abc")
+        self.assertThat(
+            collapse_messages(
+                self.make_message(MSG_TYPE.PATCH, "update", {"a": 1}),
+                delete),
+            Equals(delete))
+
 
 class MakeProtocolFactoryMixin:
 
@@ -681,6 +1066,7 @@ class MakeProtocolFactoryMixin:
         protocol = factory.buildProtocol(None)
         protocol.transport = MagicMock()
         protocol.transport.cookies = b""
+        protocol.transport.uri = b""
         if user is None:
             user = maas_factory.make_User()
         mock_authenticate = self.patch(protocol, "authenticate")
@@ -819,6 +1205,18 @@ class TestWebSocketFactory(MAASTestCase, MakeProtocolFactoryMixin):
         self.assertItemsEqual(
             ALL_NOTIFIERS, factory.listener.listeners.keys())
 
+    def test_registerNotifiers_registers_batch_handlers(self):
+        factory = self.make_factory()
+        [handler] = [
+            handler
+            for handler in factory.listener.listeners["machine"]
+            if isinstance(handler, BatchHandler)
+        ]
+        self.expectThat(handler.handler.func, Equals(factory.onNotifyMany))
+        self.expectThat(
+            handler.handler.args,
+            Equals((factory.getHandler("machine"), "machine")))
+
 
 class TestWebSocketFactoryTransactional(
         MAASTransactionServerTestCase, MakeProtocolFactoryMixin):
@@ -885,7 +1283,57 @@ class TestWebSocketFactoryTransactional(
         yield factory.onNotify(
             mock_class, sentinel.channel, action, sentinel.obj_id)
         self.assertThat(
-            mock_sendNotify, MockCalledWith(name, action, data))
+            mock_sendNotify, MockCalledWith(name, action, data, {}))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotify_shares_cache_between_clients(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        other_protocol, _ = self.make_protocol_with_factory(user=user)
+        factory.clients.append(other_protocol)
+        mock_class = MagicMock()
+        mock_class.return_value.on_listen.return_value = None
+        mock_processNotify = self.patch(factory, "processNotify")
+        mock_processNotify.return_value = None
+        yield factory.onNotify(
+            mock_class, sentinel.channel, sentinel.action, sentinel.obj_id)
+        [first_call, second_call] = mock_processNotify.call_args_list
+        self.expectThat(first_call[0][-1], Equals({}))
+        self.expectThat(second_call[0][-1], Is(first_call[0][-1]))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotifyMany_calls_sendNotify_for_each_message(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        mock_class = MagicMock()
+        mock_class.return_value.on_listen_many.return_value = [
+            ("machine", "update", sentinel.data),
+            ("machine", "create", sentinel.other_data),
+        ]
+        mock_sendNotify = self.patch(protocol, "sendNotify")
+        yield factory.onNotifyMany(
+            mock_class, sentinel.channel, "update", sentinel.obj_ids)
+        self.expectThat(
+            mock_class.return_value.on_listen_many,
+            MockCalledOnceWith(sentinel.channel, "update", sentinel.obj_ids))
+        self.expectThat(mock_sendNotify, MockCallsMatch(
+            call("machine", "update", sentinel.data, {}),
+            call("machine", "create", sentinel.other_data, {})))
+
+    @wait_for_reactor
+    @inlineCallbacks
+    def test_onNotify_records_notify_statistics(self):
+        user = yield deferToDatabase(self.make_user)
+        protocol, factory = self.make_protocol_with_factory(user=user)
+        mock_class = MagicMock()
+        mock_class.return_value.on_listen.return_value = None
+        mock_record = self.patch(protocol_module, "record_notify")
+        yield factory.onNotify(
+            mock_class, sentinel.channel, sentinel.action, sentinel.obj_id)
+        self.assertThat(
+            mock_record, MockCalledOnceWith(sentinel.channel, ANY, 0))
 
     @wait_for_reactor
     @inlineCallbacks
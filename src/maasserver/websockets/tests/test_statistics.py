@@ -0,0 +1,122 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for `maasserver.websockets.statistics`."""
+
+__all__ = []
+
+from django.db import connection
+from maasserver.models import Node
+from maasserver.testing.testcase import MAASServerTestCase
+from maasserver.websockets.statistics import (
+    get_websocket_statistics,
+    Histogram,
+    Measurement,
+    record_notify,
+    record_queries,
+    record_request,
+    record_request_error,
+    reset_websocket_statistics,
+)
+from maastesting.testcase import MAASTestCase
+from testtools.matchers import (
+    Equals,
+    GreaterThan,
+    Is,
+)
+
+
+class TestHistogram(MAASTestCase):
+
+    def test_counts_values_in_buckets(self):
+        histogram = Histogram((1, 10))
+        for value in (0, 1, 2, 10, 11, 100):
+            histogram.observe(value)
+        self.assertThat(histogram.as_dict(), Equals({
+            "buckets": {"1": 2, "10": 2, "+Inf": 2},
+            "count": 6,
+            "sum": 124,
+            "max": 100,
+        }))
+
+    def test_empty(self):
+        histogram = Histogram((0.5,))
+        self.assertThat(histogram.as_dict(), Equals({
+            "buckets": {"0.5": 0, "+Inf": 0},
+            "count": 0,
+            "sum": 0,
+            "max": 0,
+        }))
+
+
+class TestWebSocketStatistics(MAASTestCase):
+
+    def setUp(self):
+        super(TestWebSocketStatistics, self).setUp()
+        reset_websocket_statistics()
+        self.addCleanup(reset_websocket_statistics)
+
+    def test_empty(self):
+        self.assertThat(get_websocket_statistics(), Equals({
+            "requests": {},
+            "notifications": {},
+        }))
+
+    def test_records_requests_by_handler_and_method(self):
+        record_request("machine", "list", 0.2, 5000)
+        record_request("machine", "list", 0.3, 100)
+        record_queries("machine", "list", 7)
+        record_request_error("machine", "get")
+        requests = get_websocket_statistics()["requests"]
+        self.assertThat(
+            sorted(requests), Equals(["machine.get", "machine.list"]))
+        machine_list = requests["machine.list"]
+        self.expectThat(machine_list["seconds"]["count"], Equals(2))
+        self.expectThat(machine_list["seconds"]["max"], Equals(0.3))
+        self.expectThat(machine_list["response_bytes"]["sum"], Equals(5100))
+        self.expectThat(machine_list["queries"]["sum"], Equals(7))
+        self.expectThat(machine_list["errors"], Equals(0))
+        self.expectThat(requests["machine.get"]["errors"], Equals(1))
+
+    def test_records_notifications_by_channel(self):
+        record_notify("machine", 0.01, 3)
+        record_notify("machine", 0.02, 5)
+        notifications = get_websocket_statistics()["notifications"]
+        self.assertThat(list(notifications), Equals(["machine"]))
+        self.expectThat(
+            notifications["machine"]["seconds"]["count"], Equals(2))
+        self.expectThat(notifications["machine"]["queries"]["sum"], Equals(8))
+
+    def test_reset_forgets_statistics(self):
+        record_request("machine", "list", 0.2, 5000)
+        record_notify("machine", 0.01, 3)
+        reset_websocket_statistics()
+        self.assertThat(get_websocket_statistics(), Equals({
+            "requests": {},
+            "notifications": {},
+        }))
+
+
+class TestMeasurement(MAASServerTestCase):
+
+    def test_measures_queries_and_time(self):
+        with Measurement() as measurement:
+            list(Node.objects.all())
+            list(Node.objects.all())
+        self.expectThat(measurement.queries, Equals(2))
+        self.expectThat(measurement.seconds, GreaterThan(0))
+
+    def test_restores_debug_cursor_and_empties_log(self):
+        with Measurement():
+            list(Node.objects.all())
+        self.expectThat(connection.force_debug_cursor, Is(False))
+        self.expectThat(list(connection.queries_log), Equals([]))
+
+    def test_keeps_log_already_in_use(self):
+        self.patch(connection, "force_debug_cursor", True)
+        list(Node.objects.all())
+        logged = len(connection.queries_log)
+        with Measurement() as measurement:
+            list(Node.objects.all())
+        self.expectThat(measurement.queries, Equals(1))
+        self.expectThat(len(connection.queries_log), Equals(logged + 1))
@@ -12,15 +12,25 @@ HyBi-07 (http://tools.ietf.org/html/draft-ietf-hybi-thewebsocketprotocol-07),
 which are drafts of RFC 6455.
 """
 
+from itertools import cycle
+import os
+import zlib
+
 from maasserver.websockets.websockets import (
     _makeAccept,
     _makeFrame,
+    _frameSize,
     _mask,
+    _parseExtensions,
     _parseFrames,
+    _parseFramesWithFlags,
+    _parseProtocols,
     _WSException,
+    _WSMessageTooBig,
     CONTROLS,
     IWebSocketsFrameReceiver,
     lookupProtocolForFactory,
+    PerMessageDeflate,
     STATUSES,
     WebSocketsProtocol,
     WebSocketsProtocolWrapper,
@@ -56,6 +66,14 @@ from zope.interface import implementer
 from zope.interface.verify import verifyObject
 
 
+def deflate(data):
+    """Compress `data` as a client does for permessage-deflate."""
+    compressor = zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-4]
+
+
 class DummyRequest(DummyRequestBase):
 
     content = None
@@ -106,6 +124,55 @@ class TestFrameHelpers(MAASTestCase):
         key = b"\x37\xfa\x21\x3d"
         self.assertEqual(_mask(b"Hello", key), b"\x7f\x9f\x4d\x51\x58")
 
+    def test_maskLong(self):
+        """
+        Masking a long buffer XORs every byte with the matching key byte,
+        including leading zeros in the result.
+        """
+        key = b"\x00" + os.urandom(3)
+        buf = b"\x00" + os.urandom(1000)
+        self.assertEqual(
+            bytes(b ^ k for b, k in zip(buf, cycle(key))), _mask(buf, key))
+
+    def test_maskEmpty(self):
+        """
+        Masking an empty buffer returns an empty buffer.
+        """
+        self.assertEqual(b"", _mask(b"", b"abcd"))
+
+    def test_frameSize(self):
+        """
+        L{_frameSize} returns the size of a whole frame from its header.
+        """
+        self.assertEqual(7, _frameSize(b"\x81\x05"))
+        self.assertEqual(204, _frameSize(b"\x81\x7e\x00\xc8"))
+        self.assertEqual(
+            100010, _frameSize(b"\x81\x7f\x00\x00\x00\x00\x00\x01\x86\xa0"))
+        self.assertEqual(11, _frameSize(b"\x81\x85"))
+
+    def test_frameSizePartialHeader(self):
+        """
+        L{_frameSize} returns C{None} when more of the header is needed.
+        """
+        self.assertIsNone(_frameSize(b"\x81"))
+        self.assertIsNone(_frameSize(b"\x81\x7e\x00"))
+        self.assertIsNone(_frameSize(b"\x81\x7f\x00\x00"))
+
+    def test_parseChunkedPartialFrame(self):
+        """
+        L{_parseFrames} leaves the chunks of an incomplete frame as they are,
+        without joining them, and parses the frame once it is complete.
+        """
+        chunks = [b"\x81\x7e\x00\xc8", b"x" * 100, b"x" * 50]
+        frame = list(chunks)
+        self.assertEqual([], list(_parseFrames(frame, needMask=False)))
+        self.assertEqual(chunks, frame)
+        frame.append(b"x" * 50)
+        self.assertEqual(
+            [(CONTROLS.TEXT, b"x" * 200, True)],
+            list(_parseFrames(frame, needMask=False)))
+        self.assertEqual([], frame)
+
     def test_parseUnmaskedText(self):
         """
         A sample unmasked frame of "Hello" from HyBi-10, 4.7.
@@ -338,6 +405,229 @@ class TestFrameHelpers(MAASTestCase):
         buf = _makeFrame(b"Hello", CONTROLS.TEXT, True, mask=b"7\xfa!=")
         self.assertEqual(frame, buf)
 
+    def test_makeCompressedFrame(self):
+        """
+        L{_makeFrame} sets the I{RSV1} flag on compressed frames.
+        """
+        frame = b"\xc1\x05Hello"
+        buf = _makeFrame(b"Hello", CONTROLS.TEXT, True, compressed=True)
+        self.assertEqual(frame, buf)
+
+    def test_parseCompressedFrame(self):
+        """
+        L{_parseFramesWithFlags} accepts the I{RSV1} flag when compressed
+        frames are allowed, and says which frames have it.
+        """
+        frame = [b"\xc1\x05Hello\x81\x05Hello"]
+        frames = list(_parseFramesWithFlags(
+            frame, needMask=False, allowCompressed=True))
+        self.assertEqual([
+            (CONTROLS.TEXT, b"Hello", True, True),
+            (CONTROLS.TEXT, b"Hello", True, False),
+            ], frames)
+
+    def test_parseCompressedFrameNotAllowed(self):
+        """
+        L{_parseFrames} raises a L{_WSException} error when a frame has the
+        I{RSV1} flag but compression has not been negotiated.
+        """
+        frame = [b"\xc1\x05Hello"]
+        error = self.assertRaises(
+            _WSException, list, _parseFrames(frame, needMask=False))
+        self.assertEqual("Reserved flag in frame (193)", str(error))
+
+    def test_parseCompressedControlFrame(self):
+        """
+        L{_parseFramesWithFlags} raises a L{_WSException} error when a control
+        frame has the I{RSV1} flag.
+        """
+        frame = [b"\xc9\x05Hello"]
+        error = self.assertRaises(
+            _WSException, list, _parseFramesWithFlags(
+                frame, needMask=False, allowCompressed=True))
+        self.assertEqual("Reserved flag in frame (201)", str(error))
+
+
+class PerMessageDeflateTest(MAASTestCase):
+    """
+    Tests for L{PerMessageDeflate} and L{_parseExtensions}.
+    """
+
+    def test_parseExtensions(self):
+        """
+        L{_parseExtensions} parses the offers in every header value, with
+        their parameters.
+        """
+        self.assertEqual([
+            (b"permessage-deflate", [
+                (b"client_max_window_bits", None),
+                (b"server_max_window_bits", b"10"),
+            ]),
+            (b"permessage-deflate", []),
+            (b"x-webkit-deflate-frame", []),
+            ], _parseExtensions([
+                b"permessage-deflate; client_max_window_bits; "
+                b"server_max_window_bits=\"10\", permessage-deflate",
+                b"x-webkit-deflate-frame"]))
+
+    def test_parseExtensionsNone(self):
+        """
+        L{_parseExtensions} returns an empty list without headers.
+        """
+        self.assertEqual([], _parseExtensions(None))
+
+    def test_negotiate(self):
+        """
+        L{PerMessageDeflate.negotiate} accepts a plain offer with the default
+        settings.
+        """
+        deflate = PerMessageDeflate.negotiate(
+            [(b"permessage-deflate", [(b"client_max_window_bits", None)])])
+        self.assertEqual(b"permessage-deflate", deflate.makeResponse())
+
+    def test_negotiateParameters(self):
+        """
+        L{PerMessageDeflate.negotiate} accepts the client's parameters and
+        includes them in the response.
+        """
+        deflate = PerMessageDeflate.negotiate([(b"permessage-deflate", [
+            (b"server_no_context_takeover", None),
+            (b"client_no_context_takeover", None),
+            (b"server_max_window_bits", b"10"),
+        ])])
+        self.assertEqual(
+            b"permessage-deflate; server_no_context_takeover; "
+            b"client_no_context_takeover; server_max_window_bits=10",
+            deflate.makeResponse())
+
+    def test_negotiateWithoutContextTakeover(self):
+        """
+        L{PerMessageDeflate.negotiate} turns off context takeover for both
+        sides when told to.
+        """
+        deflate = PerMessageDeflate.negotiate(
+            [(b"permessage-deflate", [])], contextTakeover=False)
+        self.assertEqual(
+            b"permessage-deflate; server_no_context_takeover; "
+            b"client_no_context_takeover",
+            deflate.makeResponse())
+
+    def test_negotiateDeclinesInvalidOffers(self):
+        """
+        L{PerMessageDeflate.negotiate} declines offers with unknown,
+        duplicated, or unsupported parameters, and accepts the next one.
+        """
+        deflate = PerMessageDeflate.negotiate([
+            (b"x-webkit-deflate-frame", []),
+            (b"permessage-deflate", [(b"unknown", None)]),
+            (b"permessage-deflate", [
+                (b"server_no_context_takeover", None),
+                (b"server_no_context_takeover", None),
+            ]),
+            (b"permessage-deflate", [(b"server_max_window_bits", b"8")]),
+            (b"permessage-deflate", [(b"server_max_window_bits", None)]),
+            (b"permessage-deflate", [(b"server_max_window_bits", b"12")]),
+        ])
+        self.assertEqual(
+            b"permessage-deflate; server_max_window_bits=12",
+            deflate.makeResponse())
+
+    def test_negotiateNoOffer(self):
+        """
+        L{PerMessageDeflate.negotiate} returns C{None} when there is no
+        acceptable offer.
+        """
+        self.assertIsNone(PerMessageDeflate.negotiate(
+            [(b"permessage-deflate", [(b"unknown", None)])]))
+
+    def test_compressRoundTrip(self):
+        """
+        Messages compressed by L{PerMessageDeflate.compress} decompress to the
+        original messages.
+        """
+        deflate = PerMessageDeflate()
+        messages = [b'{"hostname": "%d"}' % index for index in range(5)]
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.assertEqual(messages, [
+            decompressor.decompress(
+                deflate.compress(message) + b"\0\0\xff\xff")
+            for message in messages
+            ])
+
+    def test_compressWithContextTakeover(self):
+        """
+        With context takeover, a repeated message compresses to less than the
+        first, as it refers back to it.
+        """
+        deflate = PerMessageDeflate()
+        message = b'{"hostname": "machine", "status": "Deployed"}' * 10
+        first = deflate.compress(message)
+        self.assertLess(len(deflate.compress(message)), len(first))
+
+    def test_compressWithoutContextTakeover(self):
+        """
+        Without context takeover, every message is compressed on its own.
+        """
+        deflate = PerMessageDeflate(contextTakeover=False)
+        message = b'{"hostname": "machine", "status": "Deployed"}' * 10
+        first = deflate.compress(message)
+        self.assertEqual(first, deflate.compress(message))
+        self.assertEqual(
+            message,
+            zlib.decompressobj(-zlib.MAX_WBITS).decompress(
+                first + b"\0\0\xff\xff"))
+
+    def test_decompressFragments(self):
+        """
+        L{PerMessageDeflate.decompress} decompresses messages split over
+        several frames, keeping its context between messages.
+        """
+        deflate = PerMessageDeflate()
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = []
+        for message in (b"Hello", b"Hello"):
+            compressed = compressor.compress(message)
+            compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+            compressed = compressed[:-4]
+            data.append(
+                deflate.decompress(compressed[:2], False) +
+                deflate.decompress(compressed[2:], True))
+        self.assertEqual([b"Hello", b"Hello"], data)
+
+    def test_decompressInvalidData(self):
+        """
+        L{PerMessageDeflate.decompress} raises a L{_WSException} for data that
+        is not deflated.
+        """
+        deflate = PerMessageDeflate()
+        self.assertRaises(
+            _WSException, deflate.decompress, b"\xff\xff\xff", True)
+
+    def test_decompressTooBig(self):
+        """
+        L{PerMessageDeflate.decompress} raises a L{_WSMessageTooBig} for a
+        message that decompresses to more than C{maxMessageSize} bytes.
+        """
+        deflate_ = PerMessageDeflate()
+        deflate_.maxMessageSize = 100
+        self.assertEqual(
+            b"x" * 100, deflate_.decompress(deflate(b"x" * 100), True))
+        self.assertRaises(
+            _WSMessageTooBig, deflate_.decompress, deflate(b"x" * 101), True)
+
+    def test_decompressFragmentsTooBig(self):
+        """
+        L{PerMessageDeflate.decompress} counts the size of a message across
+        all its frames.
+        """
+        deflate_ = PerMessageDeflate()
+        deflate_.maxMessageSize = 100
+        data = deflate(b"x" * 101)
+        deflate_.decompress(data[:2], False)
+        self.assertRaises(
+            _WSMessageTooBig, deflate_.decompress, data[2:], True)
+
 
 @implementer(IWebSocketsFrameReceiver)
 class SavingEchoReceiver(object):
@@ -412,6 +702,64 @@ class WebSocketsProtocolTest(MAASTestCase):
         self.protocol.dataReceived(b"\x72\x05")
         self.assertFalse(self.transport.connected)
 
+    def test_compressedFrameReceived(self):
+        """
+        When permessage-deflate has been negotiated, compressed messages are
+        decompressed, even when fragmented, and long messages are sent back
+        compressed.
+        """
+        receiver = SavingEchoReceiver()
+        protocol = WebSocketsProtocol(receiver)
+        protocol._deflate = PerMessageDeflate()
+        transport = StringTransportWithDisconnection()
+        protocol.makeConnection(transport)
+        transport.protocol = protocol
+        message = b"Hello" * 20
+        data = deflate(message)
+        protocol.dataReceived(
+            _makeFrame(data[:3], CONTROLS.TEXT, False, mask=b"abcd",
+                       compressed=True) +
+            _makeFrame(data[3:], CONTROLS.CONTINUE, True, mask=b"abcd") +
+            _makeFrame(data, CONTROLS.TEXT, True, mask=b"abcd",
+                       compressed=True))
+        self.assertEqual(
+            [(CONTROLS.TEXT, False), (CONTROLS.CONTINUE, True),
+             (CONTROLS.TEXT, True)],
+            [(opcode, fin) for opcode, _, fin in receiver.received])
+        [first, rest, second] = [data for _, data, _ in receiver.received]
+        self.assertEqual(message, first + rest)
+        self.assertEqual(message, second)
+        # The whole echoed message is sent back compressed.
+        [_, (opcode, data, fin, compressed)] = _parseFramesWithFlags(
+            [transport.value()], needMask=False, allowCompressed=True)
+        self.assertEqual(
+            (CONTROLS.TEXT, True, True), (opcode, fin, compressed))
+        self.assertEqual(
+            message,
+            zlib.decompressobj(-zlib.MAX_WBITS).decompress(
+                data + b"\0\0\xff\xff"))
+
+    def test_compressedFrameTooBig(self):
+        """
+        When a compressed message decompresses to more than the allowed size,
+        the connection is closed with C{MESSAGE_TOO_BIG}.
+        """
+        receiver = SavingEchoReceiver()
+        protocol = WebSocketsProtocol(receiver)
+        protocol._deflate = PerMessageDeflate()
+        protocol._deflate.maxMessageSize = 100
+        transport = StringTransportWithDisconnection()
+        protocol.makeConnection(transport)
+        transport.protocol = protocol
+        with TwistedLoggerFixture():
+            protocol.dataReceived(_makeFrame(
+                deflate(b"x" * 1000), CONTROLS.TEXT, True, mask=b"abcd",
+                compressed=True))
+        self.assertEqual([], receiver.received)
+        self.assertEqual(
+            b"\x88\x02\x03\xf1", transport.value())
+        self.assertFalse(transport.connected)
+
 
 class WebSocketsTransportTest(MAASTestCase):
     """
@@ -443,6 +791,23 @@ class WebSocketsTransportTest(MAASTestCase):
         webSocketsTranport.loseConnection(STATUSES.GOING_AWAY, b"Going away")
         self.assertEqual(b"\x88\x0c\x03\xe9Going away", transport.value())
 
+    def test_sendFrameCompressed(self):
+        """
+        L{WebSocketsTransport.sendFrame} compresses whole data messages when
+        permessage-deflate has been negotiated, but not short ones.
+        """
+        transport = StringTransportWithDisconnection()
+        transport.protocol = Protocol()
+        webSocketsTranport = WebSocketsTransport(
+            transport, PerMessageDeflate())
+        message = b"x" * 200
+        webSocketsTranport.sendFrame(CONTROLS.TEXT, b"Hello", True)
+        webSocketsTranport.sendFrame(CONTROLS.TEXT, message, True)
+        self.assertEqual(
+            b"\x81\x05Hello" + _makeFrame(
+                deflate(message), CONTROLS.TEXT, True, compressed=True),
+            transport.value())
+
 
 class WebSocketsProtocolWrapperTest(MAASTestCase):
     """
@@ -657,6 +1022,92 @@ class WebSocketsResourceTest(MAASTestCase):
         self.assertEqual([b""], request.written)
         self.assertEqual(101, request.responseCode)
 
+    def test_parseProtocols(self):
+        """
+        L{_parseProtocols} returns the names in every header value, in order.
+        """
+        self.assertEqual(
+            [b"foo", b"bar", b"baz"],
+            _parseProtocols([b"foo, bar", b"baz,"]))
+        self.assertEqual([], _parseProtocols(None))
+
+    def test_lookupProtocolForFactorySelectsSubprotocol(self):
+        """
+        The C{lookupProtocol} from L{lookupProtocolForFactory} accepts the
+        subprotocol that the protocol's C{selectSubprotocol} returns.
+        """
+        selected = []
+
+        class SubprotocolProtocol(Protocol):
+
+            def selectSubprotocol(self, names):
+                selected.append(names)
+                return b"bar"
+
+        factory = Factory.forProtocol(SubprotocolProtocol)
+        request = DummyRequest(b"/")
+        request.transport = StringTransportWithDisconnection()
+        protocol, name = lookupProtocolForFactory(factory)(
+            [b"foo, bar"], request)
+        self.assertIsInstance(protocol, SubprotocolProtocol)
+        self.assertEqual(b"bar", name)
+        self.assertEqual([[b"foo", b"bar"]], selected)
+
+    def makeDeflateRequest(self):
+        request = DummyRequest(b"/")
+        request.requestHeaders = Headers()
+        transport = StringTransportWithDisconnection()
+        transport.protocol = Protocol()
+        request.transport = transport
+        self.update_headers(request, headers={
+            b"upgrade": b"Websocket",
+            b"connection": b"Upgrade",
+            b"sec-websocket-key": b"secure",
+            b"sec-websocket-version": b"13",
+            b"sec-websocket-extensions": (
+                b"permessage-deflate; client_max_window_bits")})
+        return request, transport
+
+    def test_renderDeflate(self):
+        """
+        L{WebSocketsResource} accepts a permessage-deflate offer, and gives
+        the negotiated extension to the protocol.
+        """
+        request, transport = self.makeDeflateRequest()
+        result = self.resource.render(request)
+        self.assertEqual(NOT_DONE_YET, result)
+        self.assertEqual(
+            [b"permessage-deflate"],
+            request.responseHeaders.getRawHeaders(b"Sec-WebSocket-Extensions"))
+        self.assertIsInstance(self.echoProtocol._deflate, PerMessageDeflate)
+        self.assertTrue(self.echoProtocol._deflate.contextTakeover)
+
+    def test_renderDeflateWithoutContextTakeover(self):
+        """
+        L{WebSocketsResource} can be told not to keep compression contexts
+        between messages.
+        """
+        self.resource._contextTakeover = False
+        request, transport = self.makeDeflateRequest()
+        self.resource.render(request)
+        self.assertEqual(
+            [b"permessage-deflate; server_no_context_takeover; "
+             b"client_no_context_takeover"],
+            request.responseHeaders.getRawHeaders(b"Sec-WebSocket-Extensions"))
+        self.assertFalse(self.echoProtocol._deflate.contextTakeover)
+
+    def test_renderDeflateDisabled(self):
+        """
+        L{WebSocketsResource} does not negotiate permessage-deflate when
+        compression is turned off.
+        """
+        self.resource._deflate = False
+        request, transport = self.makeDeflateRequest()
+        self.resource.render(request)
+        self.assertIsNone(
+            request.responseHeaders.getRawHeaders(b"Sec-WebSocket-Extensions"))
+        self.assertIsNone(self.echoProtocol._deflate)
+
     def test_renderWrongUpgrade(self):
         """
         If the C{Upgrade} header contains an invalid value,
@@ -1,4 +1,4 @@
-# Copyright 2015 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 #
 # Copyright (c) Twisted Matrix Laboratories.
@@ -12,20 +12,22 @@ factory.
 
 __all__ = ["WebSocketsResource", "IWebSocketsFrameReceiver",
            "lookupProtocolForFactory", "WebSocketsProtocol",
-           "WebSocketsProtocolWrapper", "CONTROLS", "STATUSES"]
+           "WebSocketsProtocolWrapper", "CONTROLS", "STATUSES",
+           "PerMessageDeflate"]
 
 
 import base64
 from hashlib import sha1
-from itertools import cycle
 from struct import (
     pack,
     unpack,
 )
 from typing import (
     List,
+    Optional,
     Sequence,
 )
+import zlib
 
 from provisioningserver.logger import LegacyLogger
 from provisioningserver.utils import typed
@@ -54,6 +56,12 @@ class _WSException(Exception):
     """
 
 
+class _WSMessageTooBig(_WSException):
+    """
+    A compressed message decompressed to more than the allowed size.
+    """
+
+
 class CONTROLS(Values):
     """
     Control frame specifiers.
@@ -93,6 +101,9 @@ class STATUSES(Values):
 # The GUID for WebSockets, from RFC 6455.
 _WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
 
+# The opcodes of frames that start a message, which may be compressed.
+_DATA_OPCODES = frozenset({CONTROLS.TEXT, CONTROLS.BINARY})
+
 
 @typed
 def _makeAccept(key: bytes) -> bytes:
@@ -123,11 +134,18 @@ def _mask(buf: bytes, key: bytes) -> bytes:
     @rtype: C{str}
     @return: A masked buffer of bytes.
     """
-    return bytes((b ^ k) for b, k in zip(buf, cycle(key)))
+    # XOR the buffer and the repeated key as two big integers, which
+    # CPython does a machine word at a time instead of byte by byte.
+    length = len(buf)
+    keys = key * (length // 4 + 1)
+    masked = int.from_bytes(buf, "big") ^ int.from_bytes(keys[:length], "big")
+    return masked.to_bytes(length, "big")
 
 
 @typed
-def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
+def _makeFrame(
+        buf: bytes, opcode, fin: bool, mask: bytes=None,
+        compressed: bool=False) -> bytes:
     """
     Make a frame.
 
@@ -146,6 +164,10 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
     @type mask: C{bytes} or C{NoneType}
     @param mask: If specified, the masking key to apply on the created frame.
 
+    @type compressed: C{bool}
+    @param compressed: Whether or not C{buf} is compressed with
+        permessage-deflate, which sets the I{RSV1} flag.
+
     @rtype: C{bytes}
     @return: A packed frame.
     """
@@ -169,6 +191,9 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
     else:
         header = 0x01
 
+    if compressed:
+        header |= 0x40
+
     header = bytes([header | opcode.value])
     if mask is not None:
         buf = b"%s%s" % (mask, _mask(buf, mask))
@@ -176,6 +201,36 @@ def _makeFrame(buf: bytes, opcode, fin: bool, mask: bytes=None) -> bytes:
     return frame
 
 
+@typed
+def _frameSize(header: bytes) -> Optional[int]:
+    """
+    Return the size of the frame that starts with C{header}.
+
+    @param header: At least the first two bytes of a frame; up to 14 bytes
+        may be needed to find the size.
+
+    @return: The size of the whole frame, in bytes, or C{None} if more of
+        the header is needed.
+    """
+    if len(header) < 2:
+        return None
+    length = header[1] & 0x7f
+    offset = 2
+    if length == 0x7e:
+        if len(header) < 4:
+            return None
+        length = unpack(">H", header[2:4])[0]
+        offset += 2
+    elif length == 0x7f:
+        if len(header) < 10:
+            return None
+        length = unpack(">Q", header[2:10])[0]
+        offset += 8
+    if header[1] & 0x80:
+        offset += 4
+    return offset + length
+
+
 @typed
 def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
     """
@@ -188,6 +243,35 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
     @param needMask: If C{True}, refuse any frame which is not masked.
     @type needMask: C{bool}
     """
+    for opcode, data, fin, _ in _parseFramesWithFlags(frameBuffer, needMask):
+        yield opcode, data, fin
+
+
+@typed
+def _parseFramesWithFlags(
+        frameBuffer: List[bytes], needMask: bool=True,
+        allowCompressed: bool=False):
+    """
+    Parse frames like L{_parseFrames}, also yielding whether each frame is
+    compressed, i.e. has the I{RSV1} flag set.
+
+    @param allowCompressed: If C{True}, accept the I{RSV1} flag on frames
+        that start a data message, as negotiated by permessage-deflate.
+    @type allowCompressed: C{bool}
+    """
+    if len(frameBuffer) > 1:
+        # Joining the buffer copies all of it, so only do that once it holds
+        # a whole frame. Otherwise a large frame that arrives in many chunks
+        # is copied again for every chunk.
+        header = b""
+        for chunk in frameBuffer:
+            header += chunk[:14 - len(header)]
+            if len(header) == 14:
+                break
+        size = _frameSize(header)
+        if size is None or sum(map(len, frameBuffer)) < size:
+            return
+
     start = 0
     payload = b"".join(frameBuffer)
 
@@ -198,11 +282,12 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
 
         # Grab the header. This single byte holds some flags and an opcode
         header = payload[start]
-        if header & 0x70:
+        if header & 0x30 or (header & 0x40 and not allowCompressed):
             # At least one of the reserved flags is set. Pork chop sandwiches!
             raise _WSException("Reserved flag in frame (%d)" % (header,))
 
         fin = header & 0x80
+        compressed = header & 0x40
 
         # Get the opcode, and translate it to a local enum which we actually
         # care about.
@@ -212,6 +297,11 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
         except ValueError:
             raise _WSException("Unknown opcode %d in frame" % opcode)
 
+        if compressed and opcode not in _DATA_OPCODES:
+            # 6.1 of RFC 7692: only the first frame of a data message may be
+            # marked as compressed.
+            raise _WSException("Reserved flag in frame (%d)" % (header,))
+
         # Get the payload length and determine whether we need to look for an
         # extra length.
         length = payload[start + 1]
@@ -271,7 +361,7 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
                 # No reason given; use generic data.
                 data = STATUSES.NONE, b""
 
-        yield opcode, data, bool(fin)
+        yield opcode, data, bool(fin), bool(compressed)
         start += offset + length
 
     if len(payload) > start:
@@ -280,6 +370,227 @@ def _parseFrames(frameBuffer: List[bytes], needMask: bool=True):
         frameBuffer[:] = []
 
 
+@typed
+def _parseExtensions(headers: Optional[Sequence]) -> list:
+    """
+    Parse I{Sec-WebSocket-Extensions} header values.
+
+    @param headers: The raw header values, or C{None}.
+
+    @rtype: C{list}
+    @return: A list of C{(name, parameters)} tuples, in order of preference,
+        where C{parameters} is a list of C{(name, value)} tuples. C{value} is
+        C{None} for parameters given without a value.
+    """
+    extensions = []
+    for header in headers or ():
+        for offer in header.split(b","):
+            name, *params = (part.strip() for part in offer.split(b";"))
+            if len(name) == 0:
+                continue
+            parsed = []
+            for param in params:
+                param_name, equals, value = param.partition(b"=")
+                value = value.strip().strip(b'"') if equals else None
+                parsed.append((param_name.strip().lower(), value))
+            extensions.append((name.lower(), parsed))
+    return extensions
+
+
+@typed
+def _parseProtocols(headers: Optional[Sequence]) -> list:
+    """
+    Parse I{Sec-WebSocket-Protocol} header values.
+
+    @param headers: The raw header values, or C{None}.
+
+    @rtype: C{list}
+    @return: The subprotocol names, in order of preference.
+    """
+    return [
+        name.strip()
+        for header in headers or ()
+        for name in header.split(b",")
+        if len(name.strip()) > 0
+    ]
+
+
+class PerMessageDeflate(object):
+    """
+    The permessage-deflate extension (RFC 7692) for one connection.
+
+    Messages are compressed with a raw deflate stream. With context takeover
+    the stream carries on from one message to the next, so later messages
+    can refer back to earlier ones. That compresses repetitive messages far
+    better, at the cost of keeping a compressor around for each connection.
+
+    @ivar contextTakeover: Whether or not the server keeps its compression
+        context between messages.
+
+    @ivar clientContextTakeover: Whether or not the client may keep its
+        compression context between messages.
+
+    @ivar windowBits: The base-two logarithm of the server's window size.
+    """
+
+    name = b"permessage-deflate"
+
+    # Messages shorter than this are sent uncompressed, which RFC 7692
+    # allows for any message.
+    minimumSize = 64
+
+    # The tail of a deflate block flushed with Z_SYNC_FLUSH, which 7.2.1
+    # says is removed from compressed messages.
+    _tail = b"\x00\x00\xff\xff"
+
+    # The most bytes a compressed message may decompress to. A few bytes of
+    # deflate data can expand to a great deal, all on the reactor thread.
+    maxMessageSize = 2 ** 24
+
+    def __init__(
+            self, contextTakeover=True, clientContextTakeover=True,
+            windowBits=zlib.MAX_WBITS, level=zlib.Z_DEFAULT_COMPRESSION):
+        self.contextTakeover = contextTakeover
+        self.clientContextTakeover = clientContextTakeover
+        self.windowBits = windowBits
+        self.level = level
+        self._compressor = None
+        self._decompressor = None
+        self._messageSize = 0
+
+    @classmethod
+    def negotiate(cls, extensions, contextTakeover=True):
+        """
+        Accept the first acceptable permessage-deflate offer.
+
+        @param extensions: Offers as returned by L{_parseExtensions}.
+
+        @param contextTakeover: If C{False}, neither side keeps its
+            compression context between messages, whatever the client
+            offered.
+
+        @rtype: L{PerMessageDeflate} or C{None}
+        @return: The negotiated extension, or C{None} if the client did not
+            offer an acceptable permessage-deflate.
+        """
+        for name, params in extensions:
+            if name != cls.name:
+                continue
+            names = [param for param, _ in params]
+            if len(set(names)) != len(names):
+                # 7 of RFC 7692: decline offers with duplicate parameters.
+                continue
+            params = dict(params)
+            deflate = cls(contextTakeover, contextTakeover)
+            try:
+                deflate._acceptParameters(params)
+            except ValueError:
+                # Decline this offer; the client may have made another.
+                continue
+            return deflate
+        return None
+
+    def _acceptParameters(self, params):
+        """
+        Apply the parameters of a client's offer.
+
+        @raise ValueError: If the offer cannot be accepted.
+        """
+        for name, value in params.items():
+            if name == b"server_no_context_takeover":
+                if value is not None:
+                    raise ValueError(name)
+                self.contextTakeover = False
+            elif name == b"client_no_context_takeover":
+                if value is not None:
+                    raise ValueError(name)
+                self.clientContextTakeover = False
+            elif name == b"server_max_window_bits":
+                # 7.1.2.1 of RFC 7692: this parameter must have a value.
+                if value is None:
+                    raise ValueError(name)
+                # zlib does not produce raw deflate streams with an 8 bit
+                # window, so offers limiting the server to one are declined.
+                bits = int(value)
+                if not 9 <= bits <= 15:
+                    raise ValueError(name)
+                self.windowBits = bits
+            elif name == b"client_max_window_bits":
+                # The client may use any window size; the decompressor's is
+                # large enough for all of them.
+                if value is not None and not 8 <= int(value) <= 15:
+                    raise ValueError(name)
+            else:
+                raise ValueError(name)
+
+    def makeResponse(self):
+        """
+        Return the I{Sec-WebSocket-Extensions} value accepting this offer.
+
+        @rtype: C{bytes}
+        """
+        params = [self.name]
+        if not self.contextTakeover:
+            params.append(b"server_no_context_takeover")
+        if not self.clientContextTakeover:
+            params.append(b"client_no_context_takeover")
+        if self.windowBits != zlib.MAX_WBITS:
+            params.append(b"server_max_window_bits=%d" % self.windowBits)
+        return b"; ".join(params)
+
+    @typed
+    def compress(self, data: bytes) -> bytes:
+        """
+        Compress a whole message.
+
+        @rtype: C{bytes}
+        @return: The payload of the message, without the trailing empty
+            block.
+        """
+        if self._compressor is None or not self.contextTakeover:
+            self._compressor = zlib.compressobj(
+                self.level, zlib.DEFLATED, -self.windowBits)
+        data = self._compressor.compress(data)
+        data += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data.endswith(self._tail):
+            data = data[:-len(self._tail)]
+        return data
+
+    @typed
+    def decompress(self, data: bytes, fin: bool) -> bytes:
+        """
+        Decompress a frame of a compressed message.
+
+        @param fin: Whether or not this is the final frame of the message.
+
+        @raise _WSException: If the data cannot be decompressed.
+
+        @raise _WSMessageTooBig: If the message decompresses to more than
+            C{maxMessageSize} bytes.
+        """
+        if self._decompressor is None:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        if fin:
+            data += self._tail
+        # Ask for one byte more than is allowed, so that going over the
+        # limit can be told apart from reaching it.
+        remaining = self.maxMessageSize - self._messageSize
+        try:
+            data = self._decompressor.decompress(data, remaining + 1)
+        except zlib.error as error:
+            raise _WSException("Invalid compressed data (%s)" % error)
+        if len(data) > remaining:
+            raise _WSMessageTooBig(
+                "Compressed message is larger than %d bytes" % (
+                    self.maxMessageSize))
+        self._messageSize = 0 if fin else self._messageSize + len(data)
+        if fin and self._decompressor.eof:
+            # The client ended the deflate stream with a final block, so the
+            # next message starts a new one.
+            self._decompressor = None
+        return data
+
+
 class IWebSocketsFrameReceiver(Interface):
     """
     An interface for receiving WebSockets frames.
@@ -322,8 +633,9 @@ class WebSocketsTransport(object):
 
     _disconnecting = False
 
-    def __init__(self, transport):
+    def __init__(self, transport, deflate=None):
         self._transport = transport
+        self._deflate = deflate
 
     @typed
     def sendFrame(self, opcode, data: bytes, fin: bool):
@@ -338,8 +650,16 @@ class WebSocketsTransport(object):
 
         @type fin: C{bool}
         @param fin: Whether or not we're sending a final frame.
+
+        Whole data messages are compressed when permessage-deflate has been
+        negotiated.
         """
-        packet = _makeFrame(data, opcode, fin)
+        compressed = (
+            self._deflate is not None and fin and opcode in _DATA_OPCODES and
+            len(data) >= self._deflate.minimumSize)
+        if compressed:
+            data = self._deflate.compress(data)
+        packet = _makeFrame(data, opcode, fin, compressed=compressed)
         self._transport.write(packet)
 
     @typed
@@ -383,9 +703,16 @@ class WebSocketsProtocol(Protocol):
     @ivar _buffer: The pending list of frames not processed yet.
     @type _buffer: C{list}
 
+    @ivar _deflate: The negotiated permessage-deflate extension, if any.
+    @type _deflate: L{PerMessageDeflate} or C{None}
+
     @since: 13.2
     """
     _buffer = None
+    _deflate = None
+
+    # Whether or not the message being received is compressed.
+    _compressedMessage = False
 
     def __init__(self, receiver):
         self._receiver = receiver
@@ -397,13 +724,21 @@ class WebSocketsProtocol(Protocol):
         peer = self.transport.getPeer()
         log.debug("Opening connection with {peer}", peer=peer)
         self._buffer = []
-        self._receiver.makeConnection(WebSocketsTransport(self.transport))
+        self._receiver.makeConnection(
+            WebSocketsTransport(self.transport, self._deflate))
 
     def _parseFrames(self):
         """
         Find frames in incoming data and pass them to the underlying protocol.
         """
-        for opcode, data, fin in _parseFrames(self._buffer):
+        frames = _parseFramesWithFlags(
+            self._buffer, allowCompressed=self._deflate is not None)
+        for opcode, data, fin, compressed in frames:
+            if opcode in _DATA_OPCODES:
+                self._compressedMessage = compressed
+            if self._compressedMessage and (
+                    opcode in _DATA_OPCODES or opcode == CONTROLS.CONTINUE):
+                data = self._deflate.decompress(data, fin)
             self._receiver.frameReceived(opcode, data, fin)
             if opcode == CONTROLS.CLOSE:
                 # The other side wants us to close.
@@ -433,6 +768,11 @@ class WebSocketsProtocol(Protocol):
         self._buffer.append(data)
         try:
             self._parseFrames()
+        except _WSMessageTooBig:
+            log.err()
+            data = pack(">H", STATUSES.MESSAGE_TOO_BIG.value)
+            self.transport.write(_makeFrame(data, CONTROLS.CLOSE, True))
+            self.transport.loseConnection()
         except _WSException:
             # Couldn't parse all the frames, something went wrong, let's bail.
             log.err()
@@ -590,12 +930,23 @@ class WebSocketsResource(object):
         L{lookupProtocolForFactory}.
     @type lookupProtocol: C{callable}.
 
+    @param deflate: Whether or not to negotiate permessage-deflate
+        compression (RFC 7692) when the client offers it.
+    @type deflate: C{bool}
+
+    @param contextTakeover: Whether or not compression contexts are kept
+        between messages. Keeping them compresses better, but holds a
+        compressor and decompressor in memory for every connection.
+    @type contextTakeover: C{bool}
+
     @since: 13.2
     """
     isLeaf = True
 
-    def __init__(self, lookupProtocol):
+    def __init__(self, lookupProtocol, deflate=True, contextTakeover=True):
         self._lookupProtocol = lookupProtocol
+        self._deflate = deflate
+        self._contextTakeover = contextTakeover
 
     def getChildWithDefault(self, name, request):
         """
@@ -695,6 +1046,17 @@ class WebSocketsResource(object):
         # 4.2.2.5.5 Optional codec declaration
         if protocolName:
             request.setHeader(b"Sec-WebSocket-Protocol", protocolName)
+        # 9.1 of RFC 6455: Optional extensions.
+        deflate = None
+        if self._deflate:
+            extensions = _parseExtensions(
+                request.requestHeaders.getRawHeaders(
+                    b"Sec-WebSocket-Extensions"))
+            deflate = PerMessageDeflate.negotiate(
+                extensions, self._contextTakeover)
+        if deflate is not None:
+            request.setHeader(
+                b"Sec-WebSocket-Extensions", deflate.makeResponse())
 
         # Provoke request into flushing headers and finishing the handshake.
         request.write(b"")
@@ -713,6 +1075,7 @@ class WebSocketsResource(object):
 
         if not isinstance(protocol, WebSocketsProtocol):
             protocol = WebSocketsProtocolWrapper(protocol)
+        protocol._deflate = deflate
 
         # Connect the transport to our factory, and make things go. We need to
         # do some stupid stuff here; see #3204, which could fix it.
@@ -746,14 +1109,20 @@ class WebSocketsResource(object):
 def lookupProtocolForFactory(factory):
     """
     Return a suitable C{lookupProtocol} argument for L{WebSocketsResource}
-    which ignores the protocol names and just return a protocol instance built
-    by C{factory}.
+    which returns a protocol instance built by C{factory}.
+
+    If the protocol has a C{selectSubprotocol} method, it is called with the
+    subprotocol names the client asked for, and returns the name of the one
+    it will speak, or C{None}.
 
     @since: 13.2
     """
 
     def lookupProtocol(protocolNames, request):
         protocol = factory.buildProtocol(request.transport.getPeer())
-        return protocol, None
+        selectSubprotocol = getattr(protocol, "selectSubprotocol", None)
+        if selectSubprotocol is None:
+            return protocol, None
+        return protocol, selectSubprotocol(_parseProtocols(protocolNames))
 
     return lookupProtocol
@@ -0,0 +1,546 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Native client for the OMAPI protocol, which amends objects inside the
+DHCP server.
+
+This does the same job as `Omshell`, but in-process: one authenticated
+connection is kept open to each DHCP server, and many requests can be in
+flight on it at once, rather than running an `omshell` process per host.
+"""
+
+__all__ = [
+    "get_omapi_client",
+    "OmapiClient",
+    "OmapiError",
+    "OmapiProtocolError",
+]
+
+import base64
+import hashlib
+import hmac
+from itertools import count
+from random import getrandbits
+import struct
+
+from netaddr import (
+    EUI,
+    IPAddress,
+)
+from provisioningserver.logger import get_maas_logger
+from twisted.internet.defer import (
+    CancelledError,
+    Deferred,
+    DeferredSemaphore,
+    inlineCallbacks,
+    returnValue,
+)
+from twisted.internet.endpoints import (
+    connectProtocol,
+    TCP4ClientEndpoint,
+)
+from twisted.internet.error import (
+    ConnectionDone,
+    TimeoutError,
+)
+from twisted.internet.protocol import Protocol
+
+
+maaslog = get_maas_logger("dhcp.omapi")
+
+
+OMAPI_PROTOCOL_VERSION = 100
+OMAPI_HEADER_SIZE = 24
+
+# Message opcodes.
+OMAPI_OP_OPEN = 1
+OMAPI_OP_REFRESH = 2
+OMAPI_OP_UPDATE = 3
+OMAPI_OP_NOTIFY = 4
+OMAPI_OP_STATUS = 5
+OMAPI_OP_DELETE = 6
+
+# ISC result codes that dhcpd reports in status messages.
+ISC_R_SUCCESS = 0
+ISC_R_EXISTS = 18
+ISC_R_NOTFOUND = 23
+ISC_R_IOERROR = 26
+
+# The name of the key in dhcpd.conf; see the DHCP templates.
+OMAPI_KEY_NAME = b"omapi_key"
+HMAC_MD5_ALGORITHM = b"hmac-md5.SIG-ALG.REG.INT."
+HMAC_MD5_SIGNATURE_SIZE = 16
+
+# How long to wait for the DHCP server to answer a request.
+OMAPI_REQUEST_TIMEOUT = 30
+
+# The most host operations to have in flight on one connection.
+OMAPI_MAX_IN_FLIGHT = 64
+
+
+class OmapiError(Exception):
+    """The DHCP server refused an OMAPI request."""
+
+    def __init__(self, message, result=None):
+        super(OmapiError, self).__init__(message)
+        self.result = result
+
+
+class OmapiProtocolError(Exception):
+    """The conversation with the DHCP server went wrong.
+
+    This covers malformed or unexpected messages, bad signatures, and failure
+    to authenticate; it does not mean that the request itself was refused.
+    """
+
+
+def pack_uint32(value):
+    return struct.pack("!I", value)
+
+
+def unpack_uint32(data):
+    [value] = struct.unpack("!I", data)
+    return value
+
+
+def pack_pairs(pairs):
+    """Pack a sequence of `(name, value)` byte-string pairs."""
+    packed = []
+    for name, value in pairs:
+        packed.append(struct.pack("!H", len(name)))
+        packed.append(name)
+        packed.append(struct.pack("!I", len(value)))
+        packed.append(value)
+    # A zero-length name ends the section.
+    packed.append(struct.pack("!H", 0))
+    return b"".join(packed)
+
+
+def unpack_pairs(data, offset):
+    """Unpack a sequence of `(name, value)` pairs from `data` at `offset`.
+
+    :return: A tuple of `(pairs, offset)` where `offset` is just past the
+        pairs, or `None` if `data` does not contain all of the pairs yet.
+    """
+    pairs = []
+    while True:
+        if len(data) < offset + 2:
+            return None
+        [name_length] = struct.unpack_from("!H", data, offset)
+        offset += 2
+        if name_length == 0:
+            return pairs, offset
+        if len(data) < offset + name_length + 4:
+            return None
+        name = bytes(data[offset:offset + name_length])
+        offset += name_length
+        [value_length] = struct.unpack_from("!I", data, offset)
+        offset += 4
+        if len(data) < offset + value_length:
+            return None
+        value = bytes(data[offset:offset + value_length])
+        offset += value_length
+        pairs.append((name, value))
+
+
+class HMACMD5Authenticator:
+    """Signs and verifies OMAPI messages with a HMAC-MD5 key."""
+
+    size = HMAC_MD5_SIGNATURE_SIZE
+
+    def __init__(self, secret, authid):
+        """
+        :param secret: The base64-encoded shared key.
+        :param authid: The handle of the authenticator object in the DHCP
+            server, which identifies the key in signed messages.
+        """
+        self.key = base64.b64decode(secret)
+        self.authid = authid
+
+    def sign(self, data):
+        return hmac.new(self.key, data, hashlib.md5).digest()
+
+
+class OmapiMessage:
+    """A message in the OMAPI protocol.
+
+    :ivar message: A list of `(name, value)` pairs describing the request.
+    :ivar obj: A list of `(name, value)` pairs for the object's attributes.
+    """
+
+    def __init__(
+            self, opcode, handle=0, tid=0, rid=0, message=(), obj=(),
+            authid=0, signature=b""):
+        self.opcode = opcode
+        self.handle = handle
+        self.tid = tid
+        self.rid = rid
+        self.message = list(message)
+        self.obj = list(obj)
+        self.authid = authid
+        self.signature = signature
+
+    @classmethod
+    def open(cls, typename, message=(), obj=()):
+        """Return a message that opens (or creates) an object."""
+        return cls(
+            OMAPI_OP_OPEN, message=[(b"type", typename), *message], obj=obj)
+
+    def get_message_value(self, name):
+        """Return the value of `name` in the message section, or `None`."""
+        for key, value in self.message:
+            if key == name:
+                return value
+        return None
+
+    @property
+    def result(self):
+        """The result code of a status message, or `None`."""
+        result = self.get_message_value(b"result")
+        return None if result is None else unpack_uint32(result)
+
+    @property
+    def error_message(self):
+        """The text of a status message, or the result code if none."""
+        text = self.get_message_value(b"message")
+        if text is None:
+            return "result %s" % self.result
+        else:
+            return text.decode("utf-8", "replace")
+
+    def pack(self, for_signing=False):
+        """Return the message as bytes.
+
+        The data that is signed excludes the `authid` and the signature.
+        """
+        packed = [
+            struct.pack(
+                "!IIIII", len(self.signature), self.opcode, self.handle,
+                self.tid, self.rid),
+            pack_pairs(self.message),
+            pack_pairs(self.obj),
+        ]
+        if for_signing:
+            return b"".join(packed)
+        else:
+            return b"".join(
+                [pack_uint32(self.authid), *packed, self.signature])
+
+    def sign(self, authenticator):
+        """Sign the message with `authenticator`."""
+        self.authid = authenticator.authid
+        # The signature's length is part of the signed data.
+        self.signature = b"\0" * authenticator.size
+        self.signature = authenticator.sign(self.pack(for_signing=True))
+
+    def verify(self, authenticator):
+        """Return whether the message is correctly signed."""
+        if self.authid == 0:
+            return len(self.signature) == 0
+        elif authenticator is None or self.authid != authenticator.authid:
+            return False
+        else:
+            return hmac.compare_digest(
+                self.signature,
+                authenticator.sign(self.pack(for_signing=True)))
+
+    @classmethod
+    def unpack(cls, data):
+        """Unpack a message from the start of `data`.
+
+        :return: A tuple of `(message, size)`, or `None` if `data` does not
+            contain a whole message yet.
+        """
+        if len(data) < OMAPI_HEADER_SIZE:
+            return None
+        authid, authlen, opcode, handle, tid, rid = struct.unpack_from(
+            "!IIIIII", data)
+        unpacked = unpack_pairs(data, OMAPI_HEADER_SIZE)
+        if unpacked is None:
+            return None
+        message, offset = unpacked
+        unpacked = unpack_pairs(data, offset)
+        if unpacked is None:
+            return None
+        obj, offset = unpacked
+        if len(data) < offset + authlen:
+            return None
+        signature = bytes(data[offset:offset + authlen])
+        return cls(
+            opcode, handle, tid, rid, message, obj, authid,
+            signature), offset + authlen
+
+
+class OmapiProtocol(Protocol):
+    """The client side of an OMAPI connection.
+
+    Requests can be sent before earlier ones have been answered; responses
+    are matched to requests by their transaction IDs.
+    """
+
+    def __init__(self, clock=None, timeout=OMAPI_REQUEST_TIMEOUT):
+        super(OmapiProtocol, self).__init__()
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.clock = clock
+        self.timeout = timeout
+        self.buffer = bytearray()
+        self.started = Deferred()
+        self.authenticator = None
+        self.pending = {}
+        self.tids = count(getrandbits(30) + 1)
+        self.connected = False
+
+    def connectionMade(self):
+        self.connected = True
+        self.transport.write(struct.pack(
+            "!II", OMAPI_PROTOCOL_VERSION, OMAPI_HEADER_SIZE))
+
+    def connectionLost(self, reason=ConnectionDone()):
+        self.connected = False
+        if not self.started.called:
+            self.started.errback(reason)
+        pending, self.pending = self.pending, {}
+        for d in pending.values():
+            d.errback(reason)
+
+    def dataReceived(self, data):
+        self.buffer.extend(data)
+        try:
+            if not self.started.called:
+                if len(self.buffer) < 8:
+                    return
+                version, header_size = struct.unpack_from("!II", self.buffer)
+                del self.buffer[:8]
+                if (version != OMAPI_PROTOCOL_VERSION or
+                        header_size != OMAPI_HEADER_SIZE):
+                    raise OmapiProtocolError(
+                        "Unsupported OMAPI protocol version %d (header "
+                        "size %d)." % (version, header_size))
+                self.started.callback(self)
+            while True:
+                unpacked = OmapiMessage.unpack(self.buffer)
+                if unpacked is None:
+                    break
+                response, size = unpacked
+                del self.buffer[:size]
+                self.responseReceived(response)
+        except OmapiProtocolError as error:
+            maaslog.error("OMAPI conversation failed: %s", error)
+            self.transport.abortConnection()
+
+    def responseReceived(self, response):
+        if not response.verify(self.authenticator):
+            raise OmapiProtocolError(
+                "Message from DHCP server has a bad signature.")
+        d = self.pending.pop(response.rid, None)
+        if d is not None:
+            d.callback(response)
+
+    def sendMessage(self, message):
+        """Send `message`, signed if authenticated.
+
+        :return: A `Deferred` that fires with the response.
+        """
+        message.tid = next(self.tids) & 0xffffffff
+        if self.authenticator is not None:
+            message.sign(self.authenticator)
+        d = Deferred(lambda d: self.pending.pop(message.tid, None))
+        self.pending[message.tid] = d
+        self.transport.write(message.pack())
+        timeoutCall = self.clock.callLater(self.timeout, d.cancel)
+
+        def done(result):
+            if timeoutCall.active():
+                timeoutCall.cancel()
+            return result
+
+        def trapCancel(failure):
+            failure.trap(CancelledError)
+            raise TimeoutError(
+                "No response from the DHCP server after %d seconds." % (
+                    self.timeout))
+
+        return d.addBoth(done).addErrback(trapCancel)
+
+
+class OmapiClient:
+    """Manipulates host maps in a DHCP server over OMAPI.
+
+    :param server_address: The address for the DHCP server.
+    :param shared_key: The base64-encoded HMAC-MD5 key that is configured as
+        the DHCP server's `omapi-key`; see `Omshell`.
+    """
+
+    def __init__(self, server_address, shared_key, ipv6=False, clock=None):
+        self.server_address = server_address
+        self.shared_key = shared_key
+        self.ipv6 = ipv6
+        if ipv6 is True:
+            self.server_port = 7912
+        else:
+            self.server_port = 7911
+        if clock is None:
+            from twisted.internet import reactor as clock
+        self.clock = clock
+        self.protocol = None
+        self.limiter = DeferredSemaphore(OMAPI_MAX_IN_FLIGHT)
+
+    @property
+    def connected(self):
+        return self.protocol is not None and self.protocol.connected
+
+    @inlineCallbacks
+    def connect(self):
+        """Connect and authenticate to the DHCP server."""
+        endpoint = TCP4ClientEndpoint(
+            self.clock, self.server_address, self.server_port,
+            timeout=OMAPI_REQUEST_TIMEOUT)
+        protocol = OmapiProtocol(self.clock)
+        yield connectProtocol(endpoint, protocol)
+        try:
+            yield protocol.started
+            response = yield protocol.sendMessage(OmapiMessage.open(
+                b"authenticator", obj=[
+                    (b"name", OMAPI_KEY_NAME),
+                    (b"algorithm", HMAC_MD5_ALGORITHM),
+                ]))
+            if response.opcode != OMAPI_OP_UPDATE:
+                raise OmapiProtocolError(
+                    "Could not authenticate to the DHCP server: %s" % (
+                        response.error_message))
+            protocol.authenticator = HMACMD5Authenticator(
+                self.shared_key, response.handle)
+        except:
+            protocol.transport.abortConnection()
+            raise
+        self.protocol = protocol
+        returnValue(self)
+
+    def disconnect(self):
+        if self.protocol is not None:
+            self.protocol.transport.loseConnection()
+            self.protocol = None
+
+    def _send(self, message):
+        if not self.connected:
+            raise OmapiProtocolError("Not connected to the DHCP server.")
+        return self.protocol.sendMessage(message)
+
+    def _pack_ip_address(self, ip_address):
+        return IPAddress(ip_address).packed
+
+    def _pack_mac_address(self, mac_address):
+        return EUI(mac_address).packed
+
+    def _get_host_name(self, mac_address):
+        # The "name" is not a host name; it's an identifier used within the
+        # DHCP server. We use the MAC address; see `Omshell.create`.
+        return mac_address.replace(':', '-').encode("ascii")
+
+    @inlineCallbacks
+    def _open_host(self, mac_address):
+        """Return the handle of the host map for `mac_address`.
+
+        :return: The handle, or `None` if there is no such host map.
+        """
+        response = yield self._send(OmapiMessage.open(b"host", obj=[
+            (b"name", self._get_host_name(mac_address)),
+        ]))
+        if response.opcode == OMAPI_OP_UPDATE and response.handle != 0:
+            returnValue(response.handle)
+        elif response.result == ISC_R_NOTFOUND:
+            returnValue(None)
+        else:
+            raise OmapiError(response.error_message, response.result)
+
+    def create(self, ip_address, mac_address):
+        """Create a host map from `mac_address` to `ip_address`."""
+        maaslog.debug(
+            "Creating host mapping %s->%s" % (mac_address, ip_address))
+        return self.limiter.run(self._create, ip_address, mac_address)
+
+    @inlineCallbacks
+    def _create(self, ip_address, mac_address):
+        response = yield self._send(OmapiMessage.open(b"host", message=[
+            (b"create", pack_uint32(1)),
+            (b"exclusive", pack_uint32(1)),
+        ], obj=[
+            (b"name", self._get_host_name(mac_address)),
+            (b"hardware-address", self._pack_mac_address(mac_address)),
+            (b"hardware-type", pack_uint32(1)),
+            (b"ip-address", self._pack_ip_address(ip_address)),
+        ]))
+        if response.opcode == OMAPI_OP_UPDATE:
+            pass  # Success.
+        elif response.result in (ISC_R_EXISTS, ISC_R_IOERROR):
+            pass  # Host map already existed.  Treat as success.
+        else:
+            raise OmapiError(response.error_message, response.result)
+
+    def modify(self, ip_address, mac_address):
+        """Change the host map for `mac_address` to `ip_address`."""
+        maaslog.debug(
+            "Modifying host mapping %s->%s" % (mac_address, ip_address))
+        return self.limiter.run(self._modify, ip_address, mac_address)
+
+    @inlineCallbacks
+    def _modify(self, ip_address, mac_address):
+        handle = yield self._open_host(mac_address)
+        if handle is None:
+            raise OmapiError("not found", ISC_R_NOTFOUND)
+        response = yield self._send(OmapiMessage(
+            OMAPI_OP_UPDATE, handle=handle, obj=[
+                (b"hardware-address", self._pack_mac_address(mac_address)),
+                (b"hardware-type", pack_uint32(1)),
+                (b"ip-address", self._pack_ip_address(ip_address)),
+            ]))
+        if response.opcode == OMAPI_OP_UPDATE:
+            pass  # Success.
+        elif response.result != ISC_R_SUCCESS:
+            raise OmapiError(response.error_message, response.result)
+
+    def remove(self, mac_address):
+        """Remove the host map for `mac_address`, if there is one."""
+        maaslog.debug("Removing host mapping key=%s" % mac_address)
+        return self.limiter.run(self._remove, mac_address)
+
+    @inlineCallbacks
+    def _remove(self, mac_address):
+        handle = yield self._open_host(mac_address)
+        if handle is None:
+            return  # It was already removed. Consider success.
+        response = yield self._send(
+            OmapiMessage(OMAPI_OP_DELETE, handle=handle))
+        if response.opcode != OMAPI_OP_STATUS:
+            raise OmapiProtocolError(
+                "Unexpected response (opcode %d) to delete." % (
+                    response.opcode))
+        elif response.result not in (ISC_R_SUCCESS, ISC_R_NOTFOUND):
+            raise OmapiError(response.error_message, response.result)
+
+
+# Connected clients, keyed by server address and port.
+_clients = {}
+
+
+@inlineCallbacks
+def get_omapi_client(server_address, shared_key, ipv6=False):
+    """Return a connected `OmapiClient` for the given DHCP server.
+
+    The connection is kept open and reused by subsequent calls, unless it is
+    lost or the key changes (dhcpd is restarted in that case anyway).
+
+    :return: A `Deferred` that fires with the client.
+    """
+    client = OmapiClient(server_address, shared_key, ipv6)
+    key = client.server_address, client.server_port
+    existing = _clients.get(key)
+    if existing is not None:
+        if existing.connected and existing.shared_key == shared_key:
+            returnValue(existing)
+        existing.disconnect()
+        del _clients[key]
+    yield client.connect()
+    _clients[key] = client
+    returnValue(client)
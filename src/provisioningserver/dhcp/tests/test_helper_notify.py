@@ -1,4 +1,4 @@
-# Copyright 2015-2016 Canonical Ltd.  This software is licensed under the
+# Copyright 2015-2018 Canonical Ltd.  This software is licensed under the
 # GNU Affero General Public License version 3 (see the file LICENSE).
 
 """Tests for maas-dhcp-support notify command."""
@@ -49,9 +49,11 @@ class TestDHCPNotify(MAASTestCase):
             sentinel.service, reactor)
         dv = DeferredValue()
 
-        def mock_processNotification(*args, **kwargs):
+        def mock_processNotificationBatch(*args, **kwargs):
             dv.set(args)
-        self.patch(service, "processNotification", mock_processNotification)
+        self.patch(
+            service, "processNotificationBatch",
+            mock_processNotificationBatch)
 
         return socket_path, service, dv
 
@@ -81,7 +83,8 @@ class TestDHCPNotify(MAASTestCase):
         ])
         yield done.get(timeout=10)
 
-        self.assertThat(done.value[0], MatchesDict({
+        [notification] = done.value[0]
+        self.assertThat(notification, MatchesDict({
             "action": Equals(action),
             "mac": Equals(mac),
             "ip_family": Equals(ip_family),
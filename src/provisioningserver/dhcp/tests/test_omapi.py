@@ -0,0 +1,335 @@
+# Copyright 2018 Canonical Ltd.  This software is licensed under the
+# GNU Affero General Public License version 3 (see the file LICENSE).
+
+"""Tests for the native OMAPI client."""
+
+__all__ = []
+
+import base64
+import struct
+
+from maastesting.factory import factory
+from maastesting.testcase import MAASTestCase
+from maastesting.twisted import extract_result
+from netaddr import (
+    EUI,
+    IPAddress,
+)
+from provisioningserver.dhcp import omapi
+from provisioningserver.dhcp.omapi import (
+    HMACMD5Authenticator,
+    ISC_R_EXISTS,
+    ISC_R_NOTFOUND,
+    OMAPI_OP_DELETE,
+    OMAPI_OP_OPEN,
+    OMAPI_OP_STATUS,
+    OMAPI_OP_UPDATE,
+    OmapiClient,
+    OmapiError,
+    OmapiMessage,
+    OmapiProtocol,
+    pack_uint32,
+)
+from testtools import ExpectedException
+from testtools.matchers import (
+    Equals,
+    Is,
+    MatchesStructure,
+)
+from twisted.internet.error import (
+    ConnectionLost,
+    TimeoutError,
+)
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.test.proto_helpers import StringTransport
+
+
+def make_secret():
+    return base64.b64encode(factory.make_bytes(64)).decode("ascii")
+
+
+def make_message():
+    return OmapiMessage(
+        OMAPI_OP_OPEN, handle=factory.pick_port(), tid=factory.pick_port(),
+        rid=factory.pick_port(), message=[
+            (b"type", factory.make_name("type").encode("ascii")),
+        ], obj=[
+            (b"name", factory.make_name("name").encode("ascii")),
+            (b"ip-address", IPAddress(factory.make_ipv4_address()).packed),
+        ])
+
+
+def read_messages(transport):
+    """Parse and return all messages written to `transport`."""
+    data = bytearray(transport.value())
+    transport.clear()
+    messages = []
+    while len(data) > 0:
+        message, size = OmapiMessage.unpack(data)
+        del data[:size]
+        messages.append(message)
+    return messages
+
+
+def make_response(request, opcode, handle=0, result=None, signer=None):
+    """Make a response to `request` as the DHCP server would."""
+    message = [] if result is None else [(b"result", pack_uint32(result))]
+    response = OmapiMessage(
+        opcode, handle=handle, rid=request.tid, message=message)
+    if signer is not None:
+        response.sign(signer)
+    return response
+
+
+class TestOmapiMessage(MAASTestCase):
+
+    def test_pack_unpack_round_trip(self):
+        message = make_message()
+        unpacked, size = OmapiMessage.unpack(message.pack())
+        self.assertThat(size, Equals(len(message.pack())))
+        self.assertThat(unpacked, MatchesStructure.byEquality(
+            opcode=message.opcode, handle=message.handle, tid=message.tid,
+            rid=message.rid, message=message.message, obj=message.obj,
+            authid=0, signature=b""))
+
+    def test_unpack_returns_None_for_partial_message(self):
+        packed = make_message().pack()
+        for size in range(len(packed)):
+            self.assertThat(OmapiMessage.unpack(packed[:size]), Is(None))
+
+    def test_unpack_leaves_following_messages(self):
+        first, second = make_message(), make_message()
+        unpacked, size = OmapiMessage.unpack(first.pack() + second.pack())
+        self.assertThat(size, Equals(len(first.pack())))
+
+    def test_sign_and_verify(self):
+        authenticator = HMACMD5Authenticator(make_secret(), 1)
+        message = make_message()
+        message.sign(authenticator)
+        unpacked, _ = OmapiMessage.unpack(message.pack())
+        self.assertThat(unpacked.authid, Equals(1))
+        self.assertThat(len(unpacked.signature), Equals(16))
+        self.assertTrue(unpacked.verify(authenticator))
+
+    def test_verify_rejects_tampered_message(self):
+        authenticator = HMACMD5Authenticator(make_secret(), 1)
+        message = make_message()
+        message.sign(authenticator)
+        message.handle += 1
+        self.assertFalse(message.verify(authenticator))
+
+    def test_verify_rejects_other_key(self):
+        message = make_message()
+        message.sign(HMACMD5Authenticator(make_secret(), 1))
+        self.assertFalse(
+            message.verify(HMACMD5Authenticator(make_secret(), 1)))
+
+    def test_verify_accepts_unsigned_message(self):
+        self.assertTrue(make_message().verify(None))
+
+    def test_result_and_error_message(self):
+        message = OmapiMessage(OMAPI_OP_STATUS, message=[
+            (b"result", pack_uint32(ISC_R_NOTFOUND)),
+            (b"message", b"not found"),
+        ])
+        self.assertThat(message.result, Equals(ISC_R_NOTFOUND))
+        self.assertThat(message.error_message, Equals("not found"))
+
+
+class TestOmapiProtocol(MAASTestCase):
+
+    def make_protocol(self, timeout=30):
+        clock = Clock()
+        protocol = OmapiProtocol(clock, timeout=timeout)
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        protocol.dataReceived(struct.pack("!II", 100, 24))
+        transport.clear()
+        return protocol, transport, clock
+
+    def test_sends_startup_message(self):
+        protocol = OmapiProtocol(Clock())
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        self.assertThat(
+            transport.value(), Equals(struct.pack("!II", 100, 24)))
+        self.assertFalse(protocol.started.called)
+
+    def test_started_after_server_startup_message(self):
+        protocol, _, _ = self.make_protocol()
+        self.assertThat(extract_result(protocol.started), Is(protocol))
+
+    def test_aborts_on_unsupported_version(self):
+        protocol = OmapiProtocol(Clock())
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        protocol.dataReceived(struct.pack("!II", 99, 24))
+        self.assertTrue(transport.disconnecting)
+
+    def test_matches_responses_to_requests(self):
+        protocol, transport, _ = self.make_protocol()
+        d1 = protocol.sendMessage(make_message())
+        d2 = protocol.sendMessage(make_message())
+        request1, request2 = read_messages(transport)
+        response2 = make_response(request2, OMAPI_OP_UPDATE, handle=2)
+        response1 = make_response(request1, OMAPI_OP_UPDATE, handle=1)
+        # Responses can arrive in any order and split across reads.
+        data = response2.pack() + response1.pack()
+        protocol.dataReceived(data[:5])
+        protocol.dataReceived(data[5:])
+        self.assertThat(extract_result(d1).handle, Equals(1))
+        self.assertThat(extract_result(d2).handle, Equals(2))
+
+    def test_signs_messages_once_authenticated(self):
+        protocol, transport, _ = self.make_protocol()
+        protocol.authenticator = HMACMD5Authenticator(make_secret(), 5)
+        protocol.sendMessage(make_message())
+        [request] = read_messages(transport)
+        self.assertThat(request.authid, Equals(5))
+        self.assertTrue(request.verify(protocol.authenticator))
+
+    def test_aborts_on_bad_signature(self):
+        protocol, transport, _ = self.make_protocol()
+        protocol.authenticator = HMACMD5Authenticator(make_secret(), 5)
+        d = protocol.sendMessage(make_message())
+        [request] = read_messages(transport)
+        response = make_response(
+            request, OMAPI_OP_UPDATE,
+            signer=HMACMD5Authenticator(make_secret(), 5))
+        protocol.dataReceived(response.pack())
+        self.assertTrue(transport.disconnecting)
+        self.assertFalse(d.called)
+
+    def test_times_out(self):
+        protocol, _, clock = self.make_protocol(timeout=10)
+        d = protocol.sendMessage(make_message())
+        clock.advance(10)
+        with ExpectedException(TimeoutError):
+            extract_result(d)
+        self.assertThat(protocol.pending, Equals({}))
+
+    def test_fails_pending_requests_when_connection_lost(self):
+        protocol, _, clock = self.make_protocol()
+        d = protocol.sendMessage(make_message())
+        protocol.connectionLost(Failure(ConnectionLost()))
+        with ExpectedException(ConnectionLost):
+            extract_result(d)
+        self.assertThat(clock.getDelayedCalls(), Equals([]))
+
+
+class TestOmapiClient(MAASTestCase):
+
+    def make_client(self):
+        client = OmapiClient("127.0.0.1", make_secret())
+        protocol = OmapiProtocol(Clock())
+        transport = StringTransport()
+        protocol.makeConnection(transport)
+        protocol.dataReceived(struct.pack("!II", 100, 24))
+        protocol.authenticator = HMACMD5Authenticator(client.shared_key, 1)
+        transport.clear()
+        client.protocol = protocol
+        return client, transport
+
+    def respond(self, client, transport, opcode, handle=0, result=None):
+        """Answer the one outstanding request."""
+        [request] = read_messages(transport)
+        response = make_response(
+            request, opcode, handle, result, client.protocol.authenticator)
+        client.protocol.dataReceived(response.pack())
+        return request
+
+    def test_ports(self):
+        self.assertThat(
+            OmapiClient("::1", "", ipv6=True).server_port, Equals(7912))
+        self.assertThat(
+            OmapiClient("127.0.0.1", "").server_port, Equals(7911))
+
+    def test_create_sends_host_object(self):
+        client, transport = self.make_client()
+        ip, mac = factory.make_ipv4_address(), factory.make_mac_address()
+        d = client.create(ip, mac)
+        request = self.respond(client, transport, OMAPI_OP_UPDATE, handle=9)
+        self.assertThat(extract_result(d), Is(None))
+        self.assertThat(request.opcode, Equals(OMAPI_OP_OPEN))
+        self.assertThat(request.message, Equals([
+            (b"type", b"host"),
+            (b"create", pack_uint32(1)),
+            (b"exclusive", pack_uint32(1)),
+        ]))
+        self.assertThat(request.obj, Equals([
+            (b"name", mac.replace(":", "-").encode("ascii")),
+            (b"hardware-address", EUI(mac).packed),
+            (b"hardware-type", pack_uint32(1)),
+            (b"ip-address", IPAddress(ip).packed),
+        ]))
+
+    def test_create_treats_exists_as_success(self):
+        client, transport = self.make_client()
+        d = client.create(
+            factory.make_ipv4_address(), factory.make_mac_address())
+        self.respond(client, transport, OMAPI_OP_STATUS, result=ISC_R_EXISTS)
+        self.assertThat(extract_result(d), Is(None))
+
+    def test_create_raises_OmapiError_on_failure(self):
+        client, transport = self.make_client()
+        d = client.create(
+            factory.make_ipv4_address(), factory.make_mac_address())
+        self.respond(client, transport, OMAPI_OP_STATUS, result=1)
+        with ExpectedException(OmapiError):
+            extract_result(d)
+
+    def test_remove_deletes_host(self):
+        client, transport = self.make_client()
+        d = client.remove(factory.make_mac_address())
+        self.respond(client, transport, OMAPI_OP_UPDATE, handle=7)
+        request = self.respond(
+            client, transport, OMAPI_OP_STATUS, result=0)
+        self.assertThat(extract_result(d), Is(None))
+        self.assertThat(request, MatchesStructure.byEquality(
+            opcode=OMAPI_OP_DELETE, handle=7))
+
+    def test_remove_treats_not_found_as_success(self):
+        client, transport = self.make_client()
+        d = client.remove(factory.make_mac_address())
+        self.respond(
+            client, transport, OMAPI_OP_STATUS, result=ISC_R_NOTFOUND)
+        self.assertThat(extract_result(d), Is(None))
+        self.assertThat(transport.value(), Equals(b""))
+
+    def test_modify_updates_host(self):
+        client, transport = self.make_client()
+        ip, mac = factory.make_ipv4_address(), factory.make_mac_address()
+        d = client.modify(ip, mac)
+        self.respond(client, transport, OMAPI_OP_UPDATE, handle=3)
+        request = self.respond(client, transport, OMAPI_OP_UPDATE, handle=3)
+        self.assertThat(extract_result(d), Is(None))
+        self.assertThat(request, MatchesStructure.byEquality(
+            opcode=OMAPI_OP_UPDATE, handle=3))
+        self.assertIn((b"ip-address", IPAddress(ip).packed), request.obj)
+
+    def test_modify_raises_OmapiError_when_not_found(self):
+        client, transport = self.make_client()
+        d = client.modify(
+            factory.make_ipv4_address(), factory.make_mac_address())
+        self.respond(
+            client, transport, OMAPI_OP_STATUS, result=ISC_R_NOTFOUND)
+        with ExpectedException(OmapiError):
+            extract_result(d)
+
+
+class TestGetOmapiClient(MAASTestCase):
+
+    def setUp(self):
+        super(TestGetOmapiClient, self).setUp()
+        self.addCleanup(omapi._clients.clear)
+
+    def test_reuses_connected_client(self):
+        client = OmapiClient("127.0.0.1", make_secret())
+        client.protocol = OmapiProtocol(Clock())
+        client.protocol.connected = True
+        omapi._clients["127.0.0.1", 7911] = client
+        self.patch(OmapiClient, "connect")
+        d = omapi.get_omapi_client("127.0.0.1", client.shared_key)
+        self.assertThat(extract_result(d), Is(client))
+        self.assertFalse(OmapiClient.connect.called)
@@ -4,9 +4,13 @@
 """Low-level actions to manage the DNS service, like reloading zones."""
 
 __all__ = [
+    "bind_freeze_zones",
     "bind_reconfigure",
     "bind_reload",
+    "bind_reload_changed_zones",
     "bind_reload_zones",
+    "bind_thaw_zones",
+    "bind_update_records",
     "bind_write_configuration",
     "bind_write_options",
     "bind_write_zones",
@@ -18,7 +22,9 @@ from time import sleep
 
 from provisioningserver.dns.config import (
     DNSConfig,
+    execute_nsupdate_command,
     execute_rndc_command,
+    get_dns_port,
     set_up_options_conf,
 )
 from provisioningserver.logger import get_maas_logger
@@ -100,7 +106,111 @@ def bind_reload_zones(zone_list):
     return ret
 
 
-def bind_write_configuration(zones, trusted_networks):
+def bind_reload_changed_zones(zone_list):
+    """Ask BIND to reload its configuration and the given zone files.
+
+    Reloading the configuration loads any new zones, but leaves existing
+    zones alone; only those in `zone_list` are then reloaded. Like
+    `bind_reload`, this is 'best effort' (with logging).
+
+    :param zone_list: A list of the names of zones that have changed.
+    :return: True if success, False otherwise.
+    """
+    try:
+        execute_rndc_command(("reconfig",))
+    except CalledProcessError as exc:
+        maaslog.error(
+            "Reloading BIND configuration failed (is it running?): %s", exc)
+        return False
+    return bind_reload_zones(zone_list)
+
+
+def _execute_rndc_zone_command(command, zone_list, description):
+    """Run `command` for each zone in `zone_list`, or for all zones.
+
+    This operation is 'best effort' (with logging) as the server may not be
+    running, and there is often no context for reporting.
+
+    :return: True if success, False otherwise.
+    """
+    if zone_list is None:
+        try:
+            execute_rndc_command((command,))
+        except CalledProcessError as exc:
+            maaslog.error(
+                "%s BIND zones failed (is it running?): %s",
+                description, exc)
+            return False
+        else:
+            return True
+    ret = True
+    if not isinstance(zone_list, list):
+        zone_list = [zone_list]
+    for name in zone_list:
+        try:
+            execute_rndc_command((command, name))
+        except CalledProcessError as exc:
+            maaslog.error(
+                "%s BIND zone %r failed (is it running?): %s",
+                description, name, exc)
+            ret = False
+    return ret
+
+
+def bind_freeze_zones(zone_list=None):
+    """Ask BIND to suspend dynamic updates to the given zones.
+
+    Any pending dynamic updates are written out to the zone files, which may
+    then be rewritten safely. The zones must be thawed afterwards with
+    `bind_thaw_zones`.
+
+    :param zone_list: A list of zone names to freeze, or a single name as a
+        string, or `None` to freeze all zones.
+    :return: True if success, False otherwise.
+    """
+    return _execute_rndc_zone_command("freeze", zone_list, "Freezing")
+
+
+def bind_thaw_zones(zone_list=None):
+    """Ask BIND to reload the given frozen zones and resume dynamic updates.
+
+    :param zone_list: A list of zone names to thaw, or a single name as a
+        string, or `None` to thaw all zones.
+    :return: True if success, False otherwise.
+    """
+    return _execute_rndc_zone_command("thaw", zone_list, "Thawing")
+
+
+def bind_update_records(updates):
+    """Send RFC 2136 dynamic updates to BIND.
+
+    Updates are grouped by zone, in order, and each group is sent as a single
+    update message so that it is applied atomically.
+
+    :param updates: A sequence of :py:class:`DynamicDNSUpdate`.
+    :raise ExternalProcessError: If `nsupdate` fails.
+    """
+    commands = ["server 127.0.0.1 %d" % get_dns_port()]
+    zone = None
+    for update in updates:
+        if update.zone != zone:
+            if zone is not None:
+                commands.append("send")
+            zone = update.zone
+            commands.append("zone %s" % zone)
+        commands.append(update.as_nsupdate_command())
+    if zone is None:
+        return
+    commands.append("send")
+    try:
+        execute_nsupdate_command(commands)
+    except CalledProcessError as exc:
+        maaslog.error("Updating BIND records failed: %s", exc)
+        raise
+
+
+def bind_write_configuration(
+        zones, trusted_networks, dynamic_updates=False):
     """Write BIND's configuration.
 
     :param zones: Those zones to include in main config.
@@ -108,6 +218,9 @@ def bind_write_configuration(zones, trusted_networks):
 
     :param trusted_networks: A sequence of CIDR network specifications that
         are permitted to use the DNS server as a forwarder.
+
+    :param dynamic_updates: Whether the zones accept dynamic updates signed
+        with MAAS's key.
     """
     # trusted_networks was formerly specified as a single IP address with
     # netmask. These assertions are here to prevent code that assumes that
@@ -116,7 +229,8 @@ def bind_write_configuration(zones, trusted_networks):
     assert isinstance(trusted_networks, collections.Sequence)
 
     dns_config = DNSConfig(zones=zones)
-    dns_config.write_config(trusted_networks=trusted_networks)
+    dns_config.write_config(
+        trusted_networks=trusted_networks, dynamic_updates=dynamic_updates)
 
 
 def bind_write_options(upstream_dns, dnssec_validation):
@@ -136,8 +250,14 @@ def bind_write_options(upstream_dns, dnssec_validation):
 def bind_write_zones(zones):
     """Write out DNS zones.
 
+    Zones whose records have not changed since they were last written are
+    skipped.
+
     :param zones: Those zones to write.
     :type zones: Sequence of :py:class:`DomainData`.
+    :return: A list of the names of the zones that were written.
     """
+    written = []
     for zone in zones:
-        zone.write_config()
+        written.extend(zone.write_config())
+    return written
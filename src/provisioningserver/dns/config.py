@@ -5,6 +5,7 @@
 
 __all__ = [
     'DNSConfig',
+    'DynamicDNSUpdate',
     'MAAS_NAMED_CONF_OPTIONS_INSIDE_NAME',
     'set_up_rndc',
     'set_up_options_conf',
@@ -18,6 +19,10 @@ import errno
 import os
 import os.path
 import re
+from subprocess import (
+    PIPE,
+    Popen,
+)
 import sys
 
 from provisioningserver.logger import get_maas_logger
@@ -27,7 +32,10 @@ from provisioningserver.utils import (
 )
 from provisioningserver.utils.fs import atomic_write
 from provisioningserver.utils.isc import read_isc_file
-from provisioningserver.utils.shell import call_and_check
+from provisioningserver.utils.shell import (
+    call_and_check,
+    ExternalProcessError,
+)
 
 
 maaslog = get_maas_logger("dns")
@@ -36,6 +44,8 @@ MAAS_NAMED_CONF_NAME = 'named.conf.maas'
 MAAS_NAMED_CONF_OPTIONS_INSIDE_NAME = 'named.conf.options.inside.maas'
 MAAS_NAMED_RNDC_CONF_NAME = 'named.conf.rndc.maas'
 MAAS_RNDC_CONF_NAME = 'rndc.conf.maas'
+MAAS_NSUPDATE_KEY_NAME = 'nsupdate.key.maas'
+MAAS_RNDC_KEY_NAME = 'rndc-maas-key'
 
 
 def get_dns_config_dir():
@@ -68,6 +78,12 @@ def get_dns_rndc_port():
     return int(setting)
 
 
+def get_dns_port():
+    """Port on which BIND answers queries and dynamic updates."""
+    setting = os.getenv("MAAS_DNS_PORT", "53")
+    return int(setting)
+
+
 def get_dns_default_controls():
     """Include the default RNDC controls (default RNDC key on port 953)?"""
     setting = os.getenv("MAAS_DNS_DEFAULT_CONTROLS", "1")
@@ -91,6 +107,38 @@ SRVRecord = namedtuple('SRVRecord', [
     ])
 
 
+class DynamicDNSUpdate(namedtuple('DynamicDNSUpdate', [
+        'operation',
+        'zone',
+        'name',
+        'rrtype',
+        'ttl',
+        'answer',
+        ])):
+    """An RFC 2136 dynamic update of a single resource record.
+
+    :ivar operation: Either "INSERT" or "DELETE".
+    :ivar zone: The name of the zone that holds the record.
+    :ivar name: The fully-qualified owner name of the record.
+    :ivar rrtype: The type of the record, e.g. "A" or "PTR".
+    :ivar ttl: The TTL of the record; ignored when deleting.
+    :ivar answer: The data of the record. When deleting, `None` deletes the
+        whole RRset.
+    """
+
+    def as_nsupdate_command(self):
+        """Return this update as a line of `nsupdate` input."""
+        if self.operation == "DELETE":
+            if self.answer is None:
+                return "update delete %s %s" % (self.name, self.rrtype)
+            else:
+                return "update delete %s %s %s" % (
+                    self.name, self.rrtype, self.answer)
+        else:
+            return "update add %s %d %s %s" % (
+                self.name, self.ttl, self.rrtype, self.answer)
+
+
 # Default 'controls' stanza to be included in the Bind configuration, to
 # enable "remote" administration (well, only locally) for the init scripts,
 # so that they can control the DNS daemon over port 953.
@@ -119,7 +167,15 @@ def uncomment_named_conf(named_comment):
     return re.sub('^# ', '', named_comment, flags=re.MULTILINE)
 
 
-def generate_rndc(port=953, key_name='rndc-maas-key',
+def extract_named_conf_key(named_conf):
+    """Extract the 'key' statement from the generated named configuration."""
+    match = re.search(r'^key "[^"]+" {.*?^};$', named_conf, re.M | re.S)
+    if match is None:
+        raise ValueError("No key statement found in named configuration.")
+    return match.group(0) + "\n"
+
+
+def generate_rndc(port=953, key_name=MAAS_RNDC_KEY_NAME,
                   include_default_controls=True):
     """Use `rndc-confgen` (from bind9utils) to generate a rndc+named
     configuration.
@@ -155,9 +211,16 @@ def get_rndc_conf_path():
     return compose_config_path(MAAS_RNDC_CONF_NAME)
 
 
+def get_nsupdate_key_path():
+    return compose_config_path(MAAS_NSUPDATE_KEY_NAME)
+
+
 def set_up_rndc():
-    """Writes out the two files needed to enable MAAS to use rndc commands:
+    """Writes out the files needed to enable MAAS to use rndc commands:
     MAAS_RNDC_CONF_NAME and MAAS_NAMED_RNDC_CONF_NAME.
+
+    The rndc key is also written to MAAS_NSUPDATE_KEY_NAME so that it can be
+    used to sign dynamic updates sent with `nsupdate`.
     """
     rndc_content, named_content = generate_rndc(
         port=get_dns_rndc_port(),
@@ -171,6 +234,10 @@ def set_up_rndc():
     with open(target_file, "w", encoding="ascii") as f:
         f.write(named_content)
 
+    target_file = get_nsupdate_key_path()
+    with open(target_file, "w", encoding="ascii") as f:
+        f.write(extract_named_conf_key(named_content))
+
 
 def execute_rndc_command(arguments):
     """Execute a rndc command."""
@@ -180,6 +247,21 @@ def execute_rndc_command(arguments):
     call_and_check(rndc_cmd)
 
 
+def execute_nsupdate_command(commands):
+    """Execute `nsupdate`, signed with the rndc key, with the given commands.
+
+    :param commands: A sequence of lines of `nsupdate` input.
+    :raise ExternalProcessError: If `nsupdate` returns nonzero.
+    """
+    nsupdate_cmd = ['nsupdate', '-k', get_nsupdate_key_path()]
+    nsupdate_input = "".join("%s\n" % command for command in commands)
+    process = Popen(nsupdate_cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
+    _, stderr = process.communicate(nsupdate_input.encode("ascii"))
+    if process.returncode != 0:
+        raise ExternalProcessError(
+            process.returncode, nsupdate_cmd, output=stderr.strip())
+
+
 def set_up_options_conf(overwrite=True, **kwargs):
     """Write out the named.conf.options.inside.maas file.
 
@@ -298,11 +380,14 @@ class DNSConfig:
             does not exist.
         """
         trusted_networks = kwargs.pop("trusted_networks", "")
+        dynamic_updates = kwargs.pop("dynamic_updates", False)
         context = {
             'zones': self.zones,
             'DNS_CONFIG_DIR': get_dns_config_dir(),
             'named_rndc_conf_path': get_named_rndc_conf_path(),
             'trusted_networks': trusted_networks,
+            'dynamic_update_key': (
+                MAAS_RNDC_KEY_NAME if dynamic_updates else None),
             'modified': str(datetime.today()),
         }
         content = render_dns_template(self.template_file_name, kwargs, context)
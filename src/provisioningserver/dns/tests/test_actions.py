@@ -21,11 +21,13 @@ from maastesting.factory import factory
 from maastesting.matchers import (
     MockCalledOnceWith,
     MockCallsMatch,
+    MockNotCalled,
 )
 from maastesting.testcase import MAASTestCase
 from netaddr import IPNetwork
 from provisioningserver.dns import actions
 from provisioningserver.dns.config import (
+    DynamicDNSUpdate,
     MAAS_NAMED_CONF_NAME,
     MAAS_NAMED_CONF_OPTIONS_INSIDE_NAME,
 )
@@ -160,6 +162,125 @@ class TestReloadZone(MAASTestCase):
         self.assertFalse(actions.bind_reload_zones(sentinel.zone))
 
 
+class TestReloadChangedZones(MAASTestCase):
+    """Tests for :py:func:`actions.bind_reload_changed_zones`."""
+
+    def test__reconfigures_then_reloads_zones(self):
+        self.patch_autospec(actions, "execute_rndc_command")
+        self.assertTrue(
+            actions.bind_reload_changed_zones([sentinel.zone]))
+        self.assertThat(
+            actions.execute_rndc_command, MockCallsMatch(
+                call(("reconfig",)),
+                call(("reload", sentinel.zone))))
+
+    def test__logs_subprocess_error(self):
+        erc = self.patch_autospec(actions, "execute_rndc_command")
+        erc.side_effect = factory.make_CalledProcessError()
+        with FakeLogger("maas") as logger:
+            self.assertFalse(
+                actions.bind_reload_changed_zones([sentinel.zone]))
+        self.assertDocTestMatches(
+            "Reloading BIND configuration failed (is it running?): "
+            "Command ... returned non-zero exit status ...",
+            logger.output)
+        self.assertThat(erc, MockCalledOnceWith(("reconfig",)))
+
+
+class TestFreezeAndThawZones(MAASTestCase):
+    """Tests for `actions.bind_freeze_zones` and `actions.bind_thaw_zones`."""
+
+    scenarios = (
+        ("freeze", {"action": "bind_freeze_zones", "command": "freeze"}),
+        ("thaw", {"action": "bind_thaw_zones", "command": "thaw"}),
+    )
+
+    def test__executes_rndc_command_for_all_zones(self):
+        self.patch_autospec(actions, "execute_rndc_command")
+        self.assertTrue(getattr(actions, self.action)())
+        self.assertThat(
+            actions.execute_rndc_command,
+            MockCalledOnceWith((self.command,)))
+
+    def test__executes_rndc_command_for_each_zone(self):
+        self.patch_autospec(actions, "execute_rndc_command")
+        self.assertTrue(
+            getattr(actions, self.action)([sentinel.zone1, sentinel.zone2]))
+        self.assertThat(
+            actions.execute_rndc_command, MockCallsMatch(
+                call((self.command, sentinel.zone1)),
+                call((self.command, sentinel.zone2))))
+
+    def test__executes_rndc_command_for_single_zone(self):
+        self.patch_autospec(actions, "execute_rndc_command")
+        self.assertTrue(getattr(actions, self.action)(sentinel.zone))
+        self.assertThat(
+            actions.execute_rndc_command,
+            MockCalledOnceWith((self.command, sentinel.zone)))
+
+    def test__logs_subprocess_error(self):
+        erc = self.patch_autospec(actions, "execute_rndc_command")
+        erc.side_effect = factory.make_CalledProcessError()
+        with FakeLogger("maas") as logger:
+            self.assertFalse(getattr(actions, self.action)(sentinel.zone))
+        self.assertDocTestMatches(
+            "... BIND zone ... failed (is it running?): "
+            "Command ... returned non-zero exit status ...",
+            logger.output)
+
+    def test__false_on_subprocess_error_for_all_zones(self):
+        erc = self.patch_autospec(actions, "execute_rndc_command")
+        erc.side_effect = factory.make_CalledProcessError()
+        self.assertFalse(getattr(actions, self.action)())
+
+
+class TestUpdateRecords(MAASTestCase):
+    """Tests for :py:func:`actions.bind_update_records`."""
+
+    def test__sends_updates_grouped_by_zone(self):
+        self.patch(actions, "get_dns_port").return_value = 5353
+        self.patch_autospec(actions, "execute_nsupdate_command")
+        actions.bind_update_records([
+            DynamicDNSUpdate(
+                "DELETE", "example.com", "foo.example.com", "A", None, None),
+            DynamicDNSUpdate(
+                "INSERT", "example.com", "foo.example.com", "A", 30,
+                "10.0.0.1"),
+            DynamicDNSUpdate(
+                "INSERT", "0.0.10.in-addr.arpa", "1.0.0.10.in-addr.arpa",
+                "PTR", 30, "foo.example.com."),
+        ])
+        self.assertThat(
+            actions.execute_nsupdate_command, MockCalledOnceWith([
+                "server 127.0.0.1 5353",
+                "zone example.com",
+                "update delete foo.example.com A",
+                "update add foo.example.com 30 A 10.0.0.1",
+                "send",
+                "zone 0.0.10.in-addr.arpa",
+                "update add 1.0.0.10.in-addr.arpa 30 PTR foo.example.com.",
+                "send",
+            ]))
+
+    def test__does_nothing_without_updates(self):
+        self.patch_autospec(actions, "execute_nsupdate_command")
+        actions.bind_update_records([])
+        self.assertThat(actions.execute_nsupdate_command, MockNotCalled())
+
+    def test__logs_and_raises_subprocess_error(self):
+        enc = self.patch_autospec(actions, "execute_nsupdate_command")
+        enc.side_effect = factory.make_CalledProcessError()
+        update = DynamicDNSUpdate(
+            "DELETE", "example.com", "foo.example.com", "A", None, None)
+        with FakeLogger("maas") as logger:
+            self.assertRaises(
+                CalledProcessError, actions.bind_update_records, [update])
+        self.assertDocTestMatches(
+            "Updating BIND records failed: "
+            "Command ... returned non-zero exit status ...",
+            logger.output)
+
+
 class TestConfiguration(MAASTestCase):
     """Tests for the `bind_write_*` functions."""
 
@@ -208,6 +329,15 @@ class TestConfiguration(MAASTestCase):
         self.assertThat(expected_file, FileContains(
             matcher=Contains(expected_content)))
 
+    def test_bind_write_configuration_allows_dynamic_updates(self):
+        domain = factory.make_string()
+        zones = [DNSForwardZoneConfig(domain, mapping={})]
+        actions.bind_write_configuration(
+            zones=zones, trusted_networks=[], dynamic_updates=True)
+        expected_file = os.path.join(self.dns_conf_dir, MAAS_NAMED_CONF_NAME)
+        self.assertThat(expected_file, FileContains(
+            matcher=Contains("allow-update")))
+
     def test_bind_write_zones_writes_file(self):
         domain = factory.make_string()
         network = IPNetwork('192.168.0.3/24')
@@ -231,6 +361,20 @@ class TestConfiguration(MAASTestCase):
         ]
         self.assertThat(expected_files, AllMatch(FileExists()))
 
+    def test_bind_write_zones_returns_names_of_written_zones(self):
+        domain = factory.make_string()
+        network = IPNetwork('192.168.0.3/24')
+        forward_zone = DNSForwardZoneConfig(
+            domain, serial=random.randint(1, 100), mapping={})
+        reverse_zone = DNSReverseZoneConfig(
+            domain, serial=random.randint(1, 100), network=network)
+        self.assertItemsEqual(
+            [domain, '0.168.192.in-addr.arpa'],
+            actions.bind_write_zones(zones=[forward_zone, reverse_zone]))
+        forward_zone.serial += 1
+        self.assertEqual(
+            [], actions.bind_write_zones(zones=[forward_zone, reverse_zone]))
+
     def test_bind_write_options_sets_up_config(self):
         # bind_write_configuration_and_zones writes the config file, writes
         # the zone files, and reloads the dns service.
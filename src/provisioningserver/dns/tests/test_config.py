@@ -14,6 +14,7 @@ from unittest.mock import Mock
 from fixtures import EnvironmentVariable
 from maastesting.factory import factory
 from maastesting.fakemethod import FakeMethod
+from maastesting.matchers import MockCalledOnceWith
 from maastesting.testcase import MAASTestCase
 from netaddr import IPNetwork
 from provisioningserver.dns import config
@@ -23,13 +24,17 @@ from provisioningserver.dns.config import (
     DNSConfig,
     DNSConfigDirectoryMissing,
     DNSConfigFail,
+    DynamicDNSUpdate,
+    execute_nsupdate_command,
     execute_rndc_command,
     extract_suggested_named_conf,
     generate_rndc,
     MAAS_NAMED_CONF_NAME,
     MAAS_NAMED_CONF_OPTIONS_INSIDE_NAME,
     MAAS_NAMED_RNDC_CONF_NAME,
+    MAAS_NSUPDATE_KEY_NAME,
     MAAS_RNDC_CONF_NAME,
+    MAAS_RNDC_KEY_NAME,
     NAMED_CONF_OPTIONS,
     render_dns_template,
     report_missing_config_dir,
@@ -47,6 +52,7 @@ from provisioningserver.dns.zoneconfig import (
 )
 from provisioningserver.utils import locate_config
 from provisioningserver.utils.isc import read_isc_file
+from provisioningserver.utils.shell import ExternalProcessError
 from testtools.matchers import (
     AllMatch,
     Contains,
@@ -188,6 +194,17 @@ class TestRNDCUtilities(MAASTestCase):
                 conf_content = stream.read()
                 self.assertIn(content, conf_content)
 
+    def test_set_up_rndc_writes_nsupdate_key(self):
+        dns_conf_dir = patch_dns_config_path(self)
+        set_up_rndc()
+        key_path = os.path.join(dns_conf_dir, MAAS_NSUPDATE_KEY_NAME)
+        with open(key_path, "r", encoding="ascii") as stream:
+            key_content = stream.read()
+        self.assertThat(key_content, MatchesAll(
+            StartsWith('key "%s" {' % MAAS_RNDC_KEY_NAME),
+            Contains('secret'), EndsWith('};\n')))
+        self.assertNotIn('controls', key_content)
+
     def test_set_up_options_conf_writes_configuration(self):
         dns_conf_dir = patch_dns_config_path(self)
         fake_dns = [factory.make_ipv4_address(), factory.make_ipv4_address()]
@@ -278,6 +295,30 @@ class TestRNDCUtilities(MAASTestCase):
         expected_command = ['rndc', '-c', rndc_conf_path, command]
         self.assertEqual((expected_command,), recorder.calls[0][0])
 
+    def test_execute_nsupdate_command_executes_command(self):
+        fake_dir = patch_dns_config_path(self)
+        popen = self.patch(config, 'Popen')
+        popen.return_value.communicate.return_value = (b"", b"")
+        popen.return_value.returncode = 0
+        execute_nsupdate_command(["zone example.com", "send"])
+        key_path = os.path.join(fake_dir, MAAS_NSUPDATE_KEY_NAME)
+        self.assertThat(popen, MockCalledOnceWith(
+            ['nsupdate', '-k', key_path],
+            stdin=config.PIPE, stdout=config.PIPE, stderr=config.PIPE))
+        self.assertThat(
+            popen.return_value.communicate,
+            MockCalledOnceWith(b"zone example.com\nsend\n"))
+
+    def test_execute_nsupdate_command_raises_on_failure(self):
+        patch_dns_config_path(self)
+        popen = self.patch(config, 'Popen')
+        popen.return_value.communicate.return_value = (b"", b"REFUSED")
+        popen.return_value.returncode = 2
+        error = self.assertRaises(
+            ExternalProcessError, execute_nsupdate_command, ["send"])
+        self.assertEqual(2, error.returncode)
+        self.assertEqual(b"REFUSED", error.output)
+
     def test_extract_suggested_named_conf_extracts_section(self):
         named_part = factory.make_string()
         # Actual rndc-confgen output, mildly mangled for testing purposes.
@@ -483,6 +524,27 @@ class TestDNSConfig(MAASTestCase):
                         MAAS_NAMED_RNDC_CONF_NAME,
                     ])))
 
+    def test_write_config_allows_dynamic_updates(self):
+        target_dir = patch_dns_config_path(self)
+        domain = factory.make_string()
+        forward_zone = DNSForwardZoneConfig(domain, mapping={})
+        dnsconfig = DNSConfig((forward_zone,))
+        dnsconfig.write_config(dynamic_updates=True)
+        self.assertThat(
+            os.path.join(target_dir, MAAS_NAMED_CONF_NAME),
+            FileContains(matcher=Contains(
+                'allow-update { key "%s"; };' % MAAS_RNDC_KEY_NAME)))
+
+    def test_write_config_disallows_dynamic_updates_by_default(self):
+        target_dir = patch_dns_config_path(self)
+        domain = factory.make_string()
+        forward_zone = DNSForwardZoneConfig(domain, mapping={})
+        dnsconfig = DNSConfig((forward_zone,))
+        dnsconfig.write_config()
+        self.assertThat(
+            os.path.join(target_dir, MAAS_NAMED_CONF_NAME),
+            FileContains(matcher=Not(Contains('allow-update'))))
+
     def test_write_config_makes_config_world_readable(self):
         target_dir = patch_dns_config_path(self)
         DNSConfig().write_config()
@@ -504,3 +566,28 @@ class TestDNSConfig(MAASTestCase):
                         config.get_dns_config_dir(),
                         DNSConfig.target_file_name,
                     ))))
+
+
+class TestDynamicDNSUpdate(MAASTestCase):
+    """Tests for `DynamicDNSUpdate`."""
+
+    def test_as_nsupdate_command_for_insert(self):
+        update = DynamicDNSUpdate(
+            "INSERT", "example.com", "foo.example.com", "A", 30, "10.0.0.1")
+        self.assertEqual(
+            "update add foo.example.com 30 A 10.0.0.1",
+            update.as_nsupdate_command())
+
+    def test_as_nsupdate_command_for_delete_of_record(self):
+        update = DynamicDNSUpdate(
+            "DELETE", "example.com", "foo.example.com", "A", 30, "10.0.0.1")
+        self.assertEqual(
+            "update delete foo.example.com A 10.0.0.1",
+            update.as_nsupdate_command())
+
+    def test_as_nsupdate_command_for_delete_of_rrset(self):
+        update = DynamicDNSUpdate(
+            "DELETE", "example.com", "foo.example.com", "AAAA", None, None)
+        self.assertEqual(
+            "update delete foo.example.com AAAA",
+            update.as_nsupdate_command())
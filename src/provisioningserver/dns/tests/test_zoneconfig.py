@@ -8,6 +8,7 @@ __all__ = []
 from itertools import chain
 import os.path
 import random
+from textwrap import dedent
 
 from maastesting.factory import factory
 from maastesting.matchers import MockNotCalled
@@ -17,12 +18,18 @@ from netaddr import (
     IPNetwork,
     IPRange,
 )
-from provisioningserver.dns.config import get_dns_config_dir
+from provisioningserver.dns.config import (
+    get_dns_config_dir,
+    render_dns_template,
+)
 from provisioningserver.dns.testing import patch_dns_config_path
 from provisioningserver.dns.zoneconfig import (
     DNSForwardZoneConfig,
     DNSReverseZoneConfig,
     DomainInfo,
+    get_zone_content_digest,
+    IPMappingIndex,
+    read_zone_content_digest,
 )
 from testtools.matchers import (
     Contains,
@@ -31,6 +38,7 @@ from testtools.matchers import (
     FileContains,
     HasLength,
     MatchesStructure,
+    StartsWith,
 )
 from twisted.python.filepath import FilePath
 
@@ -289,6 +297,171 @@ class TestDNSForwardZoneConfig(MAASTestCase):
         filepath = FilePath(dns_zone_config.zone_info[0].target_path)
         self.assertTrue(filepath.getPermissions().other.read)
 
+    def test_writes_zone_content_digest(self):
+        patch_dns_config_path(self)
+        dns_zone_config = DNSForwardZoneConfig(
+            factory.make_string(), serial=random.randint(1, 100))
+        self.assertEqual(
+            [dns_zone_config.domain], dns_zone_config.write_config())
+        target_path = dns_zone_config.zone_info[0].target_path
+        with open(target_path, "r", encoding="utf-8") as zone_file:
+            content = zone_file.read()
+        digest = read_zone_content_digest(target_path)
+        self.assertThat(content, StartsWith(
+            "; Zone content digest: %s.\n" % digest))
+        self.assertEqual(
+            digest, get_zone_content_digest(content.split("\n", 1)[1]))
+
+    def test_skips_zone_when_only_serial_changed(self):
+        patch_dns_config_path(self)
+        serial = random.randint(1, 100)
+        mapping = {
+            factory.make_name('host'): HostnameIPMapping(
+                None, 30, {factory.make_ipv4_address()}),
+        }
+        DNSForwardZoneConfig(
+            "example.com", serial=serial, mapping=mapping).write_config()
+        dns_zone_config = DNSForwardZoneConfig(
+            "example.com", serial=serial + 1, mapping=mapping)
+        target_path = dns_zone_config.zone_info[0].target_path
+        inode = os.stat(target_path).st_ino
+        self.assertEqual([], dns_zone_config.write_config())
+        self.assertEqual(inode, os.stat(target_path).st_ino)
+        self.assertThat(
+            target_path,
+            FileContains(matcher=Contains("%d ; serial" % serial)))
+        # No temporary files are left behind.
+        self.assertEqual(
+            ["zone.example.com"], os.listdir(os.path.dirname(target_path)))
+
+    def test_rewrites_zone_when_records_changed(self):
+        patch_dns_config_path(self)
+        serial = random.randint(1, 100)
+        DNSForwardZoneConfig("example.com", serial=serial).write_config()
+        hostname = factory.make_name('host')
+        ip = factory.make_ipv4_address()
+        dns_zone_config = DNSForwardZoneConfig(
+            "example.com", serial=serial + 1, mapping={
+                hostname: HostnameIPMapping(None, 30, {ip})})
+        self.assertEqual(["example.com"], dns_zone_config.write_config())
+        self.assertThat(
+            dns_zone_config.zone_info[0].target_path,
+            FileContains(matcher=Contains("%s 30 IN A %s" % (hostname, ip))))
+
+    def test_rewrites_zone_without_digest(self):
+        patch_dns_config_path(self)
+        dns_zone_config = DNSForwardZoneConfig(
+            "example.com", serial=random.randint(1, 100))
+        dns_zone_config.write_config()
+        # BIND does not preserve comments when it writes a zone file itself,
+        # e.g. when freezing a zone that accepts dynamic updates.
+        target_path = dns_zone_config.zone_info[0].target_path
+        with open(target_path, "w", encoding="utf-8") as zone_file:
+            zone_file.write("$TTL 30\n")
+        self.assertEqual(["example.com"], dns_zone_config.write_config())
+
+
+class TestZoneContentDigest(MAASTestCase):
+    """Tests for `get_zone_content_digest` and `read_zone_content_digest`."""
+
+    def test_digest_ignores_modification_time_and_serial(self):
+        template = dedent("""\
+            ; Zone file modified: %s.
+            $TTL 30
+            @   IN    SOA example.com. nobody.example.com. (
+                          %d ; serial
+                          600 ; Refresh
+                          )
+            """)
+        self.assertEqual(
+            get_zone_content_digest(template % ("yesterday", 1)),
+            get_zone_content_digest(template % ("today", 2)))
+
+    def test_digest_ignores_record_order(self):
+        self.assertEqual(
+            get_zone_content_digest("a 30 IN A 10.0.0.1\nb 30 IN A 10.0.0.2"),
+            get_zone_content_digest("b 30 IN A 10.0.0.2\na 30 IN A 10.0.0.1"))
+
+    def test_digest_changes_with_records(self):
+        self.assertNotEqual(
+            get_zone_content_digest("a 30 IN A 10.0.0.1"),
+            get_zone_content_digest("a 30 IN A 10.0.0.2"))
+
+    def test_read_digest_returns_None_for_missing_file(self):
+        self.assertIsNone(read_zone_content_digest(
+            os.path.join(self.make_dir(), "zone.example.com")))
+
+    def test_read_digest_returns_None_without_digest(self):
+        self.assertIsNone(read_zone_content_digest(
+            self.make_file(contents="$TTL 30\n")))
+
+
+class TestRenderZoneLines(MAASTestCase):
+    """Tests for `DomainConfigBase.render_zone_lines`."""
+
+    def test_matches_template_rendering(self):
+        ttl = random.randint(10, 300)
+        parameters = DNSForwardZoneConfig(
+            factory.make_name("domain"),
+            serial=random.randint(1, 100)).make_parameters()
+        records = {
+            'mappings': {
+                'A': [(factory.make_name('host'), ttl, '10.0.0.1')],
+                'AAAA': [(factory.make_name('host'), ttl, '2001:db8::1')],
+            },
+            'other_mapping': [
+                (factory.make_name('host'), ttl, 'MX', '10 mx.example.com.'),
+            ],
+            'generate_directives': {
+                'A': [('0-255', '10-0-0-$', '10.0.0.$')],
+            },
+        }
+        expected = render_dns_template(
+            DNSForwardZoneConfig.template_file_name, parameters, records)
+        rendered = DNSForwardZoneConfig.render_zone_lines(parameters, records)
+        self.assertItemsEqual(
+            [line for line in expected.splitlines() if line != ""],
+            [line for line in rendered if line != ""])
+
+    def test_generates_records_lazily(self):
+        def records():
+            yield 'host', 30, '10.0.0.1'
+            raise AssertionError("Generated too far.")
+
+        lines = DNSForwardZoneConfig.render_zone_lines(
+            DNSForwardZoneConfig("example.com").make_parameters(),
+            {'mappings': {'A': records()}, 'generate_directives': {}})
+        self.assertIn('host 30 IN A 10.0.0.1', lines)
+
+
+class TestIPMappingIndex(MAASTestCase):
+    """Tests for `IPMappingIndex`."""
+
+    def test_enumerate_network_returns_only_addresses_in_network(self):
+        mapping = {
+            'a.example.com': HostnameIPMapping(
+                None, 30, {'10.0.1.2', '10.0.2.2', '2001:db8::1'}),
+            'b.example.com': HostnameIPMapping(None, 60, {'10.0.1.1'}),
+            'c.example.com': HostnameIPMapping(None, 90, {'10.0.1.255'}),
+        }
+        index = IPMappingIndex(mapping)
+        self.assertEqual([
+            ('b.example.com', 60, IPAddress('10.0.1.1')),
+            ('a.example.com', 30, IPAddress('10.0.1.2')),
+            ('c.example.com', 90, IPAddress('10.0.1.255')),
+        ], list(index.enumerate_network(IPNetwork('10.0.1.0/24'))))
+        self.assertEqual([
+            ('a.example.com', 30, IPAddress('2001:db8::1')),
+        ], list(index.enumerate_network(IPNetwork('2001:db8::/64'))))
+        self.assertEqual(
+            [], list(index.enumerate_network(IPNetwork('10.0.3.0/24'))))
+
+    def test_keeps_mapping(self):
+        mapping = {
+            'a.example.com': HostnameIPMapping(None, 30, {'10.0.1.2'}),
+        }
+        self.assertIs(mapping, IPMappingIndex(mapping).mapping)
+
 
 class TestDNSReverseZoneConfig(MAASTestCase):
     """Tests for DNSReverseZoneConfig."""
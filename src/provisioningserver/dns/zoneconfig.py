@@ -7,10 +7,17 @@ __all__ = [
     'DNSForwardZoneConfig',
     'DNSReverseZoneConfig',
     'DomainInfo',
+    'IPMappingIndex',
     ]
 
+from bisect import (
+    bisect_left,
+    bisect_right,
+)
 from datetime import datetime
+from hashlib import sha256
 from itertools import chain
+import re
 
 from netaddr import (
     IPAddress,
@@ -23,13 +30,74 @@ from provisioningserver.dns.config import (
     render_dns_template,
     report_missing_config_dir,
 )
-from provisioningserver.utils.fs import incremental_write
+from provisioningserver.utils.fs import AtomicFileWriter
 from provisioningserver.utils.network import (
     intersect_iprange,
     ip_range_within_network,
 )
 
 
+# The first line of every zone file that MAAS writes records a digest of the
+# zone's content, so that unchanged zones need not be rewritten or reloaded.
+ZONE_DIGEST_LINE = "; Zone content digest: %s.\n"
+ZONE_DIGEST_PATTERN = re.compile(r"^; Zone content digest: ([0-9a-f]+)\.$")
+
+# Lines of a rendered zone file that change on every publication, even when
+# the zone's records do not.
+ZONE_VOLATILE_LINE_PATTERN = re.compile(
+    r"^(; Zone file modified: .*|\s*\d+ ; serial)$")
+
+
+class ZoneContentDigest:
+    """A digest of the lines of a zone file, computed one line at a time.
+
+    The modification time and SOA serial are excluded, so two renderings of
+    the same records produce the same digest.  The digest does not depend on
+    the order of the lines either, because records are rendered from sets and
+    dicts, whose order is not stable: it is the sum of the digests of each
+    line, modulo 2^256.
+    """
+
+    def __init__(self):
+        self.total = 0
+
+    def update(self, line):
+        """Add `line`, without its line ending, to the digest."""
+        if ZONE_VOLATILE_LINE_PATTERN.match(line) is None:
+            line_digest = sha256(line.encode("utf-8")).digest()
+            self.total += int.from_bytes(line_digest, "big")
+            self.total &= (1 << 256) - 1
+
+    def hexdigest(self):
+        return "%064x" % self.total
+
+
+def get_zone_content_digest(content):
+    """Return a digest of the rendered zone file `content`.
+
+    See `ZoneContentDigest`.
+    """
+    digest = ZoneContentDigest()
+    for line in content.splitlines():
+        digest.update(line)
+    return digest.hexdigest()
+
+
+def read_zone_content_digest(path):
+    """Return the digest recorded in the zone file at `path`.
+
+    :return: The digest, or `None` if the file does not exist or does not
+        record a digest; BIND drops it when it rewrites a zone file itself.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as zone_file:
+            first_line = zone_file.readline()
+    except (FileNotFoundError, UnicodeDecodeError):
+        return None
+    match = ZONE_DIGEST_PATTERN.match(first_line.rstrip("\n"))
+    return None if match is None else match.group(1)
+
+
 def get_fqdn_or_ip_address(target):
     """Returns the ip address is target is a valid ip address, otherwise
     returns the target with appended '.' if missing."""
@@ -61,6 +129,45 @@ def enumerate_rrset_mapping(mapping):
             yield hostname, value[0], value[1], value[2]
 
 
+class IPMappingIndex:
+    """An index of a hostname:info mapping, sorted by IP address.
+
+    This allows the entries within a network to be found without examining
+    every entry in the mapping, so one index can be shared between the reverse
+    zones of many networks.
+    """
+
+    def __init__(self, mapping):
+        """
+        :param mapping: A dict mapping host names to info about the host:
+            .ttl: ttl for the RRset, .ips: list of ip addresses.
+        """
+        self.mapping = mapping
+        entries = sorted((
+            (IPAddress(ip), hostname, ttl)
+            for hostname, ttl, ip in enumerate_ip_mapping(mapping)),
+            key=lambda entry: entry[:2])
+        # Parallel lists of the address values, for bisection, and of the
+        # entries themselves, separately for each IP version.
+        self._values = {4: [], 6: []}
+        self._entries = {4: [], 6: []}
+        for ip, hostname, ttl in entries:
+            self._values[ip.version].append(ip.value)
+            self._entries[ip.version].append((hostname, ttl, ip))
+
+    def enumerate_network(self, network):
+        """Generate `(hostname, ttl, ip)` tuples for the IPs in `network`.
+
+        :type network: :class:`netaddr.IPNetwork`
+        """
+        values = self._values[network.version]
+        entries = self._entries[network.version]
+        start = bisect_left(values, network.first)
+        end = bisect_right(values, network.last)
+        for position in range(start, end):
+            yield entries[position]
+
+
 def get_details_for_ip_range(ip_range):
     """For a given IPRange, return all subnets, a useable prefix and the
     reverse DNS suffix calculated from that IP range.
@@ -163,6 +270,28 @@ class DomainConfigBase:
             'ns_host_name': self.ns_host_name,
         }
 
+    @classmethod
+    def render_zone_lines(cls, *parameters):
+        """Generate the lines of a zone file, without line endings.
+
+        The SOA, NS and $GENERATE lines come from the zone file template.  The
+        records from the `mappings` and `other_mapping` parameters, of which
+        there may be very many, are generated one at a time instead, so that
+        the whole zone is never held in memory.
+        """
+        parameters = dict(chain.from_iterable(
+            params.items() for params in parameters))
+        mappings = parameters.pop('mappings', {})
+        other_mapping = parameters.pop('other_mapping', [])
+        yield from render_dns_template(
+            cls.template_file_name, parameters,
+            {'mappings': {}, 'other_mapping': []}).splitlines()
+        for rrtype, mapping in mappings.items():
+            for item_from, rrttl, item_to in mapping:
+                yield "%s %s IN %s %s" % (item_from, rrttl, rrtype, item_to)
+        for item_from, rrttl, rrtype, rrdata in other_mapping:
+            yield "%s %s IN %s %s" % (item_from, rrttl, rrtype, rrdata)
+
     @classmethod
     def write_zone_file(cls, output_file, *parameters):
         """Write a zone file based on the zone file template.
@@ -171,14 +300,36 @@ class DomainConfigBase:
         increase with every rewrite.  Some filesystems (ext3?) only seem to
         support a resolution of one second, and so this method may set an
         unexpected modification time in order to maintain that property.
+
+        The zone is written out as it is rendered.  A zone file whose records
+        are unchanged, ignoring the serial, is left alone.
+
+        :return: True if any file was written, False otherwise.
         """
         if not isinstance(output_file, list):
             output_file = [output_file]
+        written = False
         for outfile in output_file:
-            content = render_dns_template(cls.template_file_name, *parameters)
+            previous_digest = read_zone_content_digest(outfile)
+            digest = ZoneContentDigest()
             with report_missing_config_dir():
-                incremental_write(content.encode("utf-8"), outfile, mode=0o644)
-        pass
+                with AtomicFileWriter(outfile, mode=0o644) as writer:
+                    # The digest is only known at the end, but it's always the
+                    # same length, so reserve its line for now.
+                    writer.write(
+                        (ZONE_DIGEST_LINE % ("0" * 64)).encode("utf-8"))
+                    for line in cls.render_zone_lines(*parameters):
+                        digest.update(line)
+                        writer.write(("%s\n" % line).encode("utf-8"))
+                    if digest.hexdigest() == previous_digest:
+                        writer.discard()
+                    else:
+                        writer.seek(0)
+                        writer.write((
+                            ZONE_DIGEST_LINE % digest.hexdigest()
+                        ).encode("utf-8"))
+                        written = True
+        return written
 
 
 class DNSForwardZoneConfig(DomainConfigBase):
@@ -293,7 +444,11 @@ class DNSForwardZoneConfig(DomainConfigBase):
             generate_directives, key=lambda directive: directive[2])
 
     def write_config(self):
-        """Write the zone file."""
+        """Write the zone file, unless its records are unchanged.
+
+        :return: A list of the names of the zones that were written.
+        """
+        written = []
         # Create GENERATE directives for IPv4 ranges.
         for zi in self.zone_info:
             generate_directives = list(
@@ -302,7 +457,7 @@ class DNSForwardZoneConfig(DomainConfigBase):
                     for dynamic_range in self._dynamic_ranges
                     if dynamic_range.version == 4
                 ))
-            self.write_zone_file(
+            changed = self.write_zone_file(
                 zi.target_path, self.make_parameters(),
                 {
                     'mappings': {
@@ -317,6 +472,9 @@ class DNSForwardZoneConfig(DomainConfigBase):
                         'A': generate_directives,
                     }
                 })
+            if changed:
+                written.append(zi.zone_name)
+        return written
 
 
 class DNSReverseZoneConfig(DomainConfigBase):
@@ -334,15 +492,21 @@ class DNSReverseZoneConfig(DomainConfigBase):
         :param serial: The serial to use in the zone file. This must increment
             on each change.
         :param mapping: A hostname:ips mapping for all known hosts in
-            the reverse zone.  They will be mapped as PTR records.  IP
-            addresses not in `network` will be dropped.
+            the reverse zone, or an `IPMappingIndex` of one.  They will be
+            mapped as PTR records.  IP addresses not in `network` will be
+            dropped.
         :param default_ttl: The default TTL for the zone.
         :param network: The network that the mapping exists within.
         :type network: :class:`netaddr.IPNetwork`
         :param rfc2317_ranges: List of ranges to generate RFC2317 CNAMEs for
         :type rfc2317_ranges: [:class:`netaddr.IPNetwork`]
         """
-        self._mapping = kwargs.pop('mapping', {})
+        mapping = kwargs.pop('mapping', {})
+        if mapping is not None and not isinstance(mapping, IPMappingIndex):
+            # Index the mapping once, rather than scanning all of it for each
+            # of the zones that make up this network.
+            mapping = IPMappingIndex(mapping)
+        self._mapping = mapping
         self._network = kwargs.pop("network", None)
         self._dynamic_ranges = kwargs.pop('dynamic_ranges', [])
         self._rfc2317_ranges = kwargs.pop('rfc2317_ranges', [])
@@ -458,11 +622,12 @@ class DNSReverseZoneConfig(DomainConfigBase):
 
         if mapping is None:
             return ()
+        if not isinstance(mapping, IPMappingIndex):
+            mapping = IPMappingIndex(mapping)
+        # Only the IP addresses that are in `network` are included.
         return (
             (short_name(ip, network), ttl, '%s.' % (hostname))
-            for hostname, ttl, ip in enumerate_ip_mapping(mapping)
-            # Filter out the IP addresses that are not in `network`.
-            if IPAddress(ip) in network
+            for hostname, ttl, ip in mapping.enumerate_network(network)
         )
 
     @classmethod
@@ -531,7 +696,11 @@ class DNSReverseZoneConfig(DomainConfigBase):
         return sorted(generate_directives)
 
     def write_config(self):
-        """Write the zone file."""
+        """Write the zone files, skipping those whose records are unchanged.
+
+        :return: A list of the names of the zones that were written.
+        """
+        written = []
         # Create GENERATE directives for IPv4 ranges.
         for zi in self.zone_info:
             generate_directives = list(
@@ -543,7 +712,7 @@ class DNSReverseZoneConfig(DomainConfigBase):
                     for dynamic_range in self._dynamic_ranges
                     if dynamic_range.version == 4
                 ))
-            self.write_zone_file(
+            changed = self.write_zone_file(
                 zi.target_path, self.make_parameters(),
                 {
                     'mappings': {
@@ -558,5 +727,7 @@ class DNSReverseZoneConfig(DomainConfigBase):
                             self._rfc2317_ranges,
                             self.domain),
                     }
-                }
-            )
+                })
+            if changed:
+                written.append(zi.zone_name)
+        return written
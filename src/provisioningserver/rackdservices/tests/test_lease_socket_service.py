@@ -10,12 +10,16 @@ import os
 import socket
 import time
 from unittest.mock import (
+    call,
     MagicMock,
     sentinel,
 )
 
 from maastesting.factory import factory
-from maastesting.matchers import MockCalledOnceWith
+from maastesting.matchers import (
+    MockCalledOnceWith,
+    MockCallsMatch,
+)
 from maastesting.testcase import (
     MAASTestCase,
     MAASTwistedRunTest,
@@ -25,7 +29,10 @@ from provisioningserver.rackdservices.lease_socket_service import (
     LeaseSocketService,
 )
 from provisioningserver.rpc import getRegionClient
-from provisioningserver.rpc.region import UpdateLease
+from provisioningserver.rpc.region import (
+    UpdateLease,
+    UpdateLeases,
+)
 from provisioningserver.rpc.testing import MockLiveClusterToRegionRPCFixture
 from provisioningserver.utils.twisted import (
     DeferredValue,
@@ -61,6 +68,17 @@ class TestLeaseSocketService(MAASTestCase):
         protocol, connecting = fixture.makeEventLoop(UpdateLease)
         return protocol, connecting
 
+    def make_packet(self):
+        return {
+            "action": "commit",
+            "mac": factory.make_mac_address(),
+            "ip_family": "ipv4",
+            "ip": factory.make_ipv4_address(),
+            "timestamp": int(time.time()),
+            "lease_time": 30,
+            "hostname": factory.make_name("host"),
+        }
+
     def send_notification(self, socket_path, payload):
         conn = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
         conn.connect(socket_path)
@@ -128,16 +146,18 @@ class TestLeaseSocketService(MAASTestCase):
         self.assertEquals([packet], list(service.notifications))
 
     @defer.inlineCallbacks
-    def test_processNotification_gets_called_with_notification(self):
+    def test_processNotificationBatch_gets_called_with_notification(self):
         socket_path = self.patch_socket_path()
         service = LeaseSocketService(
             sentinel.service, reactor)
         dv = DeferredValue()
 
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
+        # Mock processNotificationBatch to catch the call.
+        def mock_processNotificationBatch(*args, **kwargs):
             dv.set(args)
-        self.patch(service, "processNotification", mock_processNotification)
+        self.patch(
+            service, "processNotificationBatch",
+            mock_processNotificationBatch)
 
         # Start the service and stop it at the end of the test.
         service.startService()
@@ -152,52 +172,62 @@ class TestLeaseSocketService(MAASTestCase):
         yield deferToThread(self.send_notification, socket_path, packet)
         yield dv.get(timeout=10)
 
-        # Packet should be the argument passed to processNotifcation
-        self.assertEquals((packet,), dv.value)
+        # Packet should be the argument passed to processNotificationBatch.
+        self.assertEquals(([packet],), dv.value)
 
-    @defer.inlineCallbacks
-    def test_processNotification_gets_called_multiple_times(self):
-        socket_path = self.patch_socket_path()
+    def test_processNotifications_sends_queued_notifications_in_batches(self):
         service = LeaseSocketService(
             sentinel.service, reactor)
-        dvs = [
-            DeferredValue(),
-            DeferredValue(),
+        service.batch_size = 2
+        batches = []
+
+        # Mock processNotificationBatch to catch the calls.
+        def mock_processNotificationBatch(batch, clock):
+            batches.append(batch)
+        self.patch(
+            service, "processNotificationBatch",
+            mock_processNotificationBatch)
+
+        packets = [
+            {"test": factory.make_name("test")}
+            for _ in range(3)
         ]
+        service.notifications.extend(packets)
+        d = service.processNotifications()
 
-        # Mock processNotifcation to catch the call.
-        def mock_processNotification(*args, **kwargs):
-            for dv in dvs:
-                if not dv.isSet:
-                    dv.set(args)
-                    break
-        self.patch(service, "processNotification", mock_processNotification)
+        def check(_):
+            # Packets are sent in order.
+            self.assertEquals([packets[:2], packets[2:]], batches)
+            self.assertEquals(0, len(service.notifications))
 
-        # Start the service and stop it at the end of the test.
-        service.startService()
-        self.addCleanup(service.stopService)
+        return d.addCallback(check)
 
-        # Create test payload to send.
-        packet1 = {
-            "test1": factory.make_name("test1")
-        }
-        packet2 = {
-            "test2": factory.make_name("test2")
-        }
+    @defer.inlineCallbacks
+    def test_processNotificationBatch_send_to_region(self):
+        fixture = self.useFixture(MockLiveClusterToRegionRPCFixture())
+        protocol, connecting = fixture.makeEventLoop(UpdateLeases)
+        self.addCleanup((yield connecting))
 
-        # Send notifications to the socket and wait for notifications.
-        yield deferToThread(self.send_notification, socket_path, packet1)
-        yield deferToThread(self.send_notification, socket_path, packet2)
-        yield dvs[0].get(timeout=10)
-        yield dvs[1].get(timeout=10)
+        client = getRegionClient()
+        rpc_service = MagicMock()
+        rpc_service.getClientNow.return_value = defer.succeed(client)
+        service = LeaseSocketService(
+            rpc_service, reactor)
 
-        # Packet should be the argument passed to processNotification in
-        # order.
-        self.assertEquals((packet1,), dvs[0].value)
-        self.assertEquals((packet2,), dvs[1].value)
+        # Notifications to region.
+        packets = [
+            self.make_packet()
+            for _ in range(3)
+        ]
+        yield service.processNotificationBatch(packets, clock=reactor)
+        self.assertThat(
+            protocol.UpdateLeases,
+            MockCalledOnceWith(
+                protocol, cluster_uuid=client.localIdent, updates=packets))
 
     @defer.inlineCallbacks
-    def test_processNotification_send_to_region(self):
+    def test_processNotificationBatch_falls_back_to_UpdateLease(self):
+        # The region does not know about UpdateLeases.
         protocol, connecting = self.patch_rpc_UpdateLease()
         self.addCleanup((yield connecting))
 
@@ -207,26 +237,15 @@ class TestLeaseSocketService(MAASTestCase):
         service = LeaseSocketService(
             rpc_service, reactor)
 
-        # Notification to region.
-        packet = {
-            "action": "commit",
-            "mac": factory.make_mac_address(),
-            "ip_family": "ipv4",
-            "ip": factory.make_ipv4_address(),
-            "timestamp": int(time.time()),
-            "lease_time": 30,
-            "hostname": factory.make_name("host"),
-        }
-        yield service.processNotification(packet, clock=reactor)
+        # Notifications to region.
+        packets = [
+            self.make_packet()
+            for _ in range(2)
+        ]
+        yield service.processNotificationBatch(packets, clock=reactor)
         self.assertThat(
             protocol.UpdateLease,
-            MockCalledOnceWith(
-                protocol,
-                cluster_uuid=client.localIdent,
-                action=packet["action"],
-                mac=packet["mac"],
-                ip_family=packet["ip_family"],
-                ip=packet["ip"],
-                timestamp=packet["timestamp"],
-                lease_time=packet["lease_time"],
-                hostname=packet["hostname"]))
+            MockCallsMatch(*(
+                call(protocol, cluster_uuid=client.localIdent, **packet)
+                for packet in packets
+            )))
@@ -16,6 +16,7 @@ __all__ = [
     "ConfigureDHCPv6_V2",
     "DescribePowerTypes",
     "DescribeNOSTypes",
+    "GetDHCPStatistics",
     "GetPreseedData",
     "Identify",
     "ListBootImages",
@@ -526,6 +527,19 @@ class ValidateDHCPv6Config_V2(_ValidateDHCPConfig_V2):
     """
 
 
+class GetDHCPStatistics(amp.Command):
+    """Get the statistics of how this rack has updated its DHCP servers.
+
+    :since: 2.4
+    """
+
+    arguments = []
+    response = [
+        (b"statistics", StructureAsJSON()),
+    ]
+    errors = []
+
+
 class ImportBootImages(amp.Command):
     """Import boot images and report the final
     boot images that exist on the cluster.
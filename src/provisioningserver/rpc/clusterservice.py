@@ -515,6 +515,15 @@ class Cluster(RPCProtocol):
         d.addCallback(lambda ret: {'errors': ret} if ret is not None else {})
         return d
 
+    @cluster.GetDHCPStatistics.responder
+    def get_dhcp_statistics(self):
+        """get_dhcp_statistics()
+
+        Implementation of
+        :py:class:`~provisioningserver.rpc.cluster.GetDHCPStatistics`.
+        """
+        return {"statistics": dhcp.get_dhcp_statistics()}
+
     @amp.StartTLS.responder
     def get_tls_parameters(self):
         """get_tls_parameters()
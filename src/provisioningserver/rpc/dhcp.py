@@ -8,14 +8,19 @@ __all__ = [
     "DHCPv4Server",
     "DHCPv6Server",
     "downgrade_shared_networks",
+    "get_dhcp_statistics",
     "upgrade_shared_networks",
 ]
 
-from collections import namedtuple
+from collections import (
+    defaultdict,
+    namedtuple,
+)
 from operator import itemgetter
 import os
 import re
 from tempfile import NamedTemporaryFile
+import time
 
 from netaddr import IPAddress
 from provisioningserver.dhcp import (
@@ -23,6 +28,11 @@ from provisioningserver.dhcp import (
     DHCPv6Server,
 )
 from provisioningserver.dhcp.config import get_config
+from provisioningserver.dhcp.omapi import (
+    get_omapi_client,
+    OmapiError,
+    OmapiProtocolError,
+)
 from provisioningserver.dhcp.omshell import Omshell
 from provisioningserver.logger import get_maas_logger
 from provisioningserver.rpc.exceptions import (
@@ -50,9 +60,16 @@ from provisioningserver.utils.twisted import (
     synchronous,
 )
 from twisted.internet.defer import (
+    CancelledError,
+    DeferredList,
     inlineCallbacks,
     maybeDeferred,
 )
+from twisted.internet.error import (
+    ConnectError,
+    ConnectionClosed,
+    TimeoutError,
+)
 from twisted.internet.threads import deferToThread
 
 
@@ -63,6 +80,56 @@ maaslog = get_maas_logger("dhcp")
 _current_server_state = {}
 
 
+class DHCPServerStatistics:
+    """Counts the ways in which `configure` has updated a DHCP server, and
+    the time spent doing so.
+
+    A restart is needed whenever the configuration changes in a way that the
+    OMAPI cannot express; otherwise only host maps are updated. A rising
+    proportion of restarts, or of host map updates that fail and fall back
+    to a restart, means that the fast path is not being taken.
+    """
+
+    def __init__(self):
+        super(DHCPServerStatistics, self).__init__()
+        # Number of configuration files written.
+        self.writes = 0
+        # Number of restarts, including those after failed host updates.
+        self.restarts = 0
+        # Number of successful host-only updates, and hosts they changed.
+        self.host_updates = 0
+        self.hosts_updated = 0
+        # Number of host-only updates that failed and caused a restart.
+        self.host_update_failures = 0
+        # Number of times the server was started, rather than restarted,
+        # to pick up new host maps because it was not running.
+        self.starts = 0
+        # Number of times nothing had changed.
+        self.unchanged = 0
+        # Seconds spent rendering and writing configuration, restarting the
+        # server, and updating host maps.
+        self.write_seconds = 0.0
+        self.restart_seconds = 0.0
+        self.host_update_seconds = 0.0
+
+    def as_dict(self):
+        """Return the statistics as a dict."""
+        return dict(vars(self))
+
+
+# Holds the statistics for DHCPv4 and DHCPv6.
+_server_statistics = defaultdict(DHCPServerStatistics)
+
+
+def get_dhcp_statistics():
+    """Return the statistics for each DHCP server that has been configured,
+    keyed by service name."""
+    return {
+        dhcp_service: statistics.as_dict()
+        for dhcp_service, statistics in _server_statistics.items()
+    }
+
+
 DHCPStateBase = namedtuple("DHCPStateBase", [
     "omapi_key",
     "failover_peers",
@@ -226,8 +293,8 @@ def _modify_host_map(omshell, mac, ip_address):
 
 
 @synchronous
-def _update_hosts(server, remove, add, modify):
-    """Update the hosts using the OMAPI."""
+def _update_hosts_with_omshell(server, remove, add, modify):
+    """Update the hosts using the OMAPI, by way of `omshell`."""
     omshell = Omshell(
         server_address='127.0.0.1', shared_key=server.omapi_key,
         ipv6=server.ipv6)
@@ -239,6 +306,85 @@ def _update_hosts(server, remove, add, modify):
         _modify_host_map(omshell, host["mac"], host["ip"])
 
 
+# Errors from the native OMAPI client that mean the conversation with the
+# DHCP server failed, rather than that the DHCP server refused a change.
+_omapi_connection_errors = (
+    CancelledError,
+    ConnectError,
+    ConnectionClosed,
+    OmapiProtocolError,
+    TimeoutError,
+)
+
+
+def _call_omapi(call, error_class, err):
+    """Call `call` and translate an `OmapiError` into `error_class`."""
+
+    def eb_omapi_error(failure):
+        failure.trap(OmapiError)
+        message = "%s: %s" % (err, failure.value)
+        maaslog.error(message)
+        raise error_class(message)
+
+    return maybeDeferred(call).addErrback(eb_omapi_error)
+
+
+@inlineCallbacks
+def _gather(calls):
+    """Wait for all of `calls` and re-raise the first failure, if any."""
+    results = yield DeferredList(list(calls), consumeErrors=True)
+    for success, result in results:
+        if not success:
+            result.raiseException()
+
+
+@inlineCallbacks
+def _update_hosts_with_omapi(server, remove, add, modify):
+    """Update the hosts using the native OMAPI client.
+
+    Changes within each of `remove`, `add`, and `modify` are sent together,
+    but all removals finish before additions start, and so on, so that a
+    host moving between MAC addresses is not mapped twice.
+    """
+    client = yield get_omapi_client(
+        '127.0.0.1', server.omapi_key, ipv6=server.ipv6)
+    yield _gather(
+        _call_omapi(
+            lambda mac=host["mac"]: client.remove(mac), CannotRemoveHostMap,
+            "Could not remove host map for %s" % host["mac"])
+        for host in remove)
+    yield _gather(
+        _call_omapi(
+            lambda mac=host["mac"], ip=host["ip"]: client.create(ip, mac),
+            CannotCreateHostMap, "Could not create host map for %s -> %s" % (
+                host["mac"], host["ip"]))
+        for host in add)
+    yield _gather(
+        _call_omapi(
+            lambda mac=host["mac"], ip=host["ip"]: client.modify(ip, mac),
+            CannotModifyHostMap, "Could not modify host map for %s -> %s" % (
+                host["mac"], host["ip"]))
+        for host in modify)
+
+
+@asynchronous
+@inlineCallbacks
+def _update_hosts(server, remove, add, modify):
+    """Update the hosts using the OMAPI.
+
+    The native OMAPI client is used, falling back to `omshell` if the
+    conversation with the DHCP server fails.
+    """
+    try:
+        yield _update_hosts_with_omapi(server, remove, add, modify)
+    except _omapi_connection_errors as error:
+        maaslog.warning(
+            "Could not update host maps for %s over the OMAPI (%s); "
+            "trying again with omshell." % (server.descriptive_name, error))
+        yield deferToThread(
+            _update_hosts_with_omshell, server, remove, add, modify)
+
+
 @asynchronous
 def _catch_service_error(server, action, call, *args, **kwargs):
     """Helper to catch `ServiceActionError` and `Exception` when performing
@@ -257,6 +403,17 @@ def _catch_service_error(server, action, call, *args, **kwargs):
     return maybeDeferred(call, *args, **kwargs).addErrback(eb)
 
 
+@inlineCallbacks
+def _restart(server, statistics):
+    """Restart `server`, recording the restart in `statistics`."""
+    started = time.monotonic()
+    yield _catch_service_error(
+        server, "restart",
+        service_monitor.restartService, server.dhcp_service)
+    statistics.restarts += 1
+    statistics.restart_seconds += time.monotonic() - started
+
+
 @asynchronous
 @inlineCallbacks
 def configure(
@@ -304,7 +461,11 @@ def configure(
         # Always write the config, that way its always up-to-date. Even if
         # we are not going to restart the services. This makes sure that even
         # the comments in the file are updated.
+        statistics = _server_statistics[server.dhcp_service]
+        started = time.monotonic()
         yield deferToThread(_write_config, server, new_state)
+        statistics.writes += 1
+        statistics.write_seconds += time.monotonic() - started
 
         # Service should always be on if shared_networks exists.
         service = service_monitor.getServiceByName(server.dhcp_service)
@@ -313,13 +474,9 @@ def configure(
         # Perform the required action based on the state change.
         current_state = _current_server_state.get(server.dhcp_service, None)
         if current_state is None:
-            yield _catch_service_error(
-                server, "restart",
-                service_monitor.restartService, server.dhcp_service)
+            yield _restart(server, statistics)
         elif new_state.requires_restart(current_state):
-            yield _catch_service_error(
-                server, "restart",
-                service_monitor.restartService, server.dhcp_service)
+            yield _restart(server, statistics)
         else:
             # No restart required update the host mappings if needed.
             remove, add, modify = new_state.host_diff(current_state)
@@ -328,6 +485,7 @@ def configure(
                 yield _catch_service_error(
                     server, "start",
                     service_monitor.ensureService, server.dhcp_service)
+                statistics.unchanged += 1
             else:
                 # Check the state of the service. Only if the services was on
                 # should the host maps be updated over the OMAPI.
@@ -339,9 +497,9 @@ def configure(
                 if before_state.active_state == SERVICE_STATE.ON:
                     # Was already running, so update host maps over OMAPI
                     # instead of performing a full restart.
+                    started = time.monotonic()
                     try:
-                        yield deferToThread(
-                            _update_hosts, server, remove, add, modify)
+                        yield _update_hosts(server, remove, add, modify)
                     except:
                         # Error updating the host maps over the OMAPI.
                         # Restart the DHCP service so that the host maps
@@ -350,10 +508,22 @@ def configure(
                             "Failed to update all host maps. Restarting %s "
                             "service to ensure host maps are in-sync." % (
                                 server.descriptive_name))
-                        yield _catch_service_error(
-                            server, "restart",
-                            service_monitor.restartService,
-                            server.dhcp_service)
+                        statistics.host_update_failures += 1
+                        yield _restart(server, statistics)
+                    else:
+                        statistics.host_updates += 1
+                        statistics.hosts_updated += (
+                            len(remove) + len(add) + len(modify))
+                        statistics.host_update_seconds += (
+                            time.monotonic() - started)
+                else:
+                    statistics.starts += 1
+
+        maaslog.debug(
+            "%s server statistics: %s", server.descriptive_name,
+            ", ".join(
+                "%s=%s" % item
+                for item in sorted(statistics.as_dict().items())))
 
         # Update the current state to the new state.
         _current_server_state[server.dhcp_service] = new_state
@@ -5,6 +5,7 @@
 
 __all__ = []
 
+from collections import defaultdict
 from hashlib import sha256
 from hmac import HMAC
 from itertools import product
@@ -121,12 +122,14 @@ from provisioningserver.utils.twisted import makeDeferredWithProcessProtocol
 from provisioningserver.utils.version import get_maas_version
 from testtools import ExpectedException
 from testtools.matchers import (
+    ContainsDict,
     Equals,
     HasLength,
     Is,
     IsInstance,
     KeysEqual,
     MatchesAll,
+    MatchesDict,
     MatchesListwise,
     MatchesStructure,
 )
@@ -2221,6 +2224,40 @@ class TestClusterProtocol_ValidateDHCP(MAASTestCase):
             response['errors'])
 
 
+class TestClusterProtocol_GetDHCPStatistics(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def test_get_dhcp_statistics_is_registered(self):
+        protocol = Cluster()
+        responder = protocol.locateResponder(
+            cluster.GetDHCPStatistics.commandName)
+        self.assertIsNotNone(responder)
+
+    @inlineCallbacks
+    def test_get_dhcp_statistics_returns_statistics_for_each_server(self):
+        server_statistics = self.patch(
+            dhcp, "_server_statistics",
+            defaultdict(dhcp.DHCPServerStatistics))
+        server_statistics["dhcpd"].restarts = 2
+        server_statistics["dhcpd"].host_updates = 3
+        server_statistics["dhcpd6"].host_update_failures = 1
+
+        response = yield call_responder(
+            Cluster(), cluster.GetDHCPStatistics, {})
+
+        self.assertThat(response, KeysEqual("statistics"))
+        self.assertThat(response["statistics"], MatchesDict({
+            "dhcpd": ContainsDict({
+                "restarts": Equals(2),
+                "host_updates": Equals(3),
+            }),
+            "dhcpd6": ContainsDict({
+                "host_update_failures": Equals(1),
+            }),
+        }))
+
+
 class TestClusterProtocol_EvaluateTag(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
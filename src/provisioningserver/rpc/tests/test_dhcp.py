@@ -36,6 +36,7 @@ from provisioningserver.dhcp.testing.config import (
     make_shared_network,
     make_subnet_dhcp_snippets,
 )
+from provisioningserver.dhcp.omapi import OmapiError
 from provisioningserver.rpc import (
     dhcp,
     exceptions,
@@ -47,8 +48,17 @@ from provisioningserver.utils.service_monitor import (
 )
 from provisioningserver.utils.shell import ExternalProcessError
 from testtools import ExpectedException
-from testtools.matchers import MatchesStructure
-from twisted.internet.defer import inlineCallbacks
+from testtools.matchers import (
+    ContainsDict,
+    Equals,
+    MatchesStructure,
+)
+from twisted.internet.defer import (
+    fail,
+    inlineCallbacks,
+    succeed,
+)
+from twisted.internet.error import ConnectionRefusedError
 
 
 class TestDHCPState(MAASTestCase):
@@ -410,13 +420,13 @@ class TestCreateHostMap(MAASTestCase):
             logger.output)
 
 
-class TestUpdateHost(MAASTestCase):
+class TestUpdateHostWithOmshell(MAASTestCase):
 
     def test__creates_omshell_with_correct_arguments(self):
         omshell = self.patch(dhcp, "Omshell")
         server = Mock()
         server.ipv6 = factory.pick_bool()
-        dhcp._update_hosts(server, [], [], [])
+        dhcp._update_hosts_with_omshell(server, [], [], [])
         self.assertThat(omshell, MockCallsMatch(
             call(
                 ipv6=server.ipv6, server_address="127.0.0.1",
@@ -431,7 +441,8 @@ class TestUpdateHost(MAASTestCase):
         modify_host = make_host()
         server = Mock()
         server.ipv6 = factory.pick_bool()
-        dhcp._update_hosts(server, [remove_host], [add_host], [modify_host])
+        dhcp._update_hosts_with_omshell(
+            server, [remove_host], [add_host], [modify_host])
         self.assertThat(
             omshell.remove,
             MockCallsMatch(
@@ -449,6 +460,77 @@ class TestUpdateHost(MAASTestCase):
             ))
 
 
+class TestUpdateHost(MAASTestCase):
+
+    run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
+
+    def patch_omapi_client(self):
+        client = Mock()
+        client.remove.return_value = succeed(None)
+        client.create.return_value = succeed(None)
+        client.modify.return_value = succeed(None)
+        get_omapi_client = self.patch(dhcp, "get_omapi_client")
+        get_omapi_client.return_value = succeed(client)
+        return get_omapi_client, client
+
+    @inlineCallbacks
+    def test__connects_omapi_client_with_correct_arguments(self):
+        get_omapi_client, _ = self.patch_omapi_client()
+        server = Mock()
+        server.ipv6 = factory.pick_bool()
+        yield dhcp._update_hosts(server, [], [], [])
+        self.assertThat(get_omapi_client, MockCalledOnceWith(
+            "127.0.0.1", server.omapi_key, ipv6=server.ipv6))
+
+    @inlineCallbacks
+    def test__performs_operations(self):
+        _, client = self.patch_omapi_client()
+        remove_host = make_host()
+        add_host = make_host()
+        modify_host = make_host()
+        server = Mock()
+        server.ipv6 = factory.pick_bool()
+        yield dhcp._update_hosts(
+            server, [remove_host], [add_host], [modify_host])
+        self.assertThat(
+            client.remove, MockCalledOnceWith(remove_host["mac"]))
+        self.assertThat(
+            client.create,
+            MockCalledOnceWith(add_host["ip"], add_host["mac"]))
+        self.assertThat(
+            client.modify,
+            MockCalledOnceWith(modify_host["ip"], modify_host["mac"]))
+
+    @inlineCallbacks
+    def test__raises_CannotCreateHostMap_when_refused(self):
+        _, client = self.patch_omapi_client()
+        client.create.return_value = fail(OmapiError("refused"))
+        update_hosts_with_omshell = self.patch(
+            dhcp, "_update_hosts_with_omshell")
+        add_host = make_host()
+        server = Mock()
+        with FakeLogger("maas.dhcp") as logger:
+            with ExpectedException(exceptions.CannotCreateHostMap):
+                yield dhcp._update_hosts(server, [], [add_host], [])
+        self.assertDocTestMatches(
+            "Could not create host map for %s -> %s: refused" % (
+                add_host["mac"], add_host["ip"]),
+            logger.output)
+        self.assertThat(update_hosts_with_omshell, MockNotCalled())
+
+    @inlineCallbacks
+    def test__falls_back_to_omshell_when_omapi_connection_fails(self):
+        get_omapi_client, _ = self.patch_omapi_client()
+        get_omapi_client.return_value = fail(ConnectionRefusedError())
+        update_hosts_with_omshell = self.patch(
+            dhcp, "_update_hosts_with_omshell")
+        hosts = [make_host()], [make_host()], [make_host()]
+        server = Mock()
+        yield dhcp._update_hosts(server, *hosts)
+        self.assertThat(
+            update_hosts_with_omshell, MockCalledOnceWith(server, *hosts))
+
+
 class TestConfigureDHCP(MAASTestCase):
 
     run_tests_with = MAASTwistedRunTest.make_factory(timeout=5)
@@ -466,6 +548,7 @@ class TestConfigureDHCP(MAASTestCase):
         self.addCleanup(dhcp.service_monitor.getServiceByName("dhcpd6").off)
         # The dhcp server states are global so we clean them after each test.
         self.addCleanup(dhcp._current_server_state.clear)
+        self.addCleanup(dhcp._server_statistics.clear)
         # Temporarily prevent hostname resolution when generating DHCP
         # configuration. This is tested elsewhere.
         self.useFixture(DHCPConfigNameResolutionDisabled())
@@ -903,6 +986,117 @@ class TestConfigureDHCP(MAASTestCase):
             "service to ensure host maps are in-sync.",
             logger.output)
 
+    def make_configuration(self, hosts):
+        failover_peers = make_failover_peer_config()
+        shared_network = make_shared_network()
+        [shared_network] = fix_shared_networks_failover(
+            [shared_network], [failover_peers])
+        return (
+            factory.make_name('omapi_key'), [failover_peers],
+            [shared_network], hosts, [make_interface()], [])
+
+    def get_statistics(self):
+        return dhcp.get_dhcp_statistics()[self.server.dhcp_service]
+
+    @inlineCallbacks
+    def test__records_restart_when_no_current_state(self):
+        self.patch_sudo_write_file()
+        self.patch_restartService()
+        self.patch_get_config().return_value = factory.make_name('config')
+        self.patch_autospec(dhcp.service_monitor.getServiceByName(
+            self.server.dhcp_service), "on")
+
+        yield self.configure(*self.make_configuration([make_host()]))
+
+        self.assertThat(self.get_statistics(), ContainsDict({
+            "writes": Equals(1),
+            "restarts": Equals(1),
+            "host_updates": Equals(0),
+            "unchanged": Equals(0),
+        }))
+
+    @inlineCallbacks
+    def test__records_unchanged_configuration(self):
+        self.patch_sudo_write_file()
+        self.patch_restartService()
+        self.patch_ensureService()
+        self.patch_get_config().return_value = factory.make_name('config')
+        self.patch_autospec(dhcp.service_monitor.getServiceByName(
+            self.server.dhcp_service), "on")
+        configuration = self.make_configuration([make_host()])
+        dhcp._current_server_state[self.server.dhcp_service] = (
+            dhcp.DHCPState(*configuration))
+
+        yield self.configure(*configuration)
+
+        self.assertThat(self.get_statistics(), ContainsDict({
+            "writes": Equals(1),
+            "restarts": Equals(0),
+            "host_updates": Equals(0),
+            "unchanged": Equals(1),
+        }))
+
+    @inlineCallbacks
+    def test__records_host_updates(self):
+        self.patch_sudo_write_file()
+        self.patch_getServiceState().return_value = ServiceState(
+            SERVICE_STATE.ON, "running")
+        self.patch_restartService()
+        self.patch_ensureService()
+        self.patch_update_hosts()
+        self.patch_get_config().return_value = factory.make_name('config')
+        self.patch_autospec(dhcp.service_monitor.getServiceByName(
+            self.server.dhcp_service), "on")
+        configuration = self.make_configuration(
+            [make_host(dhcp_snippets=[])])
+        dhcp._current_server_state[self.server.dhcp_service] = (
+            dhcp.DHCPState(*configuration))
+        omapi_key, failover_peers, shared_networks, _, interfaces, _ = (
+            configuration)
+
+        yield self.configure(
+            omapi_key, failover_peers, shared_networks,
+            [make_host(dhcp_snippets=[]), make_host(dhcp_snippets=[])],
+            interfaces, [])
+
+        self.assertThat(self.get_statistics(), ContainsDict({
+            "restarts": Equals(0),
+            "host_updates": Equals(1),
+            # One host removed and two added.
+            "hosts_updated": Equals(3),
+            "host_update_failures": Equals(0),
+        }))
+
+    @inlineCallbacks
+    def test__records_failed_host_updates(self):
+        self.patch_sudo_write_file()
+        self.patch_getServiceState().return_value = ServiceState(
+            SERVICE_STATE.ON, "running")
+        self.patch_restartService()
+        self.patch_ensureService()
+        self.patch_update_hosts().side_effect = factory.make_exception()
+        self.patch_get_config().return_value = factory.make_name('config')
+        self.patch_autospec(dhcp.service_monitor.getServiceByName(
+            self.server.dhcp_service), "on")
+        configuration = self.make_configuration(
+            [make_host(dhcp_snippets=[])])
+        dhcp._current_server_state[self.server.dhcp_service] = (
+            dhcp.DHCPState(*configuration))
+        omapi_key, failover_peers, shared_networks, _, interfaces, _ = (
+            configuration)
+
+        with FakeLogger("maas"):
+            yield self.configure(
+                omapi_key, failover_peers, shared_networks,
+                [make_host(dhcp_snippets=[])], interfaces, [])
+
+        self.assertThat(self.get_statistics(), ContainsDict({
+            "restarts": Equals(1),
+            "host_updates": Equals(0),
+            "hosts_updated": Equals(0),
+            "host_update_failures": Equals(1),
+        }))
+
     @inlineCallbacks
     def test__converts_failure_writing_file_to_CannotConfigureDHCP(self):
         self.patch_sudo_delete_file()
@@ -1002,6 +1196,25 @@ class TestConfigureDHCP(MAASTestCase):
             "DHCP is on strike today", logger.output)
 
 
+class TestGetDHCPStatistics(MAASTestCase):
+
+    def setUp(self):
+        super(TestGetDHCPStatistics, self).setUp()
+        self.addCleanup(dhcp._server_statistics.clear)
+
+    def test__returns_empty_dict_before_configuring(self):
+        self.assertThat(dhcp.get_dhcp_statistics(), Equals({}))
+
+    def test__returns_statistics_for_each_server(self):
+        dhcp._server_statistics["dhcpd"].restarts += 1
+        dhcp._server_statistics["dhcpd6"].host_updates += 2
+        statistics = dhcp.get_dhcp_statistics()
+        self.assertThat(statistics["dhcpd"], ContainsDict({
+            "restarts": Equals(1), "host_updates": Equals(0)}))
+        self.assertThat(statistics["dhcpd6"], ContainsDict({
+            "restarts": Equals(0), "host_updates": Equals(2)}))
+
+
 class TestValidateDHCP(MAASTestCase):
 
     scenarios = (
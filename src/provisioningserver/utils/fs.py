@@ -4,6 +4,7 @@
 """Generic utilities for dealing with files and the filesystem."""
 
 __all__ = [
+    'AtomicFileWriter',
     'atomic_copy',
     'atomic_delete',
     'atomic_symlink',
@@ -145,6 +146,15 @@ def atomic_write(content, filename, overwrite=True, mode=0o600):
         raise TypeError("Content must be bytes, got: %r" % (content, ))
 
     temp_file = _write_temp_file(content, filename)
+    _replace_with_temp_file(temp_file, filename, overwrite, mode)
+
+
+def _replace_with_temp_file(temp_file, filename, overwrite, mode):
+    """Rename `temp_file` over `filename`, as the last step of a write.
+
+    :param overwrite: Overwrite `filename` if it already exists?
+    :param mode: Access permissions for the file, if written.
+    """
     os.chmod(temp_file, mode)
 
     # Copy over ownership attributes if file exists
@@ -168,6 +178,63 @@ def atomic_write(content, filename, overwrite=True, mode=0o600):
             os.remove(temp_file)
 
 
+class AtomicFileWriter:
+    """Write a file in an atomic fashion, a piece at a time.
+
+    This is like `atomic_write`, but for content that is produced
+    incrementally and need not be held in memory all at once.  Use it as a
+    context manager; the content is written to a temporary file next to
+    `filename`, which replaces `filename` when the context exits cleanly.  It
+    is discarded instead if an exception is raised or `discard` is called.
+    """
+
+    def __init__(self, filename, overwrite=True, mode=0o600):
+        """
+        :param overwrite: Overwrite `filename` if it already exists?  Default
+            is True.
+        :param mode: Access permissions for the file, if written.
+        """
+        self.filename = filename
+        self.overwrite = overwrite
+        self.mode = mode
+        self.file = None
+        self.temp_file = None
+        self.discarded = False
+
+    def __enter__(self):
+        # An empty write creates the temporary file, on the same filesystem as
+        # the destination.
+        self.temp_file = _write_temp_file(b"", self.filename)
+        self.file = open(self.temp_file, "r+b")
+        return self
+
+    def write(self, content):
+        """Write the `content` bytes to the temporary file."""
+        self.file.write(content)
+
+    def seek(self, offset):
+        """Move to `offset` in the temporary file, e.g. to patch a header."""
+        self.file.seek(offset)
+
+    def discard(self):
+        """Leave `filename` untouched when the context exits."""
+        self.discarded = True
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        try:
+            if exc_type is None and not self.discarded:
+                # See `_write_temp_file` for why this is synced.
+                self.file.flush()
+                os.fsync(self.file)
+                self.file.close()
+                _replace_with_temp_file(
+                    self.temp_file, self.filename, self.overwrite, self.mode)
+        finally:
+            self.file.close()
+            if os.path.isfile(self.temp_file):
+                os.remove(self.temp_file)
+
+
 def are_identical_files(old, new):
     """Are `old` and `new` identical?
 
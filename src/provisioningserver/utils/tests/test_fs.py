@@ -49,6 +49,7 @@ from provisioningserver.utils.fs import (
     atomic_delete,
     atomic_symlink,
     atomic_write,
+    AtomicFileWriter,
     FileLock,
     get_library_script_path,
     get_maas_common_command,
@@ -202,6 +203,55 @@ class TestAtomicWrite(MAASTestCase):
             factory.make_string())
 
 
+class TestAtomicFileWriter(MAASTestCase):
+    """Test `AtomicFileWriter`."""
+
+    def test_writes_content_in_pieces(self):
+        filename = self.make_file(contents=factory.make_string())
+        with AtomicFileWriter(filename) as writer:
+            writer.write(b"abc")
+            writer.write(b"def")
+        self.assertThat(filename, FileContains(b"abcdef"))
+
+    def test_seek_allows_content_to_be_patched(self):
+        filename = os.path.join(self.make_dir(), factory.make_string())
+        with AtomicFileWriter(filename) as writer:
+            writer.write(b"xxx def")
+            writer.seek(0)
+            writer.write(b"abc")
+        self.assertThat(filename, FileContains(b"abc def"))
+
+    def test_discard_leaves_file_alone(self):
+        content = factory.make_bytes()
+        filename = self.make_file(contents=content)
+        with AtomicFileWriter(filename) as writer:
+            writer.write(factory.make_bytes())
+            writer.discard()
+        self.assertThat(filename, FileContains(content))
+        self.assertEqual(
+            [os.path.basename(filename)],
+            os.listdir(os.path.dirname(filename)))
+
+    def test_exception_leaves_file_alone(self):
+        content = factory.make_bytes()
+        filename = self.make_file(contents=content)
+        with ExpectedException(ZeroDivisionError):
+            with AtomicFileWriter(filename) as writer:
+                writer.write(factory.make_bytes())
+                0 / 0
+        self.assertThat(filename, FileContains(content))
+        self.assertEqual(
+            [os.path.basename(filename)],
+            os.listdir(os.path.dirname(filename)))
+
+    def test_sets_permissions(self):
+        filename = os.path.join(self.make_dir(), factory.make_string())
+        mode = 0o323
+        with AtomicFileWriter(filename, mode=mode) as writer:
+            writer.write(factory.make_bytes())
+        self.assertEqual(mode, stat.S_IMODE(os.stat(filename).st_mode))
+
+
 class TestAtomicCopy(MAASTestCase):
 
     def test_integration(self):